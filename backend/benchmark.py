@@ -0,0 +1,523 @@
+#!/usr/bin/env python3
+"""Local benchmark suite for the Right Tech Centre API.
+
+Runs the FastAPI app in-process (httpx ASGI transport) against a local
+mongod, with the LLM and Stripe clients replaced by the fakes in
+``fake_integrations``. A weighted mix of user journeys is driven by
+concurrent virtual users and every request is timed per route template.
+
+    python benchmark.py --duration 60 --concurrency 50
+    python benchmark.py --scenarios catalog,login --save-baseline
+    python benchmark.py --compare benchmarks/baseline.json --fail-on-regression 10
+    python benchmark.py --fast-json --compare benchmarks/baseline.json
+    python benchmark.py --micro serialization
+    python benchmark.py --storage memory --compare benchmarks/baseline.json
+
+Results are written as JSON (``benchmarks/latest.json`` by default) so two
+runs can be diffed; ``--compare`` prints the change in throughput and
+p50/p95/p99 for every route against a stored baseline. ``--storage memory``
+swaps Mongo for the in-process store in ``storage.py``, so the run measures
+application overhead alone and needs no mongod.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import math
+import os
+import random
+import statistics
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+ROOT_DIR = Path(__file__).parent
+BENCHMARK_DIR = ROOT_DIR / "benchmarks"
+BENCH_PASSWORD = "loadtest123"
+BENCH_EMAIL_DOMAIN = "bench.righttechcentre.com"
+
+SCENARIO_WEIGHTS = {
+    "catalog": 40,
+    "login": 10,
+    "dashboard": 25,
+    "progress": 15,
+    "webhook": 5,
+    "tutor": 5,
+}
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(math.ceil(pct / 100.0 * len(sorted_values)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+class RouteStats:
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+        self.statuses: Dict[str, Dict[int, int]] = {}
+
+    def record(self, route: str, elapsed_ms: float, status: int):
+        self.samples.setdefault(route, []).append(elapsed_ms)
+        route_statuses = self.statuses.setdefault(route, {})
+        route_statuses[status] = route_statuses.get(status, 0) + 1
+        if status >= 500 or status == 0:
+            self.errors[route] = self.errors.get(route, 0) + 1
+
+    def summary(self, wall_seconds: float) -> Dict[str, Dict]:
+        result = {}
+        for route, samples in sorted(self.samples.items()):
+            ordered = sorted(samples)
+            result[route] = {
+                "count": len(ordered),
+                "errors": self.errors.get(route, 0),
+                "statuses": {str(code): count for code, count in sorted(self.statuses[route].items())},
+                "throughput_rps": len(ordered) / wall_seconds if wall_seconds else 0.0,
+                "mean_ms": statistics.fmean(ordered),
+                "p50_ms": percentile(ordered, 50),
+                "p95_ms": percentile(ordered, 95),
+                "p99_ms": percentile(ordered, 99),
+                "max_ms": ordered[-1],
+            }
+        return result
+
+
+class BenchmarkClient:
+    """Thin wrapper that times each request under its route template"""
+
+    def __init__(self, http, stats: RouteStats):
+        self.http = http
+        self.stats = stats
+
+    async def request(self, method: str, route: str, url: str, token: Optional[str] = None, **kwargs):
+        headers = kwargs.pop("headers", {})
+        if token:
+            headers["Authorization"] = f"Bearer {token}"
+        started = time.perf_counter()
+        try:
+            response = await self.http.request(method, url, headers=headers, **kwargs)
+            status = response.status_code
+        except Exception:
+            response = None
+            status = 0
+        self.stats.record(f"{method} {route}", (time.perf_counter() - started) * 1000, status)
+        return response
+
+
+class BenchmarkState:
+    """Fixtures created during setup and shared by the scenarios"""
+
+    def __init__(self):
+        self.course_ids: List[str] = []
+        self.course_types: List[str] = []
+        # course id -> module ids from its outline, so progress updates name real modules
+        self.course_modules: Dict[str, List[str]] = {}
+        self.users: List[Dict] = []
+        self.admin_token: Optional[str] = None
+
+
+async def setup_fixtures(server, client: BenchmarkClient, num_users: int, rng: random.Random) -> BenchmarkState:
+    import bcrypt
+
+    state = BenchmarkState()
+    courses = await server.db.courses.find(
+        {"is_published": True}, {"_id": 0, "id": 1, "course_type": 1, "modules.id": 1}).to_list(1000)
+    state.course_ids = [course["id"] for course in courses]
+    state.course_modules = {
+        course["id"]: [module["id"] for module in course.get("modules", []) if module.get("id")] for course in courses
+    }
+    state.course_types = sorted({course["course_type"] for course in courses})
+
+    password_hash = bcrypt.hashpw(BENCH_PASSWORD.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+    await server.db.users.delete_many({"email": {"$regex": f"@{BENCH_EMAIL_DOMAIN}$"}})
+    user_docs = [{
+        "id": str(uuid.uuid4()),
+        "email": f"bench{i}@{BENCH_EMAIL_DOMAIN}",
+        "full_name": f"Bench User {i}",
+        "password": password_hash,
+        "role": "student",
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "profile_image": None,
+        "synthetic": True
+    } for i in range(num_users)]
+    await server.db.users.insert_many(user_docs)
+
+    admin = await client.http.post("/api/auth/login", json={"email": "admin@righttechcentre.com", "password": "admin123"})
+    if admin.status_code == 200:
+        state.admin_token = admin.json()["access_token"]
+
+    for doc in user_docs:
+        response = await client.http.post("/api/auth/login", json={"email": doc["email"], "password": BENCH_PASSWORD})
+        token = response.json()["access_token"]
+        enrollments = []
+        for course_id in rng.sample(state.course_ids, k=min(2, len(state.course_ids))):
+            enrolled = await client.http.post("/api/enrollments", json={"course_id": course_id}, headers={"Authorization": f"Bearer {token}"})
+            if enrolled.status_code == 200:
+                enrollments.append(enrolled.json())
+        state.users.append({"email": doc["email"], "token": token, "enrollments": enrollments})
+    return state
+
+
+async def scenario_catalog(client: BenchmarkClient, state: BenchmarkState, rng: random.Random):
+    await client.request("GET", "/api/courses", "/api/courses")
+    if state.course_types:
+        course_type = rng.choice(state.course_types)
+        await client.request("GET", "/api/courses", f"/api/courses?course_type={course_type}")
+    if rng.random() < 0.3:
+        term = rng.choice(["data", "cyber", "cloud", "design", "ai"])
+        await client.request("GET", "/api/courses", f"/api/courses?search={term}")
+    for course_id in rng.sample(state.course_ids, k=min(2, len(state.course_ids))):
+        await client.request("GET", "/api/courses/{course_id}", f"/api/courses/{course_id}")
+
+
+async def scenario_login(client: BenchmarkClient, state: BenchmarkState, rng: random.Random):
+    user = rng.choice(state.users)
+    await client.request("POST", "/api/auth/login", "/api/auth/login", json={"email": user["email"], "password": BENCH_PASSWORD})
+
+
+async def scenario_dashboard(client: BenchmarkClient, state: BenchmarkState, rng: random.Random):
+    # The student dashboard issues these three requests in parallel
+    user = rng.choice(state.users)
+    await asyncio.gather(
+        client.request("GET", "/api/auth/me", "/api/auth/me", token=user["token"]),
+        client.request("GET", "/api/enrollments", "/api/enrollments", token=user["token"]),
+        client.request("GET", "/api/certificates", "/api/certificates", token=user["token"]),
+    )
+    if state.admin_token and rng.random() < 0.1:
+        await asyncio.gather(
+            client.request("GET", "/api/analytics/overview", "/api/analytics/overview", token=state.admin_token),
+            client.request("GET", "/api/users", "/api/users", token=state.admin_token),
+        )
+
+
+async def scenario_progress(client: BenchmarkClient, state: BenchmarkState, rng: random.Random):
+    user = rng.choice(state.users)
+    if not user["enrollments"]:
+        return
+    enrollment = rng.choice(user["enrollments"])
+    module_ids = state.course_modules.get(enrollment["course_id"])
+    if not module_ids:
+        return
+    module_id = rng.choice(module_ids)
+    await client.request(
+        "PUT", "/api/enrollments/{enrollment_id}/progress", f"/api/enrollments/{enrollment['id']}/progress",
+        token=user["token"], json={"module_id": module_id}
+    )
+
+
+async def scenario_webhook(client: BenchmarkClient, state: BenchmarkState, rng: random.Random):
+    user = rng.choice(state.users)
+    course_id = rng.choice(state.course_ids)
+    response = await client.request(
+        "POST", "/api/payments/checkout", "/api/payments/checkout", token=user["token"],
+        json={"course_id": course_id, "origin_url": "http://localhost:3000"}
+    )
+    if response is None or response.status_code != 200:
+        return
+    import fake_integrations
+    session_id = response.json()["session_id"]
+    fake_integrations.complete_session(session_id)
+    # Stripe retries deliver the same event several times in a burst
+    body = json.dumps(fake_integrations.webhook_event(session_id)).encode()
+    await asyncio.gather(*[
+        client.request("POST", "/api/webhook/stripe", "/api/webhook/stripe", content=body,
+                       headers={"Stripe-Signature": fake_integrations.sign_webhook(body)})
+        for _ in range(rng.randint(1, 3))
+    ])
+
+
+async def scenario_tutor(client: BenchmarkClient, state: BenchmarkState, rng: random.Random):
+    user = rng.choice(state.users)
+    course_id = rng.choice(state.course_ids)
+    await client.request(
+        "POST", "/api/ai/chat", "/api/ai/chat", token=user["token"],
+        json={"content": "Explain the first module in simple terms", "course_id": course_id}
+    )
+
+
+SCENARIOS: Dict[str, Callable] = {
+    "catalog": scenario_catalog,
+    "login": scenario_login,
+    "dashboard": scenario_dashboard,
+    "progress": scenario_progress,
+    "webhook": scenario_webhook,
+    "tutor": scenario_tutor,
+}
+
+
+async def virtual_user(client: BenchmarkClient, state: BenchmarkState, names: List[str], weights: List[int], deadline: float, seed: int):
+    rng = random.Random(seed)
+    while time.perf_counter() < deadline:
+        name = rng.choices(names, weights=weights)[0]
+        await SCENARIOS[name](client, state, rng)
+
+
+async def run_benchmark(args) -> Dict:
+    import fake_integrations
+    fake_integrations.install(llm_latency=args.llm_latency_ms / 1000.0, stripe_latency=args.stripe_latency_ms / 1000.0)
+
+    import httpx
+    import server
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    names = [name for name in args.scenarios if SCENARIO_WEIGHTS.get(name)]
+    weights = [SCENARIO_WEIGHTS[name] for name in names]
+    rng = random.Random(args.seed)
+    stats = RouteStats()
+
+    await server.app.router.startup()
+    try:
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=60) as http:
+            setup_client = BenchmarkClient(http, RouteStats())
+            state = await setup_fixtures(server, setup_client, args.users, rng)
+            client = BenchmarkClient(http, stats)
+
+            if args.warmup > 0:
+                warmup_deadline = time.perf_counter() + args.warmup
+                await asyncio.gather(*[
+                    virtual_user(setup_client, state, names, weights, warmup_deadline, args.seed + i)
+                    for i in range(args.concurrency)
+                ])
+
+            started = time.perf_counter()
+            deadline = started + args.duration
+            await asyncio.gather(*[
+                virtual_user(client, state, names, weights, deadline, args.seed + 1000 + i)
+                for i in range(args.concurrency)
+            ])
+            wall_seconds = time.perf_counter() - started
+    finally:
+        await server.app.router.shutdown()
+
+    routes = stats.summary(wall_seconds)
+    total = sum(route["count"] for route in routes.values())
+    return {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "config": {
+            "duration": args.duration,
+            "concurrency": args.concurrency,
+            "users": args.users,
+            "seed": args.seed,
+            "scenarios": names,
+            "llm_latency_ms": args.llm_latency_ms,
+            "stripe_latency_ms": args.stripe_latency_ms,
+            "fast_json": args.fast_json,
+            "storage": args.storage,
+            "mongo_url": os.environ.get('MONGO_URL', 'mongodb://localhost:27017'),
+            "db_name": os.environ.get('DB_NAME'),
+        },
+        "wall_seconds": wall_seconds,
+        "total_requests": total,
+        "throughput_rps": total / wall_seconds if wall_seconds else 0.0,
+        "routes": routes,
+    }
+
+
+def build_catalog(copies: int) -> List[Dict]:
+    """Catalog documents shaped like the seeded programs (57 courses per copy)"""
+    courses = []
+    for copy in range(copies):
+        for course_type, count, num_modules, price in (("diploma", 26, 15, 2499.0), ("bachelor", 16, 30, 4499.0), ("certification", 15, 30, 799.0)):
+            for i in range(count):
+                title = f"{course_type.title()} Program {copy}-{i}"
+                courses.append({
+                    "id": str(uuid.uuid4()),
+                    "title": title,
+                    "description": f"Comprehensive {title} program covering essential skills and industry practices.",
+                    "course_type": course_type,
+                    "thumbnail": None,
+                    "price": price,
+                    "credit_hours": 60 if course_type == "diploma" else 120,
+                    "duration_months": 15 if course_type == "diploma" else 24,
+                    "instructor_id": None,
+                    "is_published": True,
+                    "modules": [{
+                        "id": str(uuid.uuid4()),
+                        "title": f"Module {m + 1}",
+                        "description": f"Core concepts and practical skills for {title}",
+                        "objectives": ["Understand fundamental concepts", "Apply theoretical knowledge", "Complete hands-on projects"],
+                        "duration_hours": 4
+                    } for m in range(num_modules)],
+                    "created_at": datetime.now(timezone.utc).isoformat(),
+                    "enrolled_count": i * 7,
+                })
+    return courses
+
+
+async def run_serialization_benchmark(args) -> Dict:
+    """Time the default response_model path against the fast JSON paths on the catalog"""
+    from fastapi.responses import JSONResponse
+    from fastapi.routing import serialize_response
+    from fastapi.utils import create_response_field
+
+    import serialization
+    import server
+    from catalog import CatalogCache
+
+    docs = build_catalog(args.catalog_copies)
+    response_type = List[server.CourseResponse]
+    field = create_response_field(name="response", type_=response_type)
+    cache = CatalogCache()
+    cache.put("list", docs, serialization.encode(docs, trusted=True, model=server.CourseResponse))
+
+    async def default_path():
+        content = await serialize_response(field=field, response_content=docs)
+        return JSONResponse(content=content).body
+
+    async def type_adapter_path():
+        return serialization.RawJSONResponse(serialization.encode(docs, response_type)).body
+
+    async def trusted_path():
+        return serialization.RawJSONResponse(serialization.encode(docs, trusted=True, model=server.CourseResponse)).body
+
+    async def cached_path():
+        return serialization.RawJSONResponse(cache.get("list").body).body
+
+    paths = {
+        "response_model + json": default_path,
+        "TypeAdapter validate + dump_json": type_adapter_path,
+        "trusted orjson": trusted_path,
+        "cached bytes": cached_path,
+    }
+    routes = {}
+    for name, fn in paths.items():
+        size = len(await fn())
+        samples = []
+        for _ in range(args.iterations):
+            started = time.perf_counter()
+            await fn()
+            samples.append((time.perf_counter() - started) * 1000)
+        ordered = sorted(samples)
+        routes[name] = {
+            "count": len(ordered),
+            "errors": 0,
+            "statuses": {},
+            "bytes": size,
+            "throughput_rps": 1000.0 / statistics.fmean(ordered),
+            "mean_ms": statistics.fmean(ordered),
+            "p50_ms": percentile(ordered, 50),
+            "p95_ms": percentile(ordered, 95),
+            "p99_ms": percentile(ordered, 99),
+            "max_ms": ordered[-1],
+        }
+    wall_seconds = sum(route["mean_ms"] * route["count"] for route in routes.values()) / 1000
+    return {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "config": {"micro": "serialization", "courses": len(docs), "iterations": args.iterations},
+        "wall_seconds": wall_seconds,
+        "total_requests": sum(route["count"] for route in routes.values()),
+        "throughput_rps": 0.0,
+        "routes": routes,
+    }
+
+
+def print_report(result: Dict):
+    print(f"\n{result['total_requests']:,} requests in {result['wall_seconds']:.1f}s ({result['throughput_rps']:.1f} req/s)\n")
+    header = f"{'route':<52} {'count':>8} {'rps':>8} {'p50':>9} {'p95':>9} {'p99':>9} {'errors':>7}"
+    print(header)
+    print("-" * len(header))
+    for route, data in result["routes"].items():
+        print(
+            f"{route:<52} {data['count']:>8} {data['throughput_rps']:>8.1f} "
+            f"{data['p50_ms']:>8.1f}ms {data['p95_ms']:>8.1f}ms {data['p99_ms']:>8.1f}ms {data['errors']:>7}"
+        )
+
+
+def compare(result: Dict, baseline: Dict, threshold: Optional[float]) -> bool:
+    """Print per-route deltas against a baseline; returns False on regression"""
+    print(f"\nCompared with baseline from {baseline.get('created_at', 'unknown')}:\n")
+    header = f"{'route':<52} {'rps':>9} {'p50':>9} {'p95':>9} {'p99':>9}"
+    print(header)
+    print("-" * len(header))
+    regressed = False
+
+    def delta(new: float, old: float) -> float:
+        return ((new - old) / old * 100.0) if old else 0.0
+
+    for route, data in result["routes"].items():
+        old = baseline.get("routes", {}).get(route)
+        if not old:
+            print(f"{route:<52} {'new':>9}")
+            continue
+        changes = {
+            "rps": delta(data["throughput_rps"], old["throughput_rps"]),
+            "p50": delta(data["p50_ms"], old["p50_ms"]),
+            "p95": delta(data["p95_ms"], old["p95_ms"]),
+            "p99": delta(data["p99_ms"], old["p99_ms"]),
+        }
+        print(f"{route:<52} {changes['rps']:>+8.1f}% {changes['p50']:>+8.1f}% {changes['p95']:>+8.1f}% {changes['p99']:>+8.1f}%")
+        if threshold is not None and (changes["p95"] > threshold or changes["rps"] < -threshold):
+            regressed = True
+    return not regressed
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the Right Tech Centre API in-process")
+    parser.add_argument("--duration", type=float, default=30.0, help="measured run length in seconds")
+    parser.add_argument("--warmup", type=float, default=5.0, help="unmeasured warm-up in seconds")
+    parser.add_argument("--concurrency", type=int, default=20, help="number of concurrent virtual users")
+    parser.add_argument("--users", type=int, default=50, help="benchmark accounts created during setup")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--scenarios", type=lambda value: [s.strip() for s in value.split(",") if s.strip()],
+                        default=list(SCENARIO_WEIGHTS), help="comma separated subset of: " + ", ".join(SCENARIO_WEIGHTS))
+    parser.add_argument("--llm-latency-ms", type=float, default=800.0)
+    parser.add_argument("--stripe-latency-ms", type=float, default=150.0)
+    parser.add_argument("--fast-json", action="store_true", help="run the app with FAST_JSON enabled")
+    parser.add_argument("--storage", choices=["mongo", "memory"], default="mongo",
+                        help="storage backend; memory needs no mongod and measures application overhead only")
+    parser.add_argument("--micro", choices=["serialization"], help="run a micro-benchmark instead of the HTTP mix")
+    parser.add_argument("--iterations", type=int, default=200, help="iterations per path for --micro")
+    parser.add_argument("--catalog-copies", type=int, default=1, help="catalog size for --micro, in multiples of 57 courses")
+    parser.add_argument("--db-name", default="rtc_benchmark", help="database used for the run (never the production one)")
+    parser.add_argument("--output", type=Path, default=BENCHMARK_DIR / "latest.json")
+    parser.add_argument("--save-baseline", action="store_true", help="also store this run as benchmarks/baseline.json")
+    parser.add_argument("--compare", type=Path, help="baseline JSON to diff this run against")
+    parser.add_argument("--fail-on-regression", type=float, metavar="PCT",
+                        help="exit non-zero if any route's p95 grows or throughput drops by more than PCT percent")
+    args = parser.parse_args(argv)
+
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(unknown)}")
+
+    os.environ['DB_NAME'] = args.db_name
+    os.environ.setdefault('EMERGENT_LLM_KEY', 'benchmark')
+    os.environ.setdefault('STRIPE_API_KEY', 'sk_test_benchmark')
+    if args.fast_json:
+        os.environ['FAST_JSON'] = 'true'
+    os.environ['STORAGE_BACKEND'] = args.storage
+    # Every virtual user shares one client address; per-IP limits would throttle the whole run
+    os.environ['RATE_LIMIT_ENABLED'] = 'false'
+
+    if args.micro == "serialization":
+        result = asyncio.run(run_serialization_benchmark(args))
+    else:
+        result = asyncio.run(run_benchmark(args))
+    print_report(result)
+
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    args.output.write_text(json.dumps(result, indent=2))
+    print(f"\nResults written to {args.output}")
+    if args.save_baseline:
+        baseline_path = BENCHMARK_DIR / "baseline.json"
+        baseline_path.write_text(json.dumps(result, indent=2))
+        print(f"Baseline stored at {baseline_path}")
+
+    if args.compare:
+        baseline = json.loads(args.compare.read_text())
+        if not compare(result, baseline, args.fail_on_regression):
+            print(f"\nRegression above {args.fail_on_regression}% detected")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
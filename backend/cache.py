@@ -0,0 +1,93 @@
+"""Small in-process caches and the invalidation registry they subscribe to.
+
+``TTLCache`` is a bounded LRU whose entries expire after ``ttl`` seconds.
+Caches register handlers with ``invalidation`` per Mongo collection; the
+change-stream listener in ``change_streams.py`` (and local write handlers)
+dispatch changed documents to them. While change streams are healthy the
+registry raises every tracked cache to the long TTL; when they are not,
+caches fall back to the short TTL so staleness stays bounded.
+"""
+
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+import metrics
+
+CACHE_TTL_SHORT = float(os.environ.get('CACHE_TTL_SHORT', '30'))
+CACHE_TTL_LONG = float(os.environ.get('CACHE_TTL_LONG', '3600'))
+
+cache_requests_total = metrics.registry.counter(
+    "rtc_cache_requests_total", "In-process cache lookups by cache and result", ("cache", "result"))
+cache_invalidations_total = metrics.registry.counter(
+    "rtc_cache_invalidations_total", "Cache invalidations dispatched per collection", ("collection",))
+
+_MISSING = object()
+
+
+class TTLCache:
+    def __init__(self, name: str, ttl: float = CACHE_TTL_SHORT, max_entries: int = 10000):
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._entries.get(key, _MISSING)
+        if entry is _MISSING or time.monotonic() - entry[1] > self.ttl:
+            cache_requests_total.inc(cache=self.name, result="miss")
+            return default
+        self._entries.move_to_end(key)
+        cache_requests_total.inc(cache=self.name, result="hit")
+        return entry[0]
+
+    def set(self, key: Hashable, value: Any):
+        self._entries[key] = (value, time.monotonic())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, key: Hashable):
+        self._entries.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class InvalidationRegistry:
+    """Routes changed documents to the caches that hold copies of them"""
+
+    def __init__(self):
+        self._handlers: Dict[str, List[Callable[[Optional[Dict]], None]]] = {}
+        self._caches: List[Any] = []
+
+    def on(self, collection: str, handler: Callable[[Optional[Dict]], None]):
+        """Register a handler; it receives the changed document, or None when only the key is known"""
+        self._handlers.setdefault(collection, []).append(handler)
+
+    def track(self, cache):
+        """Let the registry adjust this cache's TTL with the invalidation mode"""
+        self._caches.append(cache)
+
+    def collections(self) -> List[str]:
+        return list(self._handlers)
+
+    def dispatch(self, collection: str, document: Optional[Dict] = None):
+        cache_invalidations_total.inc(collection=collection)
+        for handler in self._handlers.get(collection, []):
+            handler(document)
+
+    def flush_all(self):
+        for collection in self._handlers:
+            self.dispatch(collection, None)
+
+    def set_ttl(self, ttl: float):
+        for cache in self._caches:
+            cache.ttl = ttl
+
+
+invalidation = InvalidationRegistry()
@@ -0,0 +1,77 @@
+"""In-process cache for the public course catalog.
+
+Catalog reads (``get_courses`` without a search term and ``get_course``)
+dominate anonymous traffic, and the catalog only changes on admin edits.
+Entries hold the documents together with their serialized JSON bytes and the
+compressed variants built from them (see ``compression.negotiated_response``),
+so a cached request touches neither Mongo, the encoder nor the compressor.
+
+Every course write calls ``invalidate()``, which bumps ``version``, drops
+all entries and notifies ``on_invalidate`` listeners (the static snapshot
+publisher). Entries also expire after ``CATALOG_CACHE_TTL`` seconds, which
+bounds how stale ``enrolled_count`` can get between writes. Enrollment
+counter flushes do not write the course document, so no invalidation
+follows them. For that reason this cache is not handed to the invalidation
+registry, which raises the other caches to ``CACHE_TTL_LONG`` while change
+streams are healthy.
+"""
+
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+CATALOG_CACHE_TTL = float(os.environ.get('CATALOG_CACHE_TTL', '30'))
+CATALOG_CACHE_MAX_ENTRIES = int(os.environ.get('CATALOG_CACHE_MAX_ENTRIES', '2048'))
+
+
+@dataclass
+class CatalogEntry:
+    data: Any
+    body: Optional[bytes]
+    version: int
+    created_at: float = field(default_factory=time.monotonic)
+    # encoding -> future resolving to the compressed body
+    variants: Dict[str, Any] = field(default_factory=dict)
+
+
+class CatalogCache:
+    def __init__(self, ttl: float = CATALOG_CACHE_TTL, max_entries: int = CATALOG_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: Dict[Hashable, CatalogEntry] = {}
+        self._listeners: List[Callable[[], None]] = []
+
+    def get(self, key: Hashable) -> Optional[CatalogEntry]:
+        entry = self._entries.get(key)
+        if entry is None or entry.version != self.version or time.monotonic() - entry.created_at > self.ttl:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry
+
+    def put(self, key: Hashable, data: Any, body: Optional[bytes] = None, version: Optional[int] = None) -> CatalogEntry:
+        """Store an entry computed against ``version`` (read it before querying Mongo)"""
+        entry = CatalogEntry(data=data, body=body, version=self.version if version is None else version)
+        if entry.version != self.version:
+            # A write landed while this entry was being built; don't cache stale data
+            return entry
+        if len(self._entries) >= self.max_entries and key not in self._entries:
+            self._entries.pop(next(iter(self._entries)))
+        self._entries[key] = entry
+        return entry
+
+    def on_invalidate(self, listener: Callable[[], None]):
+        self._listeners.append(listener)
+
+    def invalidate(self):
+        self.version += 1
+        self._entries.clear()
+        for listener in self._listeners:
+            listener()
+
+
+catalog_cache = CatalogCache()
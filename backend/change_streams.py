@@ -0,0 +1,144 @@
+"""Cross-worker cache invalidation via Mongo change streams.
+
+Every worker tails the collections that back its in-process caches
+(``courses``, ``users``, ``certificates``) with a single database-level
+change stream and dispatches each change to ``cache.invalidation``. An
+``update_course`` or ``update_user_role`` served by any worker or node
+therefore evicts the stale copies everywhere within milliseconds.
+
+The last resume token is kept in memory (for reconnects) and checkpointed to
+the ``change_stream_tokens`` collection per host, so a restarted worker picks
+up where it left off. If the token has fallen off the oplog, local caches are
+flushed and the stream restarts from now. When change streams are not
+available at all (standalone mongod), caches run in TTL-only mode with the
+short TTL and the listener retries periodically.
+"""
+
+import asyncio
+import logging
+import os
+import socket
+import time
+from typing import Any, Dict, List, Optional
+
+from pymongo.errors import OperationFailure, PyMongoError
+
+import metrics
+from cache import CACHE_TTL_LONG, CACHE_TTL_SHORT, invalidation
+
+logger = logging.getLogger(__name__)
+
+CHANGE_STREAMS_ENABLED = os.environ.get('CHANGE_STREAMS_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+CHANGE_STREAM_RETRY_SECONDS = float(os.environ.get('CHANGE_STREAM_RETRY_SECONDS', '60'))
+CHANGE_STREAM_CHECKPOINT_SECONDS = float(os.environ.get('CHANGE_STREAM_CHECKPOINT_SECONDS', '5'))
+
+# Server error codes meaning "change streams cannot run here"
+UNSUPPORTED_CODES = {40573, 40324, 13297}
+# Resume token no longer in the oplog
+HISTORY_LOST_CODES = {136, 280, 286}
+
+invalidation_mode = metrics.registry.gauge(
+    "rtc_cache_invalidation_mode", "1 for the active cache invalidation mode", ("mode",))
+change_events_total = metrics.registry.counter(
+    "rtc_change_stream_events_total", "Change events received per collection and operation", ("collection", "operation"))
+
+
+class ChangeStreamInvalidator:
+    def __init__(self, db, collections: Optional[List[str]] = None, stream_name: Optional[str] = None):
+        self.db = db
+        self.collections = collections or invalidation.collections()
+        self.stream_name = stream_name or f"cache-invalidation:{socket.gethostname()}"
+        self.resume_token: Optional[Dict[str, Any]] = None
+        self.mode = "starting"
+        self._last_checkpoint = 0.0
+
+    def _set_mode(self, mode: str):
+        if mode == self.mode:
+            return
+        self.mode = mode
+        for name in ("change_stream", "ttl_only"):
+            invalidation_mode.set(1 if name == mode else 0, mode=name)
+        invalidation.set_ttl(CACHE_TTL_LONG if mode == "change_stream" else CACHE_TTL_SHORT)
+        logger.info(f"Cache invalidation mode: {mode}")
+
+    async def _load_token(self):
+        doc = await self.db.change_stream_tokens.find_one({"_id": self.stream_name})
+        self.resume_token = doc.get("token") if doc else None
+
+    async def _checkpoint(self, force: bool = False):
+        now = time.monotonic()
+        if self.resume_token is None or (not force and now - self._last_checkpoint < CHANGE_STREAM_CHECKPOINT_SECONDS):
+            return
+        self._last_checkpoint = now
+        await self.db.change_stream_tokens.update_one(
+            {"_id": self.stream_name}, {"$set": {"token": self.resume_token}}, upsert=True
+        )
+
+    def _handle(self, change: Dict[str, Any]):
+        collection = change.get("ns", {}).get("coll")
+        operation = change.get("operationType", "")
+        change_events_total.inc(collection=collection or "", operation=operation)
+        if operation in ("drop", "rename", "dropDatabase", "invalidate"):
+            invalidation.flush_all()
+            return
+        if collection not in self.collections:
+            return
+        # Deletes only carry the ObjectId key, so handlers flush what they cannot target
+        invalidation.dispatch(collection, change.get("fullDocument"))
+
+    async def run(self):
+        """Tail the change stream until cancelled"""
+        if not CHANGE_STREAMS_ENABLED or not self.collections:
+            self._set_mode("ttl_only")
+            return
+        try:
+            await self._load_token()
+        except PyMongoError as e:
+            logger.warning(f"Could not load change stream token: {e}")
+
+        pipeline = [{"$match": {"ns.coll": {"$in": self.collections}}}]
+        backoff = 1.0
+        while True:
+            try:
+                async with self.db.watch(pipeline, full_document="updateLookup", resume_after=self.resume_token) as stream:
+                    self._set_mode("change_stream")
+                    backoff = 1.0
+                    while stream.alive:
+                        change = await stream.try_next()
+                        if change is not None:
+                            self._handle(change)
+                        # Post-batch tokens advance even when nothing matched
+                        self.resume_token = stream.resume_token
+                        await self._checkpoint()
+            except asyncio.CancelledError:
+                try:
+                    await self._checkpoint(force=True)
+                except PyMongoError:
+                    pass
+                raise
+            except OperationFailure as e:
+                if e.code in HISTORY_LOST_CODES and self.resume_token is not None:
+                    logger.warning("Change stream resume token expired; flushing caches and restarting from now")
+                    self.resume_token = None
+                    invalidation.flush_all()
+                    continue
+                if e.code in UNSUPPORTED_CODES:
+                    logger.info(f"Change streams unavailable ({e.code}); using TTL-only cache invalidation")
+                    self._set_mode("ttl_only")
+                    await asyncio.sleep(CHANGE_STREAM_RETRY_SECONDS)
+                    continue
+                logger.warning(f"Change stream failed: {e}")
+            except PyMongoError as e:
+                logger.warning(f"Change stream interrupted: {e}")
+            except NotImplementedError:
+                # Storage backends without watch() support
+                self._set_mode("ttl_only")
+                return
+            except Exception:
+                logger.exception("Change stream listener crashed; retrying")
+
+            # Anything cached while we were disconnected may have missed an event
+            self._set_mode("ttl_only")
+            invalidation.flush_all()
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, CHANGE_STREAM_RETRY_SECONDS)
@@ -0,0 +1,229 @@
+"""Per-course cohort analytics for instructors.
+
+``/analytics/courses/{id}/cohort`` reports where a course's students stall:
+progress percentiles, a per-module completion funnel built from
+``completed_modules``, and the distribution of days from enrollment to
+completion. One aggregation computes everything for a course. It starts
+with a ``$match`` on ``course_id`` (served by the ``(course_id, status)``
+index) and groups into bounded histograms inside a ``$facet``, so the
+result size does not grow with the cohort. Percentiles are read off those
+histograms in Python.
+
+Results are cached per course. New enrollments (free, polled or webhook
+fulfilled), ``update_progress`` and enrollment changes seen through the
+invalidation registry call ``mark_dirty``. A dirty course
+with a cached report keeps serving it (flagged ``stale``), and the
+background ``run`` loop recomputes it within
+``ANALYTICS_RECOMPUTE_SECONDS``. A course receiving hundreds of progress
+updates a minute is therefore aggregated at most once per interval, not on
+every page view or every update. Courses without a cached report are
+computed on demand, and concurrent requests share one computation.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from pymongo.errors import PyMongoError
+
+import metrics
+from cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+ANALYTICS_RECOMPUTE_SECONDS = float(os.environ.get('ANALYTICS_RECOMPUTE_SECONDS', '60'))
+ANALYTICS_MAX_COURSES = int(os.environ.get('ANALYTICS_MAX_COURSES', '2000'))
+
+PERCENTILES = (10, 25, 50, 75, 90)
+PROGRESS_BUCKET_WIDTH = 10
+COMPLETION_WEEK_BUCKETS = 52
+
+cohort_compute_duration = metrics.registry.histogram(
+    "rtc_cohort_analytics_compute_seconds", "Time to aggregate one course's cohort analytics",
+    buckets=metrics.DEFAULT_BUCKETS)
+cohort_requests_total = metrics.registry.counter(
+    "rtc_cohort_analytics_requests_total", "Cohort analytics reads by cache outcome", ("outcome",))
+
+
+def _parse_date(field: str) -> Dict[str, Any]:
+    # A malformed or missing timestamp drops the row instead of failing the whole report
+    return {"$dateFromString": {"dateString": field, "onError": None, "onNull": None}}
+
+
+def pipeline(course_id: str) -> List[Dict[str, Any]]:
+    return [
+        {"$match": {"course_id": course_id}},
+        {"$project": {"_id": 0, "status": 1, "progress": 1, "completed_modules": 1, "enrolled_at": 1, "completed_at": 1}},
+        {"$facet": {
+            "status": [{"$group": {"_id": "$status", "count": {"$sum": 1}}}],
+            # Whole-percent histogram: at most 101 groups, exact percentiles to 1%. The raw sum
+            # per bucket keeps the mean exact.
+            "progress": [
+                {"$group": {
+                    "_id": {"$floor": {"$ifNull": ["$progress", 0]}},
+                    "count": {"$sum": 1},
+                    "sum": {"$sum": {"$ifNull": ["$progress", 0]}}
+                }}
+            ],
+            "modules": [
+                {"$unwind": "$completed_modules"},
+                {"$group": {"_id": "$completed_modules", "count": {"$sum": 1}}}
+            ],
+            "completion_days": [
+                {"$match": {"status": "completed"}},
+                {"$project": {"completed": _parse_date("$completed_at"), "enrolled": _parse_date("$enrolled_at")}},
+                {"$match": {"completed": {"$ne": None}, "enrolled": {"$ne": None}}},
+                {"$group": {
+                    "_id": {"$floor": {"$divide": [{"$subtract": ["$completed", "$enrolled"]}, 86400000]}},
+                    "count": {"$sum": 1}
+                }}
+            ]
+        }}
+    ]
+
+
+def percentiles(histogram: Dict[float, int]) -> Dict[str, Optional[float]]:
+    """Nearest-rank percentiles from a {value: count} histogram"""
+    total = sum(histogram.values())
+    result: Dict[str, Optional[float]] = {f"p{p}": None for p in PERCENTILES}
+    if not total:
+        return result
+    values = sorted(histogram)
+    for p in PERCENTILES:
+        rank = max(1, -(-p * total // 100))
+        seen = 0
+        for value in values:
+            seen += histogram[value]
+            if seen >= rank:
+                result[f"p{p}"] = value
+                break
+    return result
+
+
+def build_report(course: Dict[str, Any], facets: Dict[str, List[Dict[str, Any]]]) -> Dict[str, Any]:
+    status = {row["_id"] or "unknown": row["count"] for row in facets.get("status", [])}
+    total = sum(status.values())
+
+    progress_histogram = {min(float(row["_id"] or 0), 100.0): row["count"] for row in facets.get("progress", [])}
+    buckets = [0] * (100 // PROGRESS_BUCKET_WIDTH + 1)
+    for value, count in progress_histogram.items():
+        buckets[int(value // PROGRESS_BUCKET_WIDTH)] += count
+    progress_total = sum(row.get("sum") or 0 for row in facets.get("progress", []))
+    mean = progress_total / total if total else None
+
+    completed_by_module = {row["_id"]: row["count"] for row in facets.get("modules", [])}
+    funnel = []
+    previous = total
+    for position, module in enumerate(course.get("modules") or []):
+        completed = completed_by_module.get(module.get("id"), 0)
+        funnel.append({
+            "module_id": module.get("id"),
+            "title": module.get("title"),
+            "position": position,
+            "completed": completed,
+            "completion_rate": round(completed / total, 4) if total else 0.0,
+            # Students who finished the previous step but not this one
+            "drop_off": max(previous - completed, 0)
+        })
+        previous = completed
+    stall = max(funnel, key=lambda step: step["drop_off"], default=None)
+
+    days = {row["_id"]: row["count"] for row in facets.get("completion_days", []) if row["_id"] is not None}
+    weeks = [0] * (COMPLETION_WEEK_BUCKETS + 1)
+    for day, count in days.items():
+        weeks[min(max(int(day), 0) // 7, COMPLETION_WEEK_BUCKETS)] += count
+
+    return {
+        "course_id": course["id"],
+        "computed_at": datetime.now(timezone.utc).isoformat(),
+        "enrollments": {"total": total, "by_status": status},
+        "progress": {
+            "mean": round(mean, 2) if mean is not None else None,
+            "percentiles": percentiles(progress_histogram),
+            "histogram": [
+                {"from": index * PROGRESS_BUCKET_WIDTH, "to": min((index + 1) * PROGRESS_BUCKET_WIDTH, 100), "count": count}
+                for index, count in enumerate(buckets)
+            ]
+        },
+        "modules": funnel,
+        "stall_module_id": stall["module_id"] if stall and stall["drop_off"] else None,
+        "time_to_completion_days": {
+            "count": sum(days.values()),
+            "percentiles": percentiles(days),
+            # Last bucket collects everything from COMPLETION_WEEK_BUCKETS weeks on
+            "weekly_histogram": weeks
+        }
+    }
+
+
+class CohortAnalytics:
+    def __init__(self):
+        self.cache = TTLCache("course_analytics", max_entries=ANALYTICS_MAX_COURSES)
+        self._dirty: Dict[str, float] = {}
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    def mark_dirty(self, course_id: Optional[str] = None):
+        """Record a change to a course's enrollments; None drops every cached report"""
+        now = time.monotonic()
+        if course_id is None:
+            self.cache.clear()
+            self._dirty.clear()
+        elif course_id not in self._dirty:
+            self._dirty[course_id] = now
+
+    async def _compute(self, db, course_id: str) -> Optional[Dict[str, Any]]:
+        course = await db.courses.find_one({"id": course_id}, {"_id": 0, "id": 1, "modules.id": 1, "modules.title": 1})
+        if not course:
+            return None
+        self._dirty.pop(course_id, None)
+        started = time.monotonic()
+        facets = await db.enrollments.aggregate(pipeline(course_id)).to_list(1)
+        cohort_compute_duration.observe(time.monotonic() - started)
+        report = build_report(course, facets[0] if facets else {})
+        self.cache.set(course_id, report)
+        return report
+
+    async def _shared_compute(self, db, course_id: str) -> Optional[Dict[str, Any]]:
+        inflight = self._inflight.get(course_id)
+        if inflight is None:
+            inflight = asyncio.ensure_future(self._compute(db, course_id))
+            self._inflight[course_id] = inflight
+            inflight.add_done_callback(lambda _: self._inflight.pop(course_id, None))
+        return await asyncio.shield(inflight)
+
+    async def report(self, db, course_id: str) -> Optional[Dict[str, Any]]:
+        cached = self.cache.get(course_id)
+        if cached is not None:
+            stale = course_id in self._dirty
+            cohort_requests_total.inc(outcome="stale" if stale else "hit")
+            return {**cached, "stale": stale}
+        cohort_requests_total.inc(outcome="miss")
+        report = await self._shared_compute(db, course_id)
+        return {**report, "stale": False} if report else None
+
+    async def recompute_dirty(self, db):
+        for course_id in list(self._dirty):
+            if self.cache.get(course_id) is None:
+                # Nobody is looking at this course; the next read computes it fresh
+                self._dirty.pop(course_id, None)
+                continue
+            try:
+                await self._shared_compute(db, course_id)
+            except PyMongoError as e:
+                logger.warning(f"Cohort analytics recompute for {course_id} failed: {e}")
+
+    async def run(self, db):
+        """Recompute stale cached reports every ANALYTICS_RECOMPUTE_SECONDS until cancelled"""
+        while True:
+            await asyncio.sleep(ANALYTICS_RECOMPUTE_SECONDS)
+            await self.recompute_dirty(db)
+
+
+async def ensure_indexes(db):
+    await db.enrollments.create_index([("course_id", 1), ("status", 1)])
+
+
+course_analytics = CohortAnalytics()
@@ -0,0 +1,205 @@
+"""Negotiated gzip/brotli compression.
+
+Two paths:
+
+- ``negotiated_response`` serves catalog entries. Compressed variants are
+  built once per catalog version (off the event loop, at high quality) and
+  kept on the ``CatalogEntry``, so repeated requests never recompress.
+- ``CompressionMiddleware`` compresses any other sizeable JSON/text response
+  on the fly at a cheaper level, including streamed bodies.
+
+Both honour ``Accept-Encoding`` q-values, prefer brotli over gzip when the
+client accepts both, and always send ``Vary: Accept-Encoding`` on
+compressible responses. Compression time and bytes in/out are exported as
+metrics so the ratio and CPU cost can be tracked.
+"""
+
+import asyncio
+import gzip
+import logging
+import os
+import time
+import zlib
+from typing import Dict, List, Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.requests import Request
+from starlette.responses import Response
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - Brotli is pinned in requirements.txt
+    brotli = None
+
+COMPRESSION_ENABLED = os.environ.get('COMPRESSION_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+COMPRESSION_MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE', '1024'))
+GZIP_LEVEL_DYNAMIC = int(os.environ.get('GZIP_LEVEL_DYNAMIC', '6'))
+GZIP_LEVEL_STATIC = int(os.environ.get('GZIP_LEVEL_STATIC', '9'))
+BROTLI_QUALITY_DYNAMIC = int(os.environ.get('BROTLI_QUALITY_DYNAMIC', '4'))
+BROTLI_QUALITY_STATIC = int(os.environ.get('BROTLI_QUALITY_STATIC', '11'))
+
+COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "text/")
+
+compression_duration = metrics.registry.histogram(
+    "rtc_compression_duration_seconds", "Time spent compressing response bodies", ("encoding", "mode"),
+    buckets=metrics.MONGO_BUCKETS)
+compression_bytes_total = metrics.registry.counter(
+    "rtc_compression_bytes_total", "Bytes before (in) and after (out) compression", ("encoding", "mode", "direction"))
+compression_responses_total = metrics.registry.counter(
+    "rtc_compression_responses_total", "Responses by chosen encoding and path", ("encoding", "mode"))
+
+
+def supported_encodings() -> List[str]:
+    return ["br", "gzip"] if brotli is not None else ["gzip"]
+
+
+def negotiate(accept_encoding: Optional[str]) -> str:
+    """Pick the best supported encoding for an Accept-Encoding header, or 'identity'"""
+    if not COMPRESSION_ENABLED or not accept_encoding:
+        return "identity"
+    qualities: Dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        pieces = part.strip().split(";")
+        coding = pieces[0].strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in pieces[1:]:
+            name, _, value = param.strip().partition("=")
+            if name.strip() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        qualities[coding] = q
+    best, best_q = "identity", 0.0
+    for coding in supported_encodings():
+        q = qualities.get(coding, qualities.get("*", 0.0))
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+def compress(body: bytes, encoding: str, static: bool) -> bytes:
+    mode = "precomputed" if static else "dynamic"
+    started = time.perf_counter()
+    if encoding == "br":
+        quality = BROTLI_QUALITY_STATIC if static else BROTLI_QUALITY_DYNAMIC
+        compressed = brotli.compress(body, mode=brotli.MODE_TEXT, quality=quality)
+    else:
+        compressed = gzip.compress(body, compresslevel=GZIP_LEVEL_STATIC if static else GZIP_LEVEL_DYNAMIC, mtime=0)
+    compression_duration.observe(time.perf_counter() - started, encoding=encoding, mode=mode)
+    compression_bytes_total.inc(len(body), encoding=encoding, mode=mode, direction="in")
+    compression_bytes_total.inc(len(compressed), encoding=encoding, mode=mode, direction="out")
+    return compressed
+
+
+async def entry_variant(entry, encoding: str) -> bytes:
+    """Compressed body for a catalog entry, built once and shared by concurrent requests"""
+    variant = entry.variants.get(encoding)
+    if variant is None:
+        variant = entry.variants[encoding] = asyncio.ensure_future(asyncio.to_thread(compress, entry.body, encoding, True))
+    return await asyncio.shield(variant)
+
+
+async def negotiated_response(request: Request, entry, media_type: str = "application/json") -> Response:
+    """Serve a catalog entry's pre-encoded body in the encoding the client prefers"""
+    headers = {"Vary": "Accept-Encoding"}
+    encoding = negotiate(request.headers.get("accept-encoding"))
+    if encoding == "identity" or len(entry.body) < COMPRESSION_MIN_SIZE:
+        compression_responses_total.inc(encoding="identity", mode="precomputed")
+        return Response(content=entry.body, media_type=media_type, headers=headers)
+    headers["Content-Encoding"] = encoding
+    compression_responses_total.inc(encoding=encoding, mode="precomputed")
+    return Response(content=await entry_variant(entry, encoding), media_type=media_type, headers=headers)
+
+
+class _StreamCompressor:
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == "br":
+            self._compressor = brotli.Compressor(mode=brotli.MODE_TEXT, quality=BROTLI_QUALITY_DYNAMIC)
+        else:
+            self._compressor = zlib.compressobj(GZIP_LEVEL_DYNAMIC, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def chunk(self, data: bytes, final: bool) -> bytes:
+        if self.encoding == "br":
+            out = self._compressor.process(data) + self._compressor.flush()
+            return out + self._compressor.finish() if final else out
+        out = self._compressor.compress(data)
+        return out + (self._compressor.flush() if final else self._compressor.flush(zlib.Z_SYNC_FLUSH))
+
+
+class CompressionMiddleware:
+    """ASGI middleware compressing responses that are not already encoded"""
+
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not COMPRESSION_ENABLED:
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate(Headers(scope=scope).get("accept-encoding"))
+        start_message: Optional[dict] = None
+        state: Dict[str, object] = {"mode": "undecided", "compressor": None}
+
+        async def send_wrapper(message):
+            nonlocal start_message
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+            if message["type"] != "http.response.body" or start_message is None:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+            if state["mode"] == "undecided":
+                headers = MutableHeaders(raw=start_message["headers"])
+                content_type = headers.get("content-type", "")
+                compressible = (
+                    "content-encoding" not in headers
+                    and start_message["status"] == 200
+                    and content_type.startswith(COMPRESSIBLE_TYPES)
+                    # Event streams must reach the client unbuffered
+                    and not content_type.startswith("text/event-stream")
+                )
+                if compressible and "accept-encoding" not in headers.get("vary", "").lower():
+                    headers.add_vary_header("Accept-Encoding")
+                if not compressible or encoding == "identity" or (not more_body and len(body) < self.minimum_size):
+                    state["mode"] = "passthrough"
+                    await send(start_message)
+                    await send(message)
+                    return
+                headers["Content-Encoding"] = encoding
+                compression_responses_total.inc(encoding=encoding, mode="dynamic")
+                if not more_body:
+                    compressed = compress(body, encoding, static=False)
+                    headers["Content-Length"] = str(len(compressed))
+                    state["mode"] = "done"
+                    await send(start_message)
+                    await send({"type": "http.response.body", "body": compressed})
+                    return
+                del headers["Content-Length"]
+                state["mode"] = "stream"
+                state["compressor"] = _StreamCompressor(encoding)
+                await send(start_message)
+
+            if state["mode"] == "stream":
+                started = time.perf_counter()
+                out = state["compressor"].chunk(body, final=not more_body)
+                compression_duration.observe(time.perf_counter() - started, encoding=encoding, mode="dynamic")
+                compression_bytes_total.inc(len(body), encoding=encoding, mode="dynamic", direction="in")
+                compression_bytes_total.inc(len(out), encoding=encoding, mode="dynamic", direction="out")
+                await send({"type": "http.response.body", "body": out, "more_body": more_body})
+            else:
+                await send(message)
+
+        await self.app(scope, receive, send_wrapper)
@@ -0,0 +1,159 @@
+"""Cluster-wide startup coordination for multi-worker deployments.
+
+When the API runs as N gunicorn/uvicorn workers on one or more nodes, every
+process executes the FastAPI startup hooks. Work that must happen once per
+cluster (seeding, index builds) goes through ``run_startup_tasks`` instead:
+
+- workers race for a Mongo-backed ``LeaderLease`` (a document in ``leases``
+  with a holder and an expiry, claimed with an upsert so only one insert wins);
+- the leader runs each task, records it in ``startup_tasks`` for the current
+  ``DEPLOY_ID`` and keeps renewing the lease while it works;
+- followers wait for the tasks to be recorded, and take over if the leader's
+  lease expires before it finishes.
+
+A task that raises is not recorded, so it runs again on the next start.
+
+Set ``DEPLOY_ID`` to a release identifier (image tag, git SHA) so each
+deploy gets its own generation. Without it the generation comes from the
+first commit SHA the platform exposes (``GIT_COMMIT``, ``SOURCE_VERSION``,
+``RENDER_GIT_COMMIT``...). Failing that, it is a hash of the backend's
+Python sources. Every node running the same code then agrees on the
+generation, and a code change starts a new one.
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+import socket
+import uuid
+from datetime import datetime, timezone, timedelta
+from pathlib import Path
+from typing import Awaitable, Callable, Dict
+
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+# Commit SHAs exposed by common build and hosting platforms, tried in order
+DEPLOY_ID_FALLBACK_VARS = ('GIT_COMMIT', 'GIT_SHA', 'IMAGE_TAG', 'SOURCE_VERSION', 'RENDER_GIT_COMMIT',
+                           'RAILWAY_GIT_COMMIT_SHA', 'HEROKU_SLUG_COMMIT', 'VERCEL_GIT_COMMIT_SHA')
+
+
+def default_deploy_id(source_dir: Path = Path(__file__).parent) -> str:
+    """Generation for this release when DEPLOY_ID is unset; identical on every node running the same code"""
+    for name in DEPLOY_ID_FALLBACK_VARS:
+        if os.environ.get(name):
+            return os.environ[name]
+    digest = hashlib.sha256()
+    for path in sorted(source_dir.glob("*.py")):
+        digest.update(path.name.encode())
+        digest.update(path.read_bytes())
+    return f"src-{digest.hexdigest()[:16]}"
+
+
+DEPLOY_ID = os.environ.get('DEPLOY_ID') or default_deploy_id()
+STARTUP_LEASE_TTL = float(os.environ.get('STARTUP_LEASE_TTL', '30'))
+STARTUP_WAIT_TIMEOUT = float(os.environ.get('STARTUP_WAIT_TIMEOUT', '300'))
+
+_worker_ids: Dict[int, str] = {}
+
+
+def worker_id() -> str:
+    """Identity of this worker process; computed per PID so forked workers differ"""
+    pid = os.getpid()
+    if pid not in _worker_ids:
+        _worker_ids[pid] = f"{socket.gethostname()}:{pid}:{uuid.uuid4().hex[:8]}"
+    return _worker_ids[pid]
+
+
+class LeaderLease:
+    """Time-bounded exclusive lease stored as a single Mongo document"""
+
+    def __init__(self, collection, name: str, ttl: float = STARTUP_LEASE_TTL, holder: str = None):
+        self.collection = collection
+        self.name = name
+        self.ttl = ttl
+        self.holder = holder or worker_id()
+
+    async def try_acquire(self) -> bool:
+        now = datetime.now(timezone.utc)
+        try:
+            await self.collection.update_one(
+                {"_id": self.name, "$or": [{"expires_at": {"$lt": now}}, {"holder": self.holder}]},
+                {"$set": {"holder": self.holder, "expires_at": now + timedelta(seconds=self.ttl), "acquired_at": now}},
+                upsert=True
+            )
+            return True
+        except DuplicateKeyError:
+            # The lease document exists and another live holder owns it
+            return False
+
+    async def renew(self) -> bool:
+        now = datetime.now(timezone.utc)
+        result = await self.collection.update_one(
+            {"_id": self.name, "holder": self.holder},
+            {"$set": {"expires_at": now + timedelta(seconds=self.ttl)}}
+        )
+        return result.matched_count == 1
+
+    async def release(self):
+        await self.collection.delete_one({"_id": self.name, "holder": self.holder})
+
+    async def keep_alive(self):
+        """Renew the lease until cancelled"""
+        while True:
+            await asyncio.sleep(self.ttl / 3)
+            if not await self.renew():
+                logger.warning(f"Lost lease {self.name}")
+                return
+
+
+async def _pending_tasks(collection, names, generation: str):
+    done = await collection.find(
+        {"_id": {"$in": [f"{generation}:{name}" for name in names]}, "status": "done"}, {"_id": 1}
+    ).to_list(len(names))
+    done_ids = {doc["_id"] for doc in done}
+    return [name for name in names if f"{generation}:{name}" not in done_ids]
+
+
+async def run_startup_tasks(db, tasks: Dict[str, Callable[[], Awaitable]], generation: str = DEPLOY_ID):
+    """Run each task exactly once per cluster for this deploy generation"""
+    names = list(tasks)
+    lease = LeaderLease(db.leases, f"startup:{generation}")
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + STARTUP_WAIT_TIMEOUT
+
+    while True:
+        pending = await _pending_tasks(db.startup_tasks, names, generation)
+        if not pending:
+            return
+        if await lease.try_acquire():
+            break
+        if loop.time() > deadline:
+            logger.warning(f"Gave up waiting for startup tasks {pending} after {STARTUP_WAIT_TIMEOUT:.0f}s")
+            return
+        await asyncio.sleep(1)
+
+    keep_alive = asyncio.create_task(lease.keep_alive())
+    try:
+        # Another leader may have finished between our check and the acquire
+        pending = await _pending_tasks(db.startup_tasks, names, generation)
+        if pending:
+            logger.info(f"Worker {worker_id()} is running startup tasks {pending}")
+        for name in pending:
+            started_at = datetime.now(timezone.utc)
+            await tasks[name]()
+            await db.startup_tasks.update_one(
+                {"_id": f"{generation}:{name}"},
+                {"$set": {
+                    "status": "done",
+                    "worker": worker_id(),
+                    "started_at": started_at,
+                    "completed_at": datetime.now(timezone.utc)
+                }},
+                upsert=True
+            )
+    finally:
+        keep_alive.cancel()
+        await lease.release()
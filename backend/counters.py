@@ -0,0 +1,151 @@
+"""Sharded enrollment counters.
+
+Incrementing ``enrolled_count`` on the course document serializes every
+enrollment for a popular course on that one (large) document. Instead,
+increments land on ``COUNTER_SHARDS`` small documents per course in
+``course_counters`` (``{_id: "<course_id>:<slot>", key, slot, enrolled}``),
+with the slot picked at random so concurrent writers rarely touch the same
+document.
+
+Increments are also batched in-process: ``increment()`` only bumps a local
+tally, and a background task flushes all pending tallies every
+``COUNTER_FLUSH_INTERVAL`` seconds as one unordered ``bulk_write``. Setting
+the interval to 0 writes through on every call.
+
+``enrolled_count`` on the course document remains the baseline (seeded and
+bulk-loaded courses), and readers add the shard sum via ``totals()``. Sums
+are cached for ``COUNTER_CACHE_TTL`` seconds and include this worker's
+unflushed increments, so a count lags by at most the cache TTL plus
+another worker's flush interval.
+"""
+
+import asyncio
+import logging
+import os
+import random
+from collections import defaultdict
+from typing import Dict, Iterable
+
+from pymongo import UpdateOne
+from pymongo.errors import PyMongoError
+
+import metrics
+from cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+COUNTER_SHARDS = int(os.environ.get('ENROLLMENT_COUNTER_SHARDS', '16'))
+COUNTER_FLUSH_INTERVAL = float(os.environ.get('ENROLLMENT_COUNTER_FLUSH_SECONDS', '0.25'))
+COUNTER_CACHE_TTL = float(os.environ.get('ENROLLMENT_COUNTER_CACHE_TTL', '5'))
+
+counter_flush_size = metrics.registry.histogram(
+    "rtc_counter_flush_keys", "Distinct counters written per flush", ("counter",), buckets=metrics.COUNT_BUCKETS)
+counter_flush_failures_total = metrics.registry.counter(
+    "rtc_counter_flush_failures_total", "Counter flushes that failed and were re-queued", ("counter",))
+
+
+class ShardedCounter:
+    def __init__(self, collection: str, field: str, shards: int = COUNTER_SHARDS,
+                 flush_interval: float = COUNTER_FLUSH_INTERVAL, cache_ttl: float = COUNTER_CACHE_TTL):
+        self.collection_name = collection
+        self.field = field
+        self.shards = shards
+        self.flush_interval = flush_interval
+        self.db = None
+        self._pending: Dict[str, int] = defaultdict(int)
+        self._cache = TTLCache(collection, ttl=cache_ttl)
+
+    def bind(self, db):
+        self.db = db
+
+    @property
+    def collection(self):
+        return self.db[self.collection_name]
+
+    def _update(self, key: str, amount: int) -> UpdateOne:
+        slot = random.randrange(self.shards)
+        return UpdateOne(
+            {"_id": f"{key}:{slot}"},
+            {"$inc": {self.field: amount}, "$setOnInsert": {"key": key, "slot": slot}},
+            upsert=True
+        )
+
+    async def increment(self, key: str, amount: int = 1):
+        if self.flush_interval <= 0:
+            await self.collection.bulk_write([self._update(key, amount)])
+            self._cache.invalidate(key)
+            return
+        self._pending[key] += amount
+
+    async def flush(self):
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, defaultdict(int)
+        try:
+            await self.collection.bulk_write(
+                [self._update(key, amount) for key, amount in pending.items() if amount], ordered=False
+            )
+        except PyMongoError as e:
+            # Unordered upserts may have partially applied; re-queueing can over-count
+            # slightly, which is preferable to losing enrollments from the count
+            logger.warning(f"Counter flush for {self.collection_name} failed, re-queued: {e}")
+            counter_flush_failures_total.inc(counter=self.collection_name)
+            for key, amount in pending.items():
+                self._pending[key] += amount
+            return
+        counter_flush_size.observe(len(pending), counter=self.collection_name)
+        for key in pending:
+            self._cache.invalidate(key)
+
+    async def run(self):
+        """Flush pending increments until cancelled, then flush once more"""
+        try:
+            while True:
+                await asyncio.sleep(self.flush_interval)
+                await self.flush()
+        finally:
+            await asyncio.shield(self.flush())
+
+    async def totals(self, keys: Iterable[str]) -> Dict[str, int]:
+        """Shard sums per key (cached), plus increments not yet flushed by this worker"""
+        keys = list(dict.fromkeys(keys))
+        result: Dict[str, int] = {}
+        missing = []
+        for key in keys:
+            cached = self._cache.get(key)
+            if cached is None:
+                missing.append(key)
+            else:
+                result[key] = cached
+        if missing:
+            rows = await self.collection.aggregate([
+                {"$match": {"key": {"$in": missing}}},
+                {"$group": {"_id": "$key", "total": {"$sum": f"${self.field}"}}}
+            ]).to_list(None)
+            fetched = {row["_id"]: row["total"] for row in rows}
+            for key in missing:
+                result[key] = fetched.get(key, 0)
+                self._cache.set(key, result[key])
+        return {key: result[key] + self._pending.get(key, 0) for key in keys}
+
+    async def delete(self, key: str):
+        self._pending.pop(key, None)
+        self._cache.invalidate(key)
+        await self.collection.delete_many({"key": key})
+
+    async def ensure_indexes(self):
+        await self.collection.create_index("key")
+
+
+enrollment_counter = ShardedCounter("course_counters", "enrolled")
+
+
+async def apply_enrollment_counts(courses):
+    """Add sharded counts to course documents' baseline ``enrolled_count`` in place"""
+    docs = courses if isinstance(courses, list) else [courses]
+    if not docs:
+        return courses
+    totals = await enrollment_counter.totals(doc["id"] for doc in docs)
+    for doc in docs:
+        doc["enrolled_count"] = doc.get("enrolled_count", 0) + totals.get(doc["id"], 0)
+    return courses
@@ -0,0 +1,137 @@
+"""Module and lesson content stored outside the course document.
+
+Course documents only keep a module outline (``OUTLINE_FIELDS`` plus
+``lesson_count`` and ``version``), which is all the catalog and course detail
+pages render. Full module content (lessons, quiz references) lives in
+``course_modules``, one versioned document per module, and is served by
+``/courses/{id}/modules/{module_id}`` with an ETag derived from that version.
+This keeps hot course documents small no matter how much lesson material
+instructors add.
+"""
+
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+OUTLINE_FIELDS = ("id", "title", "description", "objectives", "duration_hours")
+CONTENT_FIELDS = ("title", "description", "objectives", "lessons", "quiz_id", "duration_hours")
+
+
+def module_etag(module: Dict[str, Any]) -> str:
+    return f'"{module["id"]}.{module.get("version", 1)}"'
+
+
+def etag_matches(header: Optional[str], etag: str) -> bool:
+    """If-None-Match / If-Match comparison (weak comparison, ``*`` matches anything)"""
+    if not header:
+        return False
+    candidates = [value.strip() for value in header.split(",")]
+    return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
+
+
+def outline(module: Dict[str, Any]) -> Dict[str, Any]:
+    """Outline entry kept on the course document for a module"""
+    entry = {field: module[field] for field in OUTLINE_FIELDS if field in module}
+    if "lessons" in module:
+        entry["lesson_count"] = len(module["lessons"] or [])
+    else:
+        entry["lesson_count"] = module.get("lesson_count", 0)
+    entry["version"] = module.get("version", 1)
+    return entry
+
+
+def is_outline(module: Dict[str, Any]) -> bool:
+    return "id" in module and "lesson_count" in module and set(module) <= {*OUTLINE_FIELDS, "lesson_count", "version"}
+
+
+def module_document(course_id: str, position: int, module: Dict[str, Any]) -> Dict[str, Any]:
+    """Full ``course_modules`` document for a module given inline"""
+    return {
+        "id": module.get("id") or str(uuid.uuid4()),
+        "course_id": course_id,
+        "position": position,
+        "title": module.get("title", f"Module {position + 1}"),
+        "description": module.get("description", ""),
+        "objectives": module.get("objectives", []),
+        "lessons": module.get("lessons", []),
+        "quiz_id": module.get("quiz_id"),
+        "duration_hours": module.get("duration_hours", 4),
+        "version": module.get("version", 1),
+        "updated_at": datetime.now(timezone.utc).isoformat()
+    }
+
+
+def split_modules(course_id: str, modules: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """Split inline modules into the course outline and their content documents"""
+    documents = [module_document(course_id, position, module) for position, module in enumerate(modules or [])]
+    return [outline(document) for document in documents], documents
+
+
+class ModuleIdConflict(ValueError):
+    """Module ids in a write that belong to another course or repeat within the write"""
+
+    def __init__(self, ids: List[str]):
+        super().__init__(f"Module ids already in use: {', '.join(sorted(ids))}")
+        self.ids = ids
+
+
+async def check_module_ids(db, course_id: str, documents: List[Dict[str, Any]]):
+    """Raise ModuleIdConflict unless every id in ``documents`` is unique and free or owned by ``course_id``"""
+    ids = [document["id"] for document in documents]
+    repeated = {module_id for module_id in ids if ids.count(module_id) > 1}
+    foreign = {
+        doc["id"] async for doc in db.course_modules.find(
+            {"id": {"$in": ids}, "course_id": {"$ne": course_id}}, {"_id": 0, "id": 1}
+        )
+    } if ids else set()
+    if repeated or foreign:
+        raise ModuleIdConflict(list(repeated | foreign))
+
+
+async def save_modules(db, course_id: str, modules: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Replace a course's module content with ``modules`` and return the new outline.
+
+    Modules are matched by id. Fields a module entry omits (e.g. ``lessons``
+    when a client sends back the outline) keep their stored content, and only
+    modules whose content changed get a new version. Modules missing from the
+    list are removed. Raises ModuleIdConflict, before writing anything, when
+    a module id belongs to another course.
+    """
+    existing = {doc["id"]: doc async for doc in db.course_modules.find({"course_id": course_id}, {"_id": 0})}
+    documents = []
+    changed = []
+    for position, module in enumerate(modules or []):
+        stored = existing.get(module.get("id"))
+        if stored is None:
+            documents.append(module_document(course_id, position, module))
+            continue
+        document = module_document(course_id, position, {**stored, **module, "version": stored.get("version", 1)})
+        if any(document[field] != stored.get(field) for field in (*CONTENT_FIELDS, "position")):
+            document["version"] += 1
+            changed.append(document)
+        documents.append(document)
+    await check_module_ids(db, course_id, documents)
+    for document in changed:
+        await db.course_modules.replace_one({"id": document["id"]}, document)
+    new_documents = [document for document in documents if document["id"] not in existing]
+    if new_documents:
+        await db.course_modules.insert_many(new_documents)
+    await db.course_modules.delete_many({"course_id": course_id, "id": {"$nin": [doc["id"] for doc in documents]}})
+    return [outline(document) for document in documents]
+
+
+async def migrate_inline_modules(db):
+    """Move lesson content still embedded in course documents into course_modules (idempotent)"""
+    async for course in db.courses.find({}, {"_id": 0, "id": 1, "modules": 1}):
+        modules = course.get("modules") or []
+        if all(is_outline(module) for module in modules):
+            continue
+        outlines, documents = split_modules(course["id"], modules)
+        for document in documents:
+            await db.course_modules.update_one({"id": document["id"]}, {"$setOnInsert": document}, upsert=True)
+        await db.courses.update_one({"id": course["id"]}, {"$set": {"modules": outlines}})
+
+
+async def ensure_indexes(db):
+    await db.course_modules.create_index("id", unique=True)
+    await db.course_modules.create_index([("course_id", 1), ("position", 1)])
@@ -0,0 +1,253 @@
+"""Request deadlines, outbound call timeouts and circuit breakers.
+
+Every HTTP request gets a time budget when it enters ``DeadlineMiddleware``
+(``ROUTE_BUDGETS`` by path prefix, else ``REQUEST_BUDGET_SECONDS``).
+Streaming routes (events, exports, imports) have no budget. The budget
+propagates in two ways:
+
+- Mongo: the request runs inside ``pymongo.timeout(budget)``. PyMongo's
+  client-side operation timeout then sends the remaining time as
+  ``maxTimeMS`` with every command and bounds connection checkout and
+  socket reads too. Motor copies the context into its executor threads.
+- LLM and Stripe: ``call_external`` awaits the call with the smaller of the
+  service timeout and what is left of the request budget.
+
+A request that runs out of budget gets a 504. ``call_external`` also goes
+through a per-service ``CircuitBreaker``. After
+``BREAKER_FAILURE_THRESHOLD`` consecutive failures or timeouts the breaker
+opens, and calls fail fast with a 503 and ``Retry-After`` instead of
+queueing behind a degraded provider. After ``BREAKER_RESET_SECONDS`` one
+trial call is let through; its outcome closes or re-opens the breaker.
+
+Only provider failures count against the breaker: timeouts, transport
+errors and 5xx answers (``is_provider_failure``). Client errors such as a
+4xx answer, a bad argument or an invalid webhook signature are caused by
+the caller, not the provider. They pass through without opening the
+breaker, so nobody can trip it by sending bad input.
+"""
+
+import asyncio
+import contextvars
+import json
+import logging
+import math
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+import pymongo
+from fastapi import HTTPException
+from pymongo.errors import PyMongoError, ServerSelectionTimeoutError
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+REQUEST_BUDGET_SECONDS = float(os.environ.get('REQUEST_BUDGET_SECONDS', '10'))
+AI_REQUEST_BUDGET_SECONDS = float(os.environ.get('AI_REQUEST_BUDGET_SECONDS', '90'))
+PAYMENT_REQUEST_BUDGET_SECONDS = float(os.environ.get('PAYMENT_REQUEST_BUDGET_SECONDS', '30'))
+LLM_TIMEOUT_SECONDS = float(os.environ.get('LLM_TIMEOUT_SECONDS', '60'))
+STRIPE_TIMEOUT_SECONDS = float(os.environ.get('STRIPE_TIMEOUT_SECONDS', '15'))
+BREAKER_FAILURE_THRESHOLD = int(os.environ.get('BREAKER_FAILURE_THRESHOLD', '5'))
+BREAKER_RESET_SECONDS = float(os.environ.get('BREAKER_RESET_SECONDS', '30'))
+MONGO_RETRY_AFTER_SECONDS = int(os.environ.get('MONGO_RETRY_AFTER_SECONDS', '5'))
+
+# First matching prefix wins; None means no deadline (long-lived or streaming responses)
+ROUTE_BUDGETS: Tuple[Tuple[str, Optional[float]], ...] = (
+    ("/api/events", None),
+    ("/api/admin/exports", None),
+    ("/api/admin/imports", None),
+    ("/api/ai/", AI_REQUEST_BUDGET_SECONDS),
+    ("/api/payments/", PAYMENT_REQUEST_BUDGET_SECONDS),
+    ("/api/webhook/", PAYMENT_REQUEST_BUDGET_SECONDS),
+)
+
+deadline_exceeded_total = metrics.registry.counter(
+    "rtc_deadline_exceeded_total", "Requests or calls that ran out of time budget", ("where",))
+breaker_state = metrics.registry.gauge(
+    "rtc_circuit_breaker_open", "1 while a service's circuit breaker is open", ("service",))
+breaker_rejections_total = metrics.registry.counter(
+    "rtc_circuit_breaker_rejections_total", "Calls failed fast by an open circuit breaker", ("service",))
+
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("request_deadline", default=None)
+
+
+def budget_for(path: str) -> Optional[float]:
+    for prefix, budget in ROUTE_BUDGETS:
+        if path.startswith(prefix):
+            return budget
+    return REQUEST_BUDGET_SECONDS
+
+
+def remaining() -> Optional[float]:
+    """Seconds left in the current request's budget, or None outside a budgeted request"""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+# Class names of transport-level errors in the provider SDKs (stripe, openai, litellm, aiohttp, httpx)
+TRANSPORT_ERROR_MARKERS = ("Connection", "Timeout", "Transport", "Network", "Disconnected")
+
+
+def _status_of(error: BaseException) -> Optional[int]:
+    for attribute in ("http_status", "status_code", "status"):
+        status = getattr(error, attribute, None)
+        if isinstance(status, int):
+            return status
+    return None
+
+
+def is_provider_failure(error: BaseException) -> bool:
+    """True for timeouts, transport errors and 5xx answers; False for client and verification errors"""
+    if isinstance(error, (asyncio.TimeoutError, OSError)):
+        return True
+    status = _status_of(error)
+    if status is not None:
+        return status >= 500
+    return any(marker in cls.__name__ for cls in type(error).__mro__ for marker in TRANSPORT_ERROR_MARKERS)
+
+
+def _retry_after(seconds: float) -> Dict[str, str]:
+    return {"Retry-After": str(max(1, math.ceil(seconds)))}
+
+
+class CircuitBreaker:
+    def __init__(self, service: str, failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+                 reset_timeout: float = BREAKER_RESET_SECONDS):
+        self.service = service
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_in_flight = False
+
+    def retry_after(self) -> Optional[float]:
+        """None if a call may proceed, else seconds until the breaker lets a trial call through"""
+        if self.opened_at is None:
+            return None
+        wait = self.opened_at + self.reset_timeout - time.monotonic()
+        if wait > 0 or self._trial_in_flight:
+            return max(wait, 1.0)
+        self._trial_in_flight = True
+        return None
+
+    def release_trial(self):
+        """The trial call ended without an outcome (cancelled or never sent)"""
+        self._trial_in_flight = False
+
+    def record_success(self):
+        if self.opened_at is not None:
+            logger.info(f"Circuit breaker for {self.service} closed")
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+        breaker_state.set(0, service=self.service)
+
+    def record_failure(self):
+        self.failures += 1
+        self._trial_in_flight = False
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            if self.opened_at is None:
+                logger.warning(f"Circuit breaker for {self.service} opened after {self.failures} failures")
+            self.opened_at = time.monotonic()
+            breaker_state.set(1, service=self.service)
+
+
+breakers: Dict[str, CircuitBreaker] = {
+    "llm": CircuitBreaker("llm"),
+    "stripe": CircuitBreaker("stripe"),
+}
+
+SERVICE_TIMEOUTS = {"llm": LLM_TIMEOUT_SECONDS, "stripe": STRIPE_TIMEOUT_SECONDS}
+SERVICE_LABELS = {"llm": "AI service", "stripe": "Payment provider"}
+
+
+async def call_external(service: str, operation: str, fn: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+    """Await ``fn(*args, **kwargs)`` under the service timeout, the request deadline and the breaker"""
+    breaker = breakers[service]
+    wait = breaker.retry_after()
+    if wait is not None:
+        breaker_rejections_total.inc(service=service)
+        raise HTTPException(status_code=503, detail=f"{SERVICE_LABELS[service]} is temporarily unavailable",
+                            headers=_retry_after(wait))
+
+    timeout = SERVICE_TIMEOUTS[service]
+    left = remaining()
+    if left is not None:
+        if left <= 0:
+            breaker.release_trial()
+            deadline_exceeded_total.inc(where=service)
+            raise HTTPException(status_code=504, detail="Request deadline exceeded")
+        timeout = min(timeout, left)
+
+    try:
+        async with metrics.track_external(service, operation):
+            result = await asyncio.wait_for(fn(*args, **kwargs), timeout)
+    except asyncio.TimeoutError:
+        breaker.record_failure()
+        deadline_exceeded_total.inc(where=service)
+        raise HTTPException(status_code=504, detail=f"{SERVICE_LABELS[service]} timed out")
+    except asyncio.CancelledError:
+        breaker.release_trial()
+        raise
+    except Exception as e:
+        if is_provider_failure(e):
+            breaker.record_failure()
+        elif _status_of(e) is not None:
+            # The provider answered; a 4xx says nothing bad about its health
+            breaker.record_success()
+        else:
+            breaker.release_trial()
+        raise
+    breaker.record_success()
+    return result
+
+
+async def send_error(send, status: int, detail: str, headers: Optional[Dict[str, str]] = None):
+    body = json.dumps({"detail": detail}).encode()
+    raw_headers = [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+    raw_headers.extend((name.lower().encode(), value.encode()) for name, value in (headers or {}).items())
+    await send({"type": "http.response.start", "status": status, "headers": raw_headers})
+    await send({"type": "http.response.body", "body": body})
+
+
+class DeadlineMiddleware:
+    """Give each HTTP request a budget that bounds its Mongo and outbound calls"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        budget = budget_for(scope["path"])
+        if budget is None:
+            return await self.app(scope, receive, send)
+
+        started = False
+
+        async def send_wrapper(message):
+            nonlocal started
+            if message["type"] == "http.response.start":
+                started = True
+            await send(message)
+
+        token = _deadline.set(time.monotonic() + budget)
+        try:
+            with pymongo.timeout(budget):
+                await asyncio.wait_for(self.app(scope, receive, send_wrapper), budget)
+        except asyncio.TimeoutError:
+            deadline_exceeded_total.inc(where="request")
+            if not started:
+                await send_error(send, 504, "Request deadline exceeded")
+        except PyMongoError as e:
+            if started or not e.timeout:
+                raise
+            if isinstance(e, ServerSelectionTimeoutError):
+                # Database unreachable: shed load rather than queue more requests behind it
+                await send_error(send, 503, "Database temporarily unavailable", _retry_after(MONGO_RETRY_AFTER_SECONDS))
+            else:
+                deadline_exceeded_total.inc(where="mongo")
+                await send_error(send, 504, "Request deadline exceeded")
+        finally:
+            _deadline.reset(token)
@@ -0,0 +1,230 @@
+"""Slow-query profiler.
+
+``SlowQueryProfiler`` is a pymongo ``CommandListener`` that samples commands
+issued by the request handlers. A sampled command slower than
+``SLOW_QUERY_THRESHOLD_MS`` is re-run through ``explain`` (executionStats) on
+the event loop, and the resulting plan is summarised: stages used, whether it
+was a ``COLLSCAN``, and how many documents were examined per document
+returned. Records are aggregated per query shape (literal values replaced by
+placeholders) together with the routes that issued them, and the worst
+offenders are listed by the admin diagnostics endpoint.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from pymongo import monitoring
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+SLOW_QUERY_THRESHOLD_MS = float(os.environ.get('SLOW_QUERY_THRESHOLD_MS', '100'))
+SLOW_QUERY_SAMPLE_RATE = float(os.environ.get('SLOW_QUERY_SAMPLE_RATE', '1.0'))
+SLOW_QUERY_EXAMINED_RATIO = float(os.environ.get('SLOW_QUERY_EXAMINED_RATIO', '100'))
+SLOW_QUERY_EXPLAIN_INTERVAL = float(os.environ.get('SLOW_QUERY_EXPLAIN_INTERVAL', '300'))
+SLOW_QUERY_MAX_SHAPES = int(os.environ.get('SLOW_QUERY_MAX_SHAPES', '500'))
+
+# Commands explain understands and that carry a query worth profiling
+EXPLAINABLE_COMMANDS = {"find", "aggregate", "count", "distinct", "findAndModify", "update", "delete"}
+
+# Query-bearing fields per command, used to build the shape
+SHAPE_FIELDS = ("filter", "query", "sort", "pipeline", "updates", "deletes", "key")
+
+slow_queries_total = metrics.registry.counter(
+    "rtc_slow_queries_total", "Sampled Mongo commands over the slow-query threshold", ("command", "collection", "flagged"))
+
+
+def query_shape(value: Any) -> Any:
+    """Replace literal values with type placeholders, keeping field names and operators"""
+    if isinstance(value, dict):
+        return {key: query_shape(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        shapes = [query_shape(item) for item in value]
+        # $in lists and similar collapse to one entry so list length does not split shapes
+        if shapes and all(shape == shapes[0] for shape in shapes):
+            return [shapes[0]]
+        return shapes
+    if isinstance(value, bool):
+        return "?bool"
+    if isinstance(value, (int, float)):
+        return "?number"
+    if value is None:
+        return None
+    return "?"
+
+
+def _walk(node: Any, key: str) -> List[Any]:
+    """Collect every value stored under ``key`` anywhere in a nested explain document"""
+    found = []
+    if isinstance(node, dict):
+        for item_key, item in node.items():
+            if item_key == key:
+                found.append(item)
+            found.extend(_walk(item, key))
+    elif isinstance(node, list):
+        for item in node:
+            found.extend(_walk(item, key))
+    return found
+
+
+def summarize_plan(explain: Dict[str, Any]) -> Dict[str, Any]:
+    """Reduce explain(executionStats) output to the fields we rank on"""
+    stages = []
+    for plan in _walk(explain, "winningPlan"):
+        stages.extend(stage for stage in _walk(plan, "stage") if isinstance(stage, str))
+    docs_examined = 0
+    keys_examined = 0
+    n_returned = 0
+    for stats in _walk(explain, "executionStats"):
+        if isinstance(stats, dict) and "totalDocsExamined" in stats:
+            docs_examined += stats.get("totalDocsExamined", 0)
+            keys_examined += stats.get("totalKeysExamined", 0)
+            n_returned += stats.get("nReturned", 0)
+    ratio = docs_examined / max(n_returned, 1)
+    collscan = "COLLSCAN" in stages
+    return {
+        "stages": list(dict.fromkeys(stages)),
+        "collscan": collscan,
+        "docs_examined": docs_examined,
+        "keys_examined": keys_examined,
+        "n_returned": n_returned,
+        "examined_ratio": round(ratio, 2),
+        "flagged": collscan or (docs_examined > 0 and ratio >= SLOW_QUERY_EXAMINED_RATIO),
+    }
+
+
+class SlowQueryProfiler(monitoring.CommandListener):
+    def __init__(self, threshold_ms: float = SLOW_QUERY_THRESHOLD_MS, sample_rate: float = SLOW_QUERY_SAMPLE_RATE):
+        self.threshold_ms = threshold_ms
+        self.sample_rate = sample_rate
+        self.enabled = threshold_ms >= 0 and sample_rate > 0
+        self.db = None
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._pending: Dict[Tuple[object, int], Dict[str, Any]] = {}
+        self._records: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def attach(self, db, loop: Optional[asyncio.AbstractEventLoop] = None):
+        """Give the profiler a database handle and loop to run explains on"""
+        self.db = db
+        self.loop = loop or asyncio.get_running_loop()
+
+    # ---------- listener callbacks (executor threads) ----------
+
+    def started(self, event):
+        if not self.enabled or event.command_name not in EXPLAINABLE_COMMANDS:
+            return
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return
+        command = {
+            key: value for key, value in event.command.items()
+            if not key.startswith("$") and key not in ("lsid", "txnNumber", "cursor", "batchSize", "readConcern", "writeConcern")
+        }
+        with self._lock:
+            self._pending[(event.connection_id, event.request_id)] = {
+                "command": command,
+                "database": event.database_name,
+                "route": metrics.current_route(),
+            }
+
+    def succeeded(self, event):
+        with self._lock:
+            sample = self._pending.pop((event.connection_id, event.request_id), None)
+        if sample is None:
+            return
+        duration_ms = event.duration_micros / 1000
+        if duration_ms >= self.threshold_ms:
+            self._record(event.command_name, sample, duration_ms)
+
+    def failed(self, event):
+        with self._lock:
+            self._pending.pop((event.connection_id, event.request_id), None)
+
+    # ---------- aggregation ----------
+
+    def _record(self, command_name: str, sample: Dict[str, Any], duration_ms: float):
+        command = sample["command"]
+        collection = command.get(command_name) if isinstance(command.get(command_name), str) else ""
+        shape = {field: query_shape(command[field]) for field in SHAPE_FIELDS if field in command}
+        key = json.dumps([collection, command_name, shape], sort_keys=True, default=str)
+        route = sample["route"] or "background"
+        now = time.time()
+
+        with self._lock:
+            record = self._records.get(key)
+            if record is None:
+                if len(self._records) >= SLOW_QUERY_MAX_SHAPES:
+                    cheapest = min(self._records, key=lambda item: self._records[item]["total_ms"])
+                    del self._records[cheapest]
+                record = self._records[key] = {
+                    "collection": collection,
+                    "command": command_name,
+                    "shape": shape,
+                    "routes": {},
+                    "count": 0,
+                    "total_ms": 0.0,
+                    "max_ms": 0.0,
+                    "first_seen": datetime.now(timezone.utc).isoformat(),
+                    "last_seen": None,
+                    "plan": None,
+                    "explained_at": 0.0,
+                }
+            record["count"] += 1
+            record["total_ms"] += duration_ms
+            record["max_ms"] = max(record["max_ms"], duration_ms)
+            record["last_seen"] = datetime.now(timezone.utc).isoformat()
+            record["routes"][route] = record["routes"].get(route, 0) + 1
+            explain_due = now - record["explained_at"] >= SLOW_QUERY_EXPLAIN_INTERVAL
+            if explain_due:
+                record["explained_at"] = now
+            flagged = bool(record["plan"] and record["plan"]["flagged"])
+
+        slow_queries_total.inc(command=command_name, collection=collection, flagged=str(flagged).lower())
+        if explain_due and self.db is not None and self.loop is not None and not self.loop.is_closed():
+            asyncio.run_coroutine_threadsafe(self._explain(key, sample["database"], command), self.loop)
+
+    async def _explain(self, key: str, database: str, command: Dict[str, Any]):
+        try:
+            explain = await self.db.client[database].command({"explain": command, "verbosity": "executionStats"})
+        except Exception as e:
+            logger.warning(f"Slow query explain failed: {e}")
+            return
+        plan = summarize_plan(explain)
+        with self._lock:
+            record = self._records.get(key)
+            if record is not None:
+                record["plan"] = plan
+        if plan["flagged"]:
+            logger.warning(
+                f"Slow query on {command.get('find') or command.get('aggregate') or key[:80]}: "
+                f"stages={plan['stages']} docsExamined={plan['docs_examined']} nReturned={plan['n_returned']}"
+            )
+
+    def top_offenders(self, limit: int = 20, flagged_only: bool = False) -> List[Dict[str, Any]]:
+        with self._lock:
+            records = [dict(record, routes=dict(record["routes"])) for record in self._records.values()]
+        if flagged_only:
+            records = [record for record in records if record["plan"] and record["plan"]["flagged"]]
+        # Flagged plans first, then by total time spent
+        records.sort(key=lambda record: (not (record["plan"] or {}).get("flagged", False), -record["total_ms"]))
+        for record in records:
+            record["avg_ms"] = round(record["total_ms"] / record["count"], 2)
+            record["total_ms"] = round(record["total_ms"], 2)
+            record["max_ms"] = round(record["max_ms"], 2)
+            record.pop("explained_at", None)
+        return records[:limit]
+
+    def reset(self):
+        with self._lock:
+            self._records.clear()
+
+
+slow_query_profiler = SlowQueryProfiler()
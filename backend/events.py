@@ -0,0 +1,268 @@
+"""Real-time events for dashboards over WebSocket and Server-Sent Events.
+
+Write handlers call ``event_bus.publish(topic, type, data)``. Topics are
+``user:<id>`` for a student's own activity and ``admin`` for platform-wide
+counters. Subscribers (one per open socket or SSE stream) receive events
+through a small bounded buffer. If a slow client falls behind, its oldest
+events are dropped; clients refetch on reconnect anyway.
+
+Fan-out across workers goes through ``MongoEventRelay``. Each published event
+is batched into the capped ``events`` collection, and every worker tails that
+collection with a tailable/await cursor and delivers events from other
+workers to its local subscribers. When tailing is unavailable the bus keeps
+working in local-only mode and the relay retries.
+
+An idle subscriber is a deque plus an ``asyncio.Event``, with no timers and no
+Mongo reads, so a node can hold tens of thousands of open connections. Keep
+the worker's open-file limit (``ulimit -n``) above that.
+"""
+
+import asyncio
+import logging
+import os
+import time
+import uuid
+from collections import deque
+from datetime import datetime, timezone
+from typing import Any, Deque, Dict, Iterable, List, Optional, Set
+
+from pymongo import CursorType
+from pymongo.errors import CollectionInvalid, PyMongoError
+
+import metrics
+from coordination import worker_id
+
+logger = logging.getLogger(__name__)
+
+EVENTS_ENABLED = os.environ.get('EVENTS_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+EVENTS_BUFFER_SIZE = int(os.environ.get('EVENTS_BUFFER_SIZE', '64'))
+EVENTS_HEARTBEAT_SECONDS = float(os.environ.get('EVENTS_HEARTBEAT_SECONDS', '25'))
+EVENTS_CAPPED_SIZE_BYTES = int(os.environ.get('EVENTS_CAPPED_SIZE_BYTES', str(16 * 1024 * 1024)))
+EVENTS_RELAY_RETRY_SECONDS = float(os.environ.get('EVENTS_RELAY_RETRY_SECONDS', '30'))
+
+ADMIN_TOPIC = "admin"
+
+events_published_total = metrics.registry.counter(
+    "rtc_events_published_total", "Events published by type and origin", ("type", "origin"))
+events_delivered_total = metrics.registry.counter(
+    "rtc_events_delivered_total", "Events queued to subscribers", ("transport",))
+events_dropped_total = metrics.registry.counter(
+    "rtc_events_dropped_total", "Events dropped because a subscriber buffer was full", ("transport",))
+event_subscribers = metrics.registry.gauge(
+    "rtc_event_subscribers", "Open event subscriptions", ("transport",))
+event_relay_mode = metrics.registry.gauge(
+    "rtc_event_relay_mode", "1 for the active cross-worker relay mode", ("mode",))
+
+
+def user_topic(user_id: str) -> str:
+    return f"user:{user_id}"
+
+
+class Subscription:
+    """Bounded event buffer for one connection"""
+
+    __slots__ = ("topics", "transport", "_buffer", "_ready", "closed")
+
+    def __init__(self, topics: Iterable[str], transport: str, buffer_size: int = EVENTS_BUFFER_SIZE):
+        self.topics = tuple(topics)
+        self.transport = transport
+        self._buffer: Deque[Dict[str, Any]] = deque(maxlen=buffer_size)
+        self._ready = asyncio.Event()
+        self.closed = False
+
+    def push(self, event: Dict[str, Any]):
+        if len(self._buffer) == self._buffer.maxlen:
+            events_dropped_total.inc(transport=self.transport)
+        self._buffer.append(event)
+        self._ready.set()
+
+    async def next(self, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """Next event, or None on timeout (used for heartbeats)"""
+        if not self._buffer:
+            self._ready.clear()
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                return None
+        return self._buffer.popleft() if self._buffer else None
+
+
+class EventBus:
+    def __init__(self):
+        self._subscribers: Dict[str, Set[Subscription]] = {}
+        self.relay: Optional["MongoEventRelay"] = None
+
+    def subscribe(self, topics: Iterable[str], transport: str) -> Subscription:
+        subscription = Subscription(topics, transport)
+        for topic in subscription.topics:
+            self._subscribers.setdefault(topic, set()).add(subscription)
+        event_subscribers.inc(transport=transport)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        if subscription.closed:
+            return
+        subscription.closed = True
+        for topic in subscription.topics:
+            subscribers = self._subscribers.get(topic)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[topic]
+        event_subscribers.dec(transport=subscription.transport)
+
+    def publish(self, topic: str, event_type: str, data: Optional[Dict[str, Any]] = None):
+        """Deliver an event locally and hand it to the relay for other workers"""
+        if not EVENTS_ENABLED:
+            return
+        event = {
+            "id": uuid.uuid4().hex,
+            "topic": topic,
+            "type": event_type,
+            "data": data or {},
+            "published_at": datetime.now(timezone.utc).isoformat()
+        }
+        events_published_total.inc(type=event_type, origin="local")
+        self.deliver(event)
+        if self.relay is not None:
+            self.relay.enqueue(event)
+
+    def deliver(self, event: Dict[str, Any]):
+        for subscription in self._subscribers.get(event["topic"], ()):
+            subscription.push(event)
+            events_delivered_total.inc(transport=subscription.transport)
+
+    def subscriber_count(self) -> int:
+        return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+
+class MongoEventRelay:
+    """Cross-worker fan-out through a capped collection"""
+
+    def __init__(self, db, bus: EventBus, collection: str = "events"):
+        self.db = db
+        self.bus = bus
+        self.collection = db[collection]
+        self.collection_name = collection
+        self.origin = worker_id()
+        self.mode = "starting"
+        self._outbox: Deque[Dict[str, Any]] = deque(maxlen=10000)
+        self._outbox_ready = asyncio.Event()
+
+    def enqueue(self, event: Dict[str, Any]):
+        self._outbox.append(event)
+        self._outbox_ready.set()
+
+    def _set_mode(self, mode: str):
+        if mode == self.mode:
+            return
+        self.mode = mode
+        for name in ("relay", "local_only"):
+            event_relay_mode.set(1 if name == mode else 0, mode=name)
+        logger.info(f"Event relay mode: {mode}")
+
+    async def _ensure_collection(self):
+        try:
+            await self.db.create_collection(self.collection_name, capped=True, size=EVENTS_CAPPED_SIZE_BYTES)
+        except CollectionInvalid:
+            pass
+
+    async def _writer(self):
+        """Batch outgoing events into the capped collection"""
+        while True:
+            await self._outbox_ready.wait()
+            self._outbox_ready.clear()
+            if self.mode != "relay":
+                # Nobody is tailing; other workers would never see these
+                self._outbox.clear()
+                continue
+            batch: List[Dict[str, Any]] = []
+            while self._outbox:
+                event = self._outbox.popleft()
+                batch.append({**event, "origin": self.origin, "created_at": datetime.now(timezone.utc)})
+            if not batch:
+                continue
+            try:
+                await self.collection.insert_many(batch, ordered=False)
+            except PyMongoError as e:
+                logger.warning(f"Dropped {len(batch)} events for other workers: {e}")
+
+    async def _resume_point(self, after: Optional[Any]) -> Optional[Any]:
+        """``_id`` to resume after: ``after`` while it is still in the collection, else the newest document"""
+        if after is not None and await self.collection.find_one({"_id": after}, {"_id": 1}):
+            return after
+        if after is not None:
+            logger.warning("Event relay fell behind the capped collection; resuming at its end")
+        last = await self.collection.find_one({}, {"_id": 1}, sort=[("$natural", -1)])
+        return last["_id"] if last else None
+
+    async def _tail(self):
+        # Position by the last document in natural (insertion) order rather than by time, so events
+        # from hosts with a lagging clock are not skipped. An unfiltered tailable cursor only dies
+        # on an empty collection, where re-opening it costs nothing.
+        after = await self._resume_point(None)
+        while True:
+            cursor = self.collection.find(
+                {},
+                cursor_type=CursorType.TAILABLE_AWAIT,
+                max_await_time_ms=int(EVENTS_HEARTBEAT_SECONDS * 1000)
+            )
+            self._set_mode("relay")
+            skipping = after is not None
+            while cursor.alive:
+                async for doc in cursor:
+                    if skipping:
+                        skipping = doc["_id"] != after
+                        continue
+                    after = doc["_id"]
+                    if doc.get("origin") == self.origin:
+                        continue
+                    doc.pop("_id", None)
+                    doc.pop("origin", None)
+                    doc.pop("created_at", None)
+                    events_published_total.inc(type=doc.get("type", ""), origin="relay")
+                    self.bus.deliver(doc)
+                # Drained without meeting ``after``: it was overwritten, so whatever arrives next is new
+                skipping = False
+                # getMore already waited server-side; this only guards against drivers that return at once
+                await asyncio.sleep(0.05)
+            await asyncio.sleep(0.1)
+            if after is not None:
+                after = await self._resume_point(after)
+
+    async def run(self):
+        """Relay events between workers until cancelled"""
+        writer = asyncio.create_task(self._writer())
+        try:
+            while True:
+                started = time.monotonic()
+                try:
+                    await self._ensure_collection()
+                    await self._tail()
+                except asyncio.CancelledError:
+                    raise
+                except (PyMongoError, NotImplementedError) as e:
+                    if self.mode != "local_only":
+                        logger.warning(f"Event relay unavailable, delivering events locally only: {e}")
+                except Exception:
+                    logger.exception("Event relay crashed; delivering events locally only")
+                self._set_mode("local_only")
+                delay = EVENTS_RELAY_RETRY_SECONDS if time.monotonic() - started < 1 else 1
+                await asyncio.sleep(delay)
+        finally:
+            writer.cancel()
+
+
+event_bus = EventBus()
+
+
+def publish_counters(**deltas: float):
+    """Push analytics overview deltas (e.g. ``total_enrollments=1``) to admin dashboards"""
+    event_bus.publish(ADMIN_TOPIC, "counters.updated", deltas)
+
+
+def start_relay(db) -> Optional[asyncio.Task]:
+    if not EVENTS_ENABLED:
+        return None
+    event_bus.relay = MongoEventRelay(db, event_bus)
+    return asyncio.create_task(event_bus.relay.run())
@@ -0,0 +1,151 @@
+"""Streaming admin exports.
+
+``/api/admin/exports/{dataset}`` streams users, enrollments or payment
+transactions as NDJSON or CSV straight from a Mongo cursor. Documents are
+fetched ``EXPORT_BATCH_SIZE`` at a time with a projection limited to the
+exported fields, encoded row by row and flushed in chunks of about
+``EXPORT_CHUNK_BYTES``, so memory stays flat whether the export has a thousand
+rows or millions.
+
+Rows are ordered by ``_id`` and every row carries it as ``cursor``. An
+interrupted export resumes with ``?after=<last cursor received>``, and the
+same parameter can split a large export into ranges.
+
+CSV text cells that a spreadsheet would read as a formula (starting with
+``=``, ``+``, ``-``, ``@``, tab or carriage return) are prefixed with ``'``.
+Names and emails are user input, so a cell like ``=HYPERLINK(...)`` would
+otherwise run when an admin opens the file.
+"""
+
+import csv
+import io
+import os
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
+
+from bson import ObjectId
+from bson.errors import InvalidId
+
+import metrics
+import serialization
+
+EXPORT_BATCH_SIZE = int(os.environ.get('EXPORT_BATCH_SIZE', '2000'))
+EXPORT_CHUNK_BYTES = int(os.environ.get('EXPORT_CHUNK_BYTES', str(64 * 1024)))
+
+FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+export_rows_total = metrics.registry.counter(
+    "rtc_export_rows_total", "Rows streamed by admin exports", ("dataset", "format"))
+
+
+@dataclass(frozen=True)
+class Dataset:
+    collection: str
+    fields: Tuple[str, ...]
+    filters: Tuple[str, ...]
+    date_field: str
+
+
+DATASETS: Dict[str, Dataset] = {
+    "users": Dataset(
+        collection="users",
+        fields=("id", "email", "full_name", "role", "created_at", "profile_image"),
+        filters=("role",),
+        date_field="created_at"
+    ),
+    "enrollments": Dataset(
+        collection="enrollments",
+        fields=("id", "user_id", "course_id", "status", "progress", "enrolled_at", "completed_at", "payment_id"),
+        filters=("status", "course_id", "user_id"),
+        date_field="enrolled_at"
+    ),
+    "transactions": Dataset(
+        collection="payment_transactions",
+        fields=("id", "session_id", "user_id", "course_id", "amount", "currency", "status", "payment_status", "created_at"),
+        filters=("status", "payment_status", "course_id", "user_id"),
+        date_field="created_at"
+    ),
+}
+
+
+class ExportError(ValueError):
+    """Invalid export parameters"""
+
+
+def build_query(dataset: Dataset, filters: Dict[str, Optional[str]], since: Optional[str],
+                until: Optional[str], after: Optional[str]) -> Dict[str, Any]:
+    query: Dict[str, Any] = {}
+    for name, value in filters.items():
+        if value is None:
+            continue
+        if name not in dataset.filters:
+            raise ExportError(f"Filter '{name}' is not supported for this export")
+        query[name] = value
+    # Timestamps are stored as ISO-8601 UTC strings, which compare chronologically
+    date_range = {}
+    if since:
+        date_range["$gte"] = since
+    if until:
+        date_range["$lt"] = until
+    if date_range:
+        query[dataset.date_field] = date_range
+    if after:
+        try:
+            query["_id"] = {"$gt": ObjectId(after)}
+        except (InvalidId, TypeError):
+            raise ExportError("Invalid 'after' cursor")
+    return query
+
+
+FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+
+def csv_cell(value: Any) -> Any:
+    """Neutralise spreadsheet formulas in text cells; numbers and other values pass through"""
+    if value is None:
+        return ""
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def _csv_line(values) -> str:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerow(values)
+    return buffer.getvalue()
+
+
+async def stream_rows(db, name: str, query: Dict[str, Any], fmt: str, limit: Optional[int] = None) -> AsyncIterator[bytes]:
+    dataset = DATASETS[name]
+    projection = {field: 1 for field in dataset.fields}
+    cursor = db[dataset.collection].find(query, projection).sort("_id", 1).batch_size(EXPORT_BATCH_SIZE)
+    if limit:
+        cursor = cursor.limit(limit)
+
+    chunk = []
+    size = 0
+    rows = 0
+    if fmt == "csv":
+        header = _csv_line(("cursor", *dataset.fields)).encode()
+        chunk.append(header)
+        size += len(header)
+
+    async for doc in cursor:
+        if fmt == "csv":
+            line = _csv_line((str(doc["_id"]), *(csv_cell(doc.get(field)) for field in dataset.fields))).encode()
+        else:
+            row = {"cursor": str(doc["_id"])}
+            row.update((field, doc.get(field)) for field in dataset.fields)
+            line = serialization.dumps(row) + b"\n"
+        chunk.append(line)
+        size += len(line)
+        rows += 1
+        if size >= EXPORT_CHUNK_BYTES:
+            yield b"".join(chunk)
+            export_rows_total.inc(rows, dataset=name, format=fmt)
+            chunk, size, rows = [], 0, 0
+
+    if chunk:
+        yield b"".join(chunk)
+    if rows:
+        export_rows_total.inc(rows, dataset=name, format=fmt)
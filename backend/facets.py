@@ -0,0 +1,205 @@
+"""Precomputed facet counts for the published course catalog.
+
+``/courses/facets`` answers "how many courses per course type, price band,
+credit hours and duration" for whatever search and filters the catalog page
+has applied. Instead of running a ``$facet`` aggregation per request,
+``FacetIndex`` keeps the published catalog in memory as parallel arrays (one
+slot per course) plus one bitmap per facet value. Python ints serve as the
+bitmaps: bit ``i`` is set when the course in slot ``i`` has that value.
+
+Counts for a facet apply every active filter except the facet's own, so the
+UI can show how many results each alternative value would give. Filtering is
+bitwise AND over the bitmaps, and a search term is matched as a literal,
+case-insensitive substring of the in-memory titles and descriptions (the
+same match as ``get_courses``). It is never compiled as a regex, because a
+pathological pattern would block the event loop on every title.
+
+The index is loaded once, then kept current incrementally. Course writes on
+any worker reach ``mark_stale`` (directly or via the invalidation registry),
+and the next read re-fetches only those courses and updates their slots.
+Like the other caches, the index is also rebuilt once its ``ttl`` passes,
+which bounds staleness while change streams are unavailable.
+"""
+
+import asyncio
+import os
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from cache import CACHE_TTL_SHORT
+
+FACETS = ("course_type", "price_band", "credit_hours", "duration_months")
+# Longer catalog search terms are rejected with a 422
+SEARCH_MAX_LENGTH = int(os.environ.get('CATALOG_SEARCH_MAX_LENGTH', '100'))
+
+# (key, lower bound inclusive, upper bound exclusive)
+PRICE_BANDS = (
+    ("free", 0, 0.01),
+    ("under_500", 0.01, 500),
+    ("500_999", 500, 1000),
+    ("1000_2499", 1000, 2500),
+    ("2500_plus", 2500, float("inf")),
+)
+
+INDEX_FIELDS = {"_id": 0, "id": 1, "title": 1, "description": 1, "is_published": 1,
+                "course_type": 1, "price": 1, "credit_hours": 1, "duration_months": 1}
+
+
+def price_band(price: Any) -> Optional[str]:
+    try:
+        price = float(price)
+    except (TypeError, ValueError):
+        return None
+    for key, low, high in PRICE_BANDS:
+        if low <= price < high:
+            return key
+    return None
+
+
+def facet_values(course: Dict[str, Any]) -> Dict[str, str]:
+    """Facet value per facet for a course; values are strings, as they arrive in query parameters"""
+    values = {
+        "course_type": course.get("course_type"),
+        "price_band": price_band(course.get("price")),
+        "credit_hours": course.get("credit_hours"),
+        "duration_months": course.get("duration_months"),
+    }
+    return {facet: str(value) for facet, value in values.items() if value is not None}
+
+
+def search_key(search: str) -> str:
+    return search.casefold()
+
+
+class FacetIndex:
+    def __init__(self, ttl: float = CACHE_TTL_SHORT):
+        self.ttl = ttl
+        self.loaded_at: Optional[float] = None
+        self._stale: Set[str] = set()
+        self._reload = True
+        self._lock = asyncio.Lock()
+        self._clear()
+
+    def _clear(self):
+        self._slots: Dict[str, int] = {}
+        self._free: List[int] = []
+        self._text: List[Tuple[str, ...]] = []
+        self._values: List[Dict[str, str]] = []
+        self._bitmaps: Dict[str, Dict[str, int]] = {facet: defaultdict(int) for facet in FACETS}
+        self._all = 0
+
+    def mark_stale(self, course_id: Optional[str] = None):
+        """Refresh ``course_id`` on the next read; None rebuilds the whole index"""
+        if course_id is None:
+            self._reload = True
+        else:
+            self._stale.add(course_id)
+
+    def _remove(self, course_id: str):
+        slot = self._slots.pop(course_id, None)
+        if slot is None:
+            return
+        bit = 1 << slot
+        for facet, value in self._values[slot].items():
+            bitmap = self._bitmaps[facet]
+            bitmap[value] &= ~bit
+            if not bitmap[value]:
+                del bitmap[value]
+        self._all &= ~bit
+        self._text[slot] = ()
+        self._values[slot] = {}
+        self._free.append(slot)
+
+    def _add(self, course: Dict[str, Any]):
+        self._remove(course["id"])
+        if not course.get("is_published"):
+            return
+        if self._free:
+            slot = self._free.pop()
+        else:
+            slot = len(self._text)
+            self._text.append(())
+            self._values.append({})
+        bit = 1 << slot
+        values = facet_values(course)
+        for facet, value in values.items():
+            self._bitmaps[facet][value] |= bit
+        self._slots[course["id"]] = slot
+        self._text[slot] = (search_key(course.get("title") or ""), search_key(course.get("description") or ""))
+        self._values[slot] = values
+        self._all |= bit
+
+    async def refresh(self, db):
+        """Apply pending rebuilds / per-course refreshes before a read"""
+        if self.loaded_at is not None and time.monotonic() - self.loaded_at > self.ttl:
+            self._reload = True
+        if not self._reload and not self._stale:
+            return
+        async with self._lock:
+            if self._reload:
+                # Courses marked stale while the catalog loads are refreshed right after it
+                self._reload = False
+                self._stale.clear()
+                try:
+                    loaded_at = time.monotonic()
+                    courses = await db.courses.find({"is_published": True}, INDEX_FIELDS).to_list(None)
+                except Exception:
+                    self._reload = True
+                    raise
+                self._clear()
+                for course in courses:
+                    self._add(course)
+                self.loaded_at = loaded_at
+            if not self._stale:
+                return
+            stale, self._stale = self._stale, set()
+            try:
+                found = {course["id"]: course async for course in db.courses.find({"id": {"$in": list(stale)}}, INDEX_FIELDS)}
+            except Exception:
+                self._stale |= stale
+                raise
+            # Free every stale slot first so re-added courses reuse them instead of growing the bitmaps
+            for course_id in stale:
+                self._remove(course_id)
+            for course in found.values():
+                self._add(course)
+
+    def _match(self, filters: Dict[str, Optional[str]], skip: Optional[str], base: int) -> int:
+        mask = base
+        for facet, value in filters.items():
+            if value is None or facet == skip:
+                continue
+            mask &= self._bitmaps[facet].get(value, 0)
+        return mask
+
+    def _search_mask(self, search: Optional[str]) -> int:
+        if not search:
+            return self._all
+        needle = search_key(search)
+        mask = 0
+        for slot in self._slots.values():
+            if any(needle in text for text in self._text[slot]):
+                mask |= 1 << slot
+        return mask
+
+    def counts(self, filters: Dict[str, Optional[str]], search: Optional[str] = None) -> Dict[str, Any]:
+        base = self._search_mask(search)
+        facets = {}
+        for facet in FACETS:
+            mask = self._match(filters, facet, base)
+            counts = {value: (bitmap & mask).bit_count() for value, bitmap in self._bitmaps[facet].items()}
+            facets[facet] = {value: count for value, count in sorted(counts.items(), key=_facet_order(facet)) if count}
+        return {"total": self._match(filters, None, base).bit_count(), "facets": facets}
+
+
+def _facet_order(facet: str):
+    if facet == "price_band":
+        order = {key: position for position, (key, _, _) in enumerate(PRICE_BANDS)}
+        return lambda item: order.get(item[0], len(order))
+    if facet in ("credit_hours", "duration_months"):
+        return lambda item: float(item[0])
+    return lambda item: item[0]
+
+
+facet_index = FacetIndex()
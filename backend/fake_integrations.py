@@ -0,0 +1,244 @@
+"""Offline stand-ins for the emergentintegrations LLM and Stripe clients.
+
+``install()`` registers fake ``emergentintegrations`` modules in
+``sys.modules`` so the lazy imports inside the server's payment and AI
+handlers resolve to these classes instead of calling OpenAI or Stripe.
+Latencies are simulated with ``asyncio.sleep`` so benchmarks keep the
+concurrency profile of the real network calls.
+
+The Stripe fake keeps checkout sessions in ``FAKE_SESSIONS`` and moves them
+through Stripe's states: ``open``/``unpaid`` on creation, then
+``complete_session`` (``complete``/``paid``) or ``expire_session``
+(``expired``). ``webhook_event`` builds the matching Stripe event and
+``sign_webhook`` signs it the way Stripe does (``Stripe-Signature:
+t=<timestamp>,v1=<HMAC-SHA256>`` keyed by ``FAKE_WEBHOOK_SECRET``).
+``handle_webhook`` verifies that signature with ``stripe_webhooks`` and,
+like Stripe's client, only parses the event; deliveries never change
+session state, so duplicated or reordered webhooks cannot un-pay a session. ``webhook_replay.py`` drives
+webhook storms against the app with these helpers.
+"""
+
+import asyncio
+import json
+import os
+import sys
+import time
+import types
+import uuid
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+import stripe_webhooks
+
+FAKE_LATENCY = {
+    "llm": 0.8,
+    "stripe": 0.15,
+}
+
+FAKE_WEBHOOK_SECRET = os.environ.get('STRIPE_WEBHOOK_SECRET') or 'whsec_test_fake'
+
+# session_id -> {"amount": float, "currency": str, "metadata": dict, "status": str,
+#                "payment_status": str, "created": float, "paid_at": float | None}
+FAKE_SESSIONS: Dict[str, Dict[str, Any]] = {}
+
+
+async def _simulate(kind: str):
+    delay = FAKE_LATENCY.get(kind, 0)
+    if delay > 0:
+        await asyncio.sleep(delay)
+
+
+# ==================== LLM ====================
+
+@dataclass
+class UserMessage:
+    text: str
+
+
+class LlmChat:
+    def __init__(self, api_key: str, session_id: str, system_message: str):
+        self.api_key = api_key
+        self.session_id = session_id
+        self.system_message = system_message
+        self.provider = None
+        self.model = None
+
+    def with_model(self, provider: str, model: str) -> "LlmChat":
+        self.provider = provider
+        self.model = model
+        return self
+
+    async def send_message(self, message: UserMessage) -> str:
+        await _simulate("llm")
+        if "multiple choice questions" in message.text:
+            return json.dumps({"questions": [{
+                "question": "What does HTTP stand for?",
+                "options": ["HyperText Transfer Protocol", "High Transfer Text Protocol", "Host Transfer Protocol", "None"],
+                "correct_answer": 0,
+                "explanation": "HTTP is the HyperText Transfer Protocol."
+            }]})
+        return f"Fake tutor answer to: {message.text[:200]}"
+
+
+# ==================== STRIPE ====================
+
+@dataclass
+class CheckoutSessionRequest:
+    amount: float
+    currency: str
+    success_url: str
+    cancel_url: str
+    metadata: Optional[Dict[str, str]] = None
+
+
+@dataclass
+class CheckoutSessionResponse:
+    url: str
+    session_id: str
+
+
+@dataclass
+class CheckoutStatusResponse:
+    status: str
+    payment_status: str
+    amount_total: int
+    currency: str
+    metadata: Dict[str, str]
+
+
+@dataclass
+class WebhookResponse:
+    event_type: str
+    event_id: str
+    session_id: str
+    payment_status: str
+    metadata: Dict[str, str]
+
+
+class StripeCheckout:
+    def __init__(self, api_key: str, webhook_url: str):
+        self.api_key = api_key
+        self.webhook_url = webhook_url
+
+    async def create_checkout_session(self, request: CheckoutSessionRequest) -> CheckoutSessionResponse:
+        await _simulate("stripe")
+        session_id = f"cs_test_{uuid.uuid4().hex}"
+        FAKE_SESSIONS[session_id] = {
+            "amount": request.amount,
+            "currency": request.currency,
+            "metadata": request.metadata or {},
+            "status": "open",
+            "payment_status": "unpaid",
+            "created": time.time(),
+            "paid_at": None
+        }
+        return CheckoutSessionResponse(url=f"https://checkout.stripe.test/pay/{session_id}", session_id=session_id)
+
+    async def get_checkout_status(self, session_id: str) -> CheckoutStatusResponse:
+        await _simulate("stripe")
+        session = FAKE_SESSIONS.get(session_id, {"amount": 0, "currency": "usd", "metadata": {},
+                                                 "status": "open", "payment_status": "unpaid"})
+        return CheckoutStatusResponse(
+            status=session["status"],
+            payment_status=session["payment_status"],
+            amount_total=int(round(session["amount"] * 100)),
+            currency=session["currency"],
+            metadata=session["metadata"]
+        )
+
+    async def handle_webhook(self, body: bytes, signature: Optional[str]) -> WebhookResponse:
+        stripe_webhooks.verify_signature(body, signature, FAKE_WEBHOOK_SECRET)
+        event = json.loads(body)
+        session = event["data"]["object"]
+        return WebhookResponse(
+            event_type=event["type"],
+            event_id=event["id"],
+            session_id=session["id"],
+            payment_status=session["payment_status"],
+            metadata=session.get("metadata") or {}
+        )
+
+
+def complete_session(session_id: str, payment_status: str = "paid"):
+    """Complete a fake session, as if the customer finished checkout
+
+    ``payment_status="unpaid"`` models a delayed payment method; call again
+    with ``"paid"`` when the payment clears.
+    """
+    session = FAKE_SESSIONS[session_id]
+    session["status"] = "complete"
+    session["payment_status"] = payment_status
+    if payment_status == "paid" and session["paid_at"] is None:
+        session["paid_at"] = time.time()
+
+
+def expire_session(session_id: str):
+    """Expire an open fake session, as Stripe does 24 hours after creation"""
+    session = FAKE_SESSIONS[session_id]
+    if session["status"] == "open":
+        session["status"] = "expired"
+
+
+def webhook_event(session_id: str, event_type: str = "checkout.session.completed",
+                  payment_status: Optional[str] = None, event_id: Optional[str] = None) -> Dict[str, Any]:
+    """Stripe event for a fake session; payment_status defaults to the session's current one"""
+    session = FAKE_SESSIONS.get(session_id, {"amount": 0, "currency": "usd", "metadata": {},
+                                             "status": "open", "payment_status": "unpaid"})
+    return {
+        "id": event_id or f"evt_{uuid.uuid4().hex}",
+        "object": "event",
+        "type": event_type,
+        "created": int(time.time()),
+        "data": {"object": {
+            "id": session_id,
+            "object": "checkout.session",
+            "status": session["status"],
+            "payment_status": payment_status or session["payment_status"],
+            "amount_total": int(round(session["amount"] * 100)),
+            "currency": session["currency"],
+            "metadata": session["metadata"]
+        }}
+    }
+
+
+def sign_webhook(body: bytes, secret: Optional[str] = None, timestamp: Optional[int] = None) -> str:
+    """Stripe-Signature header value for ``body``"""
+    timestamp = int(time.time()) if timestamp is None else timestamp
+    return f"t={timestamp},v1={stripe_webhooks.compute_signature(body, secret or FAKE_WEBHOOK_SECRET, timestamp)}"
+
+
+def install(llm_latency: Optional[float] = None, stripe_latency: Optional[float] = None):
+    """Register the fake modules under the emergentintegrations import paths"""
+    if llm_latency is not None:
+        FAKE_LATENCY["llm"] = llm_latency
+    if stripe_latency is not None:
+        FAKE_LATENCY["stripe"] = stripe_latency
+
+    chat_module = types.ModuleType("emergentintegrations.llm.chat")
+    chat_module.LlmChat = LlmChat
+    chat_module.UserMessage = UserMessage
+
+    checkout_module = types.ModuleType("emergentintegrations.payments.stripe.checkout")
+    checkout_module.StripeCheckout = StripeCheckout
+    checkout_module.CheckoutSessionRequest = CheckoutSessionRequest
+    checkout_module.CheckoutSessionResponse = CheckoutSessionResponse
+    checkout_module.CheckoutStatusResponse = CheckoutStatusResponse
+    checkout_module.WebhookResponse = WebhookResponse
+
+    packages = {
+        "emergentintegrations": types.ModuleType("emergentintegrations"),
+        "emergentintegrations.llm": types.ModuleType("emergentintegrations.llm"),
+        "emergentintegrations.payments": types.ModuleType("emergentintegrations.payments"),
+        "emergentintegrations.payments.stripe": types.ModuleType("emergentintegrations.payments.stripe"),
+        "emergentintegrations.llm.chat": chat_module,
+        "emergentintegrations.payments.stripe.checkout": checkout_module,
+    }
+    packages["emergentintegrations"].llm = packages["emergentintegrations.llm"]
+    packages["emergentintegrations"].payments = packages["emergentintegrations.payments"]
+    packages["emergentintegrations.llm"].chat = chat_module
+    packages["emergentintegrations.payments"].stripe = packages["emergentintegrations.payments.stripe"]
+    packages["emergentintegrations.payments.stripe"].checkout = checkout_module
+    for name, module in packages.items():
+        if module not in (chat_module, checkout_module):
+            module.__path__ = []
+        sys.modules[name] = module
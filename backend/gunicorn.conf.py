@@ -0,0 +1,34 @@
+"""Gunicorn settings for running the API on every core of a box.
+
+    gunicorn -c gunicorn.conf.py
+
+Each worker is a separate process with its own event loop and Motor client,
+created after fork by ``server.create_app``. One-time startup work (seeding)
+runs on a single leader worker per cluster; see ``coordination.py``.
+
+Size the Mongo pool per worker: a node opens up to
+``WEB_CONCURRENCY x MONGO_MAX_POOL_SIZE`` connections.
+
+Point the load balancer's health check at ``/api/ready``, which fails until
+a worker has finished its warm-up (see ``warmup.py``).
+"""
+
+import multiprocessing
+import os
+
+bind = os.environ.get('BIND', '0.0.0.0:8001')
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+worker_class = "uvicorn.workers.UvicornWorker"
+wsgi_app = "server:create_app()"
+
+# Import the app in each worker so no Mongo client or asyncio state crosses fork
+preload_app = False
+
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '60'))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', '30'))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', '5'))
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', '0'))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', '0'))
+
+accesslog = "-"
+errorlog = "-"
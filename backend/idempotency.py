@@ -0,0 +1,106 @@
+"""Idempotent checkout sessions.
+
+Double-clicks, reloads and client retries of ``/payments/checkout`` used to
+create a fresh Stripe session and ``payment_transactions`` row every time.
+``create_checkout`` now resolves a request in this order:
+
+1. An ``Idempotency-Key`` header already used by this user replays the stored
+   session. Reusing a key for a different course is rejected.
+2. A still-open pending session for the same ``(user_id, course_id)``, origin
+   and price, created within ``CHECKOUT_SESSION_REUSE_SECONDS``, is returned.
+3. Otherwise the caller takes a short ``LeaderLease`` on the pair and creates
+   the session. Concurrent duplicates wait for that transaction to appear and
+   return it, across workers as well.
+"""
+
+import asyncio
+import logging
+import os
+import uuid
+from datetime import datetime, timezone, timedelta
+from typing import Dict, Optional
+
+import metrics
+from coordination import LeaderLease, worker_id
+
+logger = logging.getLogger(__name__)
+
+CHECKOUT_SESSION_REUSE_SECONDS = float(os.environ.get('CHECKOUT_SESSION_REUSE_SECONDS', '1800'))
+CHECKOUT_CLAIM_TTL = float(os.environ.get('CHECKOUT_CLAIM_TTL', '30'))
+CHECKOUT_CLAIM_WAIT_SECONDS = float(os.environ.get('CHECKOUT_CLAIM_WAIT_SECONDS', '10'))
+
+checkout_sessions_total = metrics.registry.counter(
+    "rtc_checkout_sessions_total", "Checkout requests by how the session was obtained", ("outcome",))
+
+
+class IdempotencyConflict(Exception):
+    """An Idempotency-Key was reused with different request parameters"""
+
+
+def _reusable(transaction: Dict, course_id: str, origin_url: str, amount: float) -> bool:
+    return (
+        transaction.get("checkout_url") is not None
+        and transaction.get("course_id") == course_id
+        and transaction.get("origin_url") == origin_url
+        and transaction.get("amount") == amount
+    )
+
+
+async def find_replay(db, user_id: str, course_id: str, idempotency_key: Optional[str]) -> Optional[Dict]:
+    """Transaction previously created under this user's Idempotency-Key"""
+    if not idempotency_key:
+        return None
+    transaction = await db.payment_transactions.find_one(
+        {"user_id": user_id, "idempotency_key": idempotency_key}, {"_id": 0}
+    )
+    if transaction and transaction["course_id"] != course_id:
+        raise IdempotencyConflict(idempotency_key)
+    return transaction
+
+
+async def find_open_session(db, user_id: str, course_id: str, origin_url: str, amount: float) -> Optional[Dict]:
+    """Most recent pending session for this user and course that can still be completed"""
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=CHECKOUT_SESSION_REUSE_SECONDS)
+    transaction = await db.payment_transactions.find_one(
+        {
+            "user_id": user_id,
+            "course_id": course_id,
+            "status": {"$in": ["pending", "open"]},
+            "payment_status": {"$in": ["initiated", "unpaid"]},
+            "created_at": {"$gte": cutoff.isoformat()}
+        },
+        {"_id": 0},
+        sort=[("created_at", -1)]
+    )
+    if transaction and _reusable(transaction, course_id, origin_url, amount):
+        return transaction
+    return None
+
+
+def claim(db, user_id: str, course_id: str) -> LeaderLease:
+    # Holders are per request: requests served by the same worker must exclude each other too
+    return LeaderLease(
+        db.leases, f"checkout:{user_id}:{course_id}", ttl=CHECKOUT_CLAIM_TTL,
+        holder=f"{worker_id()}:{uuid.uuid4().hex[:8]}"
+    )
+
+
+async def wait_for_session(db, user_id: str, course_id: str, origin_url: str, amount: float) -> Optional[Dict]:
+    """Wait for a concurrent request holding the claim to record its session"""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + CHECKOUT_CLAIM_WAIT_SECONDS
+    while loop.time() < deadline:
+        await asyncio.sleep(0.2)
+        transaction = await find_open_session(db, user_id, course_id, origin_url, amount)
+        if transaction:
+            return transaction
+    return None
+
+
+async def ensure_indexes(db):
+    await db.payment_transactions.create_index([("user_id", 1), ("course_id", 1), ("created_at", -1)])
+    await db.payment_transactions.create_index(
+        [("user_id", 1), ("idempotency_key", 1)],
+        unique=True,
+        partialFilterExpression={"idempotency_key": {"$type": "string"}}
+    )
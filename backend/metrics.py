@@ -0,0 +1,412 @@
+"""Prometheus-compatible metrics for the Right Tech Centre API.
+
+A tiny in-process registry (counters, gauges, histograms with labels) that
+renders the Prometheus text exposition format, plus the collectors wired into
+``server.py``:
+
+- ``MetricsMiddleware`` records latency and status per FastAPI route template.
+- ``MongoCommandListener`` times every Mongo command and attributes the count
+  and duration to the request that issued it (Motor copies contextvars into its
+  executor threads, so the listener sees the request context).
+- ``MongoPoolListener`` tracks connection-pool checkouts.
+- ``monitor_event_loop_lag`` samples scheduler delay on the event loop.
+- ``track_external`` times LLM and Stripe calls.
+
+``/metrics`` reveals per-route latency and error counts, so it is not public.
+Scrapers connecting from ``METRICS_ALLOWED_NETWORKS`` (comma-separated
+CIDRs, empty by default) need no credentials, and everyone else must
+present an admin token. Point Prometheus at the app from an allowlisted
+network, or give it an admin ``bearer_token``.
+"""
+
+import asyncio
+import contextvars
+import ipaddress
+import logging
+import os
+import threading
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from pymongo import monitoring
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.requests import Request
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+MONGO_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 50, 100)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+METRICS_ALLOWED_NETWORKS = tuple(
+    ipaddress.ip_network(network.strip(), strict=False)
+    for network in os.environ.get('METRICS_ALLOWED_NETWORKS', '').split(',') if network.strip()
+)
+
+
+def scrape_allowed(host: Optional[str]) -> bool:
+    """True if a client at ``host`` may read /metrics without credentials"""
+    if not host or not METRICS_ALLOWED_NETWORKS:
+        return False
+    try:
+        address = ipaddress.ip_address(host)
+    except ValueError:
+        return False
+    return any(address in network for network in METRICS_ALLOWED_NETWORKS)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{_escape(extra[1])}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return lines
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def by_labels(self) -> Dict[Tuple[str, ...], float]:
+        with self._lock:
+            return dict(self._values)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (), buckets: Iterable[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        # key -> [bucket counts..., sum, count]
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0.0] * (len(self.buckets) + 2)
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[index] += 1
+                    break
+            state[-2] += value
+            state[-1] += 1
+
+    def count(self, **labels) -> float:
+        state = self._values.get(self._key(labels))
+        return state[-1] if state else 0.0
+
+    def total(self, **labels) -> float:
+        state = self._values.get(self._key(labels))
+        return state[-2] if state else 0.0
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = [(key, list(state)) for key, state in self._values.items()]
+        lines = []
+        for key, state in items:
+            cumulative = 0.0
+            for index, bound in enumerate(self.buckets):
+                cumulative += state[index]
+                labels = _format_labels(self.labelnames, key, ("le", _format_value(bound)))
+                lines.append(f"{self.name}_bucket{labels} {_format_value(cumulative)}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(state[-2])}")
+            lines.append(f"{self.name}_count{labels} {_format_value(state[-1])}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: Metric) -> Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Iterable[str] = (), buckets: Iterable[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines: List[str] = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+# ==================== HTTP ====================
+
+http_requests_total = registry.counter(
+    "rtc_http_requests_total", "HTTP requests by route template, method and status code", ("method", "route", "status"))
+http_request_duration = registry.histogram(
+    "rtc_http_request_duration_seconds", "HTTP request latency by route template", ("method", "route"))
+http_requests_in_progress = registry.gauge(
+    "rtc_http_requests_in_progress", "HTTP requests currently being handled", ("method",))
+http_request_mongo_commands = registry.histogram(
+    "rtc_http_request_mongo_commands", "Mongo commands issued per request", ("method", "route"), buckets=COUNT_BUCKETS)
+http_request_mongo_duration = registry.histogram(
+    "rtc_http_request_mongo_duration_seconds", "Time spent in Mongo commands per request", ("method", "route"), buckets=MONGO_BUCKETS)
+
+# ==================== MONGO ====================
+
+mongo_commands_total = registry.counter(
+    "rtc_mongo_commands_total", "Mongo commands by command name, collection and outcome", ("command", "collection", "outcome"))
+mongo_command_duration = registry.histogram(
+    "rtc_mongo_command_duration_seconds", "Mongo command latency", ("command", "collection"), buckets=MONGO_BUCKETS)
+mongo_pool_checked_out = registry.gauge(
+    "rtc_mongo_pool_checked_out_connections", "Connections currently checked out of the Mongo pool", ("address",))
+mongo_pool_connections = registry.gauge(
+    "rtc_mongo_pool_connections", "Connections currently open in the Mongo pool", ("address",))
+mongo_pool_checkouts_total = registry.counter(
+    "rtc_mongo_pool_checkouts_total", "Connection pool checkouts by outcome", ("address", "outcome"))
+
+# ==================== RUNTIME AND EXTERNAL CALLS ====================
+
+event_loop_lag = registry.gauge("rtc_event_loop_lag_seconds", "Most recent event loop scheduling delay")
+event_loop_lag_histogram = registry.histogram(
+    "rtc_event_loop_lag_distribution_seconds", "Event loop scheduling delay samples", buckets=MONGO_BUCKETS)
+external_call_duration = registry.histogram(
+    "rtc_external_call_duration_seconds", "Latency of LLM and Stripe calls", ("service", "operation", "outcome"))
+
+
+# Per-request accumulator shared with the Mongo listener through the context
+_request_stats: contextvars.ContextVar[Optional[Dict[str, Any]]] = contextvars.ContextVar("rtc_request_stats", default=None)
+
+
+def route_template(request: Request) -> str:
+    """Route path template (``/api/courses/{course_id}``) so label cardinality stays bounded"""
+    route = request.scope.get("route")
+    path = getattr(route, "path", None)
+    return path or "unmatched"
+
+
+def current_route() -> Optional[str]:
+    """Route template of the request being handled in this context, if any"""
+    stats = _request_stats.get()
+    if stats is None:
+        return None
+    route = stats["scope"].get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+class MetricsMiddleware(BaseHTTPMiddleware):
+    async def dispatch(self, request: Request, call_next):
+        method = request.method
+        stats = {"mongo_commands": 0, "mongo_seconds": 0.0, "scope": request.scope}
+        token = _request_stats.set(stats)
+        http_requests_in_progress.inc(method=method)
+        started = time.perf_counter()
+        status = 500
+        try:
+            response = await call_next(request)
+            status = response.status_code
+            return response
+        finally:
+            elapsed = time.perf_counter() - started
+            http_requests_in_progress.dec(method=method)
+            _request_stats.reset(token)
+            route = route_template(request)
+            http_requests_total.inc(method=method, route=route, status=str(status))
+            http_request_duration.observe(elapsed, method=method, route=route)
+            http_request_mongo_commands.observe(stats["mongo_commands"], method=method, route=route)
+            http_request_mongo_duration.observe(stats["mongo_seconds"], method=method, route=route)
+
+
+class MongoCommandListener(monitoring.CommandListener):
+    """Times Mongo commands and charges them to the current request"""
+
+    def __init__(self):
+        self._collections: Dict[Tuple[object, int], str] = {}
+        self._lock = threading.Lock()
+
+    def started(self, event):
+        collection = event.command.get(event.command_name)
+        if not isinstance(collection, str):
+            collection = ""
+        with self._lock:
+            self._collections[(event.connection_id, event.request_id)] = collection
+
+    def _finish(self, event, outcome: str):
+        with self._lock:
+            collection = self._collections.pop((event.connection_id, event.request_id), "")
+        seconds = event.duration_micros / 1_000_000
+        mongo_commands_total.inc(command=event.command_name, collection=collection, outcome=outcome)
+        mongo_command_duration.observe(seconds, command=event.command_name, collection=collection)
+        stats = _request_stats.get()
+        if stats is not None:
+            stats["mongo_commands"] += 1
+            stats["mongo_seconds"] += seconds
+
+    def succeeded(self, event):
+        self._finish(event, "success")
+
+    def failed(self, event):
+        self._finish(event, "failure")
+
+
+class MongoPoolListener(monitoring.ConnectionPoolListener):
+    """Tracks how many pooled connections are open and checked out per server"""
+
+    def _address(self, event) -> str:
+        host, port = event.address
+        return f"{host}:{port}"
+
+    def connection_checked_out(self, event):
+        address = self._address(event)
+        mongo_pool_checked_out.inc(address=address)
+        mongo_pool_checkouts_total.inc(address=address, outcome="success")
+
+    def connection_check_out_failed(self, event):
+        mongo_pool_checkouts_total.inc(address=self._address(event), outcome=str(event.reason))
+
+    def connection_checked_in(self, event):
+        mongo_pool_checked_out.dec(address=self._address(event))
+
+    def pool_cleared(self, event):
+        mongo_pool_checked_out.set(0, address=self._address(event))
+
+    def connection_created(self, event):
+        mongo_pool_connections.inc(address=self._address(event))
+
+    def connection_closed(self, event):
+        mongo_pool_connections.dec(address=self._address(event))
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """Open and checked-out connections per server address"""
+        open_connections = mongo_pool_connections.by_labels()
+        checked_out = mongo_pool_checked_out.by_labels()
+        return {
+            key[0]: {"open": int(open_connections.get(key, 0)), "checked_out": int(checked_out.get(key, 0))}
+            for key in sorted(set(open_connections) | set(checked_out))
+        }
+
+    def pool_created(self, event): pass
+    def pool_ready(self, event): pass
+    def pool_closed(self, event): pass
+    def connection_ready(self, event): pass
+    def connection_check_out_started(self, event): pass
+
+
+mongo_command_listener = MongoCommandListener()
+mongo_pool_listener = MongoPoolListener()
+
+
+async def monitor_event_loop_lag(interval: float = 0.5):
+    """Measure how late the loop wakes a sleeping task; runs until cancelled"""
+    loop = asyncio.get_running_loop()
+    while True:
+        scheduled = loop.time()
+        await asyncio.sleep(interval)
+        lag = max(loop.time() - scheduled - interval, 0.0)
+        event_loop_lag.set(lag)
+        event_loop_lag_histogram.observe(lag)
+
+
+@asynccontextmanager
+async def track_external(service: str, operation: str):
+    """Time an outbound LLM or Stripe call"""
+    started = time.perf_counter()
+    outcome = "success"
+    try:
+        yield
+    except BaseException:
+        outcome = "error"
+        raise
+    finally:
+        external_call_duration.observe(time.perf_counter() - started, service=service, operation=operation, outcome=outcome)
@@ -0,0 +1,207 @@
+"""Per-IP and per-account rate limiting for expensive public endpoints.
+
+Login and register each cost a bcrypt computation. The certificate lookups
+are unauthenticated and reach Mongo on a cache miss. ``RateLimitMiddleware``
+sits in front of the router and answers over-limit requests with a 429 and
+``Retry-After`` before any of that work starts.
+
+Each policy in ``ROUTE_POLICIES`` (first matching method and path prefix
+wins) limits requests per client IP and, for the auth routes, per account.
+The account is the ``email`` field of the JSON body, so one address cannot
+be brute-forced from many IPs. Limits are configured per policy with
+``RATE_LIMIT_<POLICY>``. For example, ``RATE_LIMIT_LOGIN=ip:20/60,account:5/300``
+allows 20 logins per IP per minute and 5 per account per five minutes. A
+limit of 0 turns that key off.
+
+Every key gets a token bucket holding ``limit`` tokens, refilled
+continuously at ``limit / window`` per second. That gives a sliding window
+with bursts of up to ``limit``. Buckets are two floats in an LRU-ordered
+dict capped at ``RATE_LIMIT_MAX_KEYS`` entries. When the cap is hit the
+least recently seen key is dropped, and at worst that client starts again
+with a full bucket. Memory therefore stays bounded no matter how many IPs
+or addresses a flood uses.
+
+State is per worker process. With ``WEB_CONCURRENCY`` workers a client can
+get up to that many times the limit, though keep-alive connections usually
+stick to one worker. Size the limits with that in mind. Behind a proxy, run
+gunicorn/uvicorn with ``forwarded_allow_ips`` set so the client address is
+the real one and not the proxy's.
+"""
+
+import json
+import logging
+import math
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import metrics
+from deadlines import send_error
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+RATE_LIMIT_MAX_KEYS = int(os.environ.get('RATE_LIMIT_MAX_KEYS', '100000'))
+# Larger auth bodies are still limited per IP, just not per account
+RATE_LIMIT_MAX_BODY_BYTES = int(os.environ.get('RATE_LIMIT_MAX_BODY_BYTES', '16384'))
+
+DEFAULT_LIMITS = {
+    "login": "ip:20/60,account:10/300",
+    "register": "ip:5/60,account:3/3600",
+    "certificate_verify": "ip:60/60",
+    "certificate": "ip:60/60",
+}
+
+# (method, path prefix, policy); first match wins
+ROUTE_POLICIES: Tuple[Tuple[str, str, str], ...] = (
+    ("POST", "/api/auth/login", "login"),
+    ("POST", "/api/auth/register", "register"),
+    ("GET", "/api/certificates/verify/", "certificate_verify"),
+    ("GET", "/api/certificates/", "certificate"),
+)
+
+rate_limited_total = metrics.registry.counter(
+    "rtc_rate_limited_total", "Requests rejected by the rate limiter", ("policy", "key"))
+rate_limit_keys = metrics.registry.gauge("rtc_rate_limit_keys", "Token buckets held by this worker's rate limiter")
+rate_limit_evictions_total = metrics.registry.counter(
+    "rtc_rate_limit_evictions_total", "Token buckets dropped because the rate limiter was full")
+
+
+def parse_limits(spec: str) -> Dict[str, Tuple[float, float]]:
+    """``"ip:20/60,account:5/300"`` -> {"ip": (20, 60.0), "account": (5, 300.0)}; zero limits are dropped"""
+    limits = {}
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        key, _, rule = item.partition(":")
+        count, _, window = rule.partition("/")
+        try:
+            limit, seconds = float(count), float(window)
+        except ValueError:
+            raise ValueError(f"Invalid rate limit {item!r}; expected <ip|account>:<limit>/<seconds>")
+        if key not in ("ip", "account") or seconds <= 0 or limit < 0:
+            raise ValueError(f"Invalid rate limit {item!r}; expected <ip|account>:<limit>/<seconds>")
+        if limit > 0:
+            limits[key] = (limit, seconds)
+    return limits
+
+
+def load_policies() -> Dict[str, Dict[str, Tuple[float, float]]]:
+    return {
+        name: parse_limits(os.environ.get(f'RATE_LIMIT_{name.upper()}', default))
+        for name, default in DEFAULT_LIMITS.items()
+    }
+
+
+def policy_for(method: str, path: str) -> Optional[str]:
+    for route_method, prefix, policy in ROUTE_POLICIES:
+        if method == route_method and path.startswith(prefix):
+            return policy
+    return None
+
+
+class TokenBuckets:
+    """Token buckets keyed by (policy, key, value), bounded by LRU eviction"""
+
+    def __init__(self, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self.max_keys = max(max_keys, 1)
+        # key -> (tokens, last refill as time.monotonic())
+        self._buckets: "OrderedDict[Tuple[str, str, str], Tuple[float, float]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def _level(self, key: Tuple[str, str, str], limit: float, window: float, now: float) -> float:
+        state = self._buckets.get(key)
+        if state is None:
+            return limit
+        tokens, updated = state
+        return min(limit, tokens + (now - updated) * limit / window)
+
+    def acquire(self, keys: List[Tuple[Tuple[str, str, str], float, float]]) -> Tuple[Optional[Tuple[str, str, str]], float]:
+        """Take one token from every bucket in ``keys``, or none if any is empty.
+
+        Returns (None, 0) when allowed, else the exhausted key and the seconds
+        until it holds a token again.
+        """
+        now = time.monotonic()
+        levels = []
+        for key, limit, window in keys:
+            level = self._level(key, limit, window, now)
+            if level < 1:
+                # A throttled client is still recently seen; evicting it first would refill its bucket
+                if key in self._buckets:
+                    self._buckets.move_to_end(key)
+                return key, (1 - level) * window / limit
+            levels.append(level)
+        for (key, _, _), level in zip(keys, levels):
+            self._buckets[key] = (level - 1, now)
+            self._buckets.move_to_end(key)
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+            rate_limit_evictions_total.inc()
+        rate_limit_keys.set(len(self._buckets))
+        return None, 0.0
+
+
+def _account(body: bytes) -> Optional[str]:
+    try:
+        email = json.loads(body).get("email")
+    except (ValueError, AttributeError):
+        return None
+    return email.strip().lower()[:254] if isinstance(email, str) and email.strip() else None
+
+
+class RateLimitMiddleware:
+    """Reject over-limit requests with 429 before they reach a route"""
+
+    def __init__(self, app):
+        self.app = app
+        self.policies = load_policies()
+        self.buckets = TokenBuckets()
+
+    async def _read_body(self, receive) -> Tuple[List[dict], bytes, bool]:
+        """Buffer up to RATE_LIMIT_MAX_BODY_BYTES; returns (messages, body, complete)"""
+        messages = []
+        body = b""
+        while True:
+            message = await receive()
+            messages.append(message)
+            if message["type"] != "http.request":
+                return messages, body, False
+            body += message.get("body", b"")
+            if not message.get("more_body", False):
+                return messages, body, True
+            if len(body) > RATE_LIMIT_MAX_BODY_BYTES:
+                return messages, body, False
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not RATE_LIMIT_ENABLED:
+            return await self.app(scope, receive, send)
+        policy = policy_for(scope["method"], scope["path"])
+        limits = self.policies.get(policy) if policy else None
+        if not limits:
+            return await self.app(scope, receive, send)
+
+        keys = []
+        if "ip" in limits:
+            client = scope.get("client")
+            keys.append(((policy, "ip", client[0] if client else "unknown"), *limits["ip"]))
+        if "account" in limits:
+            messages, body, complete = await self._read_body(receive)
+            account = _account(body) if complete else None
+            if account is not None:
+                keys.append(((policy, "account", account), *limits["account"]))
+            upstream = receive
+
+            async def receive():
+                return messages.pop(0) if messages else await upstream()
+
+        exhausted, wait = self.buckets.acquire(keys)
+        if exhausted is None:
+            return await self.app(scope, receive, send)
+        rate_limited_total.inc(policy=policy, key=exhausted[1])
+        await send_error(send, 429, "Too many requests, please try again later",
+                         {"Retry-After": str(max(1, math.ceil(wait)))})
@@ -0,0 +1,287 @@
+"""Item-item course recommendations ("students who took X also took Y").
+
+A full build scans ``enrollments`` once, sorted by user, into a sparse
+user x course matrix ``X`` (two int32 arrays, so a million enrollments cost
+about 8 MB), and computes course co-occurrence as ``X.T @ X`` with SciPy.
+Similarity is cosine over the binary enrollment vectors::
+
+    score(a, b) = shared(a, b) / sqrt(count(a) * count(b))
+
+The top ``RECOMMENDATIONS_CANDIDATES`` neighbours of each course, with
+their shared counts, are stored in ``course_recommendations``. Builds run on
+one worker at a time (a ``LeaderLease``), at most every
+``RECOMMENDATIONS_REBUILD_SECONDS``. Every worker polls
+``recommendation_builds`` and loads the newest build into memory, and
+``/courses/{id}/recommendations`` is answered from that copy.
+
+Between builds ``record_enrollment`` queues each new enrollment without
+touching Mongo, and ``run_updates`` folds the queue into the in-memory
+counts of the worker that handled the enrollment in the background, then
+re-ranks the affected courses. Enrollments handled by other workers, and
+any dropped from a full queue, show up with the next build.
+
+Each course keeps at most ``RECOMMENDATIONS_CANDIDATES`` ranked neighbours,
+which is never less than ``RECOMMENDATIONS_TOP_K``. The API caps ``limit``
+at the latter.
+"""
+
+import asyncio
+import logging
+import math
+import os
+import time
+from array import array
+from collections import deque
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from pymongo import ReplaceOne
+from pymongo.errors import PyMongoError
+from scipy import sparse
+
+import metrics
+from coordination import LeaderLease
+
+logger = logging.getLogger(__name__)
+
+RECOMMENDATIONS_TOP_K = int(os.environ.get('RECOMMENDATIONS_TOP_K', '10'))
+# Stored and ranked neighbours per course; at least TOP_K so any allowed limit can be filled
+RECOMMENDATIONS_CANDIDATES = max(int(os.environ.get('RECOMMENDATIONS_CANDIDATES', '50')), RECOMMENDATIONS_TOP_K)
+RECOMMENDATIONS_REBUILD_SECONDS = float(os.environ.get('RECOMMENDATIONS_REBUILD_SECONDS', '3600'))
+RECOMMENDATIONS_POLL_SECONDS = float(os.environ.get('RECOMMENDATIONS_POLL_SECONDS', '60'))
+RECOMMENDATIONS_SCAN_BATCH = int(os.environ.get('RECOMMENDATIONS_SCAN_BATCH', '10000'))
+RECOMMENDATIONS_MAX_LOG = int(os.environ.get('RECOMMENDATIONS_MAX_LOG', '100000'))
+RECOMMENDATIONS_MAX_PENDING = int(os.environ.get('RECOMMENDATIONS_MAX_PENDING', '10000'))
+
+BUILD_ID = "item_item"
+
+recommendation_build_duration = metrics.registry.histogram(
+    "rtc_recommendation_build_seconds", "Full item-item recommendation build time", ("phase",),
+    buckets=(0.1, 0.5, 1.0, 5.0, 15.0, 30.0, 60.0, 120.0, 300.0, 600.0))
+recommendation_build_size = metrics.registry.gauge(
+    "rtc_recommendation_build_size", "Size of the last recommendation build", ("dimension",))
+
+
+def compute_neighbours(users: np.ndarray, courses: np.ndarray, n_users: int, n_courses: int,
+                       candidates: int) -> Tuple[np.ndarray, List[List[Tuple[int, int]]]]:
+    """Enrollment counts per course and the top (course, shared) candidates per course"""
+    enrolled = sparse.csr_matrix(
+        (np.ones(len(users), dtype=np.int32), (users, courses)), shape=(n_users, n_courses)
+    )
+    # Duplicate enrollment rows would otherwise be summed into the matrix
+    enrolled.data[:] = 1
+    shared = (enrolled.T @ enrolled).tocsr()
+    counts = shared.diagonal().astype(np.int64)
+    shared.setdiag(0)
+    shared.eliminate_zeros()
+
+    norms = np.sqrt(np.maximum(counts, 1).astype(np.float64))
+    rows = np.repeat(np.arange(n_courses), np.diff(shared.indptr))
+    scores = shared.data / (norms[rows] * norms[shared.indices])
+
+    neighbours: List[List[Tuple[int, int]]] = []
+    for course in range(n_courses):
+        start, end = shared.indptr[course], shared.indptr[course + 1]
+        row_scores = scores[start:end]
+        if end - start > candidates:
+            top = np.argpartition(-row_scores, candidates - 1)[:candidates]
+        else:
+            top = np.arange(end - start)
+        top = top[np.argsort(-row_scores[top], kind="stable")]
+        neighbours.append([(int(shared.indices[start + i]), int(shared.data[start + i])) for i in top])
+    return counts, neighbours
+
+
+class Recommender:
+    def __init__(self):
+        self.built_at: Optional[datetime] = None
+        self.version = 0
+        self._counts: Dict[str, int] = {}
+        self._shared: Dict[str, Dict[str, int]] = {}
+        self._ranked: Dict[str, List[Tuple[str, float, int]]] = {}
+        # (recorded_at, course_id, other course ids) applied since the loaded build started
+        self._log: deque = deque(maxlen=RECOMMENDATIONS_MAX_LOG)
+        # (recorded_at, user_id, course_id) waiting for run_updates
+        self._pending: deque = deque(maxlen=RECOMMENDATIONS_MAX_PENDING)
+        self._pending_ready = asyncio.Event()
+
+    # ---- serving ----
+
+    def neighbours(self, course_id: str, limit: int = RECOMMENDATIONS_TOP_K) -> List[Tuple[str, float, int]]:
+        """Top (course_id, score, shared enrollments) for a course, best first; at most RECOMMENDATIONS_CANDIDATES"""
+        return self._ranked.get(course_id, [])[:limit]
+
+    def _rank(self, course_id: str):
+        count = self._counts.get(course_id, 0)
+        ranked = []
+        for other, shared in self._shared.get(course_id, {}).items():
+            denominator = math.sqrt(max(count, 1) * max(self._counts.get(other, 0), 1))
+            ranked.append((other, shared / denominator, shared))
+        ranked.sort(key=lambda item: (-item[1], -item[2], item[0]))
+        self._ranked[course_id] = ranked[:RECOMMENDATIONS_CANDIDATES]
+
+    # ---- incremental updates ----
+
+    def _apply(self, course_id: str, others: List[str]):
+        self._counts[course_id] = self._counts.get(course_id, 0) + 1
+        for other in others:
+            for a, b in ((course_id, other), (other, course_id)):
+                row = self._shared.setdefault(a, {})
+                row[b] = row.get(b, 0) + 1
+        for affected in (course_id, *others):
+            self._rank(affected)
+        self.version += 1
+
+    def record_enrollment(self, user_id: str, course_id: str):
+        """Queue a new enrollment for ``run_updates``; does no I/O on the request path"""
+        self._pending.append((datetime.now(timezone.utc), user_id, course_id))
+        self._pending_ready.set()
+
+    async def apply_pending(self, db):
+        """Fold queued enrollments into this worker's neighbour lists"""
+        while self._pending:
+            recorded_at, user_id, course_id = self._pending.popleft()
+            others = [
+                doc["course_id"] async for doc in
+                db.enrollments.find({"user_id": user_id, "course_id": {"$ne": course_id}}, {"_id": 0, "course_id": 1})
+            ]
+            self._apply(course_id, others)
+            self._log.append((recorded_at, course_id, others))
+
+    async def run_updates(self, db):
+        """Apply queued enrollments as they arrive until cancelled"""
+        while True:
+            await self._pending_ready.wait()
+            self._pending_ready.clear()
+            try:
+                await self.apply_pending(db)
+            except PyMongoError as e:
+                # The enrollment being applied is left to the next build
+                logger.warning(f"Recommendation update failed: {e}")
+
+    def forget_course(self, course_id: str):
+        self._counts.pop(course_id, None)
+        for other in self._shared.pop(course_id, {}):
+            self._shared.get(other, {}).pop(course_id, None)
+            self._rank(other)
+        self._ranked.pop(course_id, None)
+        self.version += 1
+
+    # ---- builds ----
+
+    async def _scan(self, db) -> Tuple[array, array, int, List[str]]:
+        users, courses = array('i'), array('i')
+        course_index: Dict[str, int] = {}
+        row, last_user = -1, None
+        cursor = db.enrollments.find({}, {"_id": 0, "user_id": 1, "course_id": 1}) \
+            .sort("user_id", 1).batch_size(RECOMMENDATIONS_SCAN_BATCH)
+        async for doc in cursor:
+            if doc["user_id"] != last_user:
+                row, last_user = row + 1, doc["user_id"]
+            users.append(row)
+            courses.append(course_index.setdefault(doc["course_id"], len(course_index)))
+        return users, courses, row + 1, list(course_index)
+
+    async def build(self, db):
+        """Full rebuild from enrollments; results go to course_recommendations"""
+        started_at = datetime.now(timezone.utc)
+        started = time.monotonic()
+        users, courses, n_users, course_ids = await self._scan(db)
+        scanned = time.monotonic()
+        recommendation_build_duration.observe(scanned - started, phase="scan")
+
+        counts, neighbours = await asyncio.get_running_loop().run_in_executor(
+            None, compute_neighbours,
+            np.frombuffer(users, dtype=np.int32), np.frombuffer(courses, dtype=np.int32),
+            n_users, len(course_ids), RECOMMENDATIONS_CANDIDATES
+        )
+        computed = time.monotonic()
+        recommendation_build_duration.observe(computed - scanned, phase="compute")
+
+        operations = [
+            ReplaceOne({"_id": course_id}, {
+                "_id": course_id,
+                "count": int(counts[index]),
+                "candidates": [{"course_id": course_ids[other], "shared": shared} for other, shared in neighbours[index]],
+                "started_at": started_at
+            }, upsert=True)
+            for index, course_id in enumerate(course_ids)
+        ]
+        for offset in range(0, len(operations), 1000):
+            await db.course_recommendations.bulk_write(operations[offset:offset + 1000], ordered=False)
+        await db.course_recommendations.delete_many({"started_at": {"$lt": started_at}})
+        await db.recommendation_builds.replace_one({"_id": BUILD_ID}, {
+            "_id": BUILD_ID,
+            "started_at": started_at,
+            "built_at": datetime.now(timezone.utc),
+            "enrollments": len(users),
+            "users": n_users,
+            "courses": len(course_ids)
+        }, upsert=True)
+        recommendation_build_duration.observe(time.monotonic() - computed, phase="store")
+        recommendation_build_size.set(len(users), dimension="enrollments")
+        recommendation_build_size.set(n_users, dimension="users")
+        recommendation_build_size.set(len(course_ids), dimension="courses")
+        logger.info(f"Built recommendations for {len(course_ids)} courses from {len(users)} enrollments "
+                    f"in {time.monotonic() - started:.1f}s")
+
+    async def maybe_build(self, db):
+        meta = await db.recommendation_builds.find_one({"_id": BUILD_ID})
+        if meta and (datetime.now(timezone.utc) - _aware(meta["built_at"])).total_seconds() < RECOMMENDATIONS_REBUILD_SECONDS:
+            return
+        lease = LeaderLease(db.leases, f"recommendations:{BUILD_ID}", ttl=60)
+        if not await lease.try_acquire():
+            return
+        keep_alive = asyncio.create_task(lease.keep_alive())
+        try:
+            # Another worker may have finished a build between the check and the acquire
+            meta = await db.recommendation_builds.find_one({"_id": BUILD_ID})
+            if not meta or (datetime.now(timezone.utc) - _aware(meta["built_at"])).total_seconds() >= RECOMMENDATIONS_REBUILD_SECONDS:
+                await self.build(db)
+        finally:
+            keep_alive.cancel()
+            await lease.release()
+
+    async def load(self, db):
+        """Load the newest build into memory if it is newer than the one being served"""
+        meta = await db.recommendation_builds.find_one({"_id": BUILD_ID})
+        if not meta or (self.built_at and _aware(meta["built_at"]) <= self.built_at):
+            return
+        counts: Dict[str, int] = {}
+        shared: Dict[str, Dict[str, int]] = {}
+        async for doc in db.course_recommendations.find({}):
+            counts[doc["_id"]] = doc["count"]
+            shared[doc["_id"]] = {candidate["course_id"]: candidate["shared"] for candidate in doc["candidates"]}
+        self._counts, self._shared, self._ranked = counts, shared, {}
+        for course_id in shared:
+            self._rank(course_id)
+        # Re-apply local enrollments the build's scan may have missed
+        started_at = _aware(meta["started_at"])
+        self._log = deque((entry for entry in self._log if entry[0] >= started_at), maxlen=RECOMMENDATIONS_MAX_LOG)
+        for _, course_id, others in self._log:
+            self._apply(course_id, others)
+        self.built_at = _aware(meta["built_at"])
+        self.version += 1
+
+    async def run(self, db):
+        """Build when due (one worker at a time) and keep this worker's copy current"""
+        while True:
+            try:
+                await self.maybe_build(db)
+                await self.load(db)
+            except (PyMongoError, ValueError) as e:
+                logger.warning(f"Recommendation refresh failed: {e}")
+            await asyncio.sleep(RECOMMENDATIONS_POLL_SECONDS)
+
+
+def _aware(value: datetime) -> datetime:
+    # Mongo returns naive UTC datetimes unless the client is tz_aware
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+async def ensure_indexes(db):
+    await db.enrollments.create_index([("user_id", 1), ("course_id", 1)])
+
+
+recommender = Recommender()
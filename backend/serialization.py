@@ -0,0 +1,98 @@
+"""Fast JSON response path.
+
+FastAPI's default path re-validates every returned document against the
+route's ``response_model`` and then encodes the result with the stdlib json
+encoder. When ``FAST_JSON`` is enabled, handlers that opt in hand their data
+to ``fast_response`` instead:
+
+- untrusted data is validated and dumped in one go by a Pydantic v2
+  ``TypeAdapter`` that is built once per response type;
+- trusted internal documents (read with ``projection_for(model)`` so they only
+  carry model fields) skip validation and go straight through orjson.
+
+The returned ``RawJSONResponse`` carries pre-encoded bytes, so FastAPI does no
+further work. With ``FAST_JSON`` disabled the data is returned unchanged and
+the regular ``response_model`` path applies.
+"""
+
+import logging
+import os
+from functools import lru_cache
+from typing import Any, Dict, Optional, Type
+
+from pydantic import BaseModel, TypeAdapter
+from starlette.responses import Response
+
+logger = logging.getLogger(__name__)
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is pinned in requirements.txt
+    orjson = None
+
+FAST_JSON_ENABLED = os.environ.get('FAST_JSON', 'false').lower() in ('1', 'true', 'yes')
+
+if FAST_JSON_ENABLED and orjson is None:
+    logger.warning("FAST_JSON is enabled but orjson is not installed; trusted responses fall back to TypeAdapter")
+
+
+class RawJSONResponse(Response):
+    """Response whose body is already-encoded JSON bytes"""
+    media_type = "application/json"
+
+
+@lru_cache(maxsize=None)
+def type_adapter(response_type: Any) -> TypeAdapter:
+    """Compile a TypeAdapter once per response type (e.g. ``List[CourseResponse]``)"""
+    return TypeAdapter(response_type)
+
+
+@lru_cache(maxsize=None)
+def projection_for(model: Type[BaseModel]) -> Dict[str, int]:
+    """Mongo projection limited to the fields a response model exposes"""
+    projection = {name: 1 for name in model.model_fields}
+    projection["_id"] = 0
+    return projection
+
+
+@lru_cache(maxsize=None)
+def defaults_for(model: Type[BaseModel]) -> Dict[str, Any]:
+    """Default values of a model's optional fields, applied to trusted documents"""
+    return {
+        name: info.get_default(call_default_factory=True)
+        for name, info in model.model_fields.items()
+        if not info.is_required()
+    }
+
+
+def dumps(data: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(data)
+    return type_adapter(Any).dump_json(data)
+
+
+def encode(data: Any, response_type: Any = None, trusted: bool = False, model: Optional[Type[BaseModel]] = None) -> bytes:
+    """Serialize data to JSON bytes, validating against response_type unless trusted.
+
+    Trusted documents are dumped as-is; pass ``model`` to fill in missing
+    optional fields so the output matches what the response model would emit.
+    """
+    if trusted or response_type is None:
+        if model is not None:
+            defaults = defaults_for(model)
+            if isinstance(data, list):
+                data = [{**defaults, **doc} for doc in data]
+            else:
+                data = {**defaults, **data}
+        return dumps(data)
+    adapter = type_adapter(response_type)
+    return adapter.dump_json(adapter.validate_python(data))
+
+
+def fast_response(data: Any, response_type: Any = None, trusted: bool = False, body: Optional[bytes] = None):
+    """Return a pre-encoded response on the fast path, or the data itself for FastAPI to handle"""
+    if not FAST_JSON_ENABLED:
+        return data
+    if body is None:
+        body = encode(data, response_type, trusted)
+    return RawJSONResponse(content=body)
@@ -1,26 +1,82 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, Request, Body
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Request, Body, Header, Query, WebSocket
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
+from starlette.responses import JSONResponse, Response, StreamingResponse
+import pymongo
+from pymongo import ReturnDocument
+from pymongo.errors import ConnectionFailure, DuplicateKeyError, OperationFailure, PyMongoError
 import os
+import re
 import logging
 from pathlib import Path
-from pydantic import BaseModel, Field, ConfigDict, EmailStr
-from typing import List, Optional, Dict, Any
+from pydantic import BaseModel, Field, ConfigDict, EmailStr, ValidationError
+from typing import List, Optional, Dict, Any, Tuple, Callable, Awaitable
 import uuid
 from datetime import datetime, timezone, timedelta
 import jwt
 import bcrypt
 import asyncio
+import metrics
+import diagnostics
+import bulk_import
+import cohort_analytics
+import coordination
+import course_content
+import deadlines
+import idempotency
+import rate_limit
+import recommendations
+import snapshots
+import storage
+import stripe_webhooks
+from cache import TTLCache, invalidation
+from change_streams import ChangeStreamInvalidator
+import events
+import exports
+import warmup
+import write_behind
+from events import ADMIN_TOPIC, event_bus, publish_counters, user_topic
+import serialization
+import compression
+from catalog import CatalogEntry, catalog_cache
+from facets import SEARCH_MAX_LENGTH, facet_index
+from cohort_analytics import course_analytics
+from counters import apply_enrollment_counts, enrollment_counter
+from recommendations import recommender
+from snapshots import catalog_snapshots
+from warmup import warm_up
+from serialization import fast_response, projection_for
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
 # MongoDB connection
 mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ.get('DB_NAME', 'right_tech_centre')]
+db_name = os.environ.get('DB_NAME', 'right_tech_centre')
+# Per-process pool bounds; a node opens up to workers x MONGO_MAX_POOL_SIZE connections
+MONGO_MAX_POOL_SIZE = int(os.environ.get('MONGO_MAX_POOL_SIZE', '100'))
+MONGO_MIN_POOL_SIZE = int(os.environ.get('MONGO_MIN_POOL_SIZE', '0'))
+
+client = None
+db = None
+_client_pid = None
+
+def connect_db():
+    """Create this process's storage client (see storage.py); called again in each worker after fork"""
+    global client, db, _client_pid
+    if client is not None and _client_pid == os.getpid():
+        client.close()
+    client = storage.open_client(
+        mongo_url,
+        maxPoolSize=MONGO_MAX_POOL_SIZE,
+        minPoolSize=MONGO_MIN_POOL_SIZE,
+        event_listeners=[metrics.mongo_command_listener, metrics.mongo_pool_listener, diagnostics.slow_query_profiler]
+    )
+    db = client[db_name]
+    _client_pid = os.getpid()
+
+connect_db()
 
 # JWT Configuration
 JWT_SECRET = os.environ.get('JWT_SECRET_KEY', 'rtc_super_secret_jwt_key_2025')
@@ -42,6 +98,8 @@ enrollments_router = APIRouter(prefix="/enrollments", tags=["Enrollments"])
 payments_router = APIRouter(prefix="/payments", tags=["Payments"])
 ai_router = APIRouter(prefix="/ai", tags=["AI"])
 certificates_router = APIRouter(prefix="/certificates", tags=["Certificates"])
+admin_router = APIRouter(prefix="/admin", tags=["Admin"])
+events_router = APIRouter(prefix="/events", tags=["Events"])
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -125,6 +183,33 @@ class CourseResponse(BaseModel):
     created_at: str
     enrolled_count: int = 0
 
+class RecommendedCourseResponse(CourseResponse):
+    score: float
+    shared_enrollments: int
+
+class ModuleDetailResponse(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    id: str
+    course_id: str
+    position: int
+    title: str
+    description: str
+    objectives: List[str] = []
+    lessons: List[Dict[str, Any]] = []
+    quiz_id: Optional[str] = None
+    duration_hours: int = 4
+    version: int
+    updated_at: str
+
+class ModuleUpdate(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+    title: Optional[str] = None
+    description: Optional[str] = None
+    objectives: Optional[List[str]] = None
+    lessons: Optional[List[Dict[str, Any]]] = None
+    quiz_id: Optional[str] = None
+    duration_hours: Optional[int] = None
+
 # Enrollment Models
 class EnrollmentCreate(BaseModel):
     course_id: str
@@ -189,6 +274,51 @@ class CertificateResponse(BaseModel):
     issued_at: str
     certificate_number: str
 
+# ==================== CACHES ====================
+
+# Authenticated user documents (no password) keyed by user id
+user_cache = TTLCache("users", max_entries=50000)
+# Certificates keyed by ("id", id) and ("number", certificate_number)
+certificate_cache = TTLCache("certificates", max_entries=20000)
+
+def invalidate_user(document: Optional[Dict]):
+    if document and "id" in document:
+        user_cache.invalidate(document["id"])
+    else:
+        user_cache.clear()
+
+# Full module content keyed by (course_id, module_id); values are CatalogEntry objects
+module_cache = TTLCache("course_modules", max_entries=5000)
+# Bumped on every module invalidation so reads racing a write don't cache stale content
+module_cache_generation = 0
+
+def invalidate_module(document: Optional[Dict]):
+    global module_cache_generation
+    module_cache_generation += 1
+    if document and "id" in document:
+        module_cache.invalidate((document.get("course_id"), document["id"]))
+    else:
+        module_cache.clear()
+
+def invalidate_certificate(document: Optional[Dict]):
+    if document and "id" in document:
+        certificate_cache.invalidate(("id", document["id"]))
+        certificate_cache.invalidate(("number", document.get("certificate_number")))
+    else:
+        certificate_cache.clear()
+
+invalidation.on("courses", lambda document: catalog_cache.invalidate())
+catalog_cache.on_invalidate(catalog_snapshots.mark_dirty)
+invalidation.on("courses", lambda document: facet_index.mark_stale(document.get("id") if document else None))
+invalidation.on("users", invalidate_user)
+invalidation.on("certificates", invalidate_certificate)
+invalidation.on("course_modules", invalidate_module)
+invalidation.on("enrollments", lambda document: course_analytics.mark_dirty(document.get("course_id") if document else None))
+# catalog_cache keeps its own short TTL: enrolled_count comes from counter shards, whose flushes
+# never touch the course document, so no change event would ever refresh a long-lived entry
+for _cache in (user_cache, certificate_cache, module_cache, facet_index, course_analytics.cache):
+    invalidation.track(_cache)
+
 # ==================== HELPER FUNCTIONS ====================
 
 def hash_password(password: str) -> str:
@@ -197,6 +327,30 @@ def hash_password(password: str) -> str:
 def verify_password(password: str, hashed: str) -> bool:
     return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
 
+def build_user_doc(user_data: UserBase, password_hash: str) -> Dict:
+    return {
+        "id": str(uuid.uuid4()),
+        "email": user_data.email,
+        "full_name": user_data.full_name,
+        "password": password_hash,
+        "role": user_data.role,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "profile_image": None
+    }
+
+def build_course_doc(course: CourseCreate, instructor_id: str) -> Tuple[Dict, List[Dict]]:
+    """Course document plus its course_modules documents (lesson content lives outside the course)"""
+    course_id = str(uuid.uuid4())
+    course_doc = {
+        "id": course_id,
+        **course.model_dump(),
+        "instructor_id": instructor_id,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "enrolled_count": 0
+    }
+    course_doc["modules"], module_docs = course_content.split_modules(course_id, course_doc["modules"])
+    return course_doc, module_docs
+
 def create_token(user_id: str, role: str) -> str:
     payload = {
         "user_id": user_id,
@@ -211,7 +365,11 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
         return None
     try:
         payload = jwt.decode(credentials.credentials, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-        user = await db.users.find_one({"id": payload["user_id"]}, {"_id": 0, "password": 0})
+        user = user_cache.get(payload["user_id"])
+        if user is None:
+            user = await db.users.find_one({"id": payload["user_id"]}, {"_id": 0, "password": 0})
+            if user:
+                user_cache.set(payload["user_id"], user)
         return user
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token expired")
@@ -236,6 +394,55 @@ async def require_instructor(user: Dict = Depends(require_auth)) -> Dict:
         raise HTTPException(status_code=403, detail="Instructor access required")
     return user
 
+def publish_payment_paid(transaction: Dict):
+    event_bus.publish(user_topic(transaction["user_id"]), "payment.paid", {
+        "session_id": transaction["session_id"],
+        "course_id": transaction["course_id"],
+        "amount": transaction["amount"],
+        "currency": transaction["currency"]
+    })
+    publish_counters(total_revenue=transaction["amount"])
+
+async def bump_user_version(user_id: str):
+    """Bump the counter behind the ETags of a user's /auth/me, /enrollments and /certificates"""
+    await db.users.update_one({"id": user_id}, {"$inc": {"data_version": 1}})
+
+async def user_version(user_id: str) -> int:
+    doc = await db.users.find_one({"id": user_id}, {"_id": 0, "data_version": 1})
+    return (doc or {}).get("data_version", 0)
+
+def user_etag(user_id: str, version: int, resource: str) -> str:
+    return f'"{resource}.{user_id}.{version}"'
+
+def not_modified(request: Request, etag: str) -> Optional[Response]:
+    if course_content.etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "private, no-cache"})
+    return None
+
+def with_etag(result: Any, response: Response, etag: str) -> Any:
+    """Attach the ETag whether the route returns a pre-encoded Response or plain data"""
+    target = result if isinstance(result, Response) else response
+    target.headers["ETag"] = etag
+    target.headers["Cache-Control"] = "private, no-cache"
+    return result
+
+def publish_enrollment_created(enrollment_doc: Dict):
+    event_bus.publish(
+        user_topic(enrollment_doc["user_id"]), "enrollment.created",
+        {key: value for key, value in enrollment_doc.items() if key != "_id"}
+    )
+    publish_counters(total_enrollments=1)
+
+async def audit_payment(event: str, session_id: str, **details):
+    """Queue an append-only payment audit record (written behind the request)"""
+    await write_behind.payment_audit.append({
+        "id": str(uuid.uuid4()),
+        "event": event,
+        "session_id": session_id,
+        **details,
+        "created_at": datetime.now(timezone.utc).isoformat()
+    })
+
 # ==================== AUTH ROUTES ====================
 
 @auth_router.post("/register", response_model=TokenResponse)
@@ -244,18 +451,14 @@ async def register(user_data: UserCreate):
     if existing:
         raise HTTPException(status_code=400, detail="Email already registered")
     
-    user_id = str(uuid.uuid4())
-    user_doc = {
-        "id": user_id,
-        "email": user_data.email,
-        "full_name": user_data.full_name,
-        "password": hash_password(user_data.password),
-        "role": user_data.role,
-        "created_at": datetime.now(timezone.utc).isoformat(),
-        "profile_image": None
-    }
+    user_doc = build_user_doc(user_data, hash_password(user_data.password))
+    user_id = user_doc["id"]
     
-    await db.users.insert_one(user_doc)
+    try:
+        await db.users.insert_one(user_doc)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Email already registered")
+    publish_counters(total_users=1)
     token = create_token(user_id, user_data.role)
     
     user_response = UserResponse(
@@ -288,50 +491,174 @@ async def login(credentials: UserLogin):
     return TokenResponse(access_token=token, user=user_response)
 
 @auth_router.get("/me", response_model=UserResponse)
-async def get_me(user: Dict = Depends(require_auth)):
-    return UserResponse(**user)
+async def get_me(request: Request, response: Response, user: Dict = Depends(require_auth)):
+    version = await user_version(user["id"])
+    etag = user_etag(user["id"], version, "me")
+    cached = not_modified(request, etag)
+    if cached:
+        return cached
+    if user.get("data_version", 0) != version:
+        # The cached auth document predates the counter; don't pair stale fields with the new ETag
+        user = await db.users.find_one({"id": user["id"]}, {"_id": 0, "password": 0}) or user
+        user_cache.set(user["id"], user)
+    return with_etag(UserResponse(**user), response, etag)
 
 # ==================== COURSES ROUTES ====================
 
-@courses_router.get("", response_model=List[CourseResponse])
-async def get_courses(
-    course_type: Optional[str] = None,
-    is_published: Optional[bool] = True,
-    search: Optional[str] = None
-):
+def encode_catalog(data: Any, response_type: Any) -> bytes:
+    """Catalog documents come from our own writes, so the fast path may trust them"""
+    if serialization.FAST_JSON_ENABLED:
+        return serialization.encode(data, trusted=True, model=CourseResponse)
+    return serialization.encode(data, response_type)
+
+async def catalog_list_entry(course_type: Optional[str], is_published: Optional[bool], search: Optional[str]) -> CatalogEntry:
+    # Search results are not cached; the key space is unbounded
+    cache_key = None if search else ("list", course_type, is_published)
+    if cache_key:
+        cached = catalog_cache.get(cache_key)
+        if cached:
+            return cached
+    version = catalog_cache.version
+    
     query = {}
     if course_type:
         query["course_type"] = course_type
     if is_published is not None:
         query["is_published"] = is_published
     if search:
+        # A literal substring match; user input is never run as a regex
+        pattern = re.escape(search)
         query["$or"] = [
-            {"title": {"$regex": search, "$options": "i"}},
-            {"description": {"$regex": search, "$options": "i"}}
+            {"title": {"$regex": pattern, "$options": "i"}},
+            {"description": {"$regex": pattern, "$options": "i"}}
         ]
     
-    courses = await db.courses.find(query, {"_id": 0}).to_list(1000)
-    return courses
-
-@courses_router.get("/{course_id}", response_model=CourseResponse)
-async def get_course(course_id: str):
-    course = await db.courses.find_one({"id": course_id}, {"_id": 0})
+    courses = await db.courses.find(query, projection_for(CourseResponse)).to_list(1000)
+    await apply_enrollment_counts(courses)
+    body = encode_catalog(courses, List[CourseResponse])
+    if cache_key:
+        return catalog_cache.put(cache_key, courses, body, version)
+    return CatalogEntry(data=courses, body=body, version=version)
+
+async def prime_catalog():
+    """Warm-up step: build the default course list, its compressed variants and the facet index"""
+    entry = await catalog_list_entry(None, True, None)
+    if compression.COMPRESSION_ENABLED and len(entry.body) >= compression.COMPRESSION_MIN_SIZE:
+        for encoding in compression.supported_encodings():
+            await compression.entry_variant(entry, encoding)
+    await facet_index.refresh(db)
+
+async def catalog_course_entry(course_id: str) -> CatalogEntry:
+    cache_key = ("course", course_id)
+    cached = catalog_cache.get(cache_key)
+    if cached:
+        return cached
+    version = catalog_cache.version
+    
+    course = await db.courses.find_one({"id": course_id}, projection_for(CourseResponse))
     if not course:
         raise HTTPException(status_code=404, detail="Course not found")
-    return course
+    await apply_enrollment_counts(course)
+    return catalog_cache.put(cache_key, course, encode_catalog(course, CourseResponse), version)
+
+async def build_catalog_snapshot() -> Dict[str, bytes]:
+    """Published course list and course details, encoded exactly as the API serves them"""
+    entry = await catalog_list_entry(None, True, None)
+    files = {"courses.json": entry.body}
+    for course in entry.data:
+        name = snapshots.course_file(course["id"])
+        if name:
+            files[name] = encode_catalog(course, CourseResponse)
+    return files
+
+catalog_breaker = deadlines.CircuitBreaker("catalog")
+
+async def catalog_response(request: Request, snapshot_file: Optional[str],
+                           load: Callable[[], Awaitable[CatalogEntry]]) -> Response:
+    """Serve a catalog entry, or the published static snapshot of it while Mongo is unreachable"""
+    if snapshot_file is None or catalog_snapshots.version() is None:
+        return await compression.negotiated_response(request, await load())
+    # An open breaker skips Mongo entirely until its next trial call
+    if catalog_breaker.retry_after() is None:
+        try:
+            with pymongo.timeout(snapshots.CATALOG_SNAPSHOT_FALLBACK_SECONDS):
+                entry = await load()
+        except PyMongoError as e:
+            if not (isinstance(e, ConnectionFailure) or e.timeout):
+                catalog_breaker.release_trial()
+                raise
+            catalog_breaker.record_failure()
+        except HTTPException:
+            catalog_breaker.record_success()
+            raise
+        except BaseException:
+            catalog_breaker.release_trial()
+            raise
+        else:
+            catalog_breaker.record_success()
+            return await compression.negotiated_response(request, entry)
+
+    found = await catalog_snapshots.entry(snapshot_file)
+    if found is None:
+        snapshots.snapshot_fallbacks_total.inc(outcome="missing")
+        raise HTTPException(status_code=503, detail="Catalog temporarily unavailable",
+                            headers={"Retry-After": str(deadlines.MONGO_RETRY_AFTER_SECONDS)})
+    snapshots.snapshot_fallbacks_total.inc(outcome="served")
+    version, entry = found
+    response = await compression.negotiated_response(request, entry)
+    response.headers["X-Catalog-Snapshot"] = version
+    return response
+
+@courses_router.get("", response_model=List[CourseResponse])
+async def get_courses(
+    request: Request,
+    course_type: Optional[str] = None,
+    is_published: Optional[bool] = True,
+    search: Optional[str] = Query(None, max_length=SEARCH_MAX_LENGTH)
+):
+    # Only the default listing is published as a snapshot
+    snapshot_file = "courses.json" if course_type is None and is_published is True and not search else None
+    return await catalog_response(request, snapshot_file, lambda: catalog_list_entry(course_type, is_published, search))
+
+@courses_router.get("/facets")
+async def get_course_facets(
+    course_type: Optional[str] = None,
+    price_band: Optional[str] = None,
+    credit_hours: Optional[int] = None,
+    duration_months: Optional[int] = None,
+    search: Optional[str] = Query(None, max_length=SEARCH_MAX_LENGTH)
+):
+    """Published-catalog counts per course type, price band, credit hours and duration"""
+    await facet_index.refresh(db)
+    filters = {
+        "course_type": course_type,
+        "price_band": price_band,
+        "credit_hours": None if credit_hours is None else str(credit_hours),
+        "duration_months": None if duration_months is None else str(duration_months)
+    }
+    return facet_index.counts(filters, search)
+
+@courses_router.get("/{course_id}", response_model=CourseResponse)
+async def get_course(course_id: str, request: Request):
+    return await catalog_response(request, snapshots.course_file(course_id), lambda: catalog_course_entry(course_id))
 
 @courses_router.post("", response_model=CourseResponse)
 async def create_course(course: CourseCreate, user: Dict = Depends(require_instructor)):
-    course_id = str(uuid.uuid4())
-    course_doc = {
-        "id": course_id,
-        **course.model_dump(),
-        "instructor_id": user["id"],
-        "created_at": datetime.now(timezone.utc).isoformat(),
-        "enrolled_count": 0
-    }
-    
+    course_doc, module_docs = build_course_doc(course, user["id"])
+    
+    if module_docs:
+        try:
+            await course_content.check_module_ids(db, course_doc["id"], module_docs)
+            await db.course_modules.insert_many(module_docs)
+        except course_content.ModuleIdConflict as e:
+            raise HTTPException(status_code=409, detail=str(e))
+        except DuplicateKeyError:
+            # Another write claimed one of the ids after the check
+            raise HTTPException(status_code=409, detail="Module ids already in use")
     await db.courses.insert_one(course_doc)
+    catalog_cache.invalidate()
+    facet_index.mark_stale(course_doc["id"])
+    publish_counters(total_courses=1)
     if "_id" in course_doc:
         del course_doc["_id"]
     return course_doc
@@ -347,24 +674,159 @@ async def update_course(course_id: str, course_data: Dict[str, Any] = Body(...),
     
     course_data.pop("id", None)
     course_data.pop("_id", None)
+    if "modules" in course_data:
+        try:
+            course_data["modules"] = await course_content.save_modules(db, course_id, course_data["modules"] or [])
+        except course_content.ModuleIdConflict as e:
+            raise HTTPException(status_code=409, detail=str(e))
+        except DuplicateKeyError:
+            raise HTTPException(status_code=409, detail="Module ids already in use")
+        invalidate_module(None)
     
     await db.courses.update_one({"id": course_id}, {"$set": course_data})
+    catalog_cache.invalidate()
+    facet_index.mark_stale(course_id)
     updated = await db.courses.find_one({"id": course_id}, {"_id": 0})
-    return updated
+    return await apply_enrollment_counts(updated)
 
 @courses_router.delete("/{course_id}")
 async def delete_course(course_id: str, user: Dict = Depends(require_admin)):
     result = await db.courses.delete_one({"id": course_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Course not found")
+    await enrollment_counter.delete(course_id)
+    recommender.forget_course(course_id)
+    await db.course_modules.delete_many({"course_id": course_id})
+    invalidate_module(None)
+    catalog_cache.invalidate()
+    facet_index.mark_stale(course_id)
+    publish_counters(total_courses=-1)
     return {"message": "Course deleted successfully"}
 
+@courses_router.get("/{course_id}/recommendations", response_model=List[RecommendedCourseResponse])
+async def get_course_recommendations(course_id: str, request: Request, limit: int = 6):
+    """Published courses most often taken by students of this course"""
+    limit = max(1, min(limit, recommendations.RECOMMENDATIONS_TOP_K))
+    cache_key = ("recommendations", course_id, limit, recommender.version)
+    cached = catalog_cache.get(cache_key)
+    if cached:
+        return await compression.negotiated_response(request, cached)
+    version = catalog_cache.version
+    
+    # Over-fetch neighbours so unpublished or deleted courses don't shorten the list
+    neighbours = recommender.neighbours(course_id, recommendations.RECOMMENDATIONS_CANDIDATES)
+    courses = await db.courses.find(
+        {"id": {"$in": [other for other, _, _ in neighbours]}, "is_published": True},
+        projection_for(CourseResponse)
+    ).to_list(None)
+    by_id = {course["id"]: course for course in courses}
+    results = [
+        {**by_id[other], "score": round(score, 4), "shared_enrollments": shared}
+        for other, score, shared in neighbours if other in by_id
+    ][:limit]
+    await apply_enrollment_counts(results)
+    entry = catalog_cache.put(cache_key, results, serialization.encode(results, List[RecommendedCourseResponse]), version)
+    return await compression.negotiated_response(request, entry)
+
+@courses_router.get("/{course_id}/modules", response_model=List[Dict[str, Any]])
+async def get_course_outline(course_id: str, request: Request):
+    """Module outline (no lesson bodies) for a course"""
+    cache_key = ("outline", course_id)
+    cached = catalog_cache.get(cache_key)
+    if cached:
+        return await compression.negotiated_response(request, cached)
+    version = catalog_cache.version
+    
+    course = await db.courses.find_one({"id": course_id}, {"_id": 0, "modules": 1})
+    if not course:
+        raise HTTPException(status_code=404, detail="Course not found")
+    outline = course.get("modules", [])
+    entry = catalog_cache.put(cache_key, outline, serialization.dumps(outline), version)
+    return await compression.negotiated_response(request, entry)
+
+@courses_router.get("/{course_id}/modules/{module_id}", response_model=ModuleDetailResponse)
+async def get_module(course_id: str, module_id: str, request: Request):
+    """Full module content; revalidate with If-None-Match"""
+    cache_key = (course_id, module_id)
+    entry = module_cache.get(cache_key)
+    if entry is None:
+        generation = module_cache_generation
+        module = await db.course_modules.find_one({"id": module_id, "course_id": course_id}, {"_id": 0})
+        if not module:
+            raise HTTPException(status_code=404, detail="Module not found")
+        entry = CatalogEntry(data=module, body=serialization.encode(module, ModuleDetailResponse), version=module["version"])
+        if generation == module_cache_generation:
+            module_cache.set(cache_key, entry)
+    
+    etag = course_content.module_etag(entry.data)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if course_content.etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    response = await compression.negotiated_response(request, entry)
+    response.headers.update(headers)
+    return response
+
+@courses_router.patch("/{course_id}/modules/{module_id}", response_model=ModuleDetailResponse)
+async def update_module(
+    course_id: str,
+    module_id: str,
+    changes: ModuleUpdate,
+    request: Request,
+    response: Response,
+    user: Dict = Depends(require_instructor)
+):
+    """Partial module update; send If-Match with the module's ETag to avoid lost updates"""
+    course = await db.courses.find_one({"id": course_id}, {"_id": 0, "id": 1, "instructor_id": 1})
+    if not course:
+        raise HTTPException(status_code=404, detail="Course not found")
+    if user["role"] != UserRole.ADMIN and course.get("instructor_id") != user["id"]:
+        raise HTTPException(status_code=403, detail="Not authorized to update this course")
+    
+    update_data = changes.model_dump(exclude_unset=True)
+    if not update_data:
+        raise HTTPException(status_code=400, detail="No changes provided")
+    
+    query = {"id": module_id, "course_id": course_id}
+    if_match = request.headers.get("if-match")
+    if if_match and if_match.strip() != "*":
+        current = await db.course_modules.find_one(query, {"_id": 0, "id": 1, "version": 1})
+        if not current:
+            raise HTTPException(status_code=404, detail="Module not found")
+        if not course_content.etag_matches(if_match, course_content.module_etag(current)):
+            raise HTTPException(status_code=412, detail="Module was modified by someone else")
+        query["version"] = current["version"]
+    
+    update_data["updated_at"] = datetime.now(timezone.utc).isoformat()
+    updated = await db.course_modules.find_one_and_update(
+        query,
+        {"$set": update_data, "$inc": {"version": 1}},
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER
+    )
+    if not updated:
+        if "version" in query:
+            raise HTTPException(status_code=412, detail="Module was modified by someone else")
+        raise HTTPException(status_code=404, detail="Module not found")
+    
+    await db.courses.update_one(
+        {"id": course_id, "modules.id": module_id},
+        {"$set": {"modules.$": course_content.outline(updated)}}
+    )
+    invalidate_module(updated)
+    catalog_cache.invalidate()
+    response.headers["ETag"] = course_content.module_etag(updated)
+    return updated
+
 # ==================== ENROLLMENTS ROUTES ====================
 
 @enrollments_router.get("", response_model=List[EnrollmentResponse])
-async def get_enrollments(user: Dict = Depends(require_auth)):
-    enrollments = await db.enrollments.find({"user_id": user["id"]}, {"_id": 0}).to_list(1000)
-    return enrollments
+async def get_enrollments(request: Request, response: Response, user: Dict = Depends(require_auth)):
+    etag = user_etag(user["id"], await user_version(user["id"]), "enrollments")
+    cached = not_modified(request, etag)
+    if cached:
+        return cached
+    enrollments = await db.enrollments.find({"user_id": user["id"]}, projection_for(EnrollmentResponse)).to_list(1000)
+    return with_etag(fast_response(enrollments, List[EnrollmentResponse]), response, etag)
 
 @enrollments_router.get("/{enrollment_id}", response_model=EnrollmentResponse)
 async def get_enrollment(enrollment_id: str, user: Dict = Depends(require_auth)):
@@ -404,10 +866,14 @@ async def create_enrollment(enrollment: EnrollmentCreate, user: Dict = Depends(r
     }
     
     await db.enrollments.insert_one(enrollment_doc)
-    await db.courses.update_one({"id": enrollment.course_id}, {"$inc": {"enrolled_count": 1}})
+    await enrollment_counter.increment(enrollment.course_id)
+    recommender.record_enrollment(user["id"], enrollment.course_id)
+    course_analytics.mark_dirty(enrollment.course_id)
+    await bump_user_version(user["id"])
     
     if "_id" in enrollment_doc:
         del enrollment_doc["_id"]
+    publish_enrollment_created(enrollment_doc)
     return enrollment_doc
 
 @enrollments_router.put("/{enrollment_id}/progress")
@@ -441,66 +907,113 @@ async def update_progress(
         update_data["completed_at"] = datetime.now(timezone.utc).isoformat()
     
     await db.enrollments.update_one({"id": enrollment_id}, {"$set": update_data})
+    course_analytics.mark_dirty(enrollment["course_id"])
+    await bump_user_version(user["id"])
+    event_bus.publish(user_topic(user["id"]), "progress.updated", {
+        "enrollment_id": enrollment_id,
+        "course_id": enrollment["course_id"],
+        **update_data
+    })
     return {"message": "Progress updated", "progress": progress}
 
 # ==================== PAYMENTS ROUTES ====================
 
 @payments_router.post("/checkout", response_model=PaymentResponse)
-async def create_checkout(payment: PaymentCreate, request: Request, user: Dict = Depends(require_auth)):
+async def create_checkout(
+    payment: PaymentCreate,
+    request: Request,
+    user: Dict = Depends(require_auth),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", max_length=255)
+):
     from emergentintegrations.payments.stripe.checkout import StripeCheckout, CheckoutSessionRequest
     
-    course = await db.courses.find_one({"id": payment.course_id})
+    try:
+        course, existing_enrollment, replay = await asyncio.gather(
+            db.courses.find_one({"id": payment.course_id}, {"_id": 0, "id": 1, "title": 1, "price": 1}),
+            db.enrollments.find_one({"user_id": user["id"], "course_id": payment.course_id}, {"_id": 1}),
+            idempotency.find_replay(db, user["id"], payment.course_id, idempotency_key)
+        )
+    except idempotency.IdempotencyConflict:
+        raise HTTPException(status_code=409, detail="Idempotency-Key was already used for a different course")
+    if replay:
+        idempotency.checkout_sessions_total.inc(outcome="replayed")
+        return PaymentResponse(checkout_url=replay["checkout_url"], session_id=replay["session_id"])
     if not course:
         raise HTTPException(status_code=404, detail="Course not found")
-    
-    # Check if already enrolled
-    existing_enrollment = await db.enrollments.find_one({
-        "user_id": user["id"],
-        "course_id": payment.course_id
-    })
     if existing_enrollment:
         raise HTTPException(status_code=400, detail="Already enrolled in this course")
     
-    stripe_key = os.environ.get('STRIPE_API_KEY', 'sk_test_emergent')
-    host_url = str(request.base_url).rstrip('/')
-    webhook_url = f"{host_url}/api/webhook/stripe"
-    
-    stripe_checkout = StripeCheckout(api_key=stripe_key, webhook_url=webhook_url)
-    
-    success_url = f"{payment.origin_url}/payment/success?session_id={{CHECKOUT_SESSION_ID}}"
-    cancel_url = f"{payment.origin_url}/courses/{payment.course_id}"
+    amount = float(course["price"])
+    open_session = await idempotency.find_open_session(db, user["id"], payment.course_id, payment.origin_url, amount)
+    if open_session:
+        idempotency.checkout_sessions_total.inc(outcome="reused")
+        return PaymentResponse(checkout_url=open_session["checkout_url"], session_id=open_session["session_id"])
+    
+    claim = idempotency.claim(db, user["id"], payment.course_id)
+    if not await claim.try_acquire():
+        # A concurrent request for the same course is creating the session
+        open_session = await idempotency.wait_for_session(db, user["id"], payment.course_id, payment.origin_url, amount)
+        if not open_session:
+            raise HTTPException(status_code=409, detail="A checkout for this course is already in progress",
+                                headers={"Retry-After": "2"})
+        idempotency.checkout_sessions_total.inc(outcome="reused")
+        return PaymentResponse(checkout_url=open_session["checkout_url"], session_id=open_session["session_id"])
     
-    checkout_request = CheckoutSessionRequest(
-        amount=float(course["price"]),
-        currency="usd",
-        success_url=success_url,
-        cancel_url=cancel_url,
-        metadata={
+    try:
+        stripe_key = os.environ.get('STRIPE_API_KEY', 'sk_test_emergent')
+        host_url = str(request.base_url).rstrip('/')
+        webhook_url = f"{host_url}/api/webhook/stripe"
+        
+        stripe_checkout = StripeCheckout(api_key=stripe_key, webhook_url=webhook_url)
+        
+        success_url = f"{payment.origin_url}/payment/success?session_id={{CHECKOUT_SESSION_ID}}"
+        cancel_url = f"{payment.origin_url}/courses/{payment.course_id}"
+        
+        checkout_request = CheckoutSessionRequest(
+            amount=amount,
+            currency="usd",
+            success_url=success_url,
+            cancel_url=cancel_url,
+            metadata={
+                "user_id": user["id"],
+                "course_id": payment.course_id,
+                "course_title": course["title"]
+            }
+        )
+        
+        session = await deadlines.call_external(
+            "stripe", "create_checkout_session", stripe_checkout.create_checkout_session, checkout_request
+        )
+        
+        # Create payment transaction record
+        transaction_doc = {
+            "id": str(uuid.uuid4()),
+            "session_id": session.session_id,
+            "checkout_url": session.url,
+            "origin_url": payment.origin_url,
             "user_id": user["id"],
             "course_id": payment.course_id,
-            "course_title": course["title"]
-        }
-    )
-    
-    session = await stripe_checkout.create_checkout_session(checkout_request)
-    
-    # Create payment transaction record
-    transaction_doc = {
-        "id": str(uuid.uuid4()),
-        "session_id": session.session_id,
-        "user_id": user["id"],
-        "course_id": payment.course_id,
-        "amount": float(course["price"]),
-        "currency": "usd",
-        "status": "pending",
-        "payment_status": "initiated",
-        "created_at": datetime.now(timezone.utc).isoformat(),
-        "metadata": {
-            "course_title": course["title"]
+            "amount": amount,
+            "currency": "usd",
+            "status": "pending",
+            "payment_status": "initiated",
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "metadata": {
+                "course_title": course["title"]
+            }
         }
-    }
-    await db.payment_transactions.insert_one(transaction_doc)
-    
+        if idempotency_key:
+            transaction_doc["idempotency_key"] = idempotency_key
+        try:
+            await db.payment_transactions.insert_one(transaction_doc)
+        except DuplicateKeyError:
+            raise HTTPException(status_code=409, detail="Idempotency-Key was already used for a different course")
+    finally:
+        await claim.release()
+    await audit_payment("checkout.created", session.session_id, user_id=user["id"],
+                        course_id=payment.course_id, amount=amount, currency="usd")
+    
+    idempotency.checkout_sessions_total.inc(outcome="created")
     return PaymentResponse(checkout_url=session.url, session_id=session.session_id)
 
 @payments_router.get("/status/{session_id}")
@@ -510,7 +1023,7 @@ async def get_payment_status(session_id: str, user: Dict = Depends(require_auth)
     stripe_key = os.environ.get('STRIPE_API_KEY', 'sk_test_emergent')
     stripe_checkout = StripeCheckout(api_key=stripe_key, webhook_url="")
     
-    status = await stripe_checkout.get_checkout_status(session_id)
+    status = await deadlines.call_external("stripe", "get_checkout_status", stripe_checkout.get_checkout_status, session_id)
     
     # Update transaction record
     transaction = await db.payment_transactions.find_one({"session_id": session_id})
@@ -523,6 +1036,12 @@ async def get_payment_status(session_id: str, user: Dict = Depends(require_auth)
             {"session_id": session_id},
             {"$set": update_data}
         )
+        if status.payment_status != transaction.get("payment_status"):
+            await audit_payment("status.changed", session_id, source="poll", user_id=transaction["user_id"],
+                                previous=transaction.get("payment_status"), payment_status=status.payment_status)
+        
+        if status.payment_status == "paid" and transaction.get("payment_status") != "paid":
+            publish_payment_paid(transaction)
         
         # If payment successful, create enrollment
         if status.payment_status == "paid":
@@ -544,10 +1063,11 @@ async def get_payment_status(session_id: str, user: Dict = Depends(require_auth)
                     "payment_id": transaction["id"]
                 }
                 await db.enrollments.insert_one(enrollment_doc)
-                await db.courses.update_one(
-                    {"id": transaction["course_id"]},
-                    {"$inc": {"enrolled_count": 1}}
-                )
+                await enrollment_counter.increment(transaction["course_id"])
+                recommender.record_enrollment(transaction["user_id"], transaction["course_id"])
+                course_analytics.mark_dirty(transaction["course_id"])
+                await bump_user_version(transaction["user_id"])
+                publish_enrollment_created(enrollment_doc)
     
     return {
         "status": status.status,
@@ -566,9 +1086,27 @@ async def stripe_webhook(request: Request):
     body = await request.body()
     signature = request.headers.get("Stripe-Signature")
     
+    # Forged deliveries stop here: no Stripe client call, no breaker, no database work
+    try:
+        stripe_webhooks.verify_signature(body, signature)
+    except stripe_webhooks.SignatureVerificationError as e:
+        logger.warning(f"Rejected Stripe webhook: {e}")
+        raise HTTPException(status_code=400, detail="Invalid webhook signature")
+    
+    try:
+        webhook_response = await deadlines.call_external(
+            "stripe", "handle_webhook", stripe_checkout.handle_webhook, body, signature
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        if deadlines.is_provider_failure(e):
+            raise
+        # The Stripe client rejected the signature or payload
+        logger.warning(f"Rejected Stripe webhook: {e}")
+        raise HTTPException(status_code=400, detail="Invalid webhook payload")
+    
     try:
-        webhook_response = await stripe_checkout.handle_webhook(body, signature)
-        
         if webhook_response.payment_status == "paid":
             session_id = webhook_response.session_id
             transaction = await db.payment_transactions.find_one({"session_id": session_id})
@@ -578,6 +1116,10 @@ async def stripe_webhook(request: Request):
                     {"session_id": session_id},
                     {"$set": {"status": "complete", "payment_status": "paid"}}
                 )
+                await audit_payment("status.changed", session_id, source="webhook", user_id=transaction["user_id"],
+                                    previous=transaction.get("payment_status"), payment_status="paid")
+                if transaction.get("payment_status") != "paid":
+                    publish_payment_paid(transaction)
                 
                 existing_enrollment = await db.enrollments.find_one({
                     "user_id": transaction["user_id"],
@@ -597,8 +1139,16 @@ async def stripe_webhook(request: Request):
                         "payment_id": transaction["id"]
                     }
                     await db.enrollments.insert_one(enrollment_doc)
+                    await enrollment_counter.increment(transaction["course_id"])
+                    recommender.record_enrollment(transaction["user_id"], transaction["course_id"])
+                    course_analytics.mark_dirty(transaction["course_id"])
+                    await bump_user_version(transaction["user_id"])
+                    publish_enrollment_created(enrollment_doc)
         
         return {"received": True}
+    except HTTPException:
+        # Timed out or shed: a non-2xx makes Stripe redeliver the event later
+        raise
     except Exception as e:
         logger.error(f"Webhook error: {e}")
         return {"received": True}
@@ -630,7 +1180,7 @@ async def ai_chat(message: AIMessage, user: Dict = Depends(require_auth)):
     ).with_model("openai", "gpt-5.2")
     
     user_message = UserMessage(text=message.content)
-    response = await chat.send_message(user_message)
+    response = await deadlines.call_external("llm", "chat", chat.send_message, user_message)
     
     # Store chat message
     chat_doc = {
@@ -642,7 +1192,7 @@ async def ai_chat(message: AIMessage, user: Dict = Depends(require_auth)):
         "ai_response": response,
         "created_at": datetime.now(timezone.utc).isoformat()
     }
-    await db.ai_chats.insert_one(chat_doc)
+    await write_behind.chat_log.append(chat_doc)
     
     return AIResponse(response=response, session_id=session_id)
 
@@ -682,7 +1232,7 @@ async def generate_quiz(
     
     prompt = f"Generate {num_questions} multiple choice questions about: {topic}"
     user_message = UserMessage(text=prompt)
-    response = await chat.send_message(user_message)
+    response = await deadlines.call_external("llm", "generate_quiz", chat.send_message, user_message)
     
     import json
     try:
@@ -700,25 +1250,35 @@ async def generate_quiz(
 # ==================== CERTIFICATES ROUTES ====================
 
 @certificates_router.get("", response_model=List[CertificateResponse])
-async def get_certificates(user: Dict = Depends(require_auth)):
-    certificates = await db.certificates.find({"user_id": user["id"]}, {"_id": 0}).to_list(1000)
-    return certificates
+async def get_certificates(request: Request, response: Response, user: Dict = Depends(require_auth)):
+    etag = user_etag(user["id"], await user_version(user["id"]), "certificates")
+    cached = not_modified(request, etag)
+    if cached:
+        return cached
+    certificates = await db.certificates.find({"user_id": user["id"]}, projection_for(CertificateResponse)).to_list(1000)
+    return with_etag(fast_response(certificates, List[CertificateResponse]), response, etag)
 
 @certificates_router.get("/{certificate_id}", response_model=CertificateResponse)
 async def get_certificate(certificate_id: str):
-    certificate = await db.certificates.find_one({"id": certificate_id}, {"_id": 0})
-    if not certificate:
-        raise HTTPException(status_code=404, detail="Certificate not found")
+    certificate = certificate_cache.get(("id", certificate_id))
+    if certificate is None:
+        certificate = await db.certificates.find_one({"id": certificate_id}, {"_id": 0})
+        if not certificate:
+            raise HTTPException(status_code=404, detail="Certificate not found")
+        certificate_cache.set(("id", certificate_id), certificate)
     return certificate
 
 @certificates_router.get("/verify/{certificate_number}")
 async def verify_certificate(certificate_number: str):
-    certificate = await db.certificates.find_one(
-        {"certificate_number": certificate_number}, 
-        {"_id": 0}
-    )
-    if not certificate:
-        return {"valid": False, "message": "Certificate not found"}
+    certificate = certificate_cache.get(("number", certificate_number))
+    if certificate is None:
+        certificate = await db.certificates.find_one(
+            {"certificate_number": certificate_number}, 
+            {"_id": 0}
+        )
+        if not certificate:
+            return {"valid": False, "message": "Certificate not found"}
+        certificate_cache.set(("number", certificate_number), certificate)
     return {"valid": True, "certificate": certificate}
 
 @certificates_router.post("", response_model=CertificateResponse)
@@ -760,8 +1320,11 @@ async def generate_certificate(
     }
     
     await db.certificates.insert_one(certificate_doc)
+    await bump_user_version(user["id"])
     if "_id" in certificate_doc:
         del certificate_doc["_id"]
+    event_bus.publish(user_topic(user["id"]), "certificate.issued", certificate_doc)
+    publish_counters(total_certificates=1)
     return certificate_doc
 
 # ==================== USERS ROUTES (Admin) ====================
@@ -774,8 +1337,8 @@ async def get_users(
     query = {}
     if role:
         query["role"] = role
-    users = await db.users.find(query, {"_id": 0, "password": 0}).to_list(1000)
-    return users
+    users = await db.users.find(query, projection_for(UserResponse)).to_list(1000)
+    return fast_response(users, List[UserResponse])
 
 @users_router.put("/{user_id}/role")
 async def update_user_role(
@@ -786,9 +1349,11 @@ async def update_user_role(
     if new_role not in [UserRole.STUDENT, UserRole.INSTRUCTOR, UserRole.ADMIN]:
         raise HTTPException(status_code=400, detail="Invalid role")
     
-    result = await db.users.update_one({"id": user_id}, {"$set": {"role": new_role}})
+    result = await db.users.update_one({"id": user_id}, {"$set": {"role": new_role}, "$inc": {"data_version": 1}})
     if result.modified_count == 0:
         raise HTTPException(status_code=404, detail="User not found")
+    user_cache.invalidate(user_id)
+    event_bus.publish(user_topic(user_id), "user.updated", {"id": user_id, "role": new_role})
     return {"message": "Role updated successfully"}
 
 # ==================== ANALYTICS ROUTES ====================
@@ -823,6 +1388,254 @@ async def get_analytics_overview(user: Dict = Depends(require_admin)):
         "users_by_role": {item["_id"]: item["count"] for item in users_by_role}
     }
 
+@api_router.get("/analytics/courses/{course_id}/cohort")
+async def get_course_cohort_analytics(course_id: str, user: Dict = Depends(require_instructor)):
+    """Progress percentiles, module funnel and time-to-completion for one course"""
+    course = await db.courses.find_one({"id": course_id}, {"_id": 0, "id": 1, "instructor_id": 1})
+    if not course:
+        raise HTTPException(status_code=404, detail="Course not found")
+    if user["role"] != UserRole.ADMIN and course.get("instructor_id") != user["id"]:
+        raise HTTPException(status_code=403, detail="Not authorized to view this course's analytics")
+    report = await course_analytics.report(db, course_id)
+    if report is None:
+        raise HTTPException(status_code=404, detail="Course not found")
+    return report
+
+# ==================== DIAGNOSTICS ROUTES (Admin) ====================
+
+@admin_router.get("/diagnostics/slow-queries")
+async def get_slow_queries(
+    limit: int = 20,
+    flagged_only: bool = False,
+    user: Dict = Depends(require_admin)
+):
+    profiler = diagnostics.slow_query_profiler
+    return {
+        "threshold_ms": profiler.threshold_ms,
+        "sample_rate": profiler.sample_rate,
+        "queries": profiler.top_offenders(limit=limit, flagged_only=flagged_only)
+    }
+
+@admin_router.delete("/diagnostics/slow-queries")
+async def reset_slow_queries(user: Dict = Depends(require_admin)):
+    diagnostics.slow_query_profiler.reset()
+    return {"message": "Slow query records cleared"}
+
+# ==================== EXPORTS ROUTES (Admin) ====================
+
+@admin_router.get("/exports/{dataset}")
+async def export_dataset(
+    dataset: str,
+    format: str = "ndjson",
+    role: Optional[str] = None,
+    status: Optional[str] = None,
+    payment_status: Optional[str] = None,
+    course_id: Optional[str] = None,
+    user_id: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    after: Optional[str] = None,
+    limit: Optional[int] = None,
+    user: Dict = Depends(require_admin)
+):
+    """Stream users, enrollments or transactions as NDJSON or CSV; resume with ?after=<cursor>"""
+    if dataset not in exports.DATASETS:
+        raise HTTPException(status_code=404, detail="Unknown export")
+    if format not in exports.FORMATS:
+        raise HTTPException(status_code=400, detail="Format must be ndjson or csv")
+    
+    def iso(value: Optional[datetime]) -> Optional[str]:
+        if value is None:
+            return None
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value.astimezone(timezone.utc).isoformat()
+    
+    filters = {"role": role, "status": status, "payment_status": payment_status, "course_id": course_id, "user_id": user_id}
+    try:
+        query = exports.build_query(exports.DATASETS[dataset], filters, iso(since), iso(until), after)
+    except exports.ExportError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    filename = f"{dataset}-{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')}.{format}"
+    return StreamingResponse(
+        exports.stream_rows(db, dataset, query, format, limit),
+        media_type=exports.FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+# ==================== IMPORTS ROUTES (Admin) ====================
+
+def validation_message(error: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(str(part) for part in item['loc'])}: {item['msg']}" for item in error.errors())
+
+async def import_users_batch(rows: List[Tuple[int, Dict]], report: bulk_import.ImportReport, admin: Dict, dry_run: bool):
+    valid = []
+    for line, row in rows:
+        password_hash = row.pop("password_hash", None)
+        try:
+            user_data = UserBase.model_validate(row) if password_hash else UserCreate.model_validate(row)
+        except ValidationError as e:
+            report.error(line, validation_message(e))
+            continue
+        if password_hash and not bulk_import.is_bcrypt_hash(password_hash):
+            report.error(line, "password_hash must be a bcrypt hash")
+            continue
+        if user_data.role not in (UserRole.STUDENT, UserRole.INSTRUCTOR, UserRole.ADMIN):
+            report.error(line, "Invalid role")
+            continue
+        valid.append((line, user_data, password_hash))
+    
+    # Reject known and repeated emails before paying for bcrypt
+    emails = [user_data.email for _, user_data, _ in valid]
+    taken = {doc["email"] async for doc in db.users.find({"email": {"$in": emails}}, {"_id": 0, "email": 1})}
+    seen = set()
+    accepted = []
+    for line, user_data, password_hash in valid:
+        if user_data.email in taken:
+            report.error(line, "Email already registered")
+        elif user_data.email in seen:
+            report.error(line, "Email appears earlier in this upload")
+        else:
+            seen.add(user_data.email)
+            accepted.append((line, user_data, password_hash))
+    if dry_run:
+        return
+    
+    hashes = iter(await bulk_import.hash_passwords(
+        [user_data.password for _, user_data, password_hash in accepted if not password_hash]
+    ))
+    docs = [
+        (line, build_user_doc(user_data, password_hash or next(hashes)))
+        for line, user_data, password_hash in accepted
+    ]
+    await bulk_import.write_batch(db.users, docs, report)
+
+async def import_courses_batch(rows: List[Tuple[int, Dict]], report: bulk_import.ImportReport, admin: Dict, dry_run: bool):
+    docs = []
+    module_docs = {}
+    for line, row in rows:
+        try:
+            course = CourseCreate.model_validate(row)
+        except ValidationError as e:
+            report.error(line, validation_message(e))
+            continue
+        course_doc, modules = build_course_doc(course, course.instructor_id or admin["id"])
+        docs.append((line, course_doc))
+        module_docs[line] = modules
+    if dry_run:
+        return
+    
+    written = await bulk_import.write_batch(db.courses, docs, report)
+    modules = [module for line in written for module in module_docs[line]]
+    if modules:
+        await db.course_modules.insert_many(modules, ordered=False)
+
+IMPORTERS = {"users": import_users_batch, "courses": import_courses_batch}
+
+@admin_router.post("/imports/{kind}")
+async def import_records(kind: str, request: Request, dry_run: bool = False, user: Dict = Depends(require_admin)):
+    """Import users or courses from an NDJSON body (one object per line); returns a per-line error report"""
+    importer = IMPORTERS.get(kind)
+    if importer is None:
+        raise HTTPException(status_code=404, detail="Unknown import")
+    
+    report = bulk_import.ImportReport(kind)
+    batch: List[Tuple[int, Dict]] = []
+    async for line, row in bulk_import.iter_ndjson(request.stream()):
+        report.received += 1
+        if isinstance(row, str):
+            report.error(line, row)
+            continue
+        batch.append((line, row))
+        if len(batch) >= bulk_import.IMPORT_BATCH_SIZE:
+            await importer(batch, report, user, dry_run)
+            batch = []
+    if batch:
+        await importer(batch, report, user, dry_run)
+    
+    if report.inserted:
+        if kind == "courses":
+            catalog_cache.invalidate()
+            facet_index.mark_stale()
+        publish_counters(**{f"total_{kind}": report.inserted})
+    return report.as_dict()
+
+# ==================== EVENTS ROUTES ====================
+
+async def authenticate_token(token: Optional[str]) -> Optional[Dict]:
+    """Resolve a bearer token passed as a query parameter (WebSocket and EventSource cannot set headers)"""
+    if not token:
+        return None
+    try:
+        return await get_current_user(HTTPAuthorizationCredentials(scheme="Bearer", credentials=token))
+    except HTTPException:
+        return None
+
+def event_topics(user: Dict) -> List[str]:
+    topics = [user_topic(user["id"])]
+    if user.get("role") == UserRole.ADMIN:
+        topics.append(ADMIN_TOPIC)
+    return topics
+
+def format_sse(event: Dict) -> bytes:
+    return (
+        f"id: {event['id']}\nevent: {event['type']}\ndata: ".encode()
+        + serialization.dumps(event) + b"\n\n"
+    )
+
+@events_router.get("/stream")
+async def event_stream(
+    token: Optional[str] = None,
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+):
+    """Server-Sent Events feed of the caller's events (plus admin counters for admins)"""
+    user = await authenticate_token(token or (credentials.credentials if credentials else None))
+    if not user:
+        raise HTTPException(status_code=401, detail="Authentication required")
+    subscription = event_bus.subscribe(event_topics(user), "sse")
+    
+    async def stream():
+        try:
+            yield b"retry: 5000\n: connected\n\n"
+            while True:
+                event = await subscription.next(timeout=events.EVENTS_HEARTBEAT_SECONDS)
+                # Comments keep proxies from timing out idle streams
+                yield format_sse(event) if event else b": ping\n\n"
+        finally:
+            event_bus.unsubscribe(subscription)
+    
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
+
+@events_router.websocket("/ws")
+async def event_socket(websocket: WebSocket, token: Optional[str] = None):
+    """WebSocket feed of the same events; client messages are ignored"""
+    user = await authenticate_token(token)
+    if not user:
+        await websocket.close(code=1008)
+        return
+    await websocket.accept()
+    subscription = event_bus.subscribe(event_topics(user), "websocket")
+    
+    async def pump():
+        while True:
+            event = await subscription.next(timeout=events.EVENTS_HEARTBEAT_SECONDS)
+            payload = serialization.dumps(event) if event else b'{"type": "ping"}'
+            await websocket.send_text(payload.decode())
+    
+    sender = asyncio.create_task(pump())
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+    finally:
+        sender.cancel()
+        event_bus.unsubscribe(subscription)
+
 # ==================== HEALTH CHECK ====================
 
 @api_router.get("/")
@@ -833,6 +1646,21 @@ async def root():
 async def health_check():
     return {"status": "healthy", "timestamp": datetime.now(timezone.utc).isoformat()}
 
+@api_router.get("/ready")
+async def readiness_check():
+    """503 until this worker has warmed up, and while Mongo does not answer a ping"""
+    ready, body = await warm_up.report(db, metrics.mongo_pool_listener.stats())
+    if ready:
+        return body
+    return JSONResponse(body, status_code=503, headers={"Retry-After": str(warmup.READY_RETRY_AFTER_SECONDS)})
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics(request: Request, credentials: HTTPAuthorizationCredentials = Depends(security)):
+    """Open to METRICS_ALLOWED_NETWORKS; anyone else needs an admin token"""
+    if not metrics.scrape_allowed(request.client.host if request.client else None):
+        await require_admin(await require_auth(credentials))
+    return Response(content=metrics.registry.render(), media_type=metrics.CONTENT_TYPE)
+
 # ==================== INCLUDE ROUTERS ====================
 
 api_router.include_router(auth_router)
@@ -842,9 +1670,16 @@ api_router.include_router(enrollments_router)
 api_router.include_router(payments_router)
 api_router.include_router(ai_router)
 api_router.include_router(certificates_router)
+api_router.include_router(admin_router)
+api_router.include_router(events_router)
 
 app.include_router(api_router)
 
+# Innermost, so deadline errors still get CORS headers, compression and metrics
+app.add_middleware(deadlines.DeadlineMiddleware)
+# Outside the deadline, so rejected requests never reach bcrypt or Mongo
+app.add_middleware(rate_limit.RateLimitMiddleware)
+
 # CORS Middleware
 app.add_middleware(
     CORSMiddleware,
@@ -854,13 +1689,65 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+app.add_middleware(compression.CompressionMiddleware)
+app.add_middleware(metrics.MetricsMiddleware)
+
+def create_app() -> FastAPI:
+    """App factory for multi-process mode (gunicorn.conf.py, or uvicorn --factory).
+
+    Each worker builds its own Motor client after fork; one-time startup work
+    is coordinated across workers by coordination.run_startup_tasks.
+    """
+    if _client_pid != os.getpid():
+        connect_db()
+    return app
+
+@app.on_event("startup")
+async def start_worker():
+    # A client inherited across fork (e.g. gunicorn --preload) is not safe to reuse
+    if _client_pid != os.getpid():
+        connect_db()
+    app.state.loop_lag_task = asyncio.create_task(metrics.monitor_event_loop_lag())
+    diagnostics.slow_query_profiler.attach(db)
+    app.state.invalidator_task = asyncio.create_task(ChangeStreamInvalidator(db).run())
+    app.state.event_relay_task = events.start_relay(db)
+    enrollment_counter.bind(db)
+    app.state.counter_task = asyncio.create_task(enrollment_counter.run())
+    app.state.write_behind_tasks = write_behind.start(db)
+    app.state.recommendations_task = asyncio.create_task(recommender.run(db))
+    app.state.recommendation_updates_task = asyncio.create_task(recommender.run_updates(db))
+    app.state.analytics_task = asyncio.create_task(course_analytics.run(db))
+    app.state.warmup_task = asyncio.create_task(warm_up.run(db, prime_catalog))
+    app.state.snapshot_task = (
+        asyncio.create_task(catalog_snapshots.run(db, build_catalog_snapshot)) if snapshots.CATALOG_SNAPSHOT_ENABLED else None
+    )
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    # Fail readiness first so the load balancer stops sending new requests
+    warm_up.set_ready(False)
+    app.state.warmup_task.cancel()
+    app.state.loop_lag_task.cancel()
+    app.state.invalidator_task.cancel()
+    app.state.recommendations_task.cancel()
+    app.state.recommendation_updates_task.cancel()
+    app.state.analytics_task.cancel()
+    if app.state.event_relay_task:
+        app.state.event_relay_task.cancel()
+    if app.state.snapshot_task:
+        app.state.snapshot_task.cancel()
+    # Let the counter task write its pending increments before the client closes
+    app.state.counter_task.cancel()
+    await asyncio.gather(app.state.counter_task, return_exceptions=True)
+    # Drain buffered chat logs and audit records the same way
+    for task in app.state.write_behind_tasks:
+        task.cancel()
+    await asyncio.gather(*app.state.write_behind_tasks, return_exceptions=True)
+    bulk_import.shutdown_pool()
     client.close()
 
 # ==================== SEED DATA ====================
 
-@app.on_event("startup")
 async def seed_courses():
     """Seed initial course catalog if empty"""
     course_count = await db.courses.count_documents({})
@@ -1039,7 +1926,13 @@ async def seed_courses():
             "thumbnail": None
         })
     
+    module_docs = []
+    for course_doc in courses_to_insert:
+        course_doc["modules"], docs = course_content.split_modules(course_doc["id"], course_doc["modules"])
+        module_docs.extend(docs)
+    
     if courses_to_insert:
+        await db.course_modules.insert_many(module_docs)
         await db.courses.insert_many(courses_to_insert)
         logger.info(f"Seeded {len(courses_to_insert)} courses")
     
@@ -1057,3 +1950,26 @@ async def seed_courses():
         }
         await db.users.insert_one(admin_doc)
         logger.info("Created admin user: admin@righttechcentre.com / admin123")
+
+async def ensure_user_indexes():
+    """Unique emails back both register and bulk imports"""
+    try:
+        await db.users.create_index("email", unique=True)
+    except OperationFailure as e:
+        # Existing duplicates must be resolved by hand; raising keeps the step pending so the next start retries it
+        logger.error(f"Could not create unique index on users.email: {e}")
+        raise
+
+@app.on_event("startup")
+async def run_startup_tasks():
+    """One-time startup work, executed by a single leader worker per cluster"""
+    await coordination.run_startup_tasks(db, {
+        "seed_courses": seed_courses,
+        "course_counter_indexes": enrollment_counter.ensure_indexes,
+        "payment_transaction_indexes": lambda: idempotency.ensure_indexes(db),
+        "course_module_indexes": lambda: course_content.ensure_indexes(db),
+        "split_course_modules": lambda: course_content.migrate_inline_modules(db),
+        "user_email_index": ensure_user_indexes,
+        "enrollment_user_course_index": lambda: recommendations.ensure_indexes(db),
+        "enrollment_course_index": lambda: cohort_analytics.ensure_indexes(db),
+    })
@@ -0,0 +1,274 @@
+"""Static snapshots of the public course catalog.
+
+The published catalog (``GET /api/courses`` with default filters, and
+``GET /api/courses/{id}`` for published courses) only changes on admin
+edits, so it can be served as static files. ``CatalogSnapshots.publish``
+writes one versioned directory per catalog state::
+
+    CATALOG_SNAPSHOT_DIR/
+        current -> versions/<version>
+        versions/<version>/courses.json         (+ .gz, .br)
+        versions/<version>/courses/<id>.json    (+ .gz, .br)
+        versions/<version>/manifest.json
+
+Bodies are byte-identical to the API responses. Precompressed variants sit
+next to each file for ``gzip_static`` / ``brotli_static`` style serving, so
+any static file server or CDN can answer anonymous catalog traffic from
+``current/`` without touching the Python app. Point the CDN at that
+directory, or expose it with the web server's static file rules.
+
+A version is named by a hash of its content. Publishing the same catalog
+twice is a no-op. A version is fully written under a temporary name, renamed
+into place, and only then made live by atomically replacing the ``current``
+symlink. Readers therefore never see a half-written catalog. Files that did
+not change since the live version reuse its compressed variants (hard links)
+instead of being recompressed. After a switch, only versions older than the
+new live one are pruned, keeping the newest ``CATALOG_SNAPSHOT_KEEP``.
+
+Only one worker per snapshot directory publishes: the holder of a
+``LeaderLease`` named after the host and directory. Each worker's build
+includes its own not-yet-flushed enrollment counts, so letting every worker
+publish would make ``current`` bounce between slightly different
+catalogs. The other workers only read the snapshot, and take over publishing
+if the leader's lease expires.
+
+The leader's ``run`` loop republishes shortly after ``mark_dirty`` (wired to
+catalog cache invalidation, which change streams carry to every worker) and
+at least every ``CATALOG_SNAPSHOT_REFRESH_SECONDS``. That refresh picks up
+enrollment counts, which are at most ``CATALOG_CACHE_TTL`` old in the
+catalog entries it reads. The API also falls back to the live snapshot (``entry``)
+when Mongo is unreachable; see ``catalog_response`` in server.py.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import socket
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from pymongo.errors import PyMongoError
+
+import compression
+import metrics
+from catalog import CatalogEntry
+from coordination import LeaderLease
+
+logger = logging.getLogger(__name__)
+
+CATALOG_SNAPSHOT_ENABLED = os.environ.get('CATALOG_SNAPSHOT_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+CATALOG_SNAPSHOT_DIR = Path(os.environ.get('CATALOG_SNAPSHOT_DIR', str(Path(__file__).parent / 'catalog_snapshot')))
+CATALOG_SNAPSHOT_DEBOUNCE_SECONDS = float(os.environ.get('CATALOG_SNAPSHOT_DEBOUNCE_SECONDS', '2'))
+CATALOG_SNAPSHOT_REFRESH_SECONDS = float(os.environ.get('CATALOG_SNAPSHOT_REFRESH_SECONDS', '300'))
+CATALOG_SNAPSHOT_KEEP = int(os.environ.get('CATALOG_SNAPSHOT_KEEP', '3'))
+CATALOG_SNAPSHOT_LEASE_SECONDS = float(os.environ.get('CATALOG_SNAPSHOT_LEASE_SECONDS', '30'))
+# While a snapshot exists, catalog reads give Mongo this long before falling back to it
+CATALOG_SNAPSHOT_FALLBACK_SECONDS = float(os.environ.get('CATALOG_SNAPSHOT_FALLBACK_SECONDS', '2'))
+
+SUFFIXES = {"br": ".br", "gzip": ".gz"}
+SAFE_NAME = re.compile(r"^[A-Za-z0-9_-]+$")
+
+snapshot_publishes_total = metrics.registry.counter(
+    "rtc_catalog_snapshot_publishes_total", "Catalog snapshot publish attempts by outcome", ("outcome",))
+snapshot_publish_duration = metrics.registry.histogram(
+    "rtc_catalog_snapshot_publish_seconds", "Time to build and write a catalog snapshot",
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0))
+snapshot_fallbacks_total = metrics.registry.counter(
+    "rtc_catalog_snapshot_fallbacks_total", "Catalog requests served from the snapshot while Mongo was unreachable",
+    ("outcome",))
+
+
+def course_file(course_id: str) -> Optional[str]:
+    """Snapshot path for a course detail; None for ids that cannot be a file name"""
+    return f"courses/{course_id}.json" if SAFE_NAME.match(course_id) else None
+
+
+def content_version(files: Dict[str, bytes]) -> str:
+    digest = hashlib.sha256()
+    for name in sorted(files):
+        digest.update(name.encode())
+        digest.update(b"\0")
+        digest.update(hashlib.sha256(files[name]).digest())
+    return digest.hexdigest()[:16]
+
+
+def _link_or_copy(source: Path, target: Path):
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copyfile(source, target)
+
+
+class CatalogSnapshots:
+    def __init__(self, root: Path = CATALOG_SNAPSHOT_DIR, keep: int = CATALOG_SNAPSHOT_KEEP):
+        self.root = root
+        self.keep = max(keep, 1)
+        self.published_at: Optional[float] = None
+        self._dirty = True
+
+    @property
+    def current(self) -> Path:
+        return self.root / "current"
+
+    def mark_dirty(self):
+        self._dirty = True
+
+    def version(self) -> Optional[str]:
+        """Version the ``current`` link points at, or None before the first publish"""
+        try:
+            return Path(os.readlink(self.current)).name
+        except OSError:
+            return None
+
+    # ---- publishing (blocking; run in a thread) ----
+
+    def _write_version(self, staging: Path, version: str, files: Dict[str, bytes], live: Optional[Path]):
+        for name, body in files.items():
+            path = staging / name
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(body)
+            if not compression.COMPRESSION_ENABLED or len(body) < compression.COMPRESSION_MIN_SIZE:
+                continue
+            previous = live / name if live is not None else None
+            unchanged = previous is not None and previous.is_file() and previous.read_bytes() == body
+            for encoding in compression.supported_encodings():
+                variant = path.with_name(path.name + SUFFIXES[encoding])
+                previous_variant = previous.with_name(previous.name + SUFFIXES[encoding]) if unchanged else None
+                if previous_variant is not None and previous_variant.is_file():
+                    _link_or_copy(previous_variant, variant)
+                else:
+                    variant.write_bytes(compression.compress(body, encoding, True))
+        manifest = {
+            "version": version,
+            "published_at": datetime.now(timezone.utc).isoformat(),
+            "files": sorted(files)
+        }
+        (staging / "manifest.json").write_text(json.dumps(manifest, indent=2))
+
+    def publish(self, files: Dict[str, bytes]) -> Optional[str]:
+        """Write ``files`` as a new version and make it live; None if it already is"""
+        version = content_version(files)
+        if self.version() == version:
+            return None
+        versions = self.root / "versions"
+        versions.mkdir(parents=True, exist_ok=True)
+        target = versions / version
+        if not target.exists():
+            staging = versions / f".{version}.{os.getpid()}.tmp"
+            shutil.rmtree(staging, ignore_errors=True)
+            live = self.current.resolve() if self.version() else None
+            try:
+                self._write_version(staging, version, files, live)
+                os.rename(staging, target)
+            except OSError:
+                shutil.rmtree(staging, ignore_errors=True)
+                # Another worker renamed the same version into place first
+                if not target.exists():
+                    raise
+        # Re-publishing an older version makes it the newest for pruning
+        os.utime(target)
+        link = self.root / f".current.{os.getpid()}.tmp"
+        if link.is_symlink():
+            link.unlink()
+        os.symlink(os.path.join("versions", version), link)
+        os.replace(link, self.current)
+        self._prune(versions, version)
+        return version
+
+    def _prune(self, versions: Path, live: str):
+        """Remove versions older than ``live``, keeping the newest ``keep - 1`` of them"""
+        live_mtime = (versions / live).stat().st_mtime
+        candidates = [
+            path for path in versions.iterdir()
+            if not path.name.startswith(".") and path.name != live and path.stat().st_mtime < live_mtime
+        ]
+        candidates.sort(key=lambda path: path.stat().st_mtime, reverse=True)
+        for path in candidates[self.keep - 1:]:
+            shutil.rmtree(path, ignore_errors=True)
+
+    # ---- reading ----
+
+    def _read(self, name: str) -> Optional[Tuple[str, bytes, Dict[str, bytes]]]:
+        version = self.version()
+        if version is None:
+            return None
+        directory = self.root / "versions" / version
+        try:
+            body = (directory / name).read_bytes()
+        except OSError:
+            return None
+        variants = {}
+        for encoding, suffix in SUFFIXES.items():
+            try:
+                variants[encoding] = (directory / (name + suffix)).read_bytes()
+            except OSError:
+                continue
+        return version, body, variants
+
+    async def entry(self, name: str) -> Optional[Tuple[str, CatalogEntry]]:
+        """(version, entry) for a live snapshot file, with its precompressed variants"""
+        found = await asyncio.to_thread(self._read, name)
+        if found is None:
+            return None
+        version, body, variants = found
+        entry = CatalogEntry(data=None, body=body, version=-1)
+        loop = asyncio.get_running_loop()
+        for encoding, variant in variants.items():
+            entry.variants[encoding] = loop.create_future()
+            entry.variants[encoding].set_result(variant)
+        return version, entry
+
+    # ---- background loop ----
+
+    async def refresh(self, build: Callable[[], Awaitable[Dict[str, bytes]]]):
+        self._dirty = False
+        started = time.monotonic()
+        try:
+            files = await build()
+            version = await asyncio.to_thread(self.publish, files)
+        except (PyMongoError, OSError) as e:
+            self._dirty = True
+            snapshot_publishes_total.inc(outcome="error")
+            logger.warning(f"Catalog snapshot publish failed: {e}")
+            return
+        self.published_at = time.monotonic()
+        snapshot_publish_duration.observe(self.published_at - started)
+        snapshot_publishes_total.inc(outcome="published" if version else "unchanged")
+        if version:
+            logger.info(f"Published catalog snapshot {version} ({len(files)} files)")
+
+    def lease(self, db) -> LeaderLease:
+        """Publisher lease; one per host and snapshot directory, as the files are local"""
+        return LeaderLease(db.leases, f"catalog_snapshot:{socket.gethostname()}:{self.root.resolve()}",
+                           ttl=CATALOG_SNAPSHOT_LEASE_SECONDS)
+
+    async def run(self, db, build: Callable[[], Awaitable[Dict[str, bytes]]]):
+        """While holding the publisher lease, republish after changes (debounced) and every
+        refresh interval; until cancelled"""
+        lease = self.lease(db)
+        renewed_at: Optional[float] = None
+        while True:
+            # try_acquire also renews a lease we already hold
+            if renewed_at is None or time.monotonic() - renewed_at >= lease.ttl / 3:
+                try:
+                    leader = await lease.try_acquire()
+                except PyMongoError as e:
+                    logger.warning(f"Catalog snapshot lease check failed: {e}")
+                    leader = False
+                if leader and renewed_at is None:
+                    logger.info(f"Worker {os.getpid()} publishes catalog snapshots to {self.root}")
+                renewed_at = time.monotonic() if leader else None
+            if renewed_at is not None:
+                due = self.published_at is None or time.monotonic() - self.published_at >= CATALOG_SNAPSHOT_REFRESH_SECONDS
+                if self._dirty or due:
+                    await self.refresh(build)
+            await asyncio.sleep(CATALOG_SNAPSHOT_DEBOUNCE_SECONDS)
+
+
+catalog_snapshots = CatalogSnapshots()
@@ -0,0 +1,1474 @@
+"""Storage backends behind the module-level ``db`` handle.
+
+Handlers and background modules all talk to the database through Motor's
+collection API (``db.courses.find_one(...)``), so that API is the storage
+interface. ``open_client`` builds the client for ``STORAGE_BACKEND``:
+
+- ``mongo`` (default): an ``AsyncIOMotorClient`` for ``MONGO_URL``.
+- ``memory``: ``MemoryClient``, an in-process store implementing the part of
+  the API the app uses, with Mongo's semantics. That covers query, update
+  and projection operators (including array matching and the positional
+  ``$``), upserts, unique and partial unique indexes, ``bulk_write`` errors
+  and the aggregation stages in use. Documents are copied in and out as they
+  would be through BSON. Datetimes come back as naive UTC truncated to
+  milliseconds, and ``insert_one`` sets ``_id`` on the caller's dict.
+
+The memory backend is for benchmarks and tests. With it a request costs only
+the application's own CPU, so handler overhead can be profiled without a
+mongod (``benchmark.py --storage memory``), and the two backends can be run
+side by side. Every collection keeps a hash index on the leading field of
+each ``create_index`` and on ``MEMORY_INDEX_FIELDS``. Equality and ``$in``
+queries on those fields only touch matching documents.
+
+It is a single-process store and data lives until the process exits.
+Change streams, tailable cursors and capped collections raise
+``NotImplementedError``, so cache invalidation falls back to TTLs and events
+reach local subscribers only. TTL indexes are not enforced, and the Mongo
+command and pool metrics stay empty. ``open_client`` logs this when the
+backend is selected.
+
+Supported subset (anything else raises ``NotImplementedError`` naming the
+operator; ``aggregate`` checks the whole pipeline before running it):
+
+- query: ``$and $or $nor $eq $ne $gt $gte $lt $lte $in $nin $exists $type
+  $regex $not $size $all $elemMatch``, compiled regexes; no ``$expr``,
+  ``$where``, ``$text`` or geo operators.
+- projection: inclusion and exclusion of (dotted) fields only.
+- update: ``$set $setOnInsert $unset $inc $push $addToSet $pull $min $max
+  $currentDate`` with ``$each`` and the positional ``$``; no pipeline updates.
+- aggregation stages: ``PIPELINE_STAGES``; expressions: ``_EXPRESSIONS``;
+  accumulators: ``ACCUMULATORS``; ``$$ROOT`` is the only variable.
+
+``tests/test_storage.py`` runs the same operations against this backend and
+mongomock and compares the results.
+"""
+
+import asyncio
+import logging
+import math
+import operator
+import os
+import re
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import CursorType, DeleteMany, DeleteOne, InsertOne, ReplaceOne, UpdateMany, UpdateOne
+from pymongo.errors import BulkWriteError, CollectionInvalid, DuplicateKeyError, OperationFailure, WriteError
+from pymongo.results import BulkWriteResult, DeleteResult, InsertManyResult, InsertOneResult, UpdateResult
+
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'mongo').lower()
+MEMORY_INDEX_FIELDS = tuple(
+    field.strip() for field in os.environ.get('MEMORY_INDEX_FIELDS', 'id,user_id,course_id,email,session_id,key').split(',')
+    if field.strip()
+)
+MEMORY_BATCH_SIZE = int(os.environ.get('MEMORY_BATCH_SIZE', '101'))
+
+logger = logging.getLogger(__name__)
+
+PIPELINE_STAGES = ("$match", "$project", "$addFields", "$set", "$group", "$unwind", "$facet",
+                   "$sort", "$skip", "$limit", "$count")
+ACCUMULATORS = ("$sum", "$avg", "$min", "$max", "$first", "$last", "$push", "$addToSet")
+UNSUPPORTED_FEATURES = ("change streams", "tailable cursors", "capped collections", "TTL expiry")
+
+
+def open_client(url: str, backend: Optional[str] = None, **options):
+    """Client for the configured backend; ``options`` are Motor client options"""
+    backend = (backend or STORAGE_BACKEND).lower()
+    if backend == "mongo":
+        return AsyncIOMotorClient(url, **options)
+    if backend == "memory":
+        logger.warning("Using the in-process memory storage backend; %s are not available",
+                       ", ".join(UNSUPPORTED_FEATURES))
+        return MemoryClient()
+    raise ValueError(f"Unknown STORAGE_BACKEND {backend!r}; expected 'mongo' or 'memory'")
+
+
+def _unsupported(what: str) -> NotImplementedError:
+    return NotImplementedError(f"The memory storage backend does not support {what}")
+
+
+# ==================== VALUES ====================
+
+def _bson_datetime(value: datetime) -> datetime:
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value.replace(microsecond=value.microsecond // 1000 * 1000)
+
+
+def _store(value: Any) -> Any:
+    """Copy a value in the way a BSON round trip would change it"""
+    if isinstance(value, dict):
+        return {key: _store(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_store(item) for item in value]
+    if isinstance(value, datetime):
+        return _bson_datetime(value)
+    return value
+
+
+def _copy(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {key: _copy(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_copy(item) for item in value]
+    return value
+
+
+def _hashable(value: Any) -> Any:
+    if isinstance(value, dict):
+        return ("__document__", tuple((key, _hashable(item)) for key, item in value.items()))
+    if isinstance(value, list):
+        return ("__array__", tuple(_hashable(item) for item in value))
+    return value
+
+
+def _bracket(value: Any) -> int:
+    """Mongo's cross-type sort order"""
+    if value is None:
+        return 1
+    if isinstance(value, bool):
+        return 8
+    if isinstance(value, (int, float)):
+        return 2
+    if isinstance(value, str):
+        return 3
+    if isinstance(value, dict):
+        return 4
+    if isinstance(value, list):
+        return 5
+    if isinstance(value, ObjectId):
+        return 7
+    if isinstance(value, datetime):
+        return 9
+    return 10
+
+
+def _sort_key(value: Any) -> Tuple[int, Any]:
+    bracket = _bracket(value)
+    if bracket == 1:
+        return (1, 0)
+    if bracket in (4, 5):
+        return (bracket, repr(value))
+    return (bracket, value)
+
+
+def _eq(a: Any, b: Any) -> bool:
+    if isinstance(a, bool) != isinstance(b, bool):
+        return False
+    return a == b
+
+
+def _resolve(value: Any, parts: List[str]) -> List[Any]:
+    """Values found at a dotted path; arrays on the way are traversed element by element"""
+    if not parts:
+        return [value]
+    if isinstance(value, dict):
+        return _resolve(value[parts[0]], parts[1:]) if parts[0] in value else []
+    if isinstance(value, list):
+        found = []
+        if parts[0].isdigit() and int(parts[0]) < len(value):
+            found.extend(_resolve(value[int(parts[0])], parts[1:]))
+        for item in value:
+            if isinstance(item, dict):
+                found.extend(_resolve(item, parts))
+        return found
+    return []
+
+
+def _candidates(values: List[Any]) -> Iterator[Any]:
+    for value in values:
+        yield value
+        if isinstance(value, list):
+            yield from value
+
+
+def _first(document: Dict[str, Any], path: str) -> Any:
+    values = _resolve(document, path.split("."))
+    return values[0] if values else None
+
+
+# ==================== QUERIES ====================
+
+_COMPARISONS = {"$gt": operator.gt, "$gte": operator.ge, "$lt": operator.lt, "$lte": operator.le}
+
+_TYPES = {
+    "double": float, 1: float, "string": str, 2: str, "object": dict, 3: dict, "array": list, 4: list,
+    "objectId": ObjectId, 7: ObjectId, "bool": bool, 8: bool, "date": datetime, 9: datetime,
+    "null": type(None), 10: type(None), "int": int, 16: int, "long": int, 18: int, "number": (int, float),
+}
+
+_REGEX_FLAGS = {"i": re.IGNORECASE, "m": re.MULTILINE, "s": re.DOTALL, "x": re.VERBOSE}
+
+
+def _is_operator_document(value: Any) -> bool:
+    return isinstance(value, dict) and bool(value) and next(iter(value)).startswith("$")
+
+
+def _matches(document: Dict[str, Any], query: Dict[str, Any]) -> bool:
+    for key, condition in query.items():
+        if key == "$or":
+            if not any(_matches(document, clause) for clause in condition):
+                return False
+        elif key == "$and":
+            if not all(_matches(document, clause) for clause in condition):
+                return False
+        elif key == "$nor":
+            if any(_matches(document, clause) for clause in condition):
+                return False
+        elif key.startswith("$"):
+            raise _unsupported(f"query operator {key}")
+        elif not _match_field(_resolve(document, key.split(".")), condition):
+            return False
+    return True
+
+
+def _match_field(values: List[Any], condition: Any) -> bool:
+    if isinstance(condition, re.Pattern):
+        return any(isinstance(value, str) and condition.search(value) for value in _candidates(values))
+    if not _is_operator_document(condition):
+        return _equals(values, condition)
+    options = condition.get("$options", "")
+    return all(_match_operator(op, argument, values, options) for op, argument in condition.items() if op != "$options")
+
+
+def _equals(values: List[Any], target: Any) -> bool:
+    if target is None and not values:
+        return True
+    return any(_eq(value, target) for value in _candidates(values))
+
+
+def _compare(op: str, value: Any, target: Any) -> bool:
+    bracket = _bracket(value)
+    if bracket != _bracket(target) or bracket in (4, 5):
+        return False
+    if bracket == 1:
+        return op in ("$gte", "$lte")
+    return _COMPARISONS[op](value, target)
+
+
+def _has_type(value: Any, type_name: Any) -> bool:
+    expected = _TYPES.get(type_name)
+    if expected is None:
+        raise _unsupported(f"$type {type_name!r}")
+    if isinstance(value, bool) and expected is not bool:
+        return False
+    return isinstance(value, expected)
+
+
+def _match_operator(op: str, argument: Any, values: List[Any], options: str) -> bool:
+    if op == "$eq":
+        return _equals(values, argument)
+    if op == "$ne":
+        return not _equals(values, argument)
+    if op == "$in":
+        return any(_match_field(values, item) if isinstance(item, re.Pattern) else _equals(values, item) for item in argument)
+    if op == "$nin":
+        return not _match_operator("$in", argument, values, options)
+    if op in _COMPARISONS:
+        return any(_compare(op, value, argument) for value in _candidates(values))
+    if op == "$exists":
+        return bool(values) == bool(argument)
+    if op == "$type":
+        return any(_has_type(value, argument) for value in _candidates(values))
+    if op == "$regex":
+        flags = 0
+        for flag in options:
+            flags |= _REGEX_FLAGS.get(flag, 0)
+        pattern = argument if isinstance(argument, re.Pattern) else re.compile(argument, flags)
+        return any(isinstance(value, str) and pattern.search(value) for value in _candidates(values))
+    if op == "$not":
+        return not _match_field(values, argument)
+    if op == "$size":
+        return any(isinstance(value, list) and len(value) == argument for value in values)
+    if op == "$all":
+        return all(_equals(values, item) for item in argument)
+    if op == "$elemMatch":
+        return any(
+            isinstance(value, list) and any(
+                _match_field([item], argument) if _is_operator_document(argument) else
+                isinstance(item, dict) and _matches(item, argument)
+                for item in value
+            )
+            for value in values
+        )
+    raise _unsupported(f"query operator {op}")
+
+
+# ==================== PROJECTIONS ====================
+
+def _project(document: Dict[str, Any], projection: Any) -> Dict[str, Any]:
+    if not projection:
+        return _copy(document)
+    if isinstance(projection, (list, tuple)):
+        projection = {field: 1 for field in projection}
+    include_id = bool(projection.get("_id", 1))
+    fields = {field: flag for field, flag in projection.items() if field != "_id"}
+    for flag in fields.values():
+        if isinstance(flag, dict):
+            raise _unsupported("projection operators")
+    inclusion = any(fields.values()) if fields else "_id" in projection and include_id
+    if inclusion:
+        result: Dict[str, Any] = {}
+        if include_id and "_id" in document:
+            result["_id"] = document["_id"]
+        for field, flag in fields.items():
+            if flag:
+                _copy_path(document, result, field.split("."))
+        return result
+    result = _copy(document)
+    for field in fields:
+        _remove_path(result, field.split("."))
+    if not include_id:
+        result.pop("_id", None)
+    return result
+
+
+def _copy_path(source: Any, target: Dict[str, Any], parts: List[str]):
+    if parts[0] not in source:
+        return
+    value = source[parts[0]]
+    if len(parts) == 1:
+        target[parts[0]] = _copy(value)
+    elif isinstance(value, dict):
+        _copy_path(value, target.setdefault(parts[0], {}), parts[1:])
+    elif isinstance(value, list):
+        items = [item for item in value if isinstance(item, dict)]
+        projected = target.get(parts[0])
+        if not isinstance(projected, list):
+            projected = target[parts[0]] = [{} for _ in items]
+        for item, projected_item in zip(items, projected):
+            _copy_path(item, projected_item, parts[1:])
+
+
+def _remove_path(value: Any, parts: List[str]):
+    if isinstance(value, dict):
+        if len(parts) == 1:
+            value.pop(parts[0], None)
+        elif parts[0] in value:
+            _remove_path(value[parts[0]], parts[1:])
+    elif isinstance(value, list):
+        for item in value:
+            _remove_path(item, parts)
+
+
+# ==================== UPDATES ====================
+
+_MISSING = object()
+
+
+def _child(container: Any, key: str) -> Any:
+    if isinstance(container, list):
+        index = int(key)
+        return container[index] if index < len(container) else _MISSING
+    return container.get(key, _MISSING)
+
+
+def _parent(document: Dict[str, Any], parts: List[str], create: bool) -> Any:
+    container: Any = document
+    for part in parts[:-1]:
+        child = _child(container, part) if isinstance(container, (dict, list)) else _MISSING
+        if child is _MISSING:
+            if not create:
+                return None
+            child = {}
+            _put(container, part, child)
+        if not isinstance(child, (dict, list)):
+            raise WriteError(f"Cannot create field '{parts[-1]}' in element {{{part}: {child!r}}}", code=28)
+        container = child
+    return container
+
+
+def _put(container: Any, key: str, value: Any):
+    if isinstance(container, list):
+        if not key.isdigit():
+            raise WriteError(f"Cannot create field '{key}' in an array", code=28)
+        index = int(key)
+        container.extend([None] * (index + 1 - len(container)))
+        container[index] = value
+    else:
+        container[key] = value
+
+
+def _get_path(document: Dict[str, Any], parts: List[str]) -> Any:
+    container = _parent(document, parts, create=False)
+    if container is None:
+        return _MISSING
+    return _child(container, parts[-1])
+
+
+def _set_path(document: Dict[str, Any], parts: List[str], value: Any) -> bool:
+    old = _get_path(document, parts)
+    _put(_parent(document, parts, create=True), parts[-1], value)
+    return old is _MISSING or not _eq(old, value)
+
+
+def _update_set(document, parts, value) -> bool:
+    return _set_path(document, parts, _copy(value))
+
+
+def _update_unset(document, parts, value) -> bool:
+    container = _parent(document, parts, create=False)
+    if isinstance(container, dict) and parts[-1] in container:
+        del container[parts[-1]]
+        return True
+    if isinstance(container, list) and parts[-1].isdigit() and int(parts[-1]) < len(container):
+        container[int(parts[-1])] = None
+        return True
+    return False
+
+
+def _update_inc(document, parts, value) -> bool:
+    old = _get_path(document, parts)
+    if old is _MISSING:
+        return _set_path(document, parts, value)
+    if isinstance(old, bool) or not isinstance(old, (int, float)):
+        raise WriteError(f"Cannot apply $inc to a value of non-numeric type. {{{'.'.join(parts)}: {old!r}}}", code=14)
+    return _set_path(document, parts, old + value)
+
+
+def _array_at(document, parts, op: str) -> List[Any]:
+    old = _get_path(document, parts)
+    if old is _MISSING:
+        old = []
+        _set_path(document, parts, old)
+    if not isinstance(old, list):
+        raise WriteError(f"The field '{'.'.join(parts)}' must be an array to apply {op}", code=2)
+    return old
+
+
+def _each(value: Any) -> List[Any]:
+    if isinstance(value, dict) and "$each" in value:
+        return [_copy(item) for item in value["$each"]]
+    return [_copy(value)]
+
+
+def _update_push(document, parts, value) -> bool:
+    items = _each(value)
+    _array_at(document, parts, "$push").extend(items)
+    return bool(items)
+
+
+def _update_add_to_set(document, parts, value) -> bool:
+    array = _array_at(document, parts, "$addToSet")
+    changed = False
+    for item in _each(value):
+        if not any(_eq(existing, item) for existing in array):
+            array.append(item)
+            changed = True
+    return changed
+
+
+def _update_pull(document, parts, value) -> bool:
+    old = _get_path(document, parts)
+    if not isinstance(old, list):
+        return False
+    if _is_operator_document(value):
+        keep = [item for item in old if not _match_field([item], value)]
+    elif isinstance(value, dict):
+        keep = [item for item in old if not (isinstance(item, dict) and _matches(item, value))]
+    else:
+        keep = [item for item in old if not _eq(item, value)]
+    changed = len(keep) != len(old)
+    old[:] = keep
+    return changed
+
+
+def _update_bound(op: Callable[[Any, Any], bool]):
+    def apply(document, parts, value) -> bool:
+        old = _get_path(document, parts)
+        if old is _MISSING or op(_sort_key(value), _sort_key(old)):
+            return _set_path(document, parts, _copy(value))
+        return False
+    return apply
+
+
+def _update_current_date(document, parts, value) -> bool:
+    return _set_path(document, parts, _bson_datetime(datetime.now(timezone.utc)))
+
+
+_UPDATE_OPERATORS = {
+    "$set": _update_set,
+    "$setOnInsert": _update_set,
+    "$unset": _update_unset,
+    "$inc": _update_inc,
+    "$push": _update_push,
+    "$addToSet": _update_add_to_set,
+    "$pull": _update_pull,
+    "$min": _update_bound(operator.lt),
+    "$max": _update_bound(operator.gt),
+    "$currentDate": _update_current_date,
+}
+
+
+def _positional(document: Dict[str, Any], path: str, query: Dict[str, Any]) -> str:
+    """Replace ``$`` in an update path with the index of the first array element the query matched"""
+    parts = path.split(".")
+    position = parts.index("$")
+    array_path = ".".join(parts[:position])
+    array = _get_path(document, parts[:position])
+    if isinstance(array, list):
+        for key, condition in query.items():
+            if key == array_path:
+                matched = (index for index, item in enumerate(array) if _match_field([item], condition))
+            elif key.startswith(array_path + "."):
+                sub_path = key[len(array_path) + 1:].split(".")
+                matched = (index for index, item in enumerate(array) if _match_field(_resolve(item, sub_path), condition))
+            else:
+                continue
+            index = next(matched, None)
+            if index is not None:
+                parts[position] = str(index)
+                return ".".join(parts)
+    raise WriteError("The positional operator did not find the match needed from the query.", code=2)
+
+
+def _apply_update(document: Dict[str, Any], update: Dict[str, Any], query: Dict[str, Any], inserting: bool) -> bool:
+    changed = False
+    for op, fields in update.items():
+        apply = _UPDATE_OPERATORS.get(op)
+        if apply is None:
+            raise _unsupported(f"update operator {op}")
+        if op == "$setOnInsert" and not inserting:
+            continue
+        for path, value in fields.items():
+            if "$" in path.split("."):
+                path = _positional(document, path, query)
+            changed |= apply(document, path.split("."), value)
+    return changed
+
+
+def _upsert_seed(query: Dict[str, Any]) -> Dict[str, Any]:
+    """The document an upsert starts from: the query's equality conditions"""
+    document: Dict[str, Any] = {}
+    for key, condition in query.items():
+        if key.startswith("$") or isinstance(condition, re.Pattern):
+            continue
+        if _is_operator_document(condition):
+            if "$eq" not in condition:
+                continue
+            condition = condition["$eq"]
+        _set_path(document, key.split("."), _copy(condition))
+    return document
+
+
+def _check_update(update: Any):
+    if isinstance(update, list):
+        raise _unsupported("pipeline-style updates")
+    if not update or not all(key.startswith("$") for key in update):
+        raise ValueError("update only works with $ operators")
+
+
+def _check_replacement(replacement: Dict[str, Any]):
+    if any(key.startswith("$") for key in replacement):
+        raise ValueError("replacement can not include $ operators")
+
+
+# ==================== AGGREGATION ====================
+
+def _field_value(document: Any, parts: List[str]) -> Any:
+    """Value of a ``$field.path`` expression; paths through arrays yield arrays"""
+    value = document
+    for position, part in enumerate(parts):
+        if isinstance(value, list):
+            return [item for item in (_field_value(element, parts[position:]) for element in value if isinstance(element, dict))
+                    if item is not None]
+        if not isinstance(value, dict) or part not in value:
+            return None
+        value = value[part]
+    return value
+
+
+def _numbers(values: List[Any]) -> bool:
+    return all(isinstance(value, (int, float)) and not isinstance(value, bool) for value in values)
+
+
+def _expr_floor(arguments, document):
+    value = _evaluate(arguments, document)
+    return value if value is None or isinstance(value, int) else float(math.floor(value))
+
+
+def _expr_ceil(arguments, document):
+    value = _evaluate(arguments, document)
+    return value if value is None or isinstance(value, int) else float(math.ceil(value))
+
+
+def _expr_if_null(arguments, document):
+    values = [_evaluate(argument, document) for argument in arguments]
+    return next((value for value in values[:-1] if value is not None), values[-1])
+
+
+def _expr_add(arguments, document):
+    values = [_evaluate(argument, document) for argument in arguments]
+    if any(value is None for value in values):
+        return None
+    dates = [value for value in values if isinstance(value, datetime)]
+    total = sum(value for value in values if not isinstance(value, datetime))
+    return dates[0] + timedelta(milliseconds=total) if dates else total
+
+
+def _expr_subtract(arguments, document):
+    left, right = (_evaluate(argument, document) for argument in arguments)
+    if left is None or right is None:
+        return None
+    if isinstance(left, datetime) and isinstance(right, datetime):
+        return int((left - right) / timedelta(milliseconds=1))
+    if isinstance(left, datetime):
+        return left - timedelta(milliseconds=right)
+    return left - right
+
+
+def _expr_multiply(arguments, document):
+    values = [_evaluate(argument, document) for argument in arguments]
+    if any(value is None for value in values):
+        return None
+    return math.prod(values)
+
+
+def _expr_divide(arguments, document):
+    left, right = (_evaluate(argument, document) for argument in arguments)
+    if left is None or right is None:
+        return None
+    if right == 0:
+        raise OperationFailure("can't $divide by zero", code=2)
+    return left / right
+
+
+def _expr_date_from_string(arguments, document):
+    value = _evaluate(arguments["dateString"], document)
+    if value is None:
+        return _evaluate(arguments.get("onNull"), document)
+    try:
+        return _bson_datetime(datetime.fromisoformat(value.replace("Z", "+00:00")))
+    except (AttributeError, ValueError):
+        if "onError" in arguments:
+            return _evaluate(arguments["onError"], document)
+        raise OperationFailure(f"Error parsing date string '{value}'", code=241)
+
+
+def _expr_cond(arguments, document):
+    if isinstance(arguments, list):
+        condition, then, otherwise = arguments
+    else:
+        condition, then, otherwise = arguments["if"], arguments["then"], arguments["else"]
+    return _evaluate(then if _evaluate(condition, document) else otherwise, document)
+
+
+def _expr_comparison(op: str):
+    def evaluate(arguments, document):
+        left, right = (_evaluate(argument, document) for argument in arguments)
+        if op == "$eq":
+            return _eq(left, right)
+        if op == "$ne":
+            return not _eq(left, right)
+        return _COMPARISONS[op](_sort_key(left), _sort_key(right))
+    return evaluate
+
+
+def _expr_size(arguments, document):
+    value = _evaluate(arguments, document)
+    if not isinstance(value, list):
+        raise OperationFailure("The argument to $size must be an array", code=17124)
+    return len(value)
+
+
+def _expr_concat(arguments, document):
+    values = [_evaluate(argument, document) for argument in arguments]
+    return None if any(value is None for value in values) else "".join(values)
+
+
+def _expr_case(convert: Callable[[str], str]):
+    def evaluate(arguments, document):
+        value = _evaluate(arguments, document)
+        return "" if value is None else convert(str(value))
+    return evaluate
+
+
+_EXPRESSIONS = {
+    "$floor": _expr_floor,
+    "$ceil": _expr_ceil,
+    "$ifNull": _expr_if_null,
+    "$add": _expr_add,
+    "$subtract": _expr_subtract,
+    "$multiply": _expr_multiply,
+    "$divide": _expr_divide,
+    "$dateFromString": _expr_date_from_string,
+    "$cond": _expr_cond,
+    "$size": _expr_size,
+    "$concat": _expr_concat,
+    "$toLower": _expr_case(str.lower),
+    "$toUpper": _expr_case(str.upper),
+    **{op: _expr_comparison(op) for op in ("$eq", "$ne", *_COMPARISONS)},
+}
+
+
+def _evaluate(expression: Any, document: Dict[str, Any]) -> Any:
+    if isinstance(expression, str) and expression.startswith("$"):
+        if expression == "$$ROOT":
+            return document
+        if expression.startswith("$$"):
+            raise _unsupported(f"aggregation variable {expression}")
+        return _field_value(document, expression[1:].split("."))
+    if isinstance(expression, dict):
+        if _is_operator_document(expression):
+            op, arguments = next(iter(expression.items()))
+            evaluate = _EXPRESSIONS.get(op)
+            if evaluate is None or len(expression) > 1:
+                raise _unsupported(f"aggregation expression {op}")
+            return evaluate(arguments, document)
+        return {key: _evaluate(value, document) for key, value in expression.items()}
+    if isinstance(expression, list):
+        return [_evaluate(item, document) for item in expression]
+    return expression
+
+
+class _Accumulator:
+    def __init__(self, op: str, expression: Any):
+        if op not in ACCUMULATORS:
+            raise _unsupported(f"accumulator {op}")
+        self.op = op
+        self.expression = expression
+
+    def initial(self) -> Any:
+        return {"$sum": 0, "$avg": [0, 0], "$push": [], "$addToSet": []}.get(self.op, _MISSING)
+
+    def step(self, state: Any, document: Dict[str, Any]) -> Any:
+        value = _evaluate(self.expression, document)
+        op = self.op
+        if op == "$sum":
+            return state + value if _numbers([value]) else state
+        if op == "$avg":
+            if _numbers([value]):
+                state[0] += value
+                state[1] += 1
+            return state
+        if op in ("$min", "$max"):
+            if value is None:
+                return state
+            if state is _MISSING:
+                return value
+            better = operator.lt if op == "$min" else operator.gt
+            return value if better(_sort_key(value), _sort_key(state)) else state
+        if op == "$first":
+            return value if state is _MISSING else state
+        if op == "$last":
+            return value
+        if op == "$push":
+            if value is not None:
+                state.append(value)
+            return state
+        if value is not None and not any(_eq(existing, value) for existing in state):
+            state.append(value)
+        return state
+
+    def result(self, state: Any) -> Any:
+        if self.op == "$avg":
+            return state[0] / state[1] if state[1] else None
+        return None if state is _MISSING else state
+
+
+def _group(documents: List[Dict[str, Any]], spec: Dict[str, Any]) -> List[Dict[str, Any]]:
+    if "_id" not in spec:
+        raise OperationFailure("a group specification must include an _id", code=15955)
+    accumulators = {}
+    for field, accumulator in spec.items():
+        if field != "_id":
+            (op, expression), = accumulator.items()
+            accumulators[field] = _Accumulator(op, expression)
+    groups: Dict[Any, Tuple[Any, Dict[str, Any]]] = {}
+    for document in documents:
+        key = _evaluate(spec["_id"], document)
+        entry = groups.get(_hashable(key))
+        if entry is None:
+            entry = groups[_hashable(key)] = (key, {field: acc.initial() for field, acc in accumulators.items()})
+        states = entry[1]
+        for field, accumulator in accumulators.items():
+            states[field] = accumulator.step(states[field], document)
+    return [
+        {"_id": key, **{field: accumulators[field].result(state) for field, state in states.items()}}
+        for key, states in groups.values()
+    ]
+
+
+def _with_path(document: Dict[str, Any], parts: List[str], value: Any) -> Dict[str, Any]:
+    """Shallow copy of ``document`` with ``value`` at ``parts``"""
+    result = dict(document)
+    if len(parts) == 1:
+        result[parts[0]] = value
+    else:
+        result[parts[0]] = _with_path(result.get(parts[0]) if isinstance(result.get(parts[0]), dict) else {}, parts[1:], value)
+    return result
+
+
+def _unwind(documents: List[Dict[str, Any]], spec: Any) -> List[Dict[str, Any]]:
+    if isinstance(spec, str):
+        spec = {"path": spec}
+    parts = spec["path"].lstrip("$").split(".")
+    preserve = spec.get("preserveNullAndEmptyArrays", False)
+    result = []
+    for document in documents:
+        value = _field_value(document, parts)
+        if isinstance(value, list) and value:
+            result.extend(_with_path(document, parts, item) for item in value)
+        elif value is None or value == []:
+            if preserve:
+                result.append(document)
+        else:
+            result.append(document)
+    return result
+
+
+def _sort_documents(documents: List[Dict[str, Any]], keys: List[Tuple[str, int]]) -> List[Dict[str, Any]]:
+    documents = list(documents)
+    for field, direction in reversed(keys):
+        documents.sort(key=lambda document: _sort_key(_first(document, field)), reverse=direction < 0)
+    return documents
+
+
+def _sort_spec(key_or_list: Any, direction: Optional[int] = None) -> List[Tuple[str, int]]:
+    if direction is not None:
+        return [(key_or_list, direction)]
+    if isinstance(key_or_list, str):
+        return [(key_or_list, 1)]
+    if isinstance(key_or_list, dict):
+        return list(key_or_list.items())
+    return [(field, direction) for field, direction in key_or_list]
+
+
+def _project_stage(document: Dict[str, Any], spec: Dict[str, Any]) -> Dict[str, Any]:
+    flags = {field: value for field, value in spec.items() if isinstance(value, (bool, int))}
+    computed = {field: value for field, value in spec.items() if field not in flags}
+    if not computed:
+        return _project(document, flags)
+    # Computed fields make this an inclusion projection
+    result: Dict[str, Any] = {}
+    if flags.get("_id", 1) and "_id" in document:
+        result["_id"] = document["_id"]
+    for field, flag in flags.items():
+        if flag and field != "_id":
+            _copy_path(document, result, field.split("."))
+    for field, expression in computed.items():
+        result = _with_path(result, field.split("."), _evaluate(expression, document))
+    return result
+
+
+def _check_expression(expression: Any):
+    if isinstance(expression, str) and expression.startswith("$$") and expression != "$$ROOT":
+        raise _unsupported(f"aggregation variable {expression}")
+    if isinstance(expression, dict):
+        if _is_operator_document(expression):
+            op = next(iter(expression))
+            if op not in _EXPRESSIONS or len(expression) > 1:
+                raise _unsupported(f"aggregation expression {op}")
+        for value in expression.values():
+            _check_expression(value)
+    elif isinstance(expression, list):
+        for item in expression:
+            _check_expression(item)
+
+
+def check_pipeline(pipeline: List[Dict[str, Any]]):
+    """Raise NotImplementedError before running a pipeline that uses anything outside the supported subset"""
+    for stage in pipeline:
+        (name, spec), = stage.items()
+        if name not in PIPELINE_STAGES:
+            raise _unsupported(f"aggregation stage {name}")
+        if name == "$facet":
+            for sub_pipeline in spec.values():
+                check_pipeline(sub_pipeline)
+        elif name == "$group":
+            for field, accumulator in spec.items():
+                if field == "_id":
+                    _check_expression(accumulator)
+                    continue
+                (op, expression), = accumulator.items()
+                if op not in ACCUMULATORS:
+                    raise _unsupported(f"accumulator {op}")
+                _check_expression(expression)
+        elif name in ("$project", "$addFields", "$set"):
+            _check_expression(spec)
+
+
+def _run_pipeline(documents: List[Dict[str, Any]], pipeline: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    for stage in pipeline:
+        (name, spec), = stage.items()
+        if name == "$match":
+            spec = _store(spec)
+            documents = [document for document in documents if _matches(document, spec)]
+        elif name == "$project":
+            documents = [_project_stage(document, spec) for document in documents]
+        elif name in ("$addFields", "$set"):
+            updated = []
+            for document in documents:
+                for field, expression in spec.items():
+                    document = _with_path(document, field.split("."), _evaluate(expression, document))
+                updated.append(document)
+            documents = updated
+        elif name == "$group":
+            documents = _group(documents, spec)
+        elif name == "$unwind":
+            documents = _unwind(documents, spec)
+        elif name == "$facet":
+            documents = [{field: _run_pipeline(documents, sub_pipeline) for field, sub_pipeline in spec.items()}]
+        elif name == "$sort":
+            documents = _sort_documents(documents, _sort_spec(spec))
+        elif name == "$skip":
+            documents = documents[spec:]
+        elif name == "$limit":
+            documents = documents[:spec]
+        elif name == "$count":
+            documents = [{spec: len(documents)}] if documents else []
+        else:
+            raise _unsupported(f"aggregation stage {name}")
+    return documents
+
+
+# ==================== INDEXES ====================
+
+class _Index:
+    def __init__(self, name: str, keys: List[Tuple[str, int]], unique: bool = False,
+                 partial: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.fields = [field for field, _ in keys]
+        self.leading = self.fields[0].split(".")
+        self.unique = unique
+        self.partial = partial
+        self.entries: Dict[Any, Set[int]] = defaultdict(set)
+
+    def keys_for(self, document: Dict[str, Any]) -> Set[Any]:
+        values = _resolve(document, self.leading)
+        if not values:
+            return {None}
+        return {_hashable(value) for value in _candidates(values)}
+
+    def add(self, slot: int, document: Dict[str, Any]):
+        for key in self.keys_for(document):
+            self.entries[key].add(slot)
+
+    def remove(self, slot: int, document: Dict[str, Any]):
+        for key in self.keys_for(document):
+            bucket = self.entries.get(key)
+            if bucket is not None:
+                bucket.discard(slot)
+                if not bucket:
+                    del self.entries[key]
+
+    def lookup(self, condition: Any) -> Optional[Set[int]]:
+        """Slots that may match ``condition`` on the leading field; None if the index cannot help"""
+        if _is_operator_document(condition):
+            if set(condition) == {"$eq"}:
+                targets = [condition["$eq"]]
+            elif set(condition) == {"$in"}:
+                targets = list(condition["$in"])
+            else:
+                return None
+        else:
+            targets = [condition]
+        if any(isinstance(target, (dict, list, re.Pattern)) for target in targets):
+            return None
+        slots: Set[int] = set()
+        for target in targets:
+            slots |= self.entries.get(_hashable(target), set())
+        return slots
+
+    def covers(self, document: Dict[str, Any]) -> bool:
+        return self.partial is None or _matches(document, self.partial)
+
+    def unique_key(self, document: Dict[str, Any]) -> Tuple[Any, ...]:
+        return tuple(_hashable(_first(document, field)) for field in self.fields)
+
+
+def _index_keys(keys: Any) -> List[Tuple[str, int]]:
+    if isinstance(keys, str):
+        return [(keys, 1)]
+    if isinstance(keys, dict):
+        return list(keys.items())
+    return [(field, direction) for field, direction in keys]
+
+
+# ==================== CURSORS ====================
+
+class _MemoryCursorBase:
+    def __init__(self):
+        self._results: Optional[List[Dict[str, Any]]] = None
+        self._position = 0
+        self._batch_size = MEMORY_BATCH_SIZE
+
+    def _execute(self) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def _ensure(self) -> List[Dict[str, Any]]:
+        if self._results is None:
+            self._results = self._execute()
+        return self._results
+
+    @property
+    def alive(self) -> bool:
+        return self._results is None or self._position < len(self._results)
+
+    def batch_size(self, batch_size: int):
+        self._batch_size = batch_size or MEMORY_BATCH_SIZE
+        return self
+
+    async def to_list(self, length: Optional[int] = None) -> List[Dict[str, Any]]:
+        results = self._ensure()
+        end = len(results) if not length else min(self._position + length, len(results))
+        batch = results[self._position:end]
+        self._position = end
+        return batch
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> Dict[str, Any]:
+        results = self._ensure()
+        if self._position >= len(results):
+            raise StopAsyncIteration
+        if self._position and self._position % self._batch_size == 0:
+            # Let other tasks run between batches, as a real getMore would
+            await asyncio.sleep(0)
+        document = results[self._position]
+        self._position += 1
+        return document
+
+    next = __anext__
+
+    async def close(self):
+        self._results = []
+
+
+class MemoryCursor(_MemoryCursorBase):
+    def __init__(self, collection: "MemoryCollection", query: Dict[str, Any], projection: Any = None,
+                 sort: Any = None, skip: int = 0, limit: int = 0):
+        super().__init__()
+        self.collection = collection
+        self._query = query
+        self._projection = projection
+        self._sort = _sort_spec(sort) if sort else None
+        self._skip = skip
+        self._limit = limit
+
+    def sort(self, key_or_list: Any, direction: Optional[int] = None):
+        self._sort = _sort_spec(key_or_list, direction)
+        return self
+
+    def skip(self, skip: int):
+        self._skip = skip
+        return self
+
+    def limit(self, limit: int):
+        self._limit = abs(limit)
+        return self
+
+    def _execute(self) -> List[Dict[str, Any]]:
+        return self.collection._find(self._query, self._projection, self._sort, self._skip, self._limit)
+
+
+class MemoryCommandCursor(_MemoryCursorBase):
+    def __init__(self, execute: Callable[[], List[Dict[str, Any]]]):
+        super().__init__()
+        self._execute_fn = execute
+
+    def _execute(self) -> List[Dict[str, Any]]:
+        return self._execute_fn()
+
+
+# ==================== COLLECTIONS ====================
+
+class MemoryCollection:
+    def __init__(self, database: "MemoryDatabase", name: str):
+        self.database = database
+        self.name = name
+        self.full_name = f"{database.name}.{name}"
+        self._documents: Dict[int, Dict[str, Any]] = {}
+        self._next_slot = 0
+        self._indexes: Dict[str, _Index] = {}
+        self._lookup: Dict[str, _Index] = {}
+        self._add_index(_Index("_id_", [("_id", 1)], unique=True))
+        for field in MEMORY_INDEX_FIELDS:
+            self._add_index(_Index(f"{field}_memory", [(field, 1)]))
+
+    def with_options(self, **options) -> "MemoryCollection":
+        return self
+
+    def watch(self, *args, **kwargs):
+        raise _unsupported("change streams")
+
+    # ---- internals ----
+
+    def _add_index(self, index: _Index):
+        for slot, document in self._documents.items():
+            index.add(slot, document)
+        self._indexes[index.name] = index
+        self._lookup.setdefault(".".join(index.leading), index)
+
+    def _plan(self, query: Dict[str, Any]) -> List[int]:
+        """Candidate slots for a query, in insertion order"""
+        best: Optional[Set[int]] = None
+        for field, condition in query.items():
+            index = self._lookup.get(field)
+            if index is None:
+                continue
+            slots = index.lookup(condition)
+            if slots is not None and (best is None or len(slots) < len(best)):
+                best = slots
+        return list(self._documents) if best is None else sorted(best)
+
+    def _matching(self, query: Dict[str, Any]) -> Iterator[int]:
+        for slot in self._plan(query):
+            if _matches(self._documents[slot], query):
+                yield slot
+
+    def _select(self, query: Dict[str, Any], sort: Optional[List[Tuple[str, int]]], skip: int = 0,
+                limit: int = 0) -> List[int]:
+        if sort:
+            slots = list(self._matching(query))
+            documents = self._documents
+            for field, direction in reversed(sort):
+                slots.sort(key=lambda slot: _sort_key(_first(documents[slot], field)), reverse=direction < 0)
+            return slots[skip:skip + limit if limit else None]
+        selected = []
+        for slot in self._matching(query):
+            if skip:
+                skip -= 1
+                continue
+            selected.append(slot)
+            if limit and len(selected) >= limit:
+                break
+        return selected
+
+    def _find(self, query: Any, projection: Any, sort: Optional[List[Tuple[str, int]]], skip: int,
+              limit: int) -> List[Dict[str, Any]]:
+        query = _store(query or {})
+        return [_project(self._documents[slot], projection) for slot in self._select(query, sort, skip, limit)]
+
+    def _check_unique(self, document: Dict[str, Any], own_slot: Optional[int]):
+        for index in self._indexes.values():
+            if not index.unique or not index.covers(document):
+                continue
+            key = index.unique_key(document)
+            for candidate_key in index.keys_for(document):
+                for slot in index.entries.get(candidate_key, ()):
+                    if slot == own_slot:
+                        continue
+                    other = self._documents[slot]
+                    if index.covers(other) and index.unique_key(other) == key:
+                        raise DuplicateKeyError(
+                            f"E11000 duplicate key error collection: {self.full_name} index: {index.name} "
+                            f"dup key: {dict(zip(index.fields, key))}",
+                            11000, {"keyPattern": {field: 1 for field in index.fields},
+                                    "keyValue": {field: _first(document, field) for field in index.fields}}
+                        )
+
+    def _insert_stored(self, document: Dict[str, Any]) -> Any:
+        if "_id" not in document:
+            document = {"_id": ObjectId(), **document}
+        elif next(iter(document)) != "_id":
+            document = {"_id": document["_id"], **document}
+        self._check_unique(document, None)
+        slot = self._next_slot
+        self._next_slot += 1
+        self._documents[slot] = document
+        for index in self._indexes.values():
+            index.add(slot, document)
+        return document["_id"]
+
+    def _insert(self, document: Dict[str, Any]) -> Any:
+        if "_id" not in document:
+            # Like PyMongo, the generated _id is set on the caller's document
+            document["_id"] = ObjectId()
+        return self._insert_stored(_store(document))
+
+    def _replace_slot(self, slot: int, document: Dict[str, Any]):
+        self._check_unique(document, slot)
+        old = self._documents[slot]
+        for index in self._indexes.values():
+            index.remove(slot, old)
+            index.add(slot, document)
+        self._documents[slot] = document
+
+    def _delete_slot(self, slot: int):
+        document = self._documents.pop(slot)
+        for index in self._indexes.values():
+            index.remove(slot, document)
+
+    def _updated(self, slot: int, update: Dict[str, Any], query: Dict[str, Any], replacement: bool) -> Optional[Dict[str, Any]]:
+        """The new version of a document, or None if the update leaves it unchanged"""
+        old = self._documents[slot]
+        if replacement:
+            if "_id" in update and not _eq(update["_id"], old["_id"]):
+                raise WriteError("After applying the update, the (immutable) field '_id' was found to have been altered",
+                                 code=66)
+            new = {"_id": old["_id"], **{key: _copy(value) for key, value in update.items() if key != "_id"}}
+            return new if new != old else None
+        new = _copy(old)
+        if not _apply_update(new, update, query, inserting=False):
+            return None
+        if not _eq(new.get("_id"), old["_id"]):
+            raise WriteError("Performing an update on the path '_id' would modify the immutable field '_id'", code=66)
+        return new
+
+    def _upsert(self, query: Dict[str, Any], update: Dict[str, Any], replacement: bool) -> Any:
+        seed = _upsert_seed(query)
+        if replacement:
+            document = {**({"_id": seed["_id"]} if "_id" in seed else {}), **_copy(update)}
+        else:
+            document = seed
+            _apply_update(document, update, query, inserting=True)
+        return self._insert_stored(document)
+
+    def _update(self, query: Any, update: Dict[str, Any], upsert: bool, multi: bool,
+                replacement: bool = False) -> Dict[str, Any]:
+        if replacement:
+            _check_replacement(update)
+        else:
+            _check_update(update)
+        query, update = _store(query or {}), _store(update)
+        matched = modified = 0
+        for slot in self._select(query, None, 0, 0 if multi else 1):
+            matched += 1
+            new = self._updated(slot, update, query, replacement)
+            if new is not None:
+                self._replace_slot(slot, new)
+                modified += 1
+        raw: Dict[str, Any] = {"n": matched, "nModified": modified, "ok": 1.0}
+        if not matched and upsert:
+            raw["upserted"] = self._upsert(query, update, replacement)
+            raw["n"] = 1
+        return raw
+
+    def _delete(self, query: Any, multi: bool) -> int:
+        slots = self._select(_store(query or {}), None, 0, 0 if multi else 1)
+        for slot in slots:
+            self._delete_slot(slot)
+        return len(slots)
+
+    # ---- reads ----
+
+    def find(self, filter: Any = None, projection: Any = None, *, sort: Any = None, skip: int = 0, limit: int = 0,
+             cursor_type: int = CursorType.NON_TAILABLE, **kwargs) -> MemoryCursor:
+        if cursor_type != CursorType.NON_TAILABLE:
+            raise _unsupported("tailable cursors")
+        return MemoryCursor(self, filter or {}, projection, sort, skip, limit)
+
+    async def find_one(self, filter: Any = None, projection: Any = None, *, sort: Any = None, skip: int = 0,
+                       **kwargs) -> Optional[Dict[str, Any]]:
+        if filter is not None and not isinstance(filter, dict):
+            filter = {"_id": filter}
+        found = self._find(filter, projection, _sort_spec(sort) if sort else None, skip, 1)
+        return found[0] if found else None
+
+    async def count_documents(self, filter: Dict[str, Any], skip: int = 0, limit: int = 0, **kwargs) -> int:
+        return len(self._select(_store(filter), None, skip, limit))
+
+    async def estimated_document_count(self, **kwargs) -> int:
+        return len(self._documents)
+
+    async def distinct(self, key: str, filter: Optional[Dict[str, Any]] = None, **kwargs) -> List[Any]:
+        seen: Dict[Any, Any] = {}
+        parts = key.split(".")
+        for slot in self._select(_store(filter or {}), None):
+            for value in _resolve(self._documents[slot], parts):
+                for item in (value if isinstance(value, list) else [value]):
+                    seen.setdefault(_hashable(item), item)
+        return [_copy(value) for value in seen.values()]
+
+    def aggregate(self, pipeline: List[Dict[str, Any]], **kwargs) -> MemoryCommandCursor:
+        check_pipeline(pipeline)
+
+        def execute() -> List[Dict[str, Any]]:
+            stages = list(pipeline)
+            if stages and "$match" in stages[0]:
+                query = _store(stages.pop(0)["$match"])
+                documents = [self._documents[slot] for slot in self._matching(query)]
+            else:
+                documents = list(self._documents.values())
+            return [_copy(document) for document in _run_pipeline(documents, stages)]
+        return MemoryCommandCursor(execute)
+
+    # ---- writes ----
+
+    async def insert_one(self, document: Dict[str, Any], **kwargs) -> InsertOneResult:
+        return InsertOneResult(self._insert(document), True)
+
+    async def insert_many(self, documents: Any, ordered: bool = True, **kwargs) -> InsertManyResult:
+        documents = list(documents)
+        if not documents:
+            raise TypeError("documents must be a non-empty list")
+        result = await self.bulk_write([InsertOne(document) for document in documents], ordered=ordered)
+        return InsertManyResult([document["_id"] for document in documents], result.acknowledged)
+
+    async def update_one(self, filter: Dict[str, Any], update: Dict[str, Any], upsert: bool = False,
+                         **kwargs) -> UpdateResult:
+        return UpdateResult(self._update(filter, update, upsert, multi=False), True)
+
+    async def update_many(self, filter: Dict[str, Any], update: Dict[str, Any], upsert: bool = False,
+                          **kwargs) -> UpdateResult:
+        return UpdateResult(self._update(filter, update, upsert, multi=True), True)
+
+    async def replace_one(self, filter: Dict[str, Any], replacement: Dict[str, Any], upsert: bool = False,
+                          **kwargs) -> UpdateResult:
+        return UpdateResult(self._update(filter, replacement, upsert, multi=False, replacement=True), True)
+
+    async def find_one_and_update(self, filter: Dict[str, Any], update: Dict[str, Any], projection: Any = None,
+                                  sort: Any = None, upsert: bool = False, return_document: bool = False,
+                                  **kwargs) -> Optional[Dict[str, Any]]:
+        _check_update(update)
+        query, update = _store(filter), _store(update)
+        slots = self._select(query, _sort_spec(sort) if sort else None, 0, 1)
+        if not slots:
+            if not upsert:
+                return None
+            _id = self._upsert(query, update, replacement=False)
+            return self._find({"_id": _id}, projection, None, 0, 1)[0] if return_document else None
+        slot = slots[0]
+        before = self._documents[slot]
+        new = self._updated(slot, update, query, replacement=False)
+        if new is not None:
+            self._replace_slot(slot, new)
+        return _project(self._documents[slot] if return_document else before, projection)
+
+    async def find_one_and_delete(self, filter: Dict[str, Any], projection: Any = None, sort: Any = None,
+                                  **kwargs) -> Optional[Dict[str, Any]]:
+        slots = self._select(_store(filter), _sort_spec(sort) if sort else None, 0, 1)
+        if not slots:
+            return None
+        document = _project(self._documents[slots[0]], projection)
+        self._delete_slot(slots[0])
+        return document
+
+    async def delete_one(self, filter: Dict[str, Any], **kwargs) -> DeleteResult:
+        return DeleteResult({"n": self._delete(filter, multi=False), "ok": 1.0}, True)
+
+    async def delete_many(self, filter: Dict[str, Any], **kwargs) -> DeleteResult:
+        return DeleteResult({"n": self._delete(filter, multi=True), "ok": 1.0}, True)
+
+    async def bulk_write(self, requests: List[Any], ordered: bool = True, **kwargs) -> BulkWriteResult:
+        result: Dict[str, Any] = {
+            "writeErrors": [], "writeConcernErrors": [], "nInserted": 0, "nUpserted": 0,
+            "nMatched": 0, "nModified": 0, "nRemoved": 0, "upserted": []
+        }
+        for position, request in enumerate(requests):
+            try:
+                if isinstance(request, InsertOne):
+                    self._insert(request._doc)
+                    result["nInserted"] += 1
+                    continue
+                if isinstance(request, (UpdateOne, UpdateMany, ReplaceOne)):
+                    raw = self._update(request._filter, request._doc, request._upsert,
+                                       multi=isinstance(request, UpdateMany), replacement=isinstance(request, ReplaceOne))
+                    if "upserted" in raw:
+                        result["nUpserted"] += 1
+                        result["upserted"].append({"index": position, "_id": raw["upserted"]})
+                    else:
+                        result["nMatched"] += raw["n"]
+                        result["nModified"] += raw["nModified"]
+                    continue
+                if isinstance(request, (DeleteOne, DeleteMany)):
+                    result["nRemoved"] += self._delete(request._filter, multi=isinstance(request, DeleteMany))
+                    continue
+                raise TypeError(f"{request!r} is not a valid request")
+            except WriteError as e:
+                result["writeErrors"].append({"index": position, "code": e.code, "errmsg": str(e)})
+                if ordered:
+                    break
+        if result["writeErrors"]:
+            raise BulkWriteError(result)
+        return BulkWriteResult(result, True)
+
+    # ---- administration ----
+
+    async def create_index(self, keys: Any, unique: bool = False, name: Optional[str] = None,
+                           partialFilterExpression: Optional[Dict[str, Any]] = None, **kwargs) -> str:
+        keys = _index_keys(keys)
+        name = name or "_".join(f"{field}_{direction}" for field, direction in keys)
+        if name in self._indexes:
+            return name
+        index = _Index(name, keys, unique=unique, partial=_store(partialFilterExpression) if partialFilterExpression else None)
+        if unique:
+            seen = set()
+            for document in self._documents.values():
+                if index.covers(document):
+                    key = index.unique_key(document)
+                    if key in seen:
+                        raise DuplicateKeyError(f"E11000 duplicate key error collection: {self.full_name} index: {name}",
+                                                11000)
+                    seen.add(key)
+        self._add_index(index)
+        return name
+
+    async def drop(self):
+        self.database._collections.pop(self.name, None)
+
+
+class MemoryDatabase:
+    def __init__(self, client: "MemoryClient", name: str):
+        self.client = client
+        self.name = name
+        self._collections: Dict[str, MemoryCollection] = {}
+
+    def __getitem__(self, name: str) -> MemoryCollection:
+        collection = self._collections.get(name)
+        if collection is None:
+            collection = self._collections[name] = MemoryCollection(self, name)
+        return collection
+
+    def __getattr__(self, name: str) -> MemoryCollection:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+    def get_collection(self, name: str, **options) -> MemoryCollection:
+        return self[name]
+
+    async def create_collection(self, name: str, capped: bool = False, **options) -> MemoryCollection:
+        if capped:
+            raise _unsupported("capped collections")
+        if name in self._collections:
+            raise CollectionInvalid(f"collection {name} already exists")
+        return self[name]
+
+    async def list_collection_names(self, **kwargs) -> List[str]:
+        return list(self._collections)
+
+    async def drop_collection(self, name: str):
+        self._collections.pop(name, None)
+
+    async def command(self, command: Any, value: Any = 1, **kwargs) -> Dict[str, Any]:
+        name = command if isinstance(command, str) else next(iter(command))
+        if name == "ping":
+            return {"ok": 1.0}
+        raise OperationFailure(f"no such command: '{name}'", code=59)
+
+    def watch(self, *args, **kwargs):
+        raise _unsupported("change streams")
+
+
+class MemoryClient:
+    """In-process stand-in for ``AsyncIOMotorClient``; see the module docstring"""
+
+    def __init__(self):
+        self._databases: Dict[str, MemoryDatabase] = {}
+
+    def __getitem__(self, name: str) -> MemoryDatabase:
+        database = self._databases.get(name)
+        if database is None:
+            database = self._databases[name] = MemoryDatabase(self, name)
+        return database
+
+    def __getattr__(self, name: str) -> MemoryDatabase:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+    def get_database(self, name: str, **options) -> MemoryDatabase:
+        return self[name]
+
+    async def drop_database(self, name: str):
+        self._databases.pop(getattr(name, "name", name), None)
+
+    def close(self):
+        # Data lives as long as the process; a new client starts empty
+        pass
@@ -0,0 +1,404 @@
+#!/usr/bin/env python3
+"""Synthetic data generator for load testing.
+
+Streams production-shaped users, enrollments, progress, payment transactions,
+certificates and AI chat logs into a local MongoDB using batched insert_many
+calls, so memory stays flat from 1K up to 10M users.
+
+    python synthetic_data.py --users 100k --seed 42
+    python synthetic_data.py --users 10m --batch-size 10000
+    python synthetic_data.py --drop
+
+Runs write to their own database (``--db-name``, default ``rtc_load_test``),
+never the app's ``DB_NAME``; an empty catalog there is seeded first. Every
+generated document carries ``"synthetic": True`` so a run can be removed
+again without touching the seeded catalog or real accounts. All synthetic
+users share the password given by ``--password`` (hashed once up front), so
+they are students and instructors only unless ``--admin-fraction`` asks for
+admins explicitly.
+
+Content is reproducible from ``--seed``. Ids are drawn from a second stream
+seeded with the seed and the number of synthetic users already present, so
+repeated runs with the same seed add new ids instead of reusing old ones.
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import random
+import sys
+import time
+import uuid
+from datetime import datetime, timezone, timedelta
+from pathlib import Path
+from typing import Dict, List
+
+import bcrypt
+from dotenv import load_dotenv
+from pymongo import MongoClient, UpdateOne
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger("synthetic_data")
+
+MIN_USERS = 1_000
+MAX_USERS = 10_000_000
+
+SYNTHETIC_COLLECTIONS = ["users", "enrollments", "payment_transactions", "certificates", "ai_chats"]
+
+FIRST_NAMES = [
+    "Amara", "Ben", "Chen", "Dami", "Elena", "Farid", "Grace", "Hiro", "Ifeoma", "Jonas",
+    "Kemi", "Luca", "Maya", "Nadia", "Omar", "Priya", "Quinn", "Rosa", "Sipho", "Tariq",
+    "Uche", "Vera", "Wei", "Ximena", "Yusuf", "Zara"
+]
+LAST_NAMES = [
+    "Adeyemi", "Brown", "Costa", "Dubois", "Eze", "Fischer", "Garcia", "Hassan", "Ivanova",
+    "Johnson", "Kim", "Lazarous", "Mensah", "Nakamura", "Okafor", "Patel", "Rossi", "Singh",
+    "Tanaka", "Usman", "Valdez", "Williams", "Xu", "Yamamoto", "Zhang"
+]
+CHAT_PROMPTS = [
+    "Can you explain this module in simpler terms?",
+    "What is the difference between a list and a tuple?",
+    "How do I prepare for the certification exam?",
+    "Give me a practice question on this topic.",
+    "Why does my code raise a KeyError here?",
+    "Summarise the key objectives of this module.",
+    "What are common interview questions for this field?",
+    "How does gradient descent work?"
+]
+
+# Number of courses a user enrolls in: most take one or two, a long tail takes more.
+ENROLLMENTS_PER_USER_WEIGHTS = [0.30, 0.38, 0.17, 0.08, 0.04, 0.02, 0.01]
+
+
+def parse_count(value: str) -> int:
+    """Parse counts such as 5000, 250k or 10m"""
+    text = value.strip().lower().replace("_", "")
+    multiplier = 1
+    if text.endswith("k"):
+        multiplier, text = 1_000, text[:-1]
+    elif text.endswith("m"):
+        multiplier, text = 1_000_000, text[:-1]
+    try:
+        count = int(float(text) * multiplier)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid count: {value}")
+    if not MIN_USERS <= count <= MAX_USERS:
+        raise argparse.ArgumentTypeError(f"user count must be between {MIN_USERS:,} and {MAX_USERS:,}")
+    return count
+
+
+def fraction(value: str) -> float:
+    number = float(value)
+    if not 0.0 <= number <= 1.0:
+        raise argparse.ArgumentTypeError("must be between 0 and 1")
+    return number
+
+
+def make_uuid(rng: random.Random) -> str:
+    return str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+
+def isoformat(ts: datetime) -> str:
+    return ts.isoformat()
+
+
+class BatchWriter:
+    """Buffers documents per collection and flushes them with insert_many"""
+
+    def __init__(self, db, batch_size: int, dry_run: bool = False):
+        self.db = db
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+        self.buffers: Dict[str, List[Dict]] = {name: [] for name in SYNTHETIC_COLLECTIONS}
+        self.counts: Dict[str, int] = {name: 0 for name in SYNTHETIC_COLLECTIONS}
+
+    def add(self, collection: str, doc: Dict):
+        buffer = self.buffers[collection]
+        buffer.append(doc)
+        if len(buffer) >= self.batch_size:
+            self.flush(collection)
+
+    def flush(self, collection: str):
+        buffer = self.buffers[collection]
+        if not buffer:
+            return
+        if not self.dry_run:
+            self.db[collection].insert_many(buffer, ordered=False)
+        self.counts[collection] += len(buffer)
+        self.buffers[collection] = []
+
+    def flush_all(self):
+        for collection in SYNTHETIC_COLLECTIONS:
+            self.flush(collection)
+
+
+class SyntheticDataGenerator:
+    def __init__(self, courses: List[Dict], password_hash: str, seed: int, days: int, chats_per_user: float,
+                 offset: int = 0, admin_fraction: float = 0.0):
+        self.rng = random.Random(seed)
+        # Ids get their own stream keyed by the run's offset so the same seed never repeats an id in one database
+        self.id_rng = random.Random(f"{seed}:{offset}")
+        self.admin_fraction = admin_fraction
+        self.password_hash = password_hash
+        self.days = days
+        self.chats_per_user = chats_per_user
+        self.now = datetime.now(timezone.utc)
+        self.enrollment_counts: Dict[str, int] = {}
+
+        # Zipf-like popularity over a seeded random ranking of the catalog
+        self.courses = list(courses)
+        self.rng.shuffle(self.courses)
+        weights = [1.0 / (rank ** 1.1) for rank in range(1, len(self.courses) + 1)]
+        total = sum(weights)
+        running = 0.0
+        self.course_cum_weights = []
+        for weight in weights:
+            running += weight / total
+            self.course_cum_weights.append(running)
+
+    def new_id(self) -> str:
+        return make_uuid(self.id_rng)
+
+    def random_time_after(self, start: datetime) -> datetime:
+        span = (self.now - start).total_seconds()
+        if span <= 0:
+            return self.now
+        return start + timedelta(seconds=self.rng.random() * span)
+
+    def pick_courses(self, count: int) -> List[Dict]:
+        picked: Dict[str, Dict] = {}
+        attempts = 0
+        while len(picked) < count and attempts < count * 10:
+            course = self.rng.choices(self.courses, cum_weights=self.course_cum_weights)[0]
+            picked[course["id"]] = course
+            attempts += 1
+        return list(picked.values())
+
+    def completed_fraction(self) -> float:
+        roll = self.rng.random()
+        if roll < 0.12:
+            return 1.0
+        if roll < 0.30:
+            return 0.0
+        # Most learners stall early; beta(0.8, 2.2) skews towards the first modules
+        return self.rng.betavariate(0.8, 2.2)
+
+    def generate_user(self, index: int, writer: BatchWriter):
+        rng = self.rng
+        user_id = self.new_id()
+        created_at = self.now - timedelta(seconds=rng.random() * self.days * 86400)
+        role_roll = rng.random()
+        role = "student"
+        if role_roll < self.admin_fraction:
+            role = "admin"
+        elif role_roll > 0.97:
+            role = "instructor"
+        full_name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+
+        writer.add("users", {
+            "id": user_id,
+            "email": f"user{index}@loadtest.righttechcentre.com",
+            "full_name": full_name,
+            "password": self.password_hash,
+            "role": role,
+            "created_at": isoformat(created_at),
+            "profile_image": None,
+            "synthetic": True
+        })
+
+        num_enrollments = rng.choices(range(len(ENROLLMENTS_PER_USER_WEIGHTS)), weights=ENROLLMENTS_PER_USER_WEIGHTS)[0]
+        enrolled_courses = self.pick_courses(num_enrollments)
+
+        # Abandoned checkouts that never turned into an enrollment
+        if rng.random() < 0.15:
+            course = self.pick_courses(1)[0]
+            writer.add("payment_transactions", self.transaction_doc(user_id, course, created_at, paid=False))
+
+        for course in enrolled_courses:
+            self.generate_enrollment(user_id, full_name, course, created_at, writer)
+
+        for _ in range(self.chat_count()):
+            course_id = rng.choice(enrolled_courses)["id"] if enrolled_courses and rng.random() < 0.8 else None
+            asked_at = self.random_time_after(created_at)
+            session_id = f"rtc-{user_id}-{course_id or 'general'}"
+            writer.add("ai_chats", {
+                "id": self.new_id(),
+                "user_id": user_id,
+                "session_id": session_id,
+                "course_id": course_id,
+                "user_message": rng.choice(CHAT_PROMPTS),
+                "ai_response": "Synthetic tutor response. " * rng.randint(5, 60),
+                "created_at": isoformat(asked_at),
+                "synthetic": True
+            })
+
+    def chat_count(self) -> int:
+        # Geometric distribution with the configured mean
+        if self.chats_per_user <= 0:
+            return 0
+        p = 1.0 / (1.0 + self.chats_per_user)
+        count = 0
+        while self.rng.random() > p:
+            count += 1
+        return count
+
+    def transaction_doc(self, user_id: str, course: Dict, created_at: datetime, paid: bool) -> Dict:
+        started_at = self.random_time_after(created_at)
+        return {
+            "id": self.new_id(),
+            "session_id": f"cs_test_{uuid.UUID(int=self.id_rng.getrandbits(128)).hex}",
+            "user_id": user_id,
+            "course_id": course["id"],
+            "amount": float(course["price"]),
+            "currency": "usd",
+            "status": "complete" if paid else self.rng.choice(["pending", "expired"]),
+            "payment_status": "paid" if paid else self.rng.choice(["initiated", "unpaid"]),
+            "created_at": isoformat(started_at),
+            "metadata": {"course_title": course["title"]},
+            "synthetic": True
+        }
+
+    def generate_enrollment(self, user_id: str, user_name: str, course: Dict, created_at: datetime, writer: BatchWriter):
+        rng = self.rng
+        payment_id = None
+        if rng.random() < 0.85:
+            transaction = self.transaction_doc(user_id, course, created_at, paid=True)
+            writer.add("payment_transactions", transaction)
+            payment_id = transaction["id"]
+            enrolled_at = datetime.fromisoformat(transaction["created_at"]) + timedelta(seconds=rng.randint(5, 600))
+        else:
+            enrolled_at = self.random_time_after(created_at)
+
+        module_ids = [module.get("id") or str(i) for i, module in enumerate(course.get("modules", []))]
+        completed_count = int(round(self.completed_fraction() * len(module_ids)))
+        completed_modules = module_ids[:completed_count]
+        progress = (completed_count / len(module_ids) * 100) if module_ids else 0
+        completed_at = None
+        status = "active"
+        if module_ids and completed_count == len(module_ids):
+            status = "completed"
+            completed_at = self.random_time_after(enrolled_at)
+
+        enrollment_doc = {
+            "id": self.new_id(),
+            "user_id": user_id,
+            "course_id": course["id"],
+            "status": status,
+            "progress": progress,
+            "completed_modules": completed_modules,
+            "enrolled_at": isoformat(enrolled_at),
+            "completed_at": isoformat(completed_at) if completed_at else None,
+            "synthetic": True
+        }
+        if payment_id:
+            enrollment_doc["payment_id"] = payment_id
+        writer.add("enrollments", enrollment_doc)
+        self.enrollment_counts[course["id"]] = self.enrollment_counts.get(course["id"], 0) + 1
+
+        if completed_at and rng.random() < 0.9:
+            writer.add("certificates", {
+                "id": self.new_id(),
+                "user_id": user_id,
+                "course_id": course["id"],
+                "course_title": course["title"],
+                "user_name": user_name,
+                "credit_hours": course["credit_hours"],
+                "issued_at": isoformat(self.random_time_after(completed_at)),
+                "certificate_number": f"RTC-{completed_at.year}-{uuid.UUID(int=self.id_rng.getrandbits(128)).hex[:8].upper()}",
+                "synthetic": True
+            })
+
+
+def load_courses(db) -> List[Dict]:
+    courses = list(db.courses.find({}, {"_id": 0, "id": 1, "title": 1, "price": 1, "credit_hours": 1, "modules.id": 1}))
+    if courses:
+        return courses
+
+    logger.info("Course catalog is empty, running the server seed first")
+    import server
+    asyncio.run(server.seed_courses())
+    return list(db.courses.find({}, {"_id": 0, "id": 1, "title": 1, "price": 1, "credit_hours": 1, "modules.id": 1}))
+
+
+def drop_synthetic(db):
+    for collection in SYNTHETIC_COLLECTIONS:
+        result = db[collection].delete_many({"synthetic": True})
+        logger.info(f"Removed {result.deleted_count} synthetic documents from {collection}")
+    db.courses.update_many({}, {"$set": {"enrolled_count": 0}})
+    pipeline = [{"$group": {"_id": "$course_id", "count": {"$sum": 1}}}]
+    updates = [UpdateOne({"id": row["_id"]}, {"$set": {"enrolled_count": row["count"]}}) for row in db.enrollments.aggregate(pipeline)]
+    if updates:
+        db.courses.bulk_write(updates, ordered=False)
+    # The recount above already includes what the sharded counters held
+    db.course_counters.delete_many({})
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Generate synthetic Right Tech Centre data for load testing")
+    parser.add_argument("--users", type=parse_count, default=MIN_USERS, help="number of users, e.g. 1k, 250k, 10m")
+    parser.add_argument("--seed", type=int, default=42, help="random seed for reproducible runs")
+    parser.add_argument("--batch-size", type=int, default=5000, help="documents per insert_many call")
+    parser.add_argument("--days", type=int, default=730, help="spread account creation over this many days")
+    parser.add_argument("--chats-per-user", type=float, default=2.0, help="mean AI chat messages per user")
+    parser.add_argument("--password", default="loadtest123", help="password shared by all synthetic users")
+    parser.add_argument("--bcrypt-rounds", type=int, default=12, help="cost factor for the shared password hash")
+    parser.add_argument("--admin-fraction", type=fraction, default=0.0,
+                        help="share of users made admins; they get the shared password too, so off by default")
+    parser.add_argument("--mongo-url", default="mongodb://localhost:27017")
+    parser.add_argument("--db-name", default="rtc_load_test", help="database used for the run (never the production one)")
+    parser.add_argument("--drop", action="store_true", help="remove previously generated synthetic data and exit")
+    parser.add_argument("--dry-run", action="store_true", help="generate documents without writing them")
+    args = parser.parse_args(argv)
+    # The catalog seed below runs through server.py, which reads these at import
+    os.environ['MONGO_URL'] = args.mongo_url
+    os.environ['DB_NAME'] = args.db_name
+
+    client = MongoClient(args.mongo_url)
+    db = client[args.db_name]
+
+    if args.drop:
+        drop_synthetic(db)
+        return 0
+
+    courses = load_courses(db)
+    if not courses:
+        logger.error("No courses available to enroll synthetic users into")
+        return 1
+
+    # Offset emails and the id stream by the synthetic users already present so repeated runs add new accounts
+    offset = 0 if args.dry_run else db.users.count_documents({"synthetic": True})
+    password_hash = bcrypt.hashpw(args.password.encode('utf-8'), bcrypt.gensalt(rounds=args.bcrypt_rounds)).decode('utf-8')
+    generator = SyntheticDataGenerator(courses, password_hash, args.seed, args.days, args.chats_per_user,
+                                       offset=offset, admin_fraction=args.admin_fraction)
+    writer = BatchWriter(db, args.batch_size, dry_run=args.dry_run)
+    started = time.perf_counter()
+    report_every = max(args.users // 20, 1)
+
+    for index in range(offset, offset + args.users):
+        generator.generate_user(index, writer)
+        done = index - offset + 1
+        if done % report_every == 0:
+            elapsed = time.perf_counter() - started
+            logger.info(f"{done:,}/{args.users:,} users ({done / elapsed:,.0f} users/s)")
+
+    writer.flush_all()
+
+    if not args.dry_run and generator.enrollment_counts:
+        db.courses.bulk_write([
+            UpdateOne({"id": course_id}, {"$inc": {"enrolled_count": count}})
+            for course_id, count in generator.enrollment_counts.items()
+        ], ordered=False)
+
+    elapsed = time.perf_counter() - started
+    summary = ", ".join(f"{name}={count:,}" for name, count in writer.counts.items())
+    logger.info(f"Generated {summary} in {elapsed:.1f}s (seed={args.seed})")
+    client.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,129 @@
+"""Per-worker warm-up and readiness reporting.
+
+A fresh worker is slow on its first requests. The checkout and AI handlers
+import ``emergentintegrations`` and its dependency tree on first use, the
+first Mongo commands pay for opening pool connections, and the catalog
+cache starts empty. ``WarmUp.run`` does that work as soon as the worker
+starts:
+
+- imports ``WARMUP_MODULES`` in a thread, so the import does not block the
+  event loop;
+- opens ``WARMUP_MONGO_CONNECTIONS`` pool connections by issuing that many
+  concurrent pings, retrying until Mongo is reachable;
+- primes the catalog (the published course list, its compressed variants
+  and the facet index) unless ``WARMUP_PRIME_CATALOG`` is off.
+
+``/api/health`` stays a liveness check. ``/api/ready`` answers 503 until the
+warm-up has finished, and afterwards whenever Mongo does not answer a ping.
+Load balancers should route on it so traffic only reaches warm workers.
+A failed import or catalog prime is reported but does not hold readiness
+back, because the worker can still serve those requests, just slower.
+"""
+
+import asyncio
+import importlib
+import logging
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+import pymongo
+from pymongo.errors import PyMongoError
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+WARMUP_MODULES: Tuple[str, ...] = (
+    "emergentintegrations.llm.chat",
+    "emergentintegrations.payments.stripe.checkout",
+)
+WARMUP_MONGO_CONNECTIONS = int(os.environ.get('WARMUP_MONGO_CONNECTIONS', '4'))
+WARMUP_PRIME_CATALOG = os.environ.get('WARMUP_PRIME_CATALOG', 'true').lower() in ('1', 'true', 'yes')
+WARMUP_RETRY_SECONDS = float(os.environ.get('WARMUP_RETRY_SECONDS', '1'))
+READY_PING_TIMEOUT_SECONDS = float(os.environ.get('READY_PING_TIMEOUT_SECONDS', '2'))
+READY_RETRY_AFTER_SECONDS = int(os.environ.get('READY_RETRY_AFTER_SECONDS', '5'))
+
+warmup_step_duration = metrics.registry.gauge(
+    "rtc_warmup_step_seconds", "Time this worker spent on each warm-up step", ("step",))
+worker_ready = metrics.registry.gauge("rtc_worker_ready", "1 once this worker has warmed up and may take traffic")
+
+
+def _import_modules():
+    for name in WARMUP_MODULES:
+        importlib.import_module(name)
+
+
+class WarmUp:
+    def __init__(self):
+        self.ready = False
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.steps: Dict[str, Dict[str, Any]] = {}
+
+    def set_ready(self, ready: bool):
+        self.ready = ready
+        worker_ready.set(1 if ready else 0)
+
+    async def _step(self, name: str, fn: Callable[[], Awaitable[Any]]):
+        started = time.monotonic()
+        error = None
+        try:
+            await fn()
+        except Exception as e:
+            error = str(e) or type(e).__name__
+            logger.warning(f"Warm-up step {name} failed: {error}")
+        seconds = time.monotonic() - started
+        warmup_step_duration.set(seconds, step=name)
+        self.steps[name] = {"seconds": round(seconds, 3), "ok": error is None}
+        if error is not None:
+            self.steps[name]["error"] = error
+
+    async def _open_pool(self, db):
+        while True:
+            try:
+                await asyncio.gather(*(db.command("ping") for _ in range(max(WARMUP_MONGO_CONNECTIONS, 1))))
+                return
+            except PyMongoError as e:
+                logger.warning(f"Warm-up waiting for Mongo: {e}")
+                await asyncio.sleep(WARMUP_RETRY_SECONDS)
+
+    async def run(self, db, prime_catalog: Optional[Callable[[], Awaitable[Any]]] = None):
+        """Warm this worker up, then mark it ready"""
+        self.started_at = time.monotonic()
+        await self._step("imports", lambda: asyncio.to_thread(_import_modules))
+        await self._step("mongo_pool", lambda: self._open_pool(db))
+        if prime_catalog is not None and WARMUP_PRIME_CATALOG:
+            await self._step("catalog", prime_catalog)
+        self.finished_at = time.monotonic()
+        self.set_ready(True)
+        logger.info(f"Worker {os.getpid()} warmed up in {self.finished_at - self.started_at:.2f}s")
+
+    async def report(self, db, pool_stats: Dict[str, Dict[str, int]]) -> Tuple[bool, Dict[str, Any]]:
+        """(ready, body) for /api/ready; pings Mongo on every call"""
+        ping_ms = None
+        ping_error = None
+        started = time.monotonic()
+        try:
+            with pymongo.timeout(READY_PING_TIMEOUT_SECONDS):
+                await db.command("ping")
+            ping_ms = round((time.monotonic() - started) * 1000, 2)
+        except PyMongoError as e:
+            ping_error = str(e)
+        ready = self.ready and ping_error is None
+        body: Dict[str, Any] = {
+            "ready": ready,
+            "warmed_up": self.ready,
+            "pid": os.getpid(),
+            "mongo": {"ping_ms": ping_ms, "pool": pool_stats},
+            "warmup": {
+                "seconds": round(self.finished_at - self.started_at, 3) if self.finished_at is not None else None,
+                "steps": self.steps
+            }
+        }
+        if ping_error is not None:
+            body["mongo"]["error"] = ping_error
+        return ready, body
+
+
+warm_up = WarmUp()
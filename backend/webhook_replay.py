@@ -0,0 +1,452 @@
+#!/usr/bin/env python3
+"""Stripe webhook storm replay for the payment path.
+
+Runs the FastAPI app in-process (httpx ASGI transport) with Stripe replaced
+by the fake in ``fake_integrations``, then simulates a flash sale:
+
+1. ``--buyers`` accounts each open a checkout for one of ``--courses``
+   published courses through ``POST /api/payments/checkout``.
+2. Most customers pay. ``--async-fraction`` of them pay with a delayed
+   method, so Stripe sends ``checkout.session.completed`` (unpaid) and then
+   ``checkout.session.async_payment_succeeded`` (paid). ``--abandon``
+   of the sessions expire instead, and each of those also receives a forged
+   "paid" event signed with the wrong secret, which must be refused.
+3. Every event is signed like Stripe signs it and delivered to
+   ``POST /api/webhook/stripe`` at ``--rate`` deliveries per second.
+   Deliveries are interleaved across sessions. ``--duplicates`` extra
+   copies of each event are sent on average, and ``--reorder`` of the
+   delayed payments have their two events swapped. ``--poll`` of the
+   buyers also poll ``GET /api/payments/status`` as the success page does.
+   Non-2xx responses are redelivered with backoff, as Stripe would.
+
+Each session is completed at the fake Stripe right before its first event
+is sent. The report compares that moment with the enrollment's
+``enrolled_at`` to give the payment-to-enrollment time. It also checks the
+outcome in the database:
+
+- fulfillment throughput, as enrollments per second;
+- paid sessions without an enrollment;
+- duplicate enrollments for the same user and course;
+- enrollments created for abandoned sessions or by forged events;
+- transactions of paid sessions that do not end up ``paid``.
+
+    python webhook_replay.py --buyers 2000 --rate 2000
+    python webhook_replay.py --buyers 5000 --rate 0 --duplicates 2 --storage memory
+    python webhook_replay.py --courses 1 --poll 0.5 --reorder 1 --async-fraction 0.5
+
+``--rate 0`` sends as fast as ``--concurrency`` allows. Results are written
+as JSON (``benchmarks/webhooks-latest.json`` by default). The exit status is
+1 when any of the checks above fails.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from benchmark import BENCHMARK_DIR, BenchmarkClient, RouteStats, percentile
+
+REPLAY_EMAIL_DOMAIN = "replay.righttechcentre.com"
+WEBHOOK_ROUTE = "/api/webhook/stripe"
+ORIGIN_URL = "http://localhost:3000"
+
+
+class Delivery:
+    """One webhook delivery (or status poll) scheduled at ``key`` in the storm"""
+
+    def __init__(self, key: float, session_id: str, kind: str, event_id: Optional[str] = None,
+                 event_type: Optional[str] = None, payment_status: Optional[str] = None):
+        self.key = key
+        self.session_id = session_id
+        self.kind = kind  # "event", "forged" or "poll"
+        self.event_id = event_id
+        self.event_type = event_type
+        self.payment_status = payment_status
+        self.attempts = 0
+
+
+class Storm:
+    def __init__(self, fake, client: BenchmarkClient, tokens: Dict[str, str], owners: Dict[str, str],
+                 concurrency: int, max_attempts: int):
+        self.fake = fake
+        self.client = client
+        self.tokens = tokens
+        self.owners = owners
+        self.max_attempts = max_attempts
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.bodies: Dict[str, bytes] = {}
+        self.redelivered = 0
+        self.gave_up = 0
+        self.forged_accepted = 0
+        self.first_sent: Optional[float] = None
+
+    def _body(self, delivery: Delivery) -> bytes:
+        """Event payload, built when the event first fires; redeliveries reuse the same bytes"""
+        body = self.bodies.get(delivery.event_id)
+        if body is None:
+            session = self.fake.FAKE_SESSIONS[delivery.session_id]
+            if delivery.kind == "event":
+                # The customer acts at the fake Stripe right before Stripe announces it
+                if delivery.payment_status == "paid":
+                    self.fake.complete_session(delivery.session_id)
+                elif session["status"] == "open" and delivery.event_type == "checkout.session.completed":
+                    self.fake.complete_session(delivery.session_id, "unpaid")
+                elif delivery.event_type == "checkout.session.expired":
+                    self.fake.expire_session(delivery.session_id)
+            event = self.fake.webhook_event(delivery.session_id, delivery.event_type,
+                                            delivery.payment_status, delivery.event_id)
+            if delivery.payment_status:
+                event["data"]["object"]["status"] = "complete"
+            body = json.dumps(event).encode()
+            self.bodies[delivery.event_id] = body
+        return body
+
+    async def deliver(self, delivery: Delivery):
+        async with self.semaphore:
+            if self.first_sent is None:
+                self.first_sent = time.perf_counter()
+            delivery.attempts += 1
+            if delivery.kind == "poll":
+                response = await self.client.request(
+                    "GET", "/api/payments/status/{session_id}", f"/api/payments/status/{delivery.session_id}",
+                    token=self.tokens[self.owners[delivery.session_id]]
+                )
+            else:
+                body = self._body(delivery)
+                secret = "whsec_forged" if delivery.kind == "forged" else None
+                response = await self.client.request(
+                    "POST", WEBHOOK_ROUTE, WEBHOOK_ROUTE, content=body,
+                    headers={"Stripe-Signature": self.fake.sign_webhook(body, secret),
+                             "Content-Type": "application/json"}
+                )
+        if delivery.kind == "forged":
+            # Stripe never sent it, so nobody redelivers it; the app must refuse it
+            if response is not None and response.status_code < 300:
+                self.forged_accepted += 1
+            return
+        if delivery.kind == "poll" or (response is not None and response.status_code < 300):
+            return
+        if delivery.attempts >= self.max_attempts:
+            self.gave_up += 1
+            return
+        # Stripe redelivers with exponential backoff; compressed to fractions of a second here
+        self.redelivered += 1
+        await asyncio.sleep(0.25 * 2 ** (delivery.attempts - 1))
+        await self.deliver(delivery)
+
+    async def run(self, deliveries: List[Delivery], rate: float) -> float:
+        """Fire ``deliveries`` in key order at ``rate`` per second; returns the send window in seconds"""
+        tasks = []
+        started = time.perf_counter()
+        for index, delivery in enumerate(deliveries):
+            if rate > 0:
+                due = started + index / rate
+                delay = due - time.perf_counter()
+                if delay > 0.001:
+                    await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(self.deliver(delivery)))
+        send_window = time.perf_counter() - started
+        await asyncio.gather(*tasks)
+        return send_window
+
+
+def extra_copies(mean: float, rng: random.Random) -> int:
+    whole = int(mean)
+    return whole + (1 if rng.random() < mean - whole else 0)
+
+
+def plan_storm(sessions: List[str], args, rng: random.Random) -> Dict:
+    """Deliveries for every session, interleaved across sessions in one ordered list"""
+    deliveries: List[Delivery] = []
+    paid: List[str] = []
+    abandoned: List[str] = []
+    reordered = 0
+    for session_id in sessions:
+        if rng.random() < args.abandon:
+            abandoned.append(session_id)
+            sequence = [("checkout.session.expired", None, "event"),
+                        ("checkout.session.completed", "paid", "forged")]
+        elif rng.random() < args.async_fraction:
+            paid.append(session_id)
+            sequence = [("checkout.session.completed", "unpaid", "event"),
+                        ("checkout.session.async_payment_succeeded", "paid", "event")]
+            if rng.random() < args.reorder:
+                sequence.reverse()
+                reordered += 1
+        else:
+            paid.append(session_id)
+            sequence = [("checkout.session.completed", "paid", "event")]
+
+        copies = []
+        for event_type, payment_status, kind in sequence:
+            event_id = f"evt_{rng.getrandbits(128):032x}"
+            for _ in range(1 + extra_copies(args.duplicates, rng)):
+                copies.append((kind, event_id, event_type, payment_status))
+        keys = sorted(rng.random() for _ in copies)
+        deliveries.extend(
+            Delivery(key, session_id, kind, event_id, event_type, payment_status)
+            for key, (kind, event_id, event_type, payment_status) in zip(keys, copies)
+        )
+        if session_id in paid and rng.random() < args.poll:
+            # The success page polls once the customer is back from Stripe
+            deliveries.append(Delivery(max(keys) + rng.random() * (1 - max(keys)), session_id, "poll"))
+
+    deliveries.sort(key=lambda delivery: delivery.key)
+    return {"deliveries": deliveries, "paid": paid, "abandoned": abandoned, "reordered": reordered}
+
+
+async def setup_buyers(server, http, args, rng: random.Random) -> Dict:
+    courses = await server.db.courses.find({"is_published": True}, {"_id": 0, "id": 1}).to_list(1000)
+    course_ids = [course["id"] for course in courses][:max(args.courses, 1)]
+    if not course_ids:
+        raise SystemExit("No published courses to sell")
+
+    previous = await server.db.users.find({"email": {"$regex": f"@{REPLAY_EMAIL_DOMAIN}$"}}, {"_id": 0, "id": 1}).to_list(None)
+    if previous:
+        previous_ids = [user["id"] for user in previous]
+        await server.db.enrollments.delete_many({"user_id": {"$in": previous_ids}})
+        await server.db.payment_transactions.delete_many({"user_id": {"$in": previous_ids}})
+        await server.db.users.delete_many({"id": {"$in": previous_ids}})
+
+    user_docs = [{
+        "id": str(uuid.uuid4()),
+        "email": f"buyer{i}@{REPLAY_EMAIL_DOMAIN}",
+        "full_name": f"Replay Buyer {i}",
+        "password": "!",  # cannot log in; the harness mints tokens directly
+        "role": "student",
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "profile_image": None,
+        "synthetic": True
+    } for i in range(args.buyers)]
+    if user_docs:
+        await server.db.users.insert_many(user_docs)
+    tokens = {doc["id"]: server.create_token(doc["id"], "student") for doc in user_docs}
+
+    stats = RouteStats()
+    client = BenchmarkClient(http, stats)
+    semaphore = asyncio.Semaphore(args.concurrency)
+    owners: Dict[str, str] = {}
+
+    async def checkout(user_id: str):
+        async with semaphore:
+            response = await client.request(
+                "POST", "/api/payments/checkout", "/api/payments/checkout", token=tokens[user_id],
+                json={"course_id": rng.choice(course_ids), "origin_url": ORIGIN_URL}
+            )
+        if response is not None and response.status_code == 200:
+            owners[response.json()["session_id"]] = user_id
+
+    started = time.perf_counter()
+    await asyncio.gather(*(checkout(doc["id"]) for doc in user_docs))
+    return {
+        "tokens": tokens,
+        "owners": owners,
+        "course_ids": course_ids,
+        "checkout": stats.summary(time.perf_counter() - started),
+    }
+
+
+async def inspect_outcome(server, fake, plan: Dict, owners: Dict[str, str]) -> Dict:
+    user_ids = list(set(owners.values()))
+    transactions = await server.db.payment_transactions.find(
+        {"session_id": {"$in": list(owners)}}, {"_id": 0, "id": 1, "session_id": 1, "payment_status": 1}
+    ).to_list(None)
+    session_by_payment = {transaction["id"]: transaction["session_id"] for transaction in transactions}
+    status_by_session = {transaction["session_id"]: transaction["payment_status"] for transaction in transactions}
+    enrollments = await server.db.enrollments.find(
+        {"user_id": {"$in": user_ids}}, {"_id": 0, "user_id": 1, "course_id": 1, "payment_id": 1, "enrolled_at": 1}
+    ).to_list(None)
+
+    per_pair: Dict[tuple, int] = {}
+    enrolled_at: Dict[str, float] = {}
+    for enrollment in enrollments:
+        pair = (enrollment["user_id"], enrollment["course_id"])
+        per_pair[pair] = per_pair.get(pair, 0) + 1
+        session_id = session_by_payment.get(enrollment.get("payment_id"))
+        if session_id is not None:
+            at = datetime.fromisoformat(enrollment["enrolled_at"]).timestamp()
+            enrolled_at[session_id] = min(at, enrolled_at.get(session_id, at))
+
+    paid = plan["paid"]
+    abandoned = set(plan["abandoned"])
+    fulfilled = [session_id for session_id in paid if session_id in enrolled_at]
+    latencies = sorted(
+        (enrolled_at[session_id] - fake.FAKE_SESSIONS[session_id]["paid_at"]) * 1000 for session_id in fulfilled
+    )
+    first_paid = min((fake.FAKE_SESSIONS[session_id]["paid_at"] for session_id in fulfilled), default=0.0)
+    last_enrolled = max((enrolled_at[session_id] for session_id in fulfilled), default=0.0)
+    window = last_enrolled - first_paid
+    return {
+        "paid_sessions": len(paid),
+        "abandoned_sessions": len(abandoned),
+        "fulfilled": len(fulfilled),
+        "missing": len(paid) - len(fulfilled),
+        "duplicate_enrollments": sum(count - 1 for count in per_pair.values() if count > 1),
+        "enrollments_for_abandoned": sum(1 for session_id in enrolled_at if session_id in abandoned),
+        "not_marked_paid": sum(1 for session_id in paid if status_by_session.get(session_id) != "paid"),
+        "fulfillment_window_seconds": window,
+        "throughput_per_second": len(fulfilled) / window if window > 0 else 0.0,
+        "payment_to_enrollment": {
+            "p50_ms": percentile(latencies, 50),
+            "p95_ms": percentile(latencies, 95),
+            "p99_ms": percentile(latencies, 99),
+            "max_ms": latencies[-1] if latencies else 0.0,
+        },
+    }
+
+
+async def run_replay(args) -> Dict:
+    import fake_integrations
+    fake_integrations.install(stripe_latency=args.stripe_latency_ms / 1000.0)
+
+    import httpx
+    import server
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    rng = random.Random(args.seed)
+    await server.app.router.startup()
+    try:
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://replay", timeout=60) as http:
+            buyers = await setup_buyers(server, http, args, rng)
+            plan = plan_storm(sorted(buyers["owners"]), args, rng)
+            stats = RouteStats()
+            storm = Storm(fake_integrations, BenchmarkClient(http, stats), buyers["tokens"], buyers["owners"],
+                          args.concurrency, args.max_attempts)
+            started = time.perf_counter()
+            send_window = await storm.run(plan["deliveries"], args.rate)
+            wall_seconds = time.perf_counter() - started
+            outcome = await inspect_outcome(server, fake_integrations, plan, buyers["owners"])
+    finally:
+        await server.app.router.shutdown()
+
+    routes = stats.summary(wall_seconds)
+    sent = sum(route["count"] for route in routes.values())
+    return {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "config": {
+            "buyers": args.buyers,
+            "courses": buyers["course_ids"],
+            "rate": args.rate,
+            "concurrency": args.concurrency,
+            "duplicates": args.duplicates,
+            "async_fraction": args.async_fraction,
+            "reorder": args.reorder,
+            "abandon": args.abandon,
+            "poll": args.poll,
+            "max_attempts": args.max_attempts,
+            "seed": args.seed,
+            "stripe_latency_ms": args.stripe_latency_ms,
+            "storage": args.storage,
+            "db_name": os.environ.get('DB_NAME'),
+        },
+        "checkout": buyers["checkout"],
+        "storm": {
+            "planned": len(plan["deliveries"]),
+            "sent": sent,
+            "redelivered": storm.redelivered,
+            "gave_up": storm.gave_up,
+            "forged_accepted": storm.forged_accepted,
+            "reordered_sessions": plan["reordered"],
+            "send_window_seconds": send_window,
+            "wall_seconds": wall_seconds,
+            "achieved_rate": sent / wall_seconds if wall_seconds else 0.0,
+            "routes": routes,
+        },
+        "fulfillment": outcome,
+    }
+
+
+def anomalies(result: Dict) -> List[str]:
+    outcome = result["fulfillment"]
+    found = []
+    for key, label in (("missing", "paid sessions without an enrollment"),
+                       ("duplicate_enrollments", "duplicate enrollments"),
+                       ("enrollments_for_abandoned", "enrollments for abandoned sessions"),
+                       ("not_marked_paid", "paid sessions whose transaction is not paid")):
+        if outcome[key]:
+            found.append(f"{outcome[key]} {label}")
+    if result["storm"]["forged_accepted"]:
+        found.append(f"{result['storm']['forged_accepted']} forged deliveries answered with 2xx")
+    if result["storm"]["gave_up"]:
+        found.append(f"{result['storm']['gave_up']} deliveries still failing after {result['config']['max_attempts']} attempts")
+    return found
+
+
+def print_report(result: Dict):
+    storm = result["storm"]
+    outcome = result["fulfillment"]
+    e2e = outcome["payment_to_enrollment"]
+    print(f"\n{storm['sent']:,} deliveries in {storm['wall_seconds']:.1f}s ({storm['achieved_rate']:.1f}/s), "
+          f"{storm['redelivered']} redelivered, {storm['reordered_sessions']} sessions reordered\n")
+    header = f"{'route':<52} {'count':>8} {'p50':>9} {'p95':>9} {'p99':>9} {'statuses'}"
+    print(header)
+    print("-" * len(header))
+    for route, data in {**result["checkout"], **storm["routes"]}.items():
+        statuses = " ".join(f"{code}:{count}" for code, count in data["statuses"].items())
+        print(f"{route:<52} {data['count']:>8} {data['p50_ms']:>8.1f}ms {data['p95_ms']:>8.1f}ms "
+              f"{data['p99_ms']:>8.1f}ms {statuses}")
+    print(f"\nFulfilled {outcome['fulfilled']}/{outcome['paid_sessions']} paid sessions at "
+          f"{outcome['throughput_per_second']:.1f} enrollments/s")
+    print(f"Payment to enrollment: p50 {e2e['p50_ms']:.1f}ms, p95 {e2e['p95_ms']:.1f}ms, "
+          f"p99 {e2e['p99_ms']:.1f}ms, max {e2e['max_ms']:.1f}ms")
+    print(f"Duplicate enrollments: {outcome['duplicate_enrollments']}, "
+          f"enrollments for abandoned sessions: {outcome['enrollments_for_abandoned']}")
+
+
+def fraction(value: str) -> float:
+    number = float(value)
+    if not 0.0 <= number <= 1.0:
+        raise argparse.ArgumentTypeError("must be between 0 and 1")
+    return number
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Replay Stripe webhook storms against the Right Tech Centre API in-process")
+    parser.add_argument("--buyers", type=int, default=1000, help="accounts that each open one checkout")
+    parser.add_argument("--courses", type=int, default=1, help="number of published courses on sale")
+    parser.add_argument("--rate", type=float, default=1000.0, help="deliveries per second; 0 sends as fast as possible")
+    parser.add_argument("--concurrency", type=int, default=200, help="maximum requests in flight")
+    parser.add_argument("--duplicates", type=float, default=1.0, help="mean extra copies of every event")
+    parser.add_argument("--async-fraction", type=fraction, default=0.2, help="share of payments with a delayed method")
+    parser.add_argument("--reorder", type=fraction, default=0.5, help="share of delayed payments whose events arrive swapped")
+    parser.add_argument("--abandon", type=fraction, default=0.1, help="share of sessions that expire (and get a forged event)")
+    parser.add_argument("--poll", type=fraction, default=0.0, help="share of buyers that also poll /api/payments/status")
+    parser.add_argument("--max-attempts", type=int, default=5, help="deliveries per event before giving up on non-2xx")
+    parser.add_argument("--stripe-latency-ms", type=float, default=150.0)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--storage", choices=["mongo", "memory"], default="mongo",
+                        help="storage backend; memory needs no mongod")
+    parser.add_argument("--db-name", default="rtc_webhook_replay", help="database used for the run (never the production one)")
+    parser.add_argument("--output", type=Path, default=BENCHMARK_DIR / "webhooks-latest.json")
+    args = parser.parse_args(argv)
+
+    os.environ['DB_NAME'] = args.db_name
+    os.environ.setdefault('STRIPE_API_KEY', 'sk_test_replay')
+    # The app verifies signatures itself; the fake Stripe signs with the same secret
+    os.environ.setdefault('STRIPE_WEBHOOK_SECRET', 'whsec_test_replay')
+    os.environ['STORAGE_BACKEND'] = args.storage
+
+    result = asyncio.run(run_replay(args))
+    print_report(result)
+
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    args.output.write_text(json.dumps(result, indent=2))
+    print(f"\nResults written to {args.output}")
+
+    found = anomalies(result)
+    for problem in found:
+        print(f"FAIL: {problem}")
+    return 1 if found else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
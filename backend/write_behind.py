@@ -0,0 +1,166 @@
+"""Write-behind buffers for append-only records.
+
+Chat transcripts (``ai_chats``) and payment audit entries (``payment_audit``)
+are never read back within the request that produces them, so awaiting one
+``insert_one`` per record only adds a Mongo round trip to user-facing
+latency. ``WriteBehindBuffer.append`` queues the document in memory and
+returns; a background task writes queued documents with ``insert_many`` once
+``WRITE_BEHIND_BATCH_SIZE`` are pending or ``WRITE_BEHIND_FLUSH_SECONDS``
+have passed, whichever comes first.
+
+The queue is bounded by ``WRITE_BEHIND_MAX_PENDING``. When Mongo falls behind
+and the queue is full, ``append`` waits for the next flush (backpressure)
+instead of growing memory without limit. Failed flushes are re-queued, and
+the shutdown hook drains whatever is pending before the client closes.
+Setting the flush interval to 0 writes through on every call.
+"""
+
+import asyncio
+import logging
+import os
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+from pymongo.errors import BulkWriteError, PyMongoError
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+WRITE_BEHIND_BATCH_SIZE = int(os.environ.get('WRITE_BEHIND_BATCH_SIZE', '200'))
+WRITE_BEHIND_FLUSH_SECONDS = float(os.environ.get('WRITE_BEHIND_FLUSH_SECONDS', '0.5'))
+WRITE_BEHIND_MAX_PENDING = int(os.environ.get('WRITE_BEHIND_MAX_PENDING', '10000'))
+WRITE_BEHIND_RETRY_SECONDS = float(os.environ.get('WRITE_BEHIND_RETRY_SECONDS', '1'))
+
+write_behind_flush_size = metrics.registry.histogram(
+    "rtc_write_behind_flush_documents", "Documents written per write-behind flush", ("collection",),
+    buckets=(1, 5, 10, 25, 50, 100, 200, 500, 1000))
+write_behind_flush_duration = metrics.registry.histogram(
+    "rtc_write_behind_flush_seconds", "insert_many latency of write-behind flushes", ("collection",),
+    buckets=metrics.MONGO_BUCKETS)
+write_behind_pending = metrics.registry.gauge(
+    "rtc_write_behind_pending", "Documents queued and not yet written", ("collection",))
+write_behind_backpressure_total = metrics.registry.counter(
+    "rtc_write_behind_backpressure_total", "Appends that waited because the queue was full", ("collection",))
+write_behind_failures_total = metrics.registry.counter(
+    "rtc_write_behind_flush_failures_total", "Write-behind flushes that failed and were re-queued", ("collection",))
+
+
+class WriteBehindBuffer:
+    def __init__(self, collection: str, batch_size: int = WRITE_BEHIND_BATCH_SIZE,
+                 flush_interval: float = WRITE_BEHIND_FLUSH_SECONDS, max_pending: int = WRITE_BEHIND_MAX_PENDING):
+        self.collection_name = collection
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max(max_pending, batch_size)
+        self.db = None
+        self._queue: deque = deque()
+        self._wakeup: Optional[asyncio.Future] = None
+        self._space = asyncio.Event()
+        self._space.set()
+
+    def bind(self, db):
+        self.db = db
+
+    @property
+    def collection(self):
+        return self.db[self.collection_name]
+
+    def pending(self) -> int:
+        return len(self._queue)
+
+    def _wake(self):
+        if self._wakeup is not None and not self._wakeup.done():
+            self._wakeup.set_result(None)
+
+    def _set_pending_gauge(self):
+        write_behind_pending.set(len(self._queue), collection=self.collection_name)
+
+    async def append(self, document: Dict[str, Any]):
+        if self.flush_interval <= 0:
+            await self.collection.insert_one(document)
+            return
+        if len(self._queue) >= self.max_pending:
+            write_behind_backpressure_total.inc(collection=self.collection_name)
+            while len(self._queue) >= self.max_pending:
+                self._space.clear()
+                self._wake()
+                await self._space.wait()
+        self._queue.append(document)
+        self._set_pending_gauge()
+        if len(self._queue) >= self.batch_size:
+            self._wake()
+
+    async def flush(self) -> bool:
+        """Write one batch; returns False if it failed and was re-queued"""
+        if not self._queue:
+            return True
+        batch: List[Dict[str, Any]] = [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+        started = asyncio.get_running_loop().time()
+        try:
+            await self.collection.insert_many(batch, ordered=False)
+        except asyncio.CancelledError:
+            self._queue.extendleft(reversed(batch))
+            raise
+        except BulkWriteError as e:
+            # Documents that failed with a duplicate key were written by an earlier attempt
+            retry = [batch[error["index"]] for error in e.details.get("writeErrors", []) if error.get("code") != 11000]
+            if retry:
+                self._requeue(retry, e)
+                return False
+        except PyMongoError as e:
+            self._requeue(batch, e)
+            return False
+        finally:
+            self._set_pending_gauge()
+            self._space.set()
+        write_behind_flush_size.observe(len(batch), collection=self.collection_name)
+        write_behind_flush_duration.observe(asyncio.get_running_loop().time() - started, collection=self.collection_name)
+        return True
+
+    def _requeue(self, documents: List[Dict[str, Any]], error: Exception):
+        logger.warning(f"Write-behind flush of {len(documents)} {self.collection_name} documents failed, re-queued: {error}")
+        write_behind_failures_total.inc(collection=self.collection_name)
+        self._queue.extendleft(reversed(documents))
+
+    async def drain(self):
+        """Flush until the queue is empty or a flush fails"""
+        while self._queue and await self.flush():
+            pass
+
+    async def run(self):
+        """Flush on size or time until cancelled, then drain what is left"""
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                if len(self._queue) < self.batch_size:
+                    self._wakeup = loop.create_future()
+                    timer = loop.call_later(self.flush_interval, self._wake)
+                    try:
+                        await self._wakeup
+                    finally:
+                        timer.cancel()
+                while self._queue:
+                    if not await self.flush():
+                        await asyncio.sleep(WRITE_BEHIND_RETRY_SECONDS)
+                        break
+                    if len(self._queue) < self.batch_size:
+                        break
+        finally:
+            await asyncio.shield(self.drain())
+            if self._queue:
+                logger.error(f"Dropped {len(self._queue)} unwritten {self.collection_name} documents at shutdown")
+
+
+chat_log = WriteBehindBuffer("ai_chats")
+payment_audit = WriteBehindBuffer("payment_audit")
+
+BUFFERS = (chat_log, payment_audit)
+
+
+def start(db) -> List[asyncio.Task]:
+    tasks = []
+    for buffer in BUFFERS:
+        buffer.bind(db)
+        tasks.append(asyncio.create_task(buffer.run()))
+    return tasks
@@ -0,0 +1,46 @@
+import { useEffect, useRef } from 'react';
+
+const API_URL = process.env.REACT_APP_BACKEND_URL + '/api';
+
+/**
+ * Subscribe to the signed-in user's server-sent events.
+ *
+ * `handlers` maps event types (e.g. 'enrollment.created') to callbacks that
+ * receive the event data. `onReconnect` fires when the stream comes back after
+ * a drop, so callers can refetch anything they missed meanwhile.
+ */
+export const useEvents = (handlers, { enabled = true, onReconnect } = {}) => {
+  const handlersRef = useRef(handlers);
+  const onReconnectRef = useRef(onReconnect);
+  handlersRef.current = handlers;
+  onReconnectRef.current = onReconnect;
+
+  useEffect(() => {
+    const token = localStorage.getItem('rtc_token');
+    if (!enabled || !token || typeof EventSource === 'undefined') {
+      return undefined;
+    }
+
+    const source = new EventSource(`${API_URL}/events/stream?token=${encodeURIComponent(token)}`);
+    Object.keys(handlersRef.current).forEach((type) => {
+      source.addEventListener(type, (message) => {
+        const handler = handlersRef.current[type];
+        if (handler) {
+          handler(JSON.parse(message.data).data);
+        }
+      });
+    });
+
+    let opened = false;
+    source.onopen = () => {
+      if (opened && onReconnectRef.current) {
+        onReconnectRef.current();
+      }
+      opened = true;
+    };
+
+    return () => source.close();
+  }, [enabled]);
+};
+
+export const eventsSupported = () => typeof EventSource !== 'undefined';
@@ -1,6 +1,7 @@
 import React, { useState, useEffect } from 'react';
 import { motion } from 'framer-motion';
 import { useAuth } from '../context/AuthContext';
+import { useEvents } from '../hooks/use-events';
 import { Button } from '../components/ui/button';
 import { Input } from '../components/ui/input';
 import { Tabs, TabsContent, TabsList, TabsTrigger } from '../components/ui/tabs';
@@ -38,6 +39,19 @@ const AdminDashboard = () => {
     fetchData();
   }, []);
 
+  useEvents({
+    'counters.updated': (deltas) => {
+      setAnalytics(prev => {
+        if (!prev) return prev;
+        const next = { ...prev };
+        Object.entries(deltas).forEach(([key, delta]) => {
+          next[key] = (next[key] || 0) + delta;
+        });
+        return next;
+      });
+    }
+  }, { onReconnect: () => fetchData() });
+
   const fetchData = async () => {
     try {
       setLoading(true);
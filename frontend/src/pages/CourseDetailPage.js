@@ -1,5 +1,5 @@
-import React, { useState, useEffect } from 'react';
-import { useParams, useNavigate } from 'react-router-dom';
+import React, { useState, useEffect, useRef } from 'react';
+import { Link, useParams, useNavigate } from 'react-router-dom';
 import { motion } from 'framer-motion';
 import { useAuth } from '../context/AuthContext';
 import { Button } from '../components/ui/button';
@@ -28,17 +28,30 @@ import { formatPrice, getCourseTypeLabel, getCourseTypeColor } from '../lib/util
 
 const CourseDetailPage = () => {
   const { courseId } = useParams();
+  // One key per page view, so double-clicks and retries replay the same checkout session
+  const checkoutKeyRef = useRef(`${courseId}-${Date.now()}-${Math.random().toString(36).slice(2)}`);
   const navigate = useNavigate();
   const { api, isAuthenticated, user } = useAuth();
   const [course, setCourse] = useState(null);
   const [enrollment, setEnrollment] = useState(null);
   const [loading, setLoading] = useState(true);
   const [purchasing, setPurchasing] = useState(false);
+  const [recommendations, setRecommendations] = useState([]);
 
   useEffect(() => {
     fetchCourseAndEnrollment();
+    fetchRecommendations();
   }, [courseId]);
 
+  const fetchRecommendations = async () => {
+    try {
+      const response = await api.get(`/courses/${courseId}/recommendations?limit=4`);
+      setRecommendations(response.data);
+    } catch (error) {
+      setRecommendations([]);
+    }
+  };
+
   const fetchCourseAndEnrollment = async () => {
     try {
       setLoading(true);
@@ -76,6 +89,8 @@ const CourseDetailPage = () => {
       const response = await api.post('/payments/checkout', {
         course_id: courseId,
         origin_url: window.location.origin
+      }, {
+        headers: { 'Idempotency-Key': checkoutKeyRef.current }
       });
       
       window.location.href = response.data.checkout_url;
@@ -375,6 +390,28 @@ const CourseDetailPage = () => {
                   </li>
                 </ul>
               </div>
+
+              {recommendations.length > 0 && (
+                <div className="bg-[#0A0A0A] border border-[#27272A] p-6 mt-6" data-testid="course-recommendations">
+                  <h3 className="font-bold text-white mb-4">Students Also Took</h3>
+                  <ul className="space-y-3">
+                    {recommendations.map((recommended) => (
+                      <li key={recommended.id}>
+                        <Link
+                          to={`/courses/${recommended.id}`}
+                          className="flex items-start gap-3 text-sm text-[#A1A1AA] hover:text-[#CCFF00] transition-colors"
+                        >
+                          <GraduationCap className="w-4 h-4 text-[#CCFF00] mt-0.5 shrink-0" />
+                          <span>
+                            {recommended.title}
+                            <span className="block text-xs text-[#52525B]">{getCourseTypeLabel(recommended.course_type)}</span>
+                          </span>
+                        </Link>
+                      </li>
+                    ))}
+                  </ul>
+                </div>
+              )}
             </div>
           </div>
         </div>
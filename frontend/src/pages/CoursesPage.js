@@ -26,6 +26,7 @@ const CoursesPage = () => {
   const { api } = useAuth();
   const [searchParams, setSearchParams] = useSearchParams();
   const [courses, setCourses] = useState([]);
+  const [typeCounts, setTypeCounts] = useState({});
   const [loading, setLoading] = useState(true);
   const [searchQuery, setSearchQuery] = useState(searchParams.get('search') || '');
   const [courseType, setCourseType] = useState(searchParams.get('type') || 'all');
@@ -45,8 +46,12 @@ const CoursesPage = () => {
         params.append('search', searchQuery);
       }
       
-      const response = await api.get(`/courses?${params.toString()}`);
+      const [response, facets] = await Promise.all([
+        api.get(`/courses?${params.toString()}`),
+        api.get(`/courses/facets?${params.toString()}`).catch(() => null),
+      ]);
       setCourses(response.data);
+      setTypeCounts(facets ? facets.data.facets.course_type : {});
     } catch (error) {
       console.error('Error fetching courses:', error);
     } finally {
@@ -78,6 +83,9 @@ const CoursesPage = () => {
     return matchesSearch;
   });
 
+  const allTypesCount = Object.values(typeCounts).reduce((sum, count) => sum + count, 0);
+  const typeLabelCount = (count) => (Object.keys(typeCounts).length ? ` (${count || 0})` : '');
+
   return (
     <div className="min-h-screen bg-[#050505] pt-20">
       {/* Hero Section */}
@@ -117,10 +125,10 @@ const CoursesPage = () => {
                   <SelectValue placeholder="All Programs" />
                 </SelectTrigger>
                 <SelectContent className="bg-[#0A0A0A] border-[#27272A]">
-                  <SelectItem value="all">All Programs</SelectItem>
-                  <SelectItem value="diploma">Diploma Programs</SelectItem>
-                  <SelectItem value="bachelor">Bachelor Programs</SelectItem>
-                  <SelectItem value="certification">Certifications</SelectItem>
+                  <SelectItem value="all">All Programs{typeLabelCount(allTypesCount)}</SelectItem>
+                  <SelectItem value="diploma">Diploma Programs{typeLabelCount(typeCounts.diploma)}</SelectItem>
+                  <SelectItem value="bachelor">Bachelor Programs{typeLabelCount(typeCounts.bachelor)}</SelectItem>
+                  <SelectItem value="certification">Certifications{typeLabelCount(typeCounts.certification)}</SelectItem>
                 </SelectContent>
               </Select>
             </div>
@@ -1,7 +1,8 @@
-import React, { useEffect, useState } from 'react';
+import React, { useEffect, useRef, useState } from 'react';
 import { useSearchParams, useNavigate, Link } from 'react-router-dom';
 import { motion } from 'framer-motion';
 import { useAuth } from '../context/AuthContext';
+import { useEvents, eventsSupported } from '../hooks/use-events';
 import { Button } from '../components/ui/button';
 import { CheckCircle, Loader2, XCircle, ArrowRight } from 'lucide-react';
 
@@ -12,6 +13,18 @@ const PaymentSuccessPage = () => {
   const [status, setStatus] = useState('checking'); // checking, success, failed
   const [paymentDetails, setPaymentDetails] = useState(null);
   const sessionId = searchParams.get('session_id');
+  const settledRef = useRef(false);
+
+  // The server pushes payment.paid as soon as the webhook lands; polling is only a fallback
+  useEvents({
+    'payment.paid': (payment) => {
+      if (payment.session_id === sessionId && !settledRef.current) {
+        settledRef.current = true;
+        setPaymentDetails({ amount_total: Math.round(payment.amount * 100), currency: payment.currency });
+        setStatus('success');
+      }
+    }
+  }, { enabled: !!sessionId && isAuthenticated });
 
   useEffect(() => {
     if (!sessionId) {
@@ -29,8 +42,11 @@ const PaymentSuccessPage = () => {
 
   const pollPaymentStatus = async (attempts = 0) => {
     const maxAttempts = 5;
-    const pollInterval = 2000;
+    const pollInterval = eventsSupported() ? 6000 : 2000;
 
+    if (settledRef.current) {
+      return;
+    }
     if (attempts >= maxAttempts) {
       setStatus('failed');
       return;
@@ -38,12 +54,17 @@ const PaymentSuccessPage = () => {
 
     try {
       const response = await api.get(`/payments/status/${sessionId}`);
+      if (settledRef.current) {
+        return;
+      }
       setPaymentDetails(response.data);
 
       if (response.data.payment_status === 'paid') {
+        settledRef.current = true;
         setStatus('success');
         return;
       } else if (response.data.status === 'expired') {
+        settledRef.current = true;
         setStatus('failed');
         return;
       }
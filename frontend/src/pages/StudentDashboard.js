@@ -2,6 +2,7 @@ import React, { useState, useEffect } from 'react';
 import { Link, useNavigate } from 'react-router-dom';
 import { motion } from 'framer-motion';
 import { useAuth } from '../context/AuthContext';
+import { useEvents } from '../hooks/use-events';
 import { Button } from '../components/ui/button';
 import { Progress } from '../components/ui/progress';
 import { toast } from 'sonner';
@@ -24,11 +25,48 @@ const StudentDashboard = () => {
   const [enrollments, setEnrollments] = useState([]);
   const [certificates, setCertificates] = useState([]);
   const [loading, setLoading] = useState(true);
+  const [recommendations, setRecommendations] = useState([]);
 
   useEffect(() => {
     fetchData();
   }, []);
 
+  // "Students also took" for the most recent enrollment, minus courses already taken
+  const latestCourseId = enrollments.reduce(
+    (latest, e) => (!latest || e.enrolled_at > latest.enrolled_at ? e : latest), null
+  )?.course_id;
+
+  useEffect(() => {
+    if (!latestCourseId) {
+      setRecommendations([]);
+      return;
+    }
+    api.get(`/courses/${latestCourseId}/recommendations?limit=10`)
+      .then((response) => setRecommendations(response.data))
+      .catch(() => setRecommendations([]));
+  }, [latestCourseId]);
+
+  const enrolledCourseIds = new Set(enrollments.map(e => e.course_id));
+  const suggestedCourses = recommendations.filter(c => !enrolledCourseIds.has(c.id)).slice(0, 3);
+
+  useEvents({
+    'enrollment.created': (enrollment) => {
+      setEnrollments(prev => prev.some(e => e.id === enrollment.id) ? prev : [...prev, enrollment]);
+    },
+    'progress.updated': (update) => {
+      setEnrollments(prev => prev.map(e => e.id === update.enrollment_id ? {
+        ...e,
+        progress: update.progress,
+        completed_modules: update.completed_modules,
+        status: update.status || e.status,
+        completed_at: update.completed_at || e.completed_at
+      } : e));
+    },
+    'certificate.issued': (certificate) => {
+      setCertificates(prev => prev.some(c => c.id === certificate.id) ? prev : [...prev, certificate]);
+    }
+  }, { onReconnect: () => fetchData() });
+
   const fetchData = async () => {
     try {
       setLoading(true);
@@ -228,6 +266,31 @@ const StudentDashboard = () => {
               </div>
             </motion.div>
 
+            {suggestedCourses.length > 0 && (
+              <motion.div
+                initial={{ opacity: 0, y: 20 }}
+                animate={{ opacity: 1, y: 0 }}
+                transition={{ delay: 0.35 }}
+                className="bg-[#0A0A0A] border border-[#27272A] p-6"
+                data-testid="dashboard-recommendations"
+              >
+                <h3 className="font-bold text-white mb-4">Students Also Took</h3>
+                <div className="space-y-3">
+                  {suggestedCourses.map((course) => (
+                    <Link
+                      key={course.id}
+                      to={`/courses/${course.id}`}
+                      className="flex items-center gap-3 p-3 bg-[#121212] hover:bg-[#1a1a1a] transition-colors group"
+                    >
+                      <BookOpen className="w-5 h-5 text-[#CCFF00] shrink-0" />
+                      <span className="text-sm text-white line-clamp-1">{course.title}</span>
+                      <ArrowRight className="w-4 h-4 text-[#52525B] ml-auto shrink-0 group-hover:text-[#CCFF00] transition-colors" />
+                    </Link>
+                  ))}
+                </div>
+              </motion.div>
+            )}
+
             {/* Learning Tip */}
             <motion.div
               initial={{ opacity: 0, y: 20 }}
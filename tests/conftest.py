@@ -0,0 +1,77 @@
+import os
+import sys
+import uuid
+
+import pytest
+
+# The app reads its configuration at import time; run it on the in-process store
+os.environ.setdefault('STORAGE_BACKEND', 'memory')
+os.environ.setdefault('DB_NAME', 'rtcapp_test')
+os.environ.setdefault('CATALOG_SNAPSHOT_ENABLED', 'false')
+# Every test client shares one address; test_rate_limit.py enables the limiter on its own app
+os.environ.setdefault('RATE_LIMIT_ENABLED', 'false')
+os.environ.setdefault('STRIPE_WEBHOOK_SECRET', 'whsec_test_suite')
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
+
+ADMIN_EMAIL = "admin@righttechcentre.com"
+ADMIN_PASSWORD = "admin123"
+
+
+@pytest.fixture(scope="session")
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture(scope="session")
+async def client(anyio_backend):
+    """An HTTP client for the app, started once on the memory backend"""
+    import httpx
+
+    import fake_integrations
+    # The offline Stripe and LLM clients, without their simulated latency
+    fake_integrations.install(llm_latency=0, stripe_latency=0)
+    import server
+
+    await server.app.router.startup()
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=server.app), base_url="http://testserver") as http:
+        yield http
+    await server.app.router.shutdown()
+
+
+@pytest.fixture(scope="session")
+async def admin_headers(client):
+    response = await client.post("/api/auth/login", json={"email": ADMIN_EMAIL, "password": ADMIN_PASSWORD})
+    assert response.status_code == 200, response.text
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+@pytest.fixture
+def register(client):
+    """Register a new account; returns (user, auth headers)"""
+    async def register(**fields):
+        payload = {"email": f"{uuid.uuid4().hex[:12]}@example.com", "full_name": "Test Student",
+                   "password": "secret123", **fields}
+        response = await client.post("/api/auth/register", json=payload)
+        assert response.status_code == 200, response.text
+        body = response.json()
+        return body["user"], {"Authorization": f"Bearer {body['access_token']}"}
+    return register
+
+
+@pytest.fixture(scope="session")
+async def course_ids(client):
+    response = await client.get("/api/courses")
+    assert response.status_code == 200, response.text
+    return [course["id"] for course in response.json()]
+
+
+@pytest.fixture
+def create_course(client, admin_headers):
+    """Create a course as the admin; returns the course as served by the API"""
+    async def create_course(**fields):
+        payload = {"title": f"Course {uuid.uuid4().hex[:6]}", "description": "A test course", "course_type": "diploma",
+                   "price": 100.0, "credit_hours": 3, "duration_months": 2, "is_published": True, **fields}
+        response = await client.post("/api/courses", json=payload, headers=admin_headers)
+        assert response.status_code == 200, response.text
+        return response.json()
+    return create_course
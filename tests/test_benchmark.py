@@ -0,0 +1,79 @@
+import pytest
+
+from benchmark import BenchmarkClient, RouteStats, compare, percentile
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.mark.parametrize("pct,expected", [(0, 1), (50, 50), (95, 95), (99, 99), (100, 100)])
+def test_percentile_is_nearest_rank(pct, expected):
+    assert percentile([float(value) for value in range(1, 101)], pct) == expected
+
+
+def test_percentile_of_nothing():
+    assert percentile([], 99) == 0.0
+
+
+def test_route_stats_summary():
+    stats = RouteStats()
+    for elapsed in (5.0, 1.0, 3.0, 2.0, 4.0):
+        stats.record("GET /api/courses", elapsed, 200)
+    stats.record("GET /api/courses", 9.0, 500)
+    stats.record("POST /api/auth/login", 7.0, 0)
+    summary = stats.summary(wall_seconds=2.0)
+    courses = summary["GET /api/courses"]
+    assert courses["count"] == 6 and courses["errors"] == 1
+    assert courses["statuses"] == {"200": 5, "500": 1}
+    assert courses["throughput_rps"] == 3.0
+    assert (courses["p50_ms"], courses["max_ms"]) == (3.0, 9.0)
+    assert summary["POST /api/auth/login"]["errors"] == 1
+
+
+def route(rps, p95):
+    return {"throughput_rps": rps, "p50_ms": 1.0, "p95_ms": p95, "p99_ms": p95}
+
+
+def test_compare_flags_regressions_above_threshold(capsys):
+    baseline = {"routes": {"GET /a": route(100, 10.0), "GET /b": route(100, 10.0)}}
+    assert compare({"routes": {"GET /a": route(95, 10.5), "GET /new": route(1, 1)}}, baseline, 10)
+    assert not compare({"routes": {"GET /a": route(100, 12.0)}}, baseline, 10)
+    assert not compare({"routes": {"GET /b": route(80, 10.0)}}, baseline, 10)
+    assert compare({"routes": {"GET /b": route(10, 100.0)}}, baseline, None)
+    assert "new" in capsys.readouterr().out
+
+
+async def test_client_times_requests_under_the_route_template():
+    class Http:
+        async def request(self, method, url, headers=None, **kwargs):
+            if url.endswith("/boom"):
+                raise ConnectionError
+            assert headers == {"Authorization": "Bearer token"}
+            return type("Response", (), {"status_code": 204})()
+
+    stats = RouteStats()
+    client = BenchmarkClient(Http(), stats)
+    await client.request("GET", "/api/courses/{id}", "/api/courses/1", token="token")
+    assert await client.request("GET", "/api/courses/{id}", "/api/courses/boom", token="token") is None
+    assert stats.statuses["GET /api/courses/{id}"] == {204: 1, 0: 1}
+
+
+async def test_progress_scenario_completes_real_modules(client):
+    import random
+
+    import server
+    from benchmark import scenario_progress, setup_fixtures
+
+    rng = random.Random(5)
+    state = await setup_fixtures(server, BenchmarkClient(client, RouteStats()), 2, rng)
+    assert all(state.course_modules[course_id] for course_id in state.course_ids)
+    enrollments = [enrollment for user in state.users for enrollment in user["enrollments"]]
+    assert enrollments
+
+    stats = RouteStats()
+    for _ in range(200):
+        await scenario_progress(BenchmarkClient(client, stats), state, rng)
+    assert set(stats.statuses["PUT /api/enrollments/{enrollment_id}/progress"]) == {200}
+    for enrollment in enrollments:
+        stored = await server.db.enrollments.find_one({"id": enrollment["id"]})
+        assert set(stored["completed_modules"]) <= set(state.course_modules[enrollment["course_id"]])
+        assert stored["progress"] <= 100
@@ -0,0 +1,119 @@
+import json
+import uuid
+
+import bcrypt
+import pytest
+
+import bulk_import
+import storage
+from bulk_import import ImportReport, iter_ndjson, write_batch
+
+pytestmark = pytest.mark.anyio
+
+
+async def chunks(*parts):
+    for part in parts:
+        yield part
+
+
+async def parse(*parts):
+    return [item async for item in iter_ndjson(chunks(*parts))]
+
+
+async def test_lines_are_numbered_across_chunk_boundaries():
+    assert await parse(b'{"a": 1}\n{"b"', b': 2}\n\n[1]\n{bad\n', b'{"c": 3}') == [
+        (1, {"a": 1}),
+        (2, {"b": 2}),
+        (4, "Each line must be a JSON object"),
+        (5, "Invalid JSON: Expecting property name enclosed in double quotes: line 1 column 2 (char 1)"),
+        (6, {"c": 3}),
+    ]
+
+
+async def test_oversized_lines_are_reported_once_and_skipped(monkeypatch):
+    monkeypatch.setattr(bulk_import, "IMPORT_MAX_LINE_BYTES", 16)
+    assert await parse(b'{"a": 1}\n{"long": "', b"x" * 20, b"x" * 20, b'"}\n{"b": 2}\n') == [
+        (1, {"a": 1}),
+        (2, "Line exceeds 16 bytes"),
+        (3, {"b": 2}),
+    ]
+
+
+async def test_write_batch_reports_duplicate_keys_by_line():
+    collection = storage.MemoryClient().rtcapp_test.users
+    await collection.create_index("email", unique=True)
+    report = ImportReport("users")
+    written = await write_batch(collection, [(1, {"email": "a@x.com"}), (2, {"email": "a@x.com"}),
+                                             (3, {"email": "b@x.com"})], report)
+    assert written == [1, 3]
+    assert report.as_dict() == {"kind": "users", "received": 0, "inserted": 2, "failed": 1,
+                                "errors": [{"line": 2, "error": "Duplicate key"}], "errors_truncated": False}
+
+
+def test_report_truncates_errors(monkeypatch):
+    monkeypatch.setattr(bulk_import, "IMPORT_MAX_ERRORS", 2)
+    report = ImportReport("users")
+    for line in (3, 1, 2):
+        report.error(line, "bad")
+    result = report.as_dict()
+    assert [error["line"] for error in result["errors"]] == [1, 3]
+    assert result["failed"] == 3 and result["errors_truncated"]
+
+
+def ndjson(*rows):
+    return "\n".join(row if isinstance(row, str) else json.dumps(row) for row in rows).encode()
+
+
+async def test_user_import_reports_bad_lines_and_duplicates(client, admin_headers):
+    taken = f"{uuid.uuid4().hex[:8]}@example.com"
+    fresh = f"{uuid.uuid4().hex[:8]}@example.com"
+    migrated = f"{uuid.uuid4().hex[:8]}@example.com"
+    password_hash = bcrypt.hashpw(b"secret123", bcrypt.gensalt(rounds=4)).decode()
+    body = ndjson(
+        {"email": taken, "full_name": "Taken", "password": "secret123"},
+        {"email": fresh, "full_name": "Fresh", "password": "secret123"},
+        "{not json",
+        {"email": "not-an-email", "full_name": "Bad", "password": "secret123"},
+        {"email": fresh, "full_name": "Again", "password": "secret123"},
+        {"email": migrated, "full_name": "Migrated", "password_hash": password_hash},
+        {"email": f"x{migrated}", "full_name": "Weak", "password_hash": "plaintext"},
+    )
+    first = await client.post("/api/admin/imports/users", content=ndjson(body.splitlines()[0].decode()),
+                              headers=admin_headers)
+    assert first.json()["inserted"] == 1
+
+    response = await client.post("/api/admin/imports/users", content=body, headers=admin_headers)
+    report = response.json()
+    assert (report["received"], report["inserted"], report["failed"]) == (7, 2, 5)
+    errors = {error["line"]: error["error"] for error in report["errors"]}
+    assert errors[1] == "Email already registered"
+    assert errors[3].startswith("Invalid JSON")
+    assert errors[4].startswith("email:")
+    assert errors[5] == "Email appears earlier in this upload"
+    assert errors[7] == "password_hash must be a bcrypt hash"
+
+    login = await client.post("/api/auth/login", json={"email": migrated, "password": "secret123"})
+    assert login.status_code == 200
+
+
+async def test_dry_run_writes_nothing(client, admin_headers):
+    email = f"{uuid.uuid4().hex[:8]}@example.com"
+    body = ndjson({"email": email, "full_name": "Dry", "password": "secret123"})
+    report = (await client.post("/api/admin/imports/users", params={"dry_run": "true"}, content=body,
+                                headers=admin_headers)).json()
+    assert (report["received"], report["inserted"], report["failed"]) == (1, 0, 0)
+    assert (await client.post("/api/auth/login", json={"email": email, "password": "secret123"})).status_code == 401
+
+
+async def test_course_import(client, admin_headers):
+    title = f"Imported {uuid.uuid4().hex[:6]}"
+    body = ndjson(
+        {"title": title, "description": "d", "course_type": "diploma", "price": 10, "credit_hours": 2,
+         "duration_months": 1, "is_published": True, "modules": [{"title": "M1", "description": "m"}]},
+        {"title": "Missing fields"},
+    )
+    report = (await client.post("/api/admin/imports/courses", content=body, headers=admin_headers)).json()
+    assert (report["inserted"], report["failed"]) == (1, 1)
+    courses = (await client.get("/api/courses", params={"search": title})).json()
+    assert [course["title"] for course in courses] == [title]
+    assert courses[0]["modules"][0]["lesson_count"] == 0
@@ -0,0 +1,134 @@
+import asyncio
+import time
+
+import pytest
+from pymongo.errors import OperationFailure
+
+import cache
+import change_streams
+import storage
+from cache import InvalidationRegistry, TTLCache
+from change_streams import ChangeStreamInvalidator
+
+pytestmark = pytest.mark.anyio
+
+
+def test_ttl_cache_expires_and_evicts_least_recent(monkeypatch):
+    clock = [100.0]
+    monkeypatch.setattr(cache.time, "monotonic", lambda: clock[0])
+    entries = TTLCache("test", ttl=10, max_entries=2)
+    entries.set("a", 1)
+    entries.set("b", 2)
+    assert entries.get("a") == 1
+    entries.set("c", 3)
+    assert entries.get("b") is None and len(entries) == 2
+    clock[0] += 11
+    assert entries.get("a", "expired") == "expired"
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    registry = InvalidationRegistry()
+    monkeypatch.setattr(change_streams, "invalidation", registry)
+    return registry
+
+
+def test_changes_are_dispatched_to_collection_handlers(registry):
+    seen = []
+    registry.on("courses", lambda document: seen.append(("courses", document)))
+    registry.on("users", lambda document: seen.append(("users", document)))
+    invalidator = ChangeStreamInvalidator(db=None)
+    assert invalidator.collections == ["courses", "users"]
+
+    invalidator._handle({"ns": {"coll": "courses"}, "operationType": "update", "fullDocument": {"id": "c1"}})
+    invalidator._handle({"ns": {"coll": "users"}, "operationType": "delete"})
+    invalidator._handle({"ns": {"coll": "payments"}, "operationType": "insert", "fullDocument": {"id": "p"}})
+    assert seen == [("courses", {"id": "c1"}), ("users", None)]
+
+    seen.clear()
+    invalidator._handle({"ns": {"coll": "courses"}, "operationType": "drop"})
+    assert sorted(seen) == [("courses", None), ("users", None)]
+
+
+class Stream:
+    def __init__(self, changes, stop):
+        self.changes = list(changes)
+        self.stop = stop
+        self.resume_token = None
+
+    @property
+    def alive(self):
+        return True
+
+    async def try_next(self):
+        if not self.changes:
+            self.stop.set()
+            await asyncio.sleep(3600)
+        change = self.changes.pop(0)
+        self.resume_token = {"_data": change["_id"]}
+        return change
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+
+async def test_run_tails_the_stream_and_checkpoints_the_resume_token(registry):
+    seen = []
+    registry.on("courses", seen.append)
+    tracked = TTLCache("courses", ttl=1)
+    registry.track(tracked)
+    db = storage.MemoryClient().rtcapp_test
+    stop = asyncio.Event()
+    changes = [{"_id": f"t{i}", "ns": {"coll": "courses"}, "operationType": "update", "fullDocument": {"id": i}}
+               for i in range(3)]
+    watched = []
+
+    def watch(pipeline, **kwargs):
+        watched.append(kwargs)
+        return Stream(changes, stop)
+
+    db.watch = watch
+    invalidator = ChangeStreamInvalidator(db, stream_name="test-stream")
+    task = asyncio.create_task(invalidator.run())
+    await asyncio.wait_for(stop.wait(), 3)
+    assert invalidator.mode == "change_stream"
+    assert tracked.ttl == change_streams.CACHE_TTL_LONG
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+
+    assert seen == [{"id": 0}, {"id": 1}, {"id": 2}]
+    assert watched[0]["resume_after"] is None
+    assert (await db.change_stream_tokens.find_one({"_id": "test-stream"}))["token"] == {"_data": "t2"}
+    restarted = ChangeStreamInvalidator(db, stream_name="test-stream")
+    await restarted._load_token()
+    assert restarted.resume_token == {"_data": "t2"}
+
+
+async def test_falls_back_to_ttl_only_without_change_streams(registry, monkeypatch):
+    registry.on("courses", lambda document: None)
+    tracked = TTLCache("courses", ttl=change_streams.CACHE_TTL_LONG)
+    registry.track(tracked)
+    invalidator = ChangeStreamInvalidator(storage.MemoryClient().rtcapp_test)
+    await asyncio.wait_for(invalidator.run(), 1)
+    assert invalidator.mode == "ttl_only"
+    assert tracked.ttl == change_streams.CACHE_TTL_SHORT
+
+    def standalone(pipeline, **kwargs):
+        raise OperationFailure("The $changeStream stage is only supported on replica sets", code=40573)
+
+    db = storage.MemoryClient().rtcapp_test
+    db.watch = standalone
+    monkeypatch.setattr(change_streams, "CHANGE_STREAM_RETRY_SECONDS", 3600)
+    invalidator = ChangeStreamInvalidator(db)
+    task = asyncio.create_task(invalidator.run())
+    started = time.monotonic()
+    while invalidator.mode != "ttl_only" and time.monotonic() - started < 1:
+        await asyncio.sleep(0.01)
+    assert invalidator.mode == "ttl_only"
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
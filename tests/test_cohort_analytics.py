@@ -0,0 +1,164 @@
+import asyncio
+import json
+
+import pytest
+
+import storage
+from cohort_analytics import CohortAnalytics, build_report, percentiles
+
+pytestmark = pytest.mark.anyio
+
+COURSE = {"id": "c1", "modules": [{"id": "m1", "title": "Intro"}, {"id": "m2", "title": "Core"},
+                                  {"id": "m3", "title": "Capstone"}]}
+
+
+def enrollment(progress, modules, status="active", enrolled_at="2024-01-01T00:00:00+00:00", completed_at=None):
+    return {"course_id": "c1", "progress": progress, "completed_modules": modules, "status": status,
+            "enrolled_at": enrolled_at, "completed_at": completed_at}
+
+
+ENROLLMENTS = [
+    enrollment(0, []),
+    enrollment(100 / 3, ["m1"]),
+    enrollment(100 / 3, ["m1"]),
+    enrollment(200 / 3, ["m1", "m2"]),
+    enrollment(100, ["m1", "m2", "m3"], "completed", completed_at="2024-01-04T12:00:00+00:00"),
+    enrollment(100, ["m1", "m2", "m3"], "completed", completed_at="2024-03-01T00:00:00+00:00"),
+    enrollment(100, ["m1", "m2", "m3"], "completed", completed_at="not a date"),
+    {"course_id": "other", "progress": 50, "completed_modules": ["m1"], "status": "active"},
+]
+
+
+def test_percentiles_use_nearest_rank():
+    assert percentiles({0.0: 1, 33.0: 2, 66.0: 1, 100.0: 3}) == {
+        "p10": 0.0, "p25": 33.0, "p50": 66.0, "p75": 100.0, "p90": 100.0}
+    assert percentiles({5.0: 1}) == {"p10": 5.0, "p25": 5.0, "p50": 5.0, "p75": 5.0, "p90": 5.0}
+    assert percentiles({}) == {"p10": None, "p25": None, "p50": None, "p75": None, "p90": None}
+
+
+def test_build_report_takes_the_mean_from_bucket_sums():
+    report = build_report(COURSE, {
+        "status": [{"_id": "active", "count": 3}],
+        "progress": [{"_id": 33.0, "count": 2, "sum": 200 / 3}, {"_id": 66.0, "count": 1, "sum": 200 / 3}],
+    })
+    assert report["progress"]["mean"] == 44.44
+    assert report["progress"]["histogram"][3]["count"] == 2
+    assert report["progress"]["histogram"][-1] == {"from": 100, "to": 100, "count": 0}
+    assert report["stall_module_id"] == "m1"
+    assert report["time_to_completion_days"]["count"] == 0
+
+
+async def test_report_from_the_aggregation():
+    db = storage.MemoryClient().rtcapp_test
+    await db.courses.insert_one(dict(COURSE))
+    await db.enrollments.insert_many([dict(row) for row in ENROLLMENTS])
+    report = await CohortAnalytics().report(db, "c1")
+
+    assert report["enrollments"] == {"total": 7, "by_status": {"active": 4, "completed": 3}}
+    assert report["progress"]["mean"] == pytest.approx((0 + 200 / 3 + 200 / 3 + 300) / 7, abs=0.01)
+    assert report["progress"]["percentiles"] == {"p10": 0.0, "p25": 33.0, "p50": 66.0, "p75": 100.0, "p90": 100.0}
+    assert [(step["module_id"], step["completed"], step["drop_off"]) for step in report["modules"]] == [
+        ("m1", 6, 1), ("m2", 4, 2), ("m3", 3, 1)]
+    assert report["stall_module_id"] == "m2"
+
+    # The malformed completion timestamp is left out instead of failing the report
+    days = report["time_to_completion_days"]
+    assert days["count"] == 2
+    assert days["percentiles"]["p10"] == 3.0 and days["percentiles"]["p90"] == 60.0
+    assert days["weekly_histogram"][0] == 1 and days["weekly_histogram"][8] == 1
+    assert report["stale"] is False
+
+
+async def test_dirty_courses_serve_the_cached_report_until_recomputed():
+    db = storage.MemoryClient().rtcapp_test
+    await db.courses.insert_one(dict(COURSE))
+    await db.enrollments.insert_one(enrollment(0, []))
+    analytics = CohortAnalytics()
+    assert (await analytics.report(db, "c1"))["enrollments"]["total"] == 1
+
+    await db.enrollments.insert_one(enrollment(100 / 3, ["m1"]))
+    analytics.mark_dirty("c1")
+    stale = await analytics.report(db, "c1")
+    assert stale["stale"] is True and stale["enrollments"]["total"] == 1
+
+    await analytics.recompute_dirty(db)
+    fresh = await analytics.report(db, "c1")
+    assert fresh["stale"] is False and fresh["enrollments"]["total"] == 2
+    assert await analytics.report(db, "missing") is None
+
+
+async def test_concurrent_misses_share_one_aggregation(monkeypatch):
+    db = storage.MemoryClient().rtcapp_test
+    await db.courses.insert_one(dict(COURSE))
+    analytics = CohortAnalytics()
+    calls = []
+    compute = analytics._compute
+
+    async def counted(db, course_id):
+        calls.append(course_id)
+        await asyncio.sleep(0.01)
+        return await compute(db, course_id)
+
+    monkeypatch.setattr(analytics, "_compute", counted)
+    reports = await asyncio.gather(*(analytics.report(db, "c1") for _ in range(5)))
+    assert calls == ["c1"]
+    assert all(report["enrollments"]["total"] == 0 for report in reports)
+
+
+async def test_cohort_endpoint_is_for_instructors_and_flags_stale_reports(client, admin_headers, register,
+                                                                          create_course):
+    course = await create_course(modules=[{"title": "Only", "description": "m"}])
+    url = f"/api/analytics/courses/{course['id']}/cohort"
+    _, student = await register()
+    enrollment = (await client.post("/api/enrollments", json={"course_id": course["id"]}, headers=student)).json()
+    assert (await client.get(url, headers=student)).status_code == 403
+    assert (await client.get("/api/analytics/courses/missing/cohort", headers=admin_headers)).status_code == 404
+
+    first = (await client.get(url, headers=admin_headers)).json()
+    assert first["enrollments"]["total"] == 1 and first["stale"] is False
+
+    response = await client.put(f"/api/enrollments/{enrollment['id']}/progress",
+                                json={"module_id": course["modules"][0]["id"]}, headers=student)
+    assert response.status_code == 200, response.text
+    assert (await client.get(url, headers=admin_headers)).json()["stale"] is True
+
+
+async def test_every_enrollment_path_marks_the_report_stale(client, admin_headers, register, create_course):
+    import fake_integrations
+    import server
+
+    course = await create_course(price=0.0)
+    url = f"/api/analytics/courses/{course['id']}/cohort"
+    assert (await client.get(url, headers=admin_headers)).json()["enrollments"]["total"] == 0
+
+    async def refreshed_total():
+        report = (await client.get(url, headers=admin_headers)).json()
+        assert report["stale"] is True
+        await server.course_analytics.recompute_dirty(server.db)
+        report = (await client.get(url, headers=admin_headers)).json()
+        assert report["stale"] is False
+        return report["enrollments"]["total"]
+
+    _, free = await register()
+    assert (await client.post("/api/enrollments", json={"course_id": course["id"]}, headers=free)).status_code == 200
+    assert await refreshed_total() == 1
+
+    paid = await create_course(price=49.0)
+    url = f"/api/analytics/courses/{paid['id']}/cohort"
+    assert (await client.get(url, headers=admin_headers)).json()["enrollments"]["total"] == 0
+    _, polling = await register()
+    session_id = (await client.post("/api/payments/checkout", headers=polling, json={
+        "course_id": paid["id"], "origin_url": "https://app.example.com"})).json()["session_id"]
+    fake_integrations.complete_session(session_id)
+    assert (await client.get(f"/api/payments/status/{session_id}", headers=polling)).status_code == 200
+    assert await refreshed_total() == 1
+
+    _, webhook = await register()
+    session_id = (await client.post("/api/payments/checkout", headers=webhook, json={
+        "course_id": paid["id"], "origin_url": "https://app.example.com"})).json()["session_id"]
+    fake_integrations.complete_session(session_id)
+    body = json.dumps(fake_integrations.webhook_event(session_id)).encode()
+    response = await client.post("/api/webhook/stripe", content=body,
+                                 headers={"Stripe-Signature": fake_integrations.sign_webhook(body)})
+    assert response.status_code == 200, response.text
+    assert await refreshed_total() == 2
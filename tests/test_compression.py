@@ -0,0 +1,84 @@
+import gzip
+
+import pytest
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse, StreamingResponse
+from starlette.routing import Route
+
+import compression
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.mark.parametrize("header,expected", [
+    (None, "identity"),
+    ("", "identity"),
+    ("gzip", "gzip"),
+    ("gzip, deflate, br", "br"),
+    ("br;q=0.5, gzip;q=0.8", "gzip"),
+    ("br;q=0, gzip;q=0", "identity"),
+    ("*", "br"),
+    ("*;q=0.2, br;q=0", "gzip"),
+    ("GZIP;q=1.0", "gzip"),
+    ("br;q=bogus, gzip", "gzip"),
+    ("deflate, identity", "identity"),
+])
+def test_negotiate(header, expected):
+    assert compression.negotiate(header) == expected
+
+
+def test_negotiate_without_brotli(monkeypatch):
+    monkeypatch.setattr(compression, "brotli", None)
+    assert compression.negotiate("br, gzip;q=0.1") == "gzip"
+    assert compression.negotiate("br") == "identity"
+
+
+@pytest.mark.parametrize("encoding", ["gzip", "br"])
+async def test_catalog_is_served_in_the_negotiated_encoding(client, encoding):
+    plain = await client.get("/api/courses", headers={"Accept-Encoding": "identity"})
+    compressed = await client.get("/api/courses", headers={"Accept-Encoding": encoding})
+    assert plain.status_code == compressed.status_code == 200
+    assert "content-encoding" not in plain.headers
+    assert compressed.headers["content-encoding"] == encoding
+    assert compressed.headers["vary"] == "Accept-Encoding"
+    assert compressed.json() == plain.json()
+
+
+def streaming_app():
+    async def stream(request):
+        async def rows():
+            for index in range(200):
+                yield f'{{"row": {index}, "padding": "{"x" * 40}"}}\n'.encode()
+        return StreamingResponse(rows(), media_type="application/x-ndjson")
+
+    async def small(request):
+        return PlainTextResponse("ok")
+
+    async def image(request):
+        return PlainTextResponse("x" * 5000, media_type="image/png")
+
+    app = Starlette(routes=[Route("/stream", stream), Route("/small", small), Route("/image", image)])
+    return compression.CompressionMiddleware(app)
+
+
+async def test_middleware_compresses_streamed_bodies():
+    import httpx
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=streaming_app()), base_url="http://x") as http:
+        response = await http.get("/stream", headers={"Accept-Encoding": "gzip"})
+        assert response.headers["content-encoding"] == "gzip"
+        assert "content-length" not in response.headers
+        assert len(response.content.splitlines()) == 200
+        assert response.num_bytes_downloaded < len(response.content)
+
+        small = await http.get("/small", headers={"Accept-Encoding": "gzip"})
+        assert "content-encoding" not in small.headers and small.text == "ok"
+        image = await http.get("/image", headers={"Accept-Encoding": "gzip"})
+        assert "content-encoding" not in image.headers
+
+
+def test_static_gzip_is_deterministic():
+    body = b'{"courses": []}' * 100
+    first = compression.compress(body, "gzip", static=True)
+    assert first == compression.compress(body, "gzip", static=True)
+    assert gzip.decompress(first) == body
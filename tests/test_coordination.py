@@ -0,0 +1,123 @@
+import asyncio
+
+import pytest
+from pymongo.errors import OperationFailure
+
+import coordination
+import storage
+from coordination import LeaderLease
+
+pytestmark = pytest.mark.anyio
+
+
+def database():
+    return storage.MemoryClient().rtcapp_test
+
+
+async def test_only_one_holder_at_a_time():
+    db = database()
+    first = LeaderLease(db.leases, "startup", ttl=30, holder="worker-1")
+    second = LeaderLease(db.leases, "startup", ttl=30, holder="worker-2")
+    assert await first.try_acquire()
+    assert not await second.try_acquire()
+    assert await first.try_acquire()
+    assert await first.renew()
+    assert not await second.renew()
+    await second.release()
+    assert not await second.try_acquire()
+    await first.release()
+    assert await second.try_acquire()
+
+
+async def test_expired_lease_can_be_taken_over():
+    db = database()
+    assert await LeaderLease(db.leases, "startup", ttl=0.05, holder="worker-1").try_acquire()
+    successor = LeaderLease(db.leases, "startup", ttl=30, holder="worker-2")
+    assert not await successor.try_acquire()
+    await asyncio.sleep(0.1)
+    assert await successor.try_acquire()
+    assert (await db.leases.find_one({"_id": "startup"}))["holder"] == "worker-2"
+
+
+async def test_startup_tasks_run_once_per_generation():
+    db = database()
+    runs = []
+
+    async def seed():
+        runs.append("seed")
+
+    async def indexes():
+        runs.append("indexes")
+
+    tasks = {"seed": seed, "indexes": indexes}
+    await coordination.run_startup_tasks(db, tasks, generation="v1")
+    await coordination.run_startup_tasks(db, tasks, generation="v1")
+    assert runs == ["seed", "indexes"]
+    assert await db.startup_tasks.count_documents({"status": "done"}) == 2
+    assert await db.leases.count_documents({}) == 0
+
+    await coordination.run_startup_tasks(db, tasks, generation="v2")
+    assert runs == ["seed", "indexes", "seed", "indexes"]
+
+
+async def test_followers_wait_for_the_leader(monkeypatch):
+    db = database()
+    leader = LeaderLease(db.leases, "startup:v1", ttl=30, holder="other-worker")
+    assert await leader.try_acquire()
+    monkeypatch.setattr(coordination, "STARTUP_WAIT_TIMEOUT", 5)
+    runs = []
+
+    async def seed():
+        runs.append("seed")
+
+    follower = asyncio.create_task(coordination.run_startup_tasks(db, {"seed": seed}, generation="v1"))
+    await asyncio.sleep(0.1)
+    assert not follower.done()
+    await db.startup_tasks.update_one({"_id": "v1:seed"}, {"$set": {"status": "done"}}, upsert=True)
+    await asyncio.wait_for(follower, 3)
+    assert runs == []
+
+
+async def test_a_failed_task_is_not_recorded():
+    db = database()
+    runs = []
+
+    async def seed():
+        runs.append("seed")
+
+    async def broken():
+        raise RuntimeError("duplicate emails")
+
+    with pytest.raises(RuntimeError):
+        await coordination.run_startup_tasks(db, {"seed": seed, "indexes": broken}, generation="v1")
+    assert await db.startup_tasks.count_documents({}) == 1
+    assert await db.leases.count_documents({}) == 0
+
+    async def fixed():
+        runs.append("indexes")
+
+    await coordination.run_startup_tasks(db, {"seed": seed, "indexes": fixed}, generation="v1")
+    assert runs == ["seed", "indexes"]
+
+
+async def test_user_email_index_failures_are_raised(monkeypatch):
+    import server
+
+    db = database()
+    await db.users.insert_many([{"email": "a@example.com"}, {"email": "a@example.com"}])
+    monkeypatch.setattr(server, "db", db)
+    with pytest.raises(OperationFailure):
+        await server.ensure_user_indexes()
+
+
+def test_default_deploy_id_follows_the_release(tmp_path, monkeypatch):
+    for name in coordination.DEPLOY_ID_FALLBACK_VARS:
+        monkeypatch.delenv(name, raising=False)
+    (tmp_path / "server.py").write_text("print('v1')")
+    first = coordination.default_deploy_id(tmp_path)
+    assert first == coordination.default_deploy_id(tmp_path)
+    (tmp_path / "server.py").write_text("print('v2')")
+    assert coordination.default_deploy_id(tmp_path) != first
+
+    monkeypatch.setenv("SOURCE_VERSION", "abc123")
+    assert coordination.default_deploy_id(tmp_path) == "abc123"
@@ -0,0 +1,108 @@
+import asyncio
+
+import pytest
+from pymongo.errors import BulkWriteError
+
+import storage
+from counters import ShardedCounter
+
+pytestmark = pytest.mark.anyio
+
+
+def counter(**options):
+    counter = ShardedCounter("course_counters", "enrolled", shards=4, **options)
+    counter.bind(storage.MemoryClient().rtcapp_test)
+    return counter
+
+
+async def test_concurrent_increments_are_batched_and_spread_over_shards():
+    enrollments = counter(flush_interval=60, cache_ttl=60)
+    await asyncio.gather(*(enrollments.increment("c1") for _ in range(200)), enrollments.increment("c2", 3))
+    assert await enrollments.collection.count_documents({}) == 0
+    assert await enrollments.totals(["c1", "c2", "c3"]) == {"c1": 200, "c2": 3, "c3": 0}
+
+    await enrollments.flush()
+    assert await enrollments.collection.count_documents({"key": "c1"}) == 1
+    for _ in range(30):
+        await enrollments.increment("c1")
+        await enrollments.flush()
+    shards = await enrollments.collection.find({"key": "c1"}).to_list(None)
+    assert 1 < len(shards) <= 4
+    assert sum(shard["enrolled"] for shard in shards) == 230
+    assert await enrollments.totals(["c1", "c2"]) == {"c1": 230, "c2": 3}
+
+
+async def test_write_through_when_the_flush_interval_is_zero():
+    enrollments = counter(flush_interval=0, cache_ttl=60)
+    assert await enrollments.totals(["c1"]) == {"c1": 0}
+    await enrollments.increment("c1")
+    await enrollments.increment("c1")
+    assert await enrollments.totals(["c1"]) == {"c1": 2}
+
+
+async def test_failed_flush_is_requeued():
+    enrollments = counter(flush_interval=60, cache_ttl=60)
+    await enrollments.increment("c1", 5)
+    write = enrollments.collection.bulk_write
+
+    async def failing(*args, **kwargs):
+        raise BulkWriteError({"writeErrors": [], "nInserted": 0})
+
+    enrollments.collection.bulk_write = failing
+    await enrollments.flush()
+    assert enrollments._pending == {"c1": 5}
+    enrollments.collection.bulk_write = write
+    await enrollments.flush()
+    assert not enrollments._pending
+    assert await enrollments.totals(["c1"]) == {"c1": 5}
+
+
+async def test_run_flushes_once_more_when_cancelled():
+    enrollments = counter(flush_interval=3600, cache_ttl=60)
+    task = asyncio.create_task(enrollments.run())
+    await asyncio.sleep(0)
+    await enrollments.increment("c1", 2)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    rows = await enrollments.collection.find({"key": "c1"}).to_list(None)
+    assert sum(row["enrolled"] for row in rows) == 2
+
+
+async def test_enrolling_raises_the_course_count(client, register, course_ids):
+    course_id = course_ids[1]
+    before = (await client.get(f"/api/courses/{course_id}")).json()["enrolled_count"]
+    for _ in range(2):
+        _, headers = await register()
+        response = await client.post("/api/enrollments", json={"course_id": course_id}, headers=headers)
+        assert response.status_code == 200, response.text
+    import server
+    server.catalog_cache.invalidate()
+    assert (await client.get(f"/api/courses/{course_id}")).json()["enrolled_count"] == before + 2
+
+
+async def test_catalog_counts_refresh_while_change_streams_keep_other_caches_long(client, register, course_ids,
+                                                                                 monkeypatch):
+    import time
+
+    import catalog
+    import server
+    from cache import invalidation
+
+    course_id = course_ids[2]
+    server.catalog_cache.invalidate()
+    before = (await client.get(f"/api/courses/{course_id}")).json()["enrolled_count"]
+    for cache in invalidation._caches:
+        monkeypatch.setattr(cache, "ttl", cache.ttl)
+    invalidation.set_ttl(3600)
+    assert server.user_cache.ttl == 3600
+    assert server.catalog_cache.ttl == catalog.CATALOG_CACHE_TTL
+
+    _, headers = await register()
+    assert (await client.post("/api/enrollments", json={"course_id": course_id}, headers=headers)).status_code == 200
+    await server.enrollment_counter.flush()
+    later = time.monotonic() + catalog.CATALOG_CACHE_TTL + 1
+    monkeypatch.setattr(time, "monotonic", lambda: later)
+    assert (await client.get(f"/api/courses/{course_id}")).json()["enrolled_count"] == before + 1
+    snapshot = await server.build_catalog_snapshot()
+    assert f'"enrolled_count":{before + 1}'.encode() in snapshot[f"courses/{course_id}.json"].replace(b" ", b"")
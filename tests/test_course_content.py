@@ -0,0 +1,106 @@
+import pytest
+
+import course_content
+import storage
+
+pytestmark = pytest.mark.anyio
+
+MODULES = [
+    {"title": "Basics", "description": "Start here", "lessons": [{"title": "One"}, {"title": "Two"}]},
+    {"title": "Next", "description": "Then this", "lessons": [{"title": "Three"}], "duration_hours": 6},
+]
+
+
+@pytest.mark.parametrize("header,matches", [
+    (None, False),
+    ('"m1.2"', True),
+    ('W/"m1.2"', True),
+    ('"m1.1", "m1.2"', True),
+    ("*", True),
+    ('"m1.1"', False),
+    ("m1.2", False),
+])
+def test_etag_matches(header, matches):
+    assert course_content.etag_matches(header, course_content.module_etag({"id": "m1", "version": 2})) is matches
+
+
+def test_split_modules_keeps_only_the_outline_on_the_course():
+    outlines, documents = course_content.split_modules("c1", MODULES)
+    assert [document["position"] for document in documents] == [0, 1]
+    assert outlines[0] == {"id": documents[0]["id"], "title": "Basics", "description": "Start here", "objectives": [],
+                           "duration_hours": 4, "lesson_count": 2, "version": 1}
+    assert all(course_content.is_outline(entry) for entry in outlines)
+    assert not course_content.is_outline(MODULES[0])
+
+
+async def test_save_modules_versions_only_changed_modules():
+    db = storage.MemoryClient().rtcapp_test
+    outlines = await course_content.save_modules(db, "c1", MODULES)
+    first, second = outlines
+    # Clients send the outline back; untouched modules keep their lessons and version
+    outlines = await course_content.save_modules(db, "c1", [first, {**second, "title": "Renamed"}])
+    assert [entry["version"] for entry in outlines] == [1, 2]
+    stored = await db.course_modules.find_one({"id": first["id"]})
+    assert [lesson["title"] for lesson in stored["lessons"]] == ["One", "Two"]
+
+    await course_content.save_modules(db, "c1", [second])
+    assert await db.course_modules.count_documents({"course_id": "c1"}) == 1
+
+
+async def test_save_modules_rejects_ids_of_another_course():
+    db = storage.MemoryClient().rtcapp_test
+    theirs = await course_content.save_modules(db, "c1", MODULES[:1])
+    with pytest.raises(course_content.ModuleIdConflict):
+        await course_content.save_modules(db, "c2", [{**MODULES[1], "id": theirs[0]["id"]}])
+    with pytest.raises(course_content.ModuleIdConflict):
+        await course_content.save_modules(db, "c2", [{**MODULES[0], "id": "dup"}, {**MODULES[1], "id": "dup"}])
+    assert await db.course_modules.count_documents({"course_id": "c2"}) == 0
+
+
+async def test_module_content_is_served_separately_with_etags(client, create_course):
+    course = await create_course(modules=MODULES)
+    assert "lessons" not in course["modules"][0]
+    module_id = course["modules"][0]["id"]
+    url = f"/api/courses/{course['id']}/modules/{module_id}"
+
+    response = await client.get(url)
+    assert response.status_code == 200
+    assert [lesson["title"] for lesson in response.json()["lessons"]] == ["One", "Two"]
+    etag = response.headers["etag"]
+    cached = await client.get(url, headers={"If-None-Match": etag})
+    assert cached.status_code == 304 and cached.headers["etag"] == etag
+
+    outline = await client.get(f"/api/courses/{course['id']}/modules")
+    assert [entry["lesson_count"] for entry in outline.json()] == [2, 1]
+    assert (await client.get(f"/api/courses/{course['id']}/modules/missing")).status_code == 404
+
+
+async def test_module_updates_require_a_current_if_match(client, admin_headers, create_course):
+    course = await create_course(modules=MODULES)
+    url = f"/api/courses/{course['id']}/modules/{course['modules'][0]['id']}"
+    etag = (await client.get(url)).headers["etag"]
+
+    updated = await client.patch(url, json={"title": "Basics v2"}, headers={**admin_headers, "If-Match": etag})
+    assert updated.status_code == 200
+    assert updated.json()["version"] == 2
+    new_etag = updated.headers["etag"]
+    assert new_etag != etag
+
+    stale = await client.patch(url, json={"title": "Lost update"}, headers={**admin_headers, "If-Match": etag})
+    assert stale.status_code == 412
+    fresh = await client.get(url, headers={"If-None-Match": etag})
+    assert fresh.status_code == 200 and fresh.json()["title"] == "Basics v2"
+    outline = (await client.get(f"/api/courses/{course['id']}")).json()["modules"][0]
+    assert (outline["title"], outline["version"]) == ("Basics v2", 2)
+
+
+async def test_module_ids_of_another_course_are_rejected_with_409(client, admin_headers, create_course):
+    theirs = await create_course(modules=MODULES)
+    mine = await create_course(modules=MODULES[1:])
+    stolen = {**MODULES[0], "id": theirs["modules"][0]["id"]}
+    response = await client.put(f"/api/courses/{mine['id']}", json={"modules": [stolen]}, headers=admin_headers)
+    assert response.status_code == 409
+    outline = (await client.get(f"/api/courses/{theirs['id']}/modules")).json()
+    assert [entry["id"] for entry in outline] == [module["id"] for module in theirs["modules"]]
+    kept = (await client.get(f"/api/courses/{mine['id']}")).json()["modules"]
+    assert kept == mine["modules"]
@@ -0,0 +1,186 @@
+import asyncio
+import json
+import time
+
+import httpx
+import pytest
+from fastapi import HTTPException
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+import deadlines
+from deadlines import CircuitBreaker, DeadlineMiddleware, budget_for, call_external, is_provider_failure
+from stripe_webhooks import SignatureVerificationError, compute_signature, verify_signature
+
+pytestmark = pytest.mark.anyio
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(time, "monotonic", clock)
+    return clock
+
+
+class ProviderError(Exception):
+    def __init__(self, status):
+        self.http_status = status
+
+
+class APIConnectionError(Exception):
+    pass
+
+
+def test_budget_for_routes():
+    assert budget_for("/api/events/stream") is None
+    assert budget_for("/api/ai/chat") == deadlines.AI_REQUEST_BUDGET_SECONDS
+    assert budget_for("/api/courses") == deadlines.REQUEST_BUDGET_SECONDS
+
+
+@pytest.mark.parametrize("error,expected", [
+    (asyncio.TimeoutError(), True), (ConnectionResetError(), True), (ProviderError(503), True),
+    (APIConnectionError(), True), (ProviderError(400), False), (ValueError("bad argument"), False),
+    (SignatureVerificationError("forged"), False),
+])
+def test_is_provider_failure(error, expected):
+    assert is_provider_failure(error) is expected
+
+
+def test_breaker_opens_lets_one_trial_through_and_closes(clock):
+    breaker = CircuitBreaker("test", failure_threshold=3, reset_timeout=30)
+    for _ in range(2):
+        breaker.record_failure()
+    assert breaker.retry_after() is None
+
+    breaker.record_failure()
+    assert breaker.retry_after() == 30
+    clock.now += 29.5
+    assert breaker.retry_after() == 1.0
+
+    clock.now += 1
+    assert breaker.retry_after() is None
+    # Only one trial call while it is in flight
+    assert breaker.retry_after() == 1.0
+    breaker.record_failure()
+    assert breaker.retry_after() == 30
+
+    clock.now += 30
+    assert breaker.retry_after() is None
+    breaker.record_success()
+    assert breaker.opened_at is None and breaker.failures == 0
+    assert breaker.retry_after() is None
+
+
+def test_released_trials_can_be_retried(clock):
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=5)
+    breaker.record_failure()
+    clock.now += 5
+    assert breaker.retry_after() is None
+    breaker.release_trial()
+    assert breaker.retry_after() is None
+
+
+@pytest.fixture
+def breaker(monkeypatch):
+    breaker = CircuitBreaker("llm", failure_threshold=2, reset_timeout=60)
+    monkeypatch.setitem(deadlines.breakers, "llm", breaker)
+    return breaker
+
+
+async def fails_with(error):
+    raise error
+
+
+async def test_call_external_fails_fast_once_the_breaker_opens(breaker):
+    for _ in range(2):
+        with pytest.raises(ProviderError):
+            await call_external("llm", "chat", fails_with, ProviderError(502))
+    with pytest.raises(HTTPException) as rejected:
+        await call_external("llm", "chat", fails_with, AssertionError("must not be called"))
+    assert rejected.value.status_code == 503
+    assert rejected.value.headers["Retry-After"] == "60"
+
+
+async def test_client_errors_do_not_count_against_the_breaker(breaker):
+    for _ in range(3):
+        with pytest.raises(ProviderError):
+            await call_external("llm", "chat", fails_with, ProviderError(400))
+        with pytest.raises(ValueError):
+            await call_external("llm", "chat", fails_with, ValueError("bad argument"))
+    assert breaker.failures == 0 and breaker.opened_at is None
+
+
+async def test_call_external_times_out_with_a_504(breaker, monkeypatch):
+    monkeypatch.setitem(deadlines.SERVICE_TIMEOUTS, "llm", 0.01)
+    with pytest.raises(HTTPException) as timed_out:
+        await call_external("llm", "chat", asyncio.sleep, 1)
+    assert timed_out.value.status_code == 504
+    assert breaker.failures == 1
+
+
+async def slow(request):
+    await asyncio.sleep(float(request.query_params.get("sleep", "0")))
+    return JSONResponse({"remaining": deadlines.remaining()})
+
+
+async def test_middleware_bounds_each_request(monkeypatch):
+    monkeypatch.setattr(deadlines, "REQUEST_BUDGET_SECONDS", 0.05)
+    app = DeadlineMiddleware(Starlette(routes=[Route("/api/slow", slow), Route("/api/events/slow", slow)]))
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://testserver") as http:
+        fast = await http.get("/api/slow")
+        assert 0 < fast.json()["remaining"] <= 0.05
+        timed_out = await http.get("/api/slow", params={"sleep": "0.2"})
+        assert (timed_out.status_code, timed_out.json()) == (504, {"detail": "Request deadline exceeded"})
+        unbounded = await http.get("/api/events/slow", params={"sleep": "0.1"})
+        assert unbounded.json() == {"remaining": None}
+
+
+def signed(body, secret="whsec_x", timestamp=None):
+    timestamp = int(time.time()) if timestamp is None else timestamp
+    return f"t={timestamp},v1={compute_signature(body, secret, timestamp)}"
+
+
+def test_verify_signature():
+    body = b'{"id": "evt_1"}'
+    verify_signature(body, signed(body), secret="whsec_x")
+    verify_signature(body, f"{signed(body)},v1=deadbeef", secret="whsec_x")
+    verify_signature(body, None, secret="")
+    for header in (None, "v1=abc", signed(body, secret="whsec_other"), signed(b"{}"),
+                   signed(body, timestamp=int(time.time()) - 600)):
+        with pytest.raises(SignatureVerificationError):
+            verify_signature(body, header, secret="whsec_x")
+
+
+async def test_forged_webhooks_get_a_400_without_touching_the_breaker(client, register, course_ids):
+    import fake_integrations
+
+    _, headers = await register()
+    checkout = await client.post("/api/payments/checkout", headers=headers,
+                                 json={"course_id": course_ids[0], "origin_url": "https://app.example.com"})
+    session_id = checkout.json()["session_id"]
+    fake_integrations.complete_session(session_id)
+    body = json.dumps(fake_integrations.webhook_event(session_id)).encode()
+
+    breaker = deadlines.breakers["stripe"]
+    failures = breaker.failures
+    for _ in range(deadlines.BREAKER_FAILURE_THRESHOLD + 1):
+        response = await client.post("/api/webhook/stripe", content=body,
+                                     headers={"Stripe-Signature": signed(body, secret="whsec_attacker")})
+        assert response.status_code == 400
+    assert breaker.failures == failures and breaker.opened_at is None
+    assert (await client.get("/api/enrollments", headers=headers)).json() == []
+
+    response = await client.post("/api/webhook/stripe", content=body,
+                                 headers={"Stripe-Signature": fake_integrations.sign_webhook(body)})
+    assert response.status_code == 200
+    enrollments = (await client.get("/api/enrollments", headers=headers)).json()
+    assert [enrollment["course_id"] for enrollment in enrollments] == [course_ids[0]]
@@ -0,0 +1,81 @@
+import asyncio
+
+import pytest
+
+from diagnostics import SlowQueryProfiler, query_shape, summarize_plan
+
+pytestmark = pytest.mark.anyio
+
+COLLSCAN_EXPLAIN = {
+    "queryPlanner": {"winningPlan": {"stage": "SORT", "inputStage": {"stage": "COLLSCAN"}}},
+    "executionStats": {"totalDocsExamined": 5000, "totalKeysExamined": 0, "nReturned": 10},
+}
+INDEXED_EXPLAIN = {
+    "queryPlanner": {"winningPlan": {"stage": "FETCH", "inputStage": {"stage": "IXSCAN"}}},
+    "executionStats": {"totalDocsExamined": 10, "totalKeysExamined": 10, "nReturned": 10},
+}
+
+
+def test_query_shape_drops_literals():
+    assert query_shape({"user_id": "u1", "progress": {"$gte": 50}, "id": {"$in": ["a", "b", "c"]}, "active": True}) == \
+        {"user_id": "?", "progress": {"$gte": "?number"}, "id": {"$in": ["?"]}, "active": "?bool"}
+    assert query_shape({"user_id": "u1"}) == query_shape({"user_id": "u2"})
+
+
+def test_summarize_plan_flags_collection_scans():
+    plan = summarize_plan(COLLSCAN_EXPLAIN)
+    assert plan["stages"] == ["SORT", "COLLSCAN"]
+    assert plan["collscan"] and plan["flagged"]
+    assert (plan["docs_examined"], plan["n_returned"], plan["examined_ratio"]) == (5000, 10, 500.0)
+    indexed = summarize_plan(INDEXED_EXPLAIN)
+    assert not indexed["collscan"] and not indexed["flagged"]
+
+
+class Event:
+    def __init__(self, request_id, name="find", command=None, duration_ms=0.0):
+        self.command_name = name
+        self.command = command or {}
+        self.database_name = "rtcapp_test"
+        self.connection_id = ("db", 27017)
+        self.request_id = request_id
+        self.duration_micros = int(duration_ms * 1000)
+
+
+def run_command(profiler, request_id, command, duration_ms, name="find"):
+    profiler.started(Event(request_id, name, command))
+    profiler.succeeded(Event(request_id, name, duration_ms=duration_ms))
+
+
+async def test_profiler_groups_slow_commands_by_shape_and_explains_them():
+    explained = []
+
+    class Database:
+        async def command(self, command):
+            explained.append(command)
+            return COLLSCAN_EXPLAIN
+
+    profiler = SlowQueryProfiler(threshold_ms=50, sample_rate=1.0)
+    profiler.attach(type("Db", (), {"client": {"rtcapp_test": Database()}})(), asyncio.get_running_loop())
+    run_command(profiler, 1, {"find": "enrollments", "filter": {"user_id": "u1"}, "lsid": {}}, 120)
+    run_command(profiler, 2, {"find": "enrollments", "filter": {"user_id": "u2"}}, 80)
+    run_command(profiler, 3, {"find": "enrollments", "filter": {"user_id": "u3"}}, 10)
+    run_command(profiler, 4, {"find": "courses", "filter": {"id": "c1"}}, 300)
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+    assert len(explained) == 2
+    assert explained[0] == {"explain": {"find": "enrollments", "filter": {"user_id": "u1"}}, "verbosity": "executionStats"}
+    offenders = profiler.top_offenders()
+    enrollments = next(record for record in offenders if record["collection"] == "enrollments")
+    assert (enrollments["count"], enrollments["max_ms"], enrollments["avg_ms"]) == (2, 120, 100)
+    assert enrollments["routes"] == {"background": 2}
+    assert enrollments["plan"]["flagged"]
+    assert [record["collection"] for record in offenders] == ["courses", "enrollments"]
+
+
+def test_profiler_ignores_unexplainable_and_failed_commands():
+    profiler = SlowQueryProfiler(threshold_ms=0, sample_rate=1.0)
+    run_command(profiler, 1, {"insert": "users"}, 500, name="insert")
+    profiler.started(Event(2, "find", {"find": "users", "filter": {}}))
+    profiler.failed(Event(2))
+    assert profiler.top_offenders() == []
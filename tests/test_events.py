@@ -0,0 +1,169 @@
+import asyncio
+
+import pytest
+
+import events
+import storage
+from events import ADMIN_TOPIC, EventBus, MongoEventRelay, Subscription, user_topic
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_subscription_drops_oldest_events_when_full():
+    subscription = Subscription(["t"], "sse", buffer_size=2)
+    for index in range(3):
+        subscription.push({"n": index})
+    assert [(await subscription.next(0.1))["n"] for _ in range(2)] == [1, 2]
+    assert await subscription.next(0.01) is None
+
+
+async def test_bus_delivers_by_topic_until_unsubscribed():
+    bus = EventBus()
+    mine = bus.subscribe([user_topic("u1")], "websocket")
+    admin = bus.subscribe([user_topic("u2"), ADMIN_TOPIC], "sse")
+    assert bus.subscriber_count() == 3
+
+    waiter = asyncio.create_task(mine.next(1))
+    await asyncio.sleep(0)
+    bus.publish(user_topic("u1"), "enrollment.created", {"course_id": "c1"})
+    bus.publish(ADMIN_TOPIC, "counters.updated", {"total_users": 1})
+    event = await waiter
+    assert (event["topic"], event["type"], event["data"]) == ("user:u1", "enrollment.created", {"course_id": "c1"})
+    assert (await admin.next(0.1))["type"] == "counters.updated"
+    assert await mine.next(0.01) is None
+
+    bus.unsubscribe(mine)
+    bus.unsubscribe(mine)
+    bus.publish(user_topic("u1"), "enrollment.created")
+    assert bus.subscriber_count() == 2
+    assert await mine.next(0.01) is None
+
+
+async def test_relay_falls_back_to_local_delivery_without_capped_collections(monkeypatch):
+    monkeypatch.setattr(events, "EVENTS_RELAY_RETRY_SECONDS", 3600)
+    bus = EventBus()
+    relay = bus.relay = MongoEventRelay(storage.MemoryClient().rtcapp_test, bus)
+    task = asyncio.create_task(relay.run())
+    for _ in range(20):
+        await asyncio.sleep(0)
+        if relay.mode == "local_only":
+            break
+    assert relay.mode == "local_only"
+
+    subscription = bus.subscribe([ADMIN_TOPIC], "sse")
+    bus.publish(ADMIN_TOPIC, "counters.updated", {"total_courses": 1})
+    assert (await subscription.next(0.1))["data"] == {"total_courses": 1}
+    await asyncio.sleep(0)
+    assert not relay._outbox
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+
+
+async def test_enrolling_pushes_events_to_the_student_and_admins(client, register, course_ids):
+    import server
+
+    user, headers = await register()
+    student = server.event_bus.subscribe([user_topic(user["id"])], "sse")
+    admins = server.event_bus.subscribe([ADMIN_TOPIC], "sse")
+    try:
+        response = await client.post("/api/enrollments", json={"course_id": course_ids[0]}, headers=headers)
+        assert response.status_code == 200, response.text
+        event = await student.next(1)
+        assert event["type"] == "enrollment.created"
+        assert event["data"]["course_id"] == course_ids[0]
+        assert (await admins.next(1))["data"] == {"total_enrollments": 1}
+    finally:
+        server.event_bus.unsubscribe(student)
+        server.event_bus.unsubscribe(admins)
+
+
+async def test_event_stream_requires_a_token(client):
+    assert (await client.get("/api/events/stream")).status_code == 401
+    assert (await client.get("/api/events/stream", params={"token": "bogus"})).status_code == 401
+
+
+class CappedCollection:
+    """Just enough of a capped collection for the relay: natural order and tailable cursors"""
+
+    def __init__(self):
+        self.docs = []
+
+    def insert(self, **doc):
+        self.docs.append({"_id": len(self.docs) + 1, **doc})
+
+    async def find_one(self, query, projection=None, sort=None):
+        matches = [doc for doc in self.docs if all(doc.get(key) == value for key, value in query.items())]
+        return dict(matches[-1 if sort else 0]) if matches else None
+
+    def find(self, query, **options):
+        assert query == {}
+        return TailableCursor(self.docs)
+
+
+class TailableCursor:
+    def __init__(self, docs):
+        self.docs = docs
+        self.position = 0
+        # Like Mongo, a tailable cursor on an empty collection is dead at once
+        self.alive = bool(docs)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self.position >= len(self.docs):
+            raise StopAsyncIteration
+        self.position += 1
+        return dict(self.docs[self.position - 1])
+
+
+async def test_relay_tails_new_events_in_insertion_order():
+    from datetime import datetime, timedelta, timezone
+
+    bus = EventBus()
+    collection = CappedCollection()
+    relay = MongoEventRelay({"events": collection}, bus)
+    now = datetime.now(timezone.utc)
+    collection.insert(id="old", topic=ADMIN_TOPIC, type="counters.updated", data={"n": 0}, origin="w2", created_at=now)
+    subscription = bus.subscribe([ADMIN_TOPIC], "sse")
+    task = asyncio.create_task(relay._tail())
+    await asyncio.sleep(0.01)
+
+    # A host whose clock lags still gets its events through
+    collection.insert(id="e1", topic=ADMIN_TOPIC, type="counters.updated", data={"n": 1}, origin="w2",
+                      created_at=now - timedelta(minutes=5))
+    collection.insert(id="e2", topic=ADMIN_TOPIC, type="counters.updated", data={"n": 2}, origin=relay.origin,
+                      created_at=now)
+    collection.insert(id="e3", topic=ADMIN_TOPIC, type="counters.updated", data={"n": 3}, origin="w3",
+                      created_at=now)
+    assert [(await subscription.next(1))["data"]["n"] for _ in range(2)] == [1, 3]
+    assert await subscription.next(0.1) is None
+    assert relay.mode == "relay"
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+
+
+async def test_relay_resumes_at_the_end_when_its_position_was_overwritten():
+    collection = CappedCollection()
+    relay = MongoEventRelay({"events": collection}, EventBus())
+    assert await relay._resume_point(None) is None
+    collection.insert(id="e1")
+    collection.insert(id="e2")
+    assert await relay._resume_point(1) == 1
+    assert await relay._resume_point(99) == 2
+
+
+async def test_relay_started_on_an_empty_collection_delivers_everything_after():
+    bus = EventBus()
+    collection = CappedCollection()
+    relay = MongoEventRelay({"events": collection}, bus)
+    subscription = bus.subscribe([ADMIN_TOPIC], "sse")
+    task = asyncio.create_task(relay._tail())
+    await asyncio.sleep(0.01)
+    collection.insert(id="e1", topic=ADMIN_TOPIC, type="counters.updated", data={"n": 1}, origin="w2")
+    assert (await subscription.next(1))["data"] == {"n": 1}
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
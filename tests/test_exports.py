@@ -0,0 +1,93 @@
+import csv
+import io
+import json
+
+import pytest
+from bson import ObjectId
+
+import exports
+import storage
+from exports import DATASETS, ExportError, build_query, csv_cell
+
+pytestmark = pytest.mark.anyio
+
+
+def test_build_query_combines_filters_dates_and_cursor():
+    cursor = str(ObjectId())
+    query = build_query(DATASETS["enrollments"], {"status": "active", "course_id": None},
+                        "2024-01-01T00:00:00+00:00", "2024-02-01T00:00:00+00:00", cursor)
+    assert query == {
+        "status": "active",
+        "enrolled_at": {"$gte": "2024-01-01T00:00:00+00:00", "$lt": "2024-02-01T00:00:00+00:00"},
+        "_id": {"$gt": ObjectId(cursor)},
+    }
+    assert build_query(DATASETS["users"], {"role": None}, None, None, None) == {}
+
+
+@pytest.mark.parametrize("filters,after", [({"role": "admin"}, None), ({}, "not-an-object-id")])
+def test_build_query_rejects_unsupported_filters_and_bad_cursors(filters, after):
+    with pytest.raises(ExportError):
+        build_query(DATASETS["transactions"], filters, None, None, after)
+
+
+@pytest.mark.parametrize("value,expected", [
+    ("=HYPERLINK(\"http://x\")", "'=HYPERLINK(\"http://x\")"),
+    ("+1", "'+1"), ("-1", "'-1"), ("@SUM(A1)", "'@SUM(A1)"), ("\tx", "'\tx"),
+    ("Ada Lovelace", "Ada Lovelace"), (-1.5, -1.5), (None, ""),
+])
+def test_csv_cell_neutralises_formulas(value, expected):
+    assert csv_cell(value) == expected
+
+
+async def seeded_users(count):
+    db = storage.MemoryClient().rtcapp_test
+    await db.users.insert_many([
+        {"id": f"u{index}", "email": f"u{index}@example.com", "full_name": f"User {index}", "password": "secret",
+         "role": "student" if index % 2 else "admin", "created_at": f"2024-01-{index + 1:02d}T00:00:00+00:00"}
+        for index in range(count)
+    ])
+    return db
+
+
+async def collect(stream):
+    return [chunk async for chunk in stream]
+
+
+async def test_ndjson_streams_in_chunks_and_resumes_after_a_cursor(monkeypatch):
+    monkeypatch.setattr(exports, "EXPORT_CHUNK_BYTES", 300)
+    db = await seeded_users(20)
+    chunks = await collect(exports.stream_rows(db, "users", {}, "ndjson"))
+    assert len(chunks) > 1
+    rows = [json.loads(line) for line in b"".join(chunks).splitlines()]
+    assert [row["id"] for row in rows] == [f"u{index}" for index in range(20)]
+    assert "password" not in rows[0]
+
+    query = build_query(DATASETS["users"], {"role": "student"}, None, None, rows[9]["cursor"])
+    resumed = b"".join(await collect(exports.stream_rows(db, "users", query, "ndjson")))
+    assert [json.loads(line)["id"] for line in resumed.splitlines()] == [f"u{index}" for index in range(11, 20, 2)]
+
+
+async def test_csv_has_a_header_and_escaped_cells():
+    db = storage.MemoryClient().rtcapp_test
+    await db.users.insert_one({"id": "u1", "email": "x@example.com", "full_name": "=cmd|' /C calc'!A0",
+                               "role": "student", "created_at": "2024-01-01T00:00:00+00:00"})
+    body = b"".join(await collect(exports.stream_rows(db, "users", {}, "csv"))).decode()
+    header, row = list(csv.reader(io.StringIO(body)))
+    assert header == ["cursor", *DATASETS["users"].fields]
+    assert row[header.index("full_name")] == "'=cmd|' /C calc'!A0"
+    assert row[header.index("profile_image")] == ""
+
+
+async def test_export_endpoint_is_admin_only_and_filters(client, admin_headers, register):
+    _, student_headers = await register()
+    assert (await client.get("/api/admin/exports/users", headers=student_headers)).status_code == 403
+    assert (await client.get("/api/admin/exports/bogus", headers=admin_headers)).status_code == 404
+    assert (await client.get("/api/admin/exports/users", params={"format": "xml"}, headers=admin_headers)).status_code == 400
+    assert (await client.get("/api/admin/exports/users", params={"status": "x"}, headers=admin_headers)).status_code == 400
+
+    response = await client.get("/api/admin/exports/users", params={"role": "admin"}, headers=admin_headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    assert "attachment" in response.headers["content-disposition"]
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert rows and {row["role"] for row in rows} == {"admin"}
@@ -0,0 +1,103 @@
+import uuid
+
+import pytest
+
+import storage
+from facets import SEARCH_MAX_LENGTH, FacetIndex, price_band
+
+pytestmark = pytest.mark.anyio
+
+NO_FILTERS = {"course_type": None, "price_band": None, "credit_hours": None, "duration_months": None}
+
+COURSES = [
+    {"id": "c1", "title": "Python Basics", "description": "Start here", "course_type": "diploma", "price": 0,
+     "credit_hours": 3, "duration_months": 2, "is_published": True},
+    {"id": "c2", "title": "C++ (Advanced)", "description": "Templates", "course_type": "diploma", "price": 750,
+     "credit_hours": 6, "duration_months": 6, "is_published": True},
+    {"id": "c3", "title": "Data Science", "description": "Python and Strasse", "course_type": "bachelor",
+     "price": 1200, "credit_hours": 3, "duration_months": 12, "is_published": True},
+    {"id": "c4", "title": "Cloud Associate", "description": "AWS", "course_type": "associate", "price": 400,
+     "credit_hours": 3, "duration_months": 2, "is_published": True},
+    {"id": "c5", "title": "Draft", "description": "Unpublished", "course_type": "diploma", "price": 10,
+     "credit_hours": 3, "duration_months": 2, "is_published": False},
+]
+
+
+async def index_for(courses):
+    db = storage.MemoryClient().rtcapp_test
+    await db.courses.insert_many([dict(course) for course in courses])
+    index = FacetIndex(ttl=3600)
+    await index.refresh(db)
+    return db, index
+
+
+@pytest.mark.parametrize("price,band", [(0, "free"), (0.5, "under_500"), (499.99, "under_500"), (500, "500_999"),
+                                        (2500, "2500_plus"), ("n/a", None), (None, None)])
+def test_price_band(price, band):
+    assert price_band(price) == band
+
+
+async def test_counts_leave_out_each_facets_own_filter():
+    _, index = await index_for(COURSES)
+    assert index.counts(NO_FILTERS) == {"total": 4, "facets": {
+        "course_type": {"associate": 1, "bachelor": 1, "diploma": 2},
+        "price_band": {"free": 1, "under_500": 1, "500_999": 1, "1000_2499": 1},
+        "credit_hours": {"3": 3, "6": 1},
+        "duration_months": {"2": 2, "6": 1, "12": 1},
+    }}
+
+    result = index.counts({**NO_FILTERS, "course_type": "diploma", "credit_hours": "3"})
+    assert result["total"] == 1
+    assert result["facets"]["course_type"] == {"associate": 1, "bachelor": 1, "diploma": 1}
+    assert result["facets"]["credit_hours"] == {"3": 1, "6": 1}
+    assert result["facets"]["price_band"] == {"free": 1}
+
+    assert index.counts({**NO_FILTERS, "price_band": "2500_plus"})["total"] == 0
+
+
+async def test_search_is_a_literal_casefolded_substring():
+    _, index = await index_for(COURSES)
+    assert index.counts(NO_FILTERS, "c++ (")["total"] == 1
+    assert index.counts(NO_FILTERS, ".*")["total"] == 0
+    assert index.counts(NO_FILTERS, "PYTHON")["total"] == 2
+    assert index.counts(NO_FILTERS, "straße")["total"] == 1
+    assert index.counts({**NO_FILTERS, "course_type": "bachelor"}, "python")["facets"]["course_type"] == {
+        "bachelor": 1, "diploma": 1}
+
+
+async def test_stale_courses_are_refreshed_incrementally():
+    db, index = await index_for(COURSES)
+    await db.courses.update_one({"id": "c1"}, {"$set": {"is_published": False}})
+    await db.courses.update_one({"id": "c5"}, {"$set": {"is_published": True, "price": 3000}})
+    await db.courses.delete_one({"id": "c4"})
+    for course_id in ("c1", "c4", "c5"):
+        index.mark_stale(course_id)
+    await index.refresh(db)
+
+    result = index.counts(NO_FILTERS)
+    assert result["total"] == 3
+    assert result["facets"]["price_band"] == {"500_999": 1, "1000_2499": 1, "2500_plus": 1}
+    assert result["facets"]["course_type"] == {"bachelor": 1, "diploma": 2}
+    assert len(index._text) == 4
+
+
+async def test_endpoint_matches_the_listing(client, admin_headers, create_course):
+    token = uuid.uuid4().hex[:8]
+    await create_course(title=f"Facet {token} one", credit_hours=4, price=0)
+    await create_course(title=f"Facet {token} two", credit_hours=5, price=600)
+    await create_course(title=f"Facet {token} draft", is_published=False)
+
+    facets = (await client.get("/api/courses/facets", params={"search": token.upper()})).json()
+    listing = (await client.get("/api/courses", params={"search": token.upper()})).json()
+    assert facets["total"] == len(listing) == 2
+    assert facets["facets"]["credit_hours"] == {"4": 1, "5": 1}
+
+    filtered = (await client.get("/api/courses/facets", params={"search": token, "credit_hours": 5})).json()
+    assert filtered["total"] == 1
+    assert filtered["facets"]["price_band"] == {"500_999": 1}
+
+
+async def test_overlong_search_terms_are_rejected(client):
+    search = "x" * (SEARCH_MAX_LENGTH + 1)
+    assert (await client.get("/api/courses/facets", params={"search": search})).status_code == 422
+    assert (await client.get("/api/courses", params={"search": search})).status_code == 422
@@ -0,0 +1,69 @@
+import asyncio
+
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+ORIGIN = "https://app.example.com"
+
+
+async def checkout(client, headers, course_id, key=None, origin=ORIGIN):
+    if key:
+        headers = {**headers, "Idempotency-Key": key}
+    return await client.post("/api/payments/checkout", json={"course_id": course_id, "origin_url": origin},
+                             headers=headers)
+
+
+async def transactions(user_id):
+    import server
+    return await server.db.payment_transactions.count_documents({"user_id": user_id})
+
+
+async def test_idempotency_key_replays_the_stored_session(client, register, course_ids):
+    user, headers = await register()
+    first = await checkout(client, headers, course_ids[0], key="order-1")
+    assert first.status_code == 200, first.text
+    again = await checkout(client, headers, course_ids[0], key="order-1", origin="https://other.example.com")
+    assert again.json() == first.json()
+    assert await transactions(user["id"]) == 1
+
+
+async def test_idempotency_key_reused_for_another_course_is_rejected(client, register, course_ids):
+    user, headers = await register()
+    assert (await checkout(client, headers, course_ids[0], key="order-1")).status_code == 200
+    conflict = await checkout(client, headers, course_ids[1], key="order-1")
+    assert conflict.status_code == 409
+    assert await transactions(user["id"]) == 1
+
+
+async def test_keys_are_scoped_to_the_user(client, register, course_ids):
+    _, alice = await register()
+    _, bob = await register()
+    first = await checkout(client, alice, course_ids[0], key="shared")
+    second = await checkout(client, bob, course_ids[0], key="shared")
+    assert second.status_code == 200
+    assert second.json()["session_id"] != first.json()["session_id"]
+
+
+async def test_open_session_is_reused_without_a_key(client, register, course_ids):
+    user, headers = await register()
+    first = await checkout(client, headers, course_ids[0])
+    assert (await checkout(client, headers, course_ids[0])).json() == first.json()
+    elsewhere = await checkout(client, headers, course_ids[0], origin="https://other.example.com")
+    assert elsewhere.json()["session_id"] != first.json()["session_id"]
+    assert await transactions(user["id"]) == 2
+
+
+async def test_concurrent_duplicates_create_one_session(client, register, course_ids):
+    user, headers = await register()
+    responses = await asyncio.gather(*(checkout(client, headers, course_ids[2]) for _ in range(5)))
+    assert {response.status_code for response in responses} == {200}
+    assert len({response.json()["session_id"] for response in responses}) == 1
+    assert await transactions(user["id"]) == 1
+
+
+async def test_checkout_rejects_unknown_courses_and_existing_enrollments(client, register, course_ids):
+    _, headers = await register()
+    assert (await checkout(client, headers, "no-such-course")).status_code == 404
+    assert (await client.post("/api/enrollments", json={"course_id": course_ids[3]}, headers=headers)).status_code == 200
+    assert (await checkout(client, headers, course_ids[3])).status_code == 400
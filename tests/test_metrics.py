@@ -0,0 +1,70 @@
+import ipaddress
+
+import pytest
+
+import metrics
+
+pytestmark = pytest.mark.anyio
+
+
+def test_registry_renders_prometheus_text():
+    registry = metrics.Registry()
+    requests = registry.counter("rtc_test_requests_total", "Requests", ("route",))
+    latency = registry.histogram("rtc_test_seconds", "Latency", buckets=(0.1, 1.0))
+    requests.inc(route='/a"b')
+    requests.inc(2, route='/a"b')
+    for value in (0.05, 0.5, 5.0):
+        latency.observe(value)
+    assert registry.counter("rtc_test_requests_total", "Requests", ("route",)) is requests
+    assert registry.render().splitlines() == [
+        "# HELP rtc_test_requests_total Requests",
+        "# TYPE rtc_test_requests_total counter",
+        'rtc_test_requests_total{route="/a\\"b"} 3',
+        "# HELP rtc_test_seconds Latency",
+        "# TYPE rtc_test_seconds histogram",
+        'rtc_test_seconds_bucket{le="0.1"} 1',
+        'rtc_test_seconds_bucket{le="1"} 2',
+        'rtc_test_seconds_bucket{le="+Inf"} 3',
+        "rtc_test_seconds_sum 5.55",
+        "rtc_test_seconds_count 3",
+    ]
+
+
+def test_scrape_allowed_only_from_configured_networks(monkeypatch):
+    assert not metrics.scrape_allowed("10.0.0.5")
+    monkeypatch.setattr(metrics, "METRICS_ALLOWED_NETWORKS", (ipaddress.ip_network("10.0.0.0/8"),))
+    assert metrics.scrape_allowed("10.0.0.5")
+    assert not metrics.scrape_allowed("192.168.1.1")
+    assert not metrics.scrape_allowed("not-an-ip")
+    assert not metrics.scrape_allowed(None)
+
+
+async def test_requests_are_counted_per_route_template(client):
+    labels = {"method": "GET", "route": "/api/courses/{course_id}", "status": "404"}
+    before = metrics.http_requests_total.value(**labels)
+    await client.get("/api/courses/no-such-course")
+    await client.get("/api/courses/another-missing-course")
+    assert metrics.http_requests_total.value(**labels) == before + 2
+
+
+async def test_metrics_endpoint_requires_admin_or_allowlisted_network(client, admin_headers, monkeypatch):
+    assert (await client.get("/metrics")).status_code == 401
+    response = await client.get("/metrics", headers=admin_headers)
+    assert response.status_code == 200
+    assert "rtc_http_requests_total" in response.text
+    monkeypatch.setattr(metrics, "METRICS_ALLOWED_NETWORKS", (ipaddress.ip_network("127.0.0.0/8"),))
+    assert (await client.get("/metrics")).status_code == 200
+
+
+def test_mongo_listener_counts_commands_per_collection():
+    listener = metrics.MongoCommandListener()
+    labels = {"command": "find", "collection": "rtc_test_courses", "outcome": "success"}
+    before = metrics.mongo_commands_total.value(**labels)
+    started = type("Started", (), {"command_name": "find", "command": {"find": "rtc_test_courses"},
+                                   "connection_id": ("db", 27017), "request_id": 1})()
+    finished = type("Succeeded", (), {"command_name": "find", "duration_micros": 1500,
+                                      "connection_id": ("db", 27017), "request_id": 1})()
+    listener.started(started)
+    listener.succeeded(finished)
+    assert metrics.mongo_commands_total.value(**labels) == before + 1
+    assert metrics.mongo_command_duration.count(command="find", collection="rtc_test_courses") == 1
@@ -0,0 +1,151 @@
+import time
+
+import httpx
+import pytest
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+import rate_limit
+from rate_limit import RateLimitMiddleware, TokenBuckets, load_policies, parse_limits, policy_for
+
+pytestmark = pytest.mark.anyio
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(time, "monotonic", clock)
+    return clock
+
+
+def test_parse_limits():
+    assert parse_limits("ip:20/60, account:5/300") == {"ip": (20, 60.0), "account": (5, 300.0)}
+    assert parse_limits("ip:0/60,account:1.5/2") == {"account": (1.5, 2.0)}
+    assert parse_limits("") == {}
+
+
+@pytest.mark.parametrize("spec", ["ip:20", "ip:x/60", "user:5/60", "ip:5/0", "ip:-1/60"])
+def test_parse_limits_rejects_malformed_rules(spec):
+    with pytest.raises(ValueError):
+        parse_limits(spec)
+
+
+def test_policies_come_from_the_environment(monkeypatch):
+    monkeypatch.setenv("RATE_LIMIT_LOGIN", "ip:0/60")
+    policies = load_policies()
+    assert policies["login"] == {}
+    assert policies["register"] == {"ip": (5, 60.0), "account": (3, 3600.0)}
+
+
+@pytest.mark.parametrize("method,path,policy", [
+    ("POST", "/api/auth/login", "login"), ("GET", "/api/auth/login", None),
+    ("GET", "/api/certificates/verify/RTC-1", "certificate_verify"), ("GET", "/api/certificates/abc", "certificate"),
+    ("GET", "/api/certificates", None), ("GET", "/api/courses", None),
+])
+def test_policy_for(method, path, policy):
+    assert policy_for(method, path) == policy
+
+
+def test_buckets_allow_a_burst_then_refill_continuously(clock):
+    buckets = TokenBuckets()
+    key = [(("login", "ip", "1.2.3.4"), 3, 60)]
+    assert [buckets.acquire(key)[0] for _ in range(3)] == [None, None, None]
+    exhausted, wait = buckets.acquire(key)
+    assert exhausted == ("login", "ip", "1.2.3.4") and wait == pytest.approx(20)
+
+    clock.now += 10
+    assert buckets.acquire(key)[1] == pytest.approx(10)
+    clock.now += 10
+    assert buckets.acquire(key) == (None, 0.0)
+    clock.now += 3600
+    assert [buckets.acquire(key)[0] for _ in range(4)] == [None, None, None, ("login", "ip", "1.2.3.4")]
+
+
+def test_an_exhausted_key_takes_no_token_from_the_others(clock):
+    buckets = TokenBuckets()
+    ip = (("login", "ip", "1.2.3.4"), 10, 60)
+    account = (("login", "account", "a@x.com"), 1, 60)
+    assert buckets.acquire([ip, account])[0] is None
+    assert buckets.acquire([ip, account])[0] == account[0]
+    assert buckets._level(ip[0], 10, 60, clock.now) == 9
+
+
+def test_least_recently_seen_keys_are_evicted(clock):
+    buckets = TokenBuckets(max_keys=2)
+    for address in ("a", "b", "a", "c"):
+        buckets.acquire([(("login", "ip", address), 1, 60)])
+    assert len(buckets) == 2
+    # The throttled "a" counts as seen, so "b" was dropped and starts again with a full bucket
+    assert buckets.acquire([(("login", "ip", "a"), 1, 60)])[0] is not None
+    assert buckets.acquire([(("login", "ip", "c"), 1, 60)])[0] is not None
+    assert buckets.acquire([(("login", "ip", "b"), 1, 60)])[0] is None
+
+
+async def echo(request):
+    return JSONResponse({"body": (await request.body()).decode()})
+
+
+@pytest.fixture
+def limited_app(monkeypatch):
+    monkeypatch.setattr(rate_limit, "RATE_LIMIT_ENABLED", True)
+    monkeypatch.setenv("RATE_LIMIT_LOGIN", "ip:3/60,account:2/300")
+    return RateLimitMiddleware(Starlette(routes=[Route("/api/auth/login", echo, methods=["POST"]),
+                                                 Route("/api/courses", echo)]))
+
+
+def client_from(app, address):
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app, client=(address, 1234)),
+                             base_url="http://testserver")
+
+
+async def test_over_limit_requests_get_a_429_with_retry_after(limited_app, clock):
+    async with client_from(limited_app, "10.0.0.1") as http:
+        for index in range(3):
+            response = await http.post("/api/auth/login", json={"email": f"user{index}@example.com"})
+            assert response.status_code == 200
+            # The route still receives the body the limiter read
+            assert response.json()["body"] == f'{{"email":"user{index}@example.com"}}'
+        limited = await http.post("/api/auth/login", json={"email": "other@example.com"})
+        assert limited.status_code == 429
+        assert limited.headers["Retry-After"] == "20"
+        assert limited.json() == {"detail": "Too many requests, please try again later"}
+        assert (await http.get("/api/courses")).status_code == 200
+
+    async with client_from(limited_app, "10.0.0.2") as http:
+        assert (await http.post("/api/auth/login", json={"email": "other@example.com"})).status_code == 200
+
+
+async def test_accounts_are_limited_across_addresses(limited_app, clock):
+    for index, address in enumerate(("10.0.1.1", "10.0.1.2", "10.0.1.3")):
+        async with client_from(limited_app, address) as http:
+            response = await http.post("/api/auth/login", json={"email": " Victim@Example.com"})
+            assert response.status_code == (429 if index == 2 else 200)
+    assert response.headers["Retry-After"] == "150"
+
+
+async def test_oversized_bodies_are_only_limited_per_address(limited_app, clock, monkeypatch):
+    monkeypatch.setattr(rate_limit, "RATE_LIMIT_MAX_BODY_BYTES", 8)
+    padding = "x" * 64
+    for address in ("10.0.2.1", "10.0.2.2", "10.0.2.3"):
+        async with client_from(limited_app, address) as http:
+            response = await http.post("/api/auth/login", json={"email": "victim@example.com", "pad": padding})
+            assert response.status_code == 200
+            assert padding in response.json()["body"]
+
+
+async def test_disabled_limiter_passes_everything(monkeypatch):
+    monkeypatch.setattr(rate_limit, "RATE_LIMIT_ENABLED", False)
+    monkeypatch.setenv("RATE_LIMIT_LOGIN", "ip:1/60")
+    app = RateLimitMiddleware(Starlette(routes=[Route("/api/auth/login", echo, methods=["POST"])]))
+    async with client_from(app, "10.0.3.1") as http:
+        for _ in range(3):
+            assert (await http.post("/api/auth/login", json={})).status_code == 200
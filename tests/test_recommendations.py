@@ -0,0 +1,129 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pytest
+
+import storage
+from recommendations import BUILD_ID, Recommender, compute_neighbours
+
+pytestmark = pytest.mark.anyio
+
+# user -> courses taken
+ENROLLMENTS = {
+    "u1": ["a", "b", "c"],
+    "u2": ["a", "b"],
+    "u3": ["a", "c"],
+    "u4": ["b"],
+    "u5": ["d"],
+}
+
+
+def test_compute_neighbours_ranks_by_cosine_similarity():
+    # courses 0..3; course 1 shares two students with 0, course 2 shares one
+    users = np.array([0, 0, 0, 1, 1, 2, 2, 3, 3], dtype=np.int32)
+    courses = np.array([0, 1, 2, 0, 1, 0, 2, 1, 1], dtype=np.int32)
+    counts, neighbours = compute_neighbours(users, courses, 4, 4, candidates=5)
+    assert counts.tolist() == [3, 3, 2, 0]
+    assert neighbours[0] == [(2, 2), (1, 2)]
+    assert neighbours[2] == [(0, 2), (1, 1)]
+    assert neighbours[3] == []
+
+    _, capped = compute_neighbours(users, courses, 4, 4, candidates=1)
+    assert capped[0] == [(2, 2)]
+
+
+async def seeded(enrollments=ENROLLMENTS):
+    db = storage.MemoryClient().rtcapp_test
+    await db.enrollments.insert_many([
+        {"user_id": user, "course_id": course} for user, courses in enrollments.items() for course in courses
+    ])
+    return db
+
+
+async def test_build_and_load_serve_ranked_neighbours():
+    db = await seeded()
+    recommender = Recommender()
+    await recommender.maybe_build(db)
+    assert await db.course_recommendations.count_documents({}) == 4
+    meta = await db.recommendation_builds.find_one({"_id": BUILD_ID})
+    assert (meta["enrollments"], meta["users"], meta["courses"]) == (9, 5, 4)
+
+    await recommender.load(db)
+    ranked = recommender.neighbours("a")
+    assert [(other, shared) for other, _, shared in ranked] == [("c", 2), ("b", 2)]
+    assert ranked[0][1] == pytest.approx(2 / 6 ** 0.5)
+    assert ranked[1][1] == pytest.approx(2 / 3)
+    assert recommender.neighbours("d") == []
+    assert recommender.neighbours("a", limit=1) == ranked[:1]
+
+
+async def test_fresh_builds_are_not_repeated():
+    db = await seeded()
+    await Recommender().maybe_build(db)
+    built_at = (await db.recommendation_builds.find_one({"_id": BUILD_ID}))["built_at"]
+    await db.enrollments.insert_one({"user_id": "u6", "course_id": "d"})
+    await Recommender().maybe_build(db)
+    assert (await db.recommendation_builds.find_one({"_id": BUILD_ID}))["built_at"] == built_at
+
+
+async def test_recorded_enrollments_update_the_loaded_build():
+    db = await seeded()
+    recommender = Recommender()
+    await recommender.maybe_build(db)
+    await recommender.load(db)
+    version = recommender.version
+
+    await db.enrollments.insert_one({"user_id": "u5", "course_id": "c"})
+    recommender.record_enrollment("u5", "c")
+    await recommender.apply_pending(db)
+    assert recommender.version > version
+    assert ("d", pytest.approx(1 / 3 ** 0.5), 1) in recommender.neighbours("c")
+    assert [other for other, _, _ in recommender.neighbours("d")] == ["c"]
+
+
+async def test_loading_a_newer_build_replays_enrollments_it_missed():
+    db = await seeded()
+    recommender = Recommender()
+    await recommender.maybe_build(db)
+    await recommender.load(db)
+
+    await db.enrollments.insert_one({"user_id": "u5", "course_id": "c"})
+    recommender.record_enrollment("u5", "c")
+    await recommender.apply_pending(db)
+    # A build that started before the enrollment was recorded cannot have seen it
+    await db.recommendation_builds.update_one({"_id": BUILD_ID}, {"$set": {
+        "started_at": datetime.now(timezone.utc) - timedelta(minutes=1),
+        "built_at": datetime.now(timezone.utc) + timedelta(seconds=1),
+    }})
+    await recommender.load(db)
+    assert [other for other, _, _ in recommender.neighbours("d")] == ["c"]
+
+
+async def test_forgotten_courses_drop_out_of_neighbour_lists():
+    db = await seeded()
+    recommender = Recommender()
+    await recommender.maybe_build(db)
+    await recommender.load(db)
+    recommender.forget_course("b")
+    assert recommender.neighbours("b") == []
+    assert [other for other, _, _ in recommender.neighbours("a")] == ["c"]
+
+
+async def test_endpoint_recommends_published_courses_taken_together(client, register, create_course):
+    first = await create_course(title="Recommended first")
+    second = await create_course(title="Recommended second")
+    draft = await create_course(title="Recommended draft", is_published=False)
+    for course_ids in ([first["id"], second["id"]], [first["id"], second["id"], draft["id"]]):
+        _, headers = await register()
+        for course_id in course_ids:
+            response = await client.post("/api/enrollments", json={"course_id": course_id}, headers=headers)
+            assert response.status_code == 200, response.text
+
+    for _ in range(50):
+        recommended = (await client.get(f"/api/courses/{first['id']}/recommendations")).json()
+        if recommended:
+            break
+        await asyncio.sleep(0.01)
+    assert [(course["id"], course["shared_enrollments"]) for course in recommended] == [(second["id"], 2)]
+    assert recommended[0]["score"] == 1.0
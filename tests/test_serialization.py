@@ -0,0 +1,54 @@
+import json
+from typing import List, Optional
+
+import pytest
+from pydantic import BaseModel
+
+import serialization
+
+pytestmark = pytest.mark.anyio
+
+
+class Item(BaseModel):
+    id: str
+    price: float
+    tags: List[str] = []
+    note: Optional[str] = None
+
+
+def test_projection_and_defaults_follow_the_model():
+    assert serialization.projection_for(Item) == {"id": 1, "price": 1, "tags": 1, "note": 1, "_id": 0}
+    assert serialization.defaults_for(Item) == {"tags": [], "note": None}
+
+
+def test_trusted_path_fills_defaults_like_validation_would():
+    documents = [{"id": "a", "price": 10.0}, {"id": "b", "price": 2.5, "tags": ["x"], "note": "n"}]
+    validated = serialization.encode(documents, List[Item])
+    trusted = serialization.encode(documents, trusted=True, model=Item)
+    assert json.loads(trusted) == json.loads(validated)
+
+
+def test_validated_path_rejects_bad_documents():
+    with pytest.raises(ValueError):
+        serialization.encode([{"id": "a"}], List[Item])
+
+
+def test_fast_response_only_when_enabled(monkeypatch):
+    data = [{"id": "a", "price": 1.0}]
+    assert serialization.fast_response(data, List[Item]) is data
+    monkeypatch.setattr(serialization, "FAST_JSON_ENABLED", True)
+    response = serialization.fast_response(data, List[Item])
+    assert isinstance(response, serialization.RawJSONResponse)
+    assert response.media_type == "application/json"
+    assert json.loads(response.body) == [{"id": "a", "price": 1.0, "tags": [], "note": None}]
+    assert serialization.fast_response(data, body=b"[]").body == b"[]"
+
+
+async def test_catalog_documents_encode_the_same_on_both_paths(client):
+    import server
+
+    documents = await server.db.courses.find({}, serialization.projection_for(server.CourseResponse)).to_list(None)
+    assert documents
+    validated = serialization.encode(documents, List[server.CourseResponse])
+    trusted = serialization.encode(documents, trusted=True, model=server.CourseResponse)
+    assert json.loads(trusted) == json.loads(validated)
@@ -0,0 +1,154 @@
+import asyncio
+import gzip
+import json
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from pymongo.errors import ServerSelectionTimeoutError
+
+import compression
+import snapshots
+import storage
+from snapshots import CatalogSnapshots, content_version, course_file
+
+pytestmark = pytest.mark.anyio
+
+BIG = json.dumps([{"id": f"c{index}", "title": "Course " * 40} for index in range(20)]).encode()
+
+
+def catalog(**overrides):
+    return {"courses.json": BIG, "courses/c1.json": b'{"id": "c1"}', **overrides}
+
+
+def test_course_file_only_accepts_safe_ids():
+    assert course_file("abc-123_X") == "courses/abc-123_X.json"
+    assert course_file("../etc/passwd") is None
+    assert course_file("a.b") is None
+
+
+def test_content_version_depends_on_names_and_bodies_only():
+    assert content_version({"a": b"1", "b": b"2"}) == content_version({"b": b"2", "a": b"1"})
+    assert content_version({"a": b"1"}) != content_version({"a": b"2"})
+    assert content_version({"a": b"1"}) != content_version({"b": b"1"})
+
+
+def test_publish_writes_a_version_and_switches_current(tmp_path):
+    published = CatalogSnapshots(tmp_path)
+    assert published.version() is None
+    version = published.publish(catalog())
+    assert published.version() == version
+    current = published.current
+    assert (current / "courses.json").read_bytes() == BIG
+    assert (current / "courses" / "c1.json").read_bytes() == b'{"id": "c1"}'
+    assert gzip.decompress((current / "courses.json.gz").read_bytes()) == BIG
+    # Bodies below the compression threshold are only stored plain
+    assert not (current / "courses" / "c1.json.gz").exists()
+    manifest = json.loads((current / "manifest.json").read_text())
+    assert manifest["version"] == version and manifest["files"] == ["courses.json", "courses/c1.json"]
+
+    assert published.publish(catalog()) is None
+    assert not [path for path in tmp_path.rglob("*.tmp")]
+
+
+def test_unchanged_files_reuse_compressed_variants(tmp_path):
+    published = CatalogSnapshots(tmp_path)
+    first = published.publish(catalog())
+    second = published.publish(catalog(**{"courses/c2.json": b"{}"}))
+    assert first != second
+    old, new = (tmp_path / "versions" / name / "courses.json.gz" for name in (first, second))
+    assert os.stat(old).st_ino == os.stat(new).st_ino
+
+
+def test_prune_keeps_the_newest_older_versions_and_anything_newer(tmp_path):
+    published = CatalogSnapshots(tmp_path, keep=2)
+    versions = tmp_path / "versions"
+    names = []
+    for index in range(4):
+        names.append(published.publish(catalog(**{"courses/c2.json": str(index).encode()})))
+        # Distinct, increasing publish times regardless of the file system's timestamp resolution
+        stamp = time.time() - 100 + index
+        os.utime(versions / names[-1], (stamp, stamp))
+    assert sorted(path.name for path in versions.iterdir()) == sorted(names[2:])
+
+    # A version another publisher made newer than ours is not ours to remove
+    future = time.time() + 60
+    os.utime(versions / names[2], (future, future))
+    republished = published.publish(catalog(**{"courses/c2.json": b"again"}))
+    assert (versions / names[2]).exists() and published.version() == republished
+
+
+async def test_entry_serves_the_live_files_with_variants(tmp_path):
+    published = CatalogSnapshots(tmp_path)
+    assert await published.entry("courses.json") is None
+    version = published.publish(catalog())
+    found_version, entry = await published.entry("courses.json")
+    assert found_version == version and entry.body == BIG
+    assert set(entry.variants) == set(compression.supported_encodings())
+    assert await published.entry("courses/missing.json") is None
+
+
+async def test_only_the_lease_holder_publishes(tmp_path, monkeypatch):
+    monkeypatch.setattr(snapshots, "CATALOG_SNAPSHOT_DEBOUNCE_SECONDS", 0.01)
+    db = storage.MemoryClient().rtcapp_test
+    published = CatalogSnapshots(tmp_path)
+    lease = published.lease(db)
+    await db.leases.insert_one({"_id": lease.name, "holder": "another-worker",
+                                "expires_at": datetime.now(timezone.utc) + timedelta(minutes=5)})
+    builds = []
+
+    async def build():
+        builds.append(True)
+        return catalog()
+
+    task = asyncio.create_task(published.run(db, build))
+    await asyncio.sleep(0.05)
+    assert builds == [] and published.version() is None
+
+    await db.leases.update_one({"_id": lease.name}, {"$set": {"expires_at": datetime.now(timezone.utc)}})
+    for _ in range(100):
+        if published.version():
+            break
+        await asyncio.sleep(0.01)
+    assert published.version() == content_version(catalog())
+    count = len(builds)
+    await asyncio.sleep(0.05)
+    assert len(builds) == count
+
+    published.mark_dirty()
+    for _ in range(100):
+        if len(builds) > count:
+            break
+        await asyncio.sleep(0.01)
+    assert len(builds) == count + 1
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+
+
+async def test_catalog_falls_back_to_the_snapshot_when_mongo_is_unreachable(client, tmp_path, monkeypatch):
+    import deadlines
+    import server
+
+    monkeypatch.setattr(server, "catalog_breaker", deadlines.CircuitBreaker("catalog"))
+    published = CatalogSnapshots(tmp_path)
+    monkeypatch.setattr(server, "catalog_snapshots", published)
+    version = published.publish(await server.build_catalog_snapshot())
+    live = await client.get("/api/courses")
+    assert "X-Catalog-Snapshot" not in live.headers
+
+    async def unreachable(*args):
+        raise ServerSelectionTimeoutError("no servers")
+
+    monkeypatch.setattr(server, "catalog_list_entry", unreachable)
+    monkeypatch.setattr(server, "catalog_course_entry", unreachable)
+    fallback = await client.get("/api/courses")
+    assert fallback.status_code == 200 and fallback.headers["X-Catalog-Snapshot"] == version
+    assert fallback.json() == live.json()
+
+    course_id = live.json()[0]["id"]
+    detail = await client.get(f"/api/courses/{course_id}")
+    assert detail.status_code == 200 and detail.json()["id"] == course_id
+    missing = await client.get("/api/courses/not-published")
+    assert missing.status_code == 503 and "Retry-After" in missing.headers
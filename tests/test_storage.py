@@ -0,0 +1,171 @@
+"""The memory backend against mongomock: same operations, same results"""
+
+import mongomock
+import pytest
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+import storage
+
+pytestmark = pytest.mark.anyio
+
+DOCUMENTS = [
+    {"_id": 1, "id": "a", "title": "Python Basics", "level": "beginner", "price": 0, "tags": ["python", "intro"],
+     "modules": [{"id": "m1", "minutes": 10}, {"id": "m2", "minutes": 25}], "meta": {"rating": 4.5}},
+    {"_id": 2, "id": "b", "title": "Advanced Python", "level": "advanced", "price": 49.5, "tags": ["python"],
+     "modules": [{"id": "m3", "minutes": 40}], "meta": {"rating": 3.9}},
+    {"_id": 3, "id": "c", "title": "Intro to Rust", "level": "beginner", "price": 19, "tags": ["rust", "intro"],
+     "modules": [], "meta": {"rating": None}},
+    {"_id": 4, "id": "d", "title": "Data Science", "level": "intermediate", "price": 29, "tags": [],
+     "meta": {}},
+    {"_id": 5, "id": "e", "title": "rust for pythonistas", "level": "intermediate", "tags": ["rust", "python"],
+     "modules": [{"id": "m4", "minutes": 15}]},
+]
+
+QUERIES = [
+    {},
+    {"level": "beginner"},
+    {"price": {"$gt": 10}},
+    {"price": {"$gte": 0, "$lt": 30}},
+    {"price": {"$ne": 0}},
+    {"price": {"$exists": False}},
+    {"tags": "python"},
+    {"tags": {"$in": ["rust", "intro"]}},
+    {"tags": {"$nin": ["python"]}},
+    {"tags": {"$all": ["rust", "intro"]}},
+    {"tags": {"$size": 0}},
+    {"title": {"$regex": "^rust", "$options": "i"}},
+    {"title": {"$not": {"$regex": "Python"}}},
+    {"modules.minutes": {"$gte": 25}},
+    {"modules": {"$elemMatch": {"id": "m2", "minutes": {"$gt": 20}}}},
+    {"meta.rating": None},
+    {"meta.rating": {"$type": "double"}},
+    {"$or": [{"level": "advanced"}, {"price": 0}]},
+    {"$and": [{"tags": "python"}, {"level": {"$ne": "beginner"}}]},
+    {"$nor": [{"level": "beginner"}, {"tags": "rust"}]},
+]
+
+UPDATES = [
+    ({"id": "a"}, {"$set": {"price": 5, "meta.rating": 5}}),
+    ({"level": "beginner"}, {"$inc": {"price": 1}}),
+    ({"id": "b"}, {"$push": {"tags": {"$each": ["ml", "data"]}}}),
+    ({"id": "c"}, {"$addToSet": {"tags": "rust"}}),
+    ({"tags": "python"}, {"$pull": {"tags": "intro"}}),
+    ({"id": "d"}, {"$unset": {"meta": ""}}),
+    ({"id": "e"}, {"$min": {"price": 3}}),
+    ({"id": "a"}, {"$max": {"price": 100}}),
+    ({"modules.id": "m2"}, {"$set": {"modules.$.minutes": 30}}),
+    ({"id": "z"}, {"$set": {"title": "New"}, "$setOnInsert": {"_id": 9, "level": "beginner"}}),
+]
+
+PIPELINES = [
+    [{"$match": {"tags": "python"}}, {"$project": {"title": 1, "_id": 0}}],
+    [{"$group": {"_id": "$level", "count": {"$sum": 1}, "avg": {"$avg": "$price"}, "max": {"$max": "$price"}}},
+     {"$sort": {"_id": 1}}],
+    [{"$unwind": "$tags"}, {"$group": {"_id": "$tags", "n": {"$sum": 1}}}, {"$sort": {"n": -1, "_id": 1}}],
+    [{"$unwind": "$modules"}, {"$group": {"_id": None, "minutes": {"$sum": "$modules.minutes"},
+                                          "ids": {"$push": "$modules.id"}}}],
+    [{"$addFields": {"discounted": {"$multiply": [{"$ifNull": ["$price", 0]}, 0.5]}}},
+     {"$sort": {"_id": 1}}, {"$project": {"discounted": 1}}],
+    [{"$project": {"bucket": {"$floor": {"$divide": [{"$ifNull": ["$price", 0]}, 10]}},
+                   "paid": {"$cond": [{"$gt": ["$price", 0]}, "yes", "no"]},
+                   "name": {"$concat": [{"$toUpper": "$level"}, ":", "$id"]}}},
+     {"$sort": {"_id": 1}}],
+    [{"$facet": {"levels": [{"$group": {"_id": "$level", "n": {"$sum": 1}}}, {"$sort": {"_id": 1}}],
+                 "total": [{"$count": "n"}]}}],
+    [{"$sort": {"price": -1, "_id": 1}}, {"$skip": 1}, {"$limit": 2}],
+    [{"$match": {"level": "beginner"}}, {"$count": "n"}],
+]
+
+
+async def seeded():
+    memory = storage.MemoryClient().test.courses
+    reference = mongomock.MongoClient().test.courses
+    await memory.insert_many([dict(document) for document in DOCUMENTS])
+    reference.insert_many([dict(document) for document in DOCUMENTS])
+    return memory, reference
+
+
+@pytest.mark.parametrize("query", QUERIES, ids=str)
+async def test_find_matches_mongomock(query):
+    memory, reference = await seeded()
+    assert await memory.find(query).sort("_id", 1).to_list(None) == list(reference.find(query).sort("_id", 1))
+    assert await memory.count_documents(query) == reference.count_documents(query)
+
+
+@pytest.mark.parametrize("projection", [{"title": 1}, {"title": 1, "_id": 0}, {"modules": 0, "meta": 0},
+                                        {"meta.rating": 1, "_id": 0}])
+async def test_projection_matches_mongomock(projection):
+    memory, reference = await seeded()
+    assert await memory.find({}, projection).sort("_id", 1).to_list(None) == \
+        list(reference.find({}, projection).sort("_id", 1))
+
+
+@pytest.mark.parametrize("query,update", UPDATES, ids=str)
+async def test_update_matches_mongomock(query, update):
+    memory, reference = await seeded()
+    result = await memory.update_many(query, update, upsert=True)
+    expected = reference.update_many(query, update, upsert=True)
+    assert (result.matched_count, result.modified_count, result.upserted_id) == \
+        (expected.matched_count, expected.modified_count, expected.upserted_id)
+    assert await memory.find().sort("_id", 1).to_list(None) == list(reference.find().sort("_id", 1))
+
+
+@pytest.mark.parametrize("pipeline", PIPELINES, ids=str)
+async def test_aggregate_matches_mongomock(pipeline):
+    memory, reference = await seeded()
+    assert await memory.aggregate(pipeline).to_list(None) == list(reference.aggregate(pipeline))
+
+
+async def test_unique_index_rejects_duplicates_like_mongomock():
+    memory, reference = await seeded()
+    await memory.create_index("id", unique=True)
+    reference.create_index("id", unique=True)
+    with pytest.raises(DuplicateKeyError):
+        await memory.insert_one({"id": "a"})
+    with pytest.raises(DuplicateKeyError):
+        reference.insert_one({"id": "a"})
+    with pytest.raises(DuplicateKeyError):
+        await memory.update_one({"id": "b"}, {"$set": {"id": "a"}})
+    assert await memory.count_documents({}) == reference.count_documents({}) == len(DOCUMENTS)
+
+
+async def test_find_one_and_update_and_delete_match_mongomock():
+    memory, reference = await seeded()
+    assert await memory.find_one_and_update({"id": "a"}, {"$inc": {"price": 2}}, return_document=ReturnDocument.AFTER) == \
+        reference.find_one_and_update({"id": "a"}, {"$inc": {"price": 2}}, return_document=ReturnDocument.AFTER)
+    assert (await memory.delete_many({"level": "beginner"})).deleted_count == \
+        reference.delete_many({"level": "beginner"}).deleted_count
+    assert await memory.distinct("level") == sorted(reference.distinct("level"))
+
+
+async def test_count_of_nothing_is_no_document():
+    # mongod returns no document here; mongomock returns {"n": 0}
+    memory, _ = await seeded()
+    assert await memory.aggregate([{"$match": {"level": "expert"}}, {"$count": "n"}]).to_list(None) == []
+
+
+async def test_date_from_string_handles_bad_and_missing_values():
+    # mongomock has no $dateFromString; check the memory backend against the values mongod returns
+    memory = storage.MemoryClient().test.enrollments
+    await memory.insert_many([{"_id": 1, "at": "2024-03-01T12:00:00Z"}, {"_id": 2, "at": "not a date"}, {"_id": 3}])
+    pipeline = [{"$project": {"at": {"$dateFromString": {"dateString": "$at", "onError": None, "onNull": None}}}}]
+    rows = await memory.aggregate(pipeline).to_list(None)
+    assert [row["at"] is not None for row in rows] == [True, False, False]
+
+
+@pytest.mark.parametrize("pipeline", [
+    [{"$lookup": {"from": "users", "localField": "id", "foreignField": "id", "as": "u"}}],
+    [{"$group": {"_id": None, "s": {"$stdDevPop": "$price"}}}],
+    [{"$project": {"x": {"$dateToString": {"date": "$created"}}}}],
+    [{"$match": {}}, {"$project": {"x": "$$NOW"}}],
+])
+async def test_unsupported_pipeline_is_rejected_before_it_runs(pipeline):
+    memory, _ = await seeded()
+    with pytest.raises(NotImplementedError):
+        memory.aggregate(pipeline)
+
+
+async def test_change_streams_are_unsupported():
+    with pytest.raises(NotImplementedError):
+        storage.MemoryClient().test.courses.watch()
@@ -0,0 +1,81 @@
+import argparse
+
+import mongomock
+import pytest
+
+from synthetic_data import BatchWriter, SyntheticDataGenerator, parse_count
+
+COURSES = [
+    {"id": f"course-{i}", "title": f"Course {i}", "price": 10.0 * i, "credit_hours": 2,
+     "modules": [{"id": f"course-{i}-m{j}"} for j in range(4)]}
+    for i in range(1, 8)
+]
+
+
+def generate(users=300, seed=7, batch_size=50, offset=0, db=None, **options):
+    db = db if db is not None else mongomock.MongoClient().loadtest
+    writer = BatchWriter(db, batch_size)
+    generator = SyntheticDataGenerator(COURSES, "hash", seed=seed, days=90, chats_per_user=1.5, offset=offset, **options)
+    for index in range(offset, offset + users):
+        generator.generate_user(index, writer)
+    writer.flush_all()
+    return db, writer, generator
+
+
+@pytest.mark.parametrize("text,count", [("5000", 5000), ("250k", 250_000), ("1.5m", 1_500_000), ("10_000", 10_000)])
+def test_parse_count(text, count):
+    assert parse_count(text) == count
+
+
+@pytest.mark.parametrize("text", ["999", "11m", "lots"])
+def test_parse_count_rejects_out_of_range_and_garbage(text):
+    with pytest.raises(argparse.ArgumentTypeError):
+        parse_count(text)
+
+
+def test_writer_flushes_in_batches_and_counts_everything():
+    db, writer, _ = generate()
+    assert writer.counts["users"] == db.users.count_documents({}) == 300
+    assert all(not buffer for buffer in writer.buffers.values())
+    assert all(db[name].count_documents({"synthetic": {"$ne": True}}) == 0 for name in writer.counts)
+
+
+def test_same_seed_generates_the_same_data():
+    first, _, _ = generate(users=50)
+    second, _, _ = generate(users=50)
+    assert first.enrollments.count_documents({}) > 0
+    assert list(first.users.find({}, {"_id": 0, "created_at": 0})) == list(second.users.find({}, {"_id": 0, "created_at": 0}))
+    assert [e["course_id"] for e in first.enrollments.find()] == [e["course_id"] for e in second.enrollments.find()]
+
+
+def test_repeated_runs_with_one_seed_add_new_ids():
+    db, _, _ = generate(users=50)
+    generate(users=50, offset=50, db=db)
+    for name in ("users", "enrollments", "payment_transactions", "certificates", "ai_chats"):
+        ids = [doc["id"] for doc in db[name].find()]
+        assert len(ids) == len(set(ids)), name
+    assert len(db.payment_transactions.distinct("session_id")) == db.payment_transactions.count_documents({})
+    assert db.users.count_documents({}) == len(db.users.distinct("email")) == 100
+
+
+def test_admins_are_only_generated_on_request():
+    db, _, _ = generate()
+    assert db.users.count_documents({"role": "admin"}) == 0
+    assert db.users.count_documents({"role": "instructor"}) > 0
+    db, _, _ = generate(admin_fraction=0.1)
+    assert 10 < db.users.count_documents({"role": "admin"}) < 60
+
+
+def test_documents_are_consistent():
+    db, _, generator = generate()
+    enrollments = list(db.enrollments.find())
+    for enrollment in enrollments:
+        if enrollment["status"] == "completed":
+            assert enrollment["progress"] == 100 and enrollment["completed_at"]
+        else:
+            assert enrollment["progress"] < 100 and enrollment["completed_at"] is None
+    completed = {(e["user_id"], e["course_id"]) for e in enrollments if e["status"] == "completed"}
+    assert {(c["user_id"], c["course_id"]) for c in db.certificates.find()} <= completed
+    paid = {t["id"] for t in db.payment_transactions.find({"payment_status": "paid"})}
+    assert {e["payment_id"] for e in enrollments if "payment_id" in e} == paid
+    assert sum(generator.enrollment_counts.values()) == len(enrollments)
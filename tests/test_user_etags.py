@@ -0,0 +1,61 @@
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+async def revalidate(client, path, headers, etag):
+    return await client.get(path, headers={**headers, "If-None-Match": etag})
+
+
+@pytest.mark.parametrize("path", ["/api/auth/me", "/api/enrollments", "/api/certificates"])
+async def test_unchanged_resources_revalidate_with_a_304(client, register, path):
+    _, headers = await register()
+    first = await client.get(path, headers=headers)
+    assert first.status_code == 200
+    etag = first.headers["ETag"]
+    assert first.headers["Cache-Control"] == "private, no-cache"
+
+    again = await revalidate(client, path, headers, etag)
+    assert (again.status_code, again.content) == (304, b"")
+    assert again.headers["ETag"] == etag
+    assert (await revalidate(client, path, headers, f'W/{etag}, "other"')).status_code == 304
+
+
+async def test_etags_are_per_user(client, register):
+    _, alice = await register()
+    _, bob = await register()
+    etag = (await client.get("/api/enrollments", headers=alice)).headers["ETag"]
+    assert (await revalidate(client, "/api/enrollments", bob, etag)).status_code == 200
+
+
+async def test_enrolling_and_progress_change_the_etags(client, register, create_course):
+    course = await create_course(modules=[{"title": "Only", "description": "m"}])
+    _, headers = await register()
+    etags = {path: (await client.get(path, headers=headers)).headers["ETag"]
+             for path in ("/api/auth/me", "/api/enrollments", "/api/certificates")}
+
+    enrollment = (await client.post("/api/enrollments", json={"course_id": course["id"]}, headers=headers)).json()
+    changed = await revalidate(client, "/api/enrollments", headers, etags["/api/enrollments"])
+    assert changed.status_code == 200
+    assert [row["id"] for row in changed.json()] == [enrollment["id"]]
+    etag = changed.headers["ETag"]
+
+    await client.put(f"/api/enrollments/{enrollment['id']}/progress",
+                     json={"module_id": course["modules"][0]["id"]}, headers=headers)
+    progressed = await revalidate(client, "/api/enrollments", headers, etag)
+    assert progressed.status_code == 200 and progressed.json()[0]["progress"] == 100
+
+    certificate = await client.post("/api/certificates", json={"enrollment_id": enrollment["id"]}, headers=headers)
+    assert certificate.status_code == 200, certificate.text
+    issued = await revalidate(client, "/api/certificates", headers, etags["/api/certificates"])
+    assert [row["id"] for row in issued.json()] == [certificate.json()["id"]]
+
+
+async def test_role_changes_refresh_the_profile(client, register, admin_headers):
+    user, headers = await register()
+    etag = (await client.get("/api/auth/me", headers=headers)).headers["ETag"]
+    response = await client.put(f"/api/users/{user['id']}/role", json={"new_role": "instructor"}, headers=admin_headers)
+    assert response.status_code == 200
+    me = await revalidate(client, "/api/auth/me", headers, etag)
+    assert me.status_code == 200 and me.json()["role"] == "instructor"
+    assert me.headers["ETag"] != etag
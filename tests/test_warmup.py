@@ -0,0 +1,99 @@
+import asyncio
+
+import pytest
+from pymongo.errors import AutoReconnect
+
+import storage
+import warmup
+from warmup import WarmUp
+
+pytestmark = pytest.mark.anyio
+
+
+class FlakyDatabase:
+    """Fails the first ``failures`` commands, like a Mongo that is still starting"""
+
+    def __init__(self, failures):
+        self.failures = failures
+        self.commands = 0
+
+    async def command(self, name):
+        self.commands += 1
+        if self.failures > 0:
+            self.failures -= 1
+            raise AutoReconnect("connection refused")
+        return {"ok": 1}
+
+
+@pytest.fixture(autouse=True)
+def fast_retries(monkeypatch):
+    monkeypatch.setattr(warmup, "WARMUP_MODULES", ("json",))
+    monkeypatch.setattr(warmup, "WARMUP_RETRY_SECONDS", 0)
+
+
+async def test_run_warms_up_every_step_then_reports_ready():
+    primed = []
+
+    async def prime():
+        primed.append(True)
+
+    warm_up = WarmUp()
+    db = storage.MemoryClient().rtcapp_test
+    ready, body = await warm_up.report(db, {})
+    assert not ready and body["warmup"]["seconds"] is None
+
+    await warm_up.run(db, prime)
+    assert primed == [True]
+    assert {name: step["ok"] for name, step in warm_up.steps.items()} == {"imports": True, "mongo_pool": True,
+                                                                          "catalog": True}
+    ready, body = await warm_up.report(db, {"pool": {"in_use": 0}})
+    assert ready and body["warmed_up"]
+    assert body["mongo"]["ping_ms"] is not None and body["mongo"]["pool"] == {"pool": {"in_use": 0}}
+
+
+async def test_failed_optional_steps_do_not_hold_readiness_back(monkeypatch):
+    monkeypatch.setattr(warmup, "WARMUP_MODULES", ("no_such_module_for_warmup",))
+
+    async def prime():
+        raise RuntimeError("catalog unavailable")
+
+    warm_up = WarmUp()
+    await warm_up.run(storage.MemoryClient().rtcapp_test, prime)
+    assert warm_up.ready
+    assert warm_up.steps["imports"]["ok"] is False
+    assert "no_such_module_for_warmup" in warm_up.steps["imports"]["error"]
+    assert warm_up.steps["catalog"]["error"] == "catalog unavailable"
+
+
+async def test_pool_warm_up_waits_for_mongo(monkeypatch):
+    monkeypatch.setattr(warmup, "WARMUP_MONGO_CONNECTIONS", 3)
+    db = FlakyDatabase(failures=2)
+    warm_up = WarmUp()
+    await asyncio.wait_for(warm_up.run(db), 1)
+    assert warm_up.steps["mongo_pool"]["ok"] and warm_up.ready
+    assert db.commands > 3
+
+
+async def test_unreachable_mongo_makes_a_warm_worker_unready():
+    warm_up = WarmUp()
+    warm_up.set_ready(True)
+    ready, body = await warm_up.report(FlakyDatabase(failures=1), {})
+    assert not ready and body["warmed_up"]
+    assert body["mongo"] == {"ping_ms": None, "pool": {}, "error": "connection refused"}
+
+
+async def test_ready_endpoint(client, monkeypatch):
+    import server
+
+    for _ in range(100):
+        if server.warm_up.ready:
+            break
+        await asyncio.sleep(0.01)
+    response = await client.get("/api/ready")
+    assert response.status_code == 200 and response.json()["ready"] is True
+
+    monkeypatch.setattr(server.warm_up, "ready", False)
+    response = await client.get("/api/ready")
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == str(warmup.READY_RETRY_AFTER_SECONDS)
+    assert (await client.get("/api/health")).status_code == 200
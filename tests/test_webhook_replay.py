@@ -0,0 +1,143 @@
+import json
+import random
+from argparse import Namespace
+from collections import Counter
+
+import pytest
+
+import fake_integrations
+import stripe_webhooks
+import webhook_replay
+from benchmark import BenchmarkClient, RouteStats
+from fake_integrations import CheckoutSessionRequest, StripeCheckout
+from webhook_replay import Storm, anomalies, extra_copies, plan_storm
+
+pytestmark = pytest.mark.anyio
+
+
+def storm_args(**overrides):
+    return Namespace(**{"abandon": 0.0, "async_fraction": 0.0, "reorder": 0.0, "duplicates": 0.0, "poll": 0.0,
+                        **overrides})
+
+
+async def open_session(amount=49.0):
+    stripe = StripeCheckout(api_key="sk_test", webhook_url="")
+    request = CheckoutSessionRequest(amount=amount, currency="usd", success_url="s", cancel_url="c",
+                                     metadata={"course_id": "c1"})
+    return (await stripe.create_checkout_session(request)).session_id
+
+
+async def test_fake_sessions_move_through_stripes_states():
+    stripe = StripeCheckout(api_key="sk_test", webhook_url="")
+    session_id = await open_session()
+    status = await stripe.get_checkout_status(session_id)
+    assert (status.status, status.payment_status, status.amount_total) == ("open", "unpaid", 4900)
+
+    fake_integrations.complete_session(session_id, "unpaid")
+    assert fake_integrations.FAKE_SESSIONS[session_id]["paid_at"] is None
+    fake_integrations.complete_session(session_id)
+    paid_at = fake_integrations.FAKE_SESSIONS[session_id]["paid_at"]
+    fake_integrations.complete_session(session_id)
+    assert fake_integrations.FAKE_SESSIONS[session_id]["paid_at"] == paid_at
+    fake_integrations.expire_session(session_id)
+    status = await stripe.get_checkout_status(session_id)
+    assert (status.status, status.payment_status) == ("complete", "paid")
+
+    abandoned = await open_session()
+    fake_integrations.expire_session(abandoned)
+    assert fake_integrations.FAKE_SESSIONS[abandoned]["status"] == "expired"
+
+
+async def test_webhooks_are_signed_like_stripe_and_only_parsed():
+    stripe = StripeCheckout(api_key="sk_test", webhook_url="")
+    session_id = await open_session()
+    event = fake_integrations.webhook_event(session_id, payment_status="paid", event_id="evt_1")
+    assert event["data"]["object"]["metadata"] == {"course_id": "c1"}
+    body = json.dumps(event).encode()
+
+    header = fake_integrations.sign_webhook(body)
+    stripe_webhooks.verify_signature(body, header, fake_integrations.FAKE_WEBHOOK_SECRET)
+    response = await stripe.handle_webhook(body, header)
+    assert (response.event_id, response.session_id, response.payment_status) == ("evt_1", session_id, "paid")
+    assert fake_integrations.FAKE_SESSIONS[session_id]["payment_status"] == "unpaid"
+
+    with pytest.raises(stripe_webhooks.SignatureVerificationError):
+        await stripe.handle_webhook(body, fake_integrations.sign_webhook(body, "whsec_forged"))
+
+
+def test_extra_copies_average_to_the_mean():
+    rng = random.Random(1)
+    assert {extra_copies(2.0, rng) for _ in range(10)} == {2}
+    assert sum(extra_copies(0.5, rng) for _ in range(10000)) == pytest.approx(5000, rel=0.05)
+
+
+def test_plan_storm_builds_each_sessions_event_sequence():
+    sessions = [f"cs_{index}" for index in range(300)]
+    plan = plan_storm(sessions, storm_args(abandon=0.2, async_fraction=0.5, reorder=1.0, duplicates=1.0, poll=1.0),
+                      random.Random(7))
+    deliveries = plan["deliveries"]
+    assert [delivery.key for delivery in deliveries] == sorted(delivery.key for delivery in deliveries)
+    assert set(plan["paid"]) | set(plan["abandoned"]) == set(sessions)
+    assert plan["abandoned"] and plan["reordered"]
+
+    by_session = {}
+    for delivery in deliveries:
+        by_session.setdefault(delivery.session_id, []).append(delivery)
+    for session_id in plan["abandoned"]:
+        kinds = Counter((delivery.kind, delivery.event_type) for delivery in by_session[session_id])
+        assert set(kinds) == {("event", "checkout.session.expired"), ("forged", "checkout.session.completed")}
+    for session_id in plan["paid"]:
+        events = [delivery for delivery in by_session[session_id] if delivery.kind == "event"]
+        assert any(delivery.payment_status == "paid" for delivery in events)
+        # Copies of one event share its id, so the app sees true duplicates
+        assert set(Counter(delivery.event_id for delivery in events).values()) == {2}
+        assert [delivery.kind for delivery in by_session[session_id]].count("poll") == 1
+    # With reorder=1 every delayed payment announces success before the unpaid completion
+    delayed = [[d for d in by_session[session_id] if d.kind == "event"] for session_id in plan["paid"]]
+    delayed = [events for events in delayed if len({d.event_type for d in events}) == 2]
+    assert len(delayed) == plan["reordered"]
+    assert all(events[0].payment_status == "paid" for events in delayed)
+
+
+def test_plan_storm_is_reproducible_from_the_seed():
+    sessions = [f"cs_{index}" for index in range(50)]
+    args = storm_args(abandon=0.3, async_fraction=0.5, duplicates=0.5)
+    first, second = (plan_storm(sessions, args, random.Random(3)) for _ in range(2))
+    assert first["paid"] == second["paid"]
+    assert [(d.session_id, d.kind, d.event_id, d.event_type) for d in first["deliveries"]] == \
+        [(d.session_id, d.kind, d.event_id, d.event_type) for d in second["deliveries"]]
+    assert plan_storm(sessions, args, random.Random(4))["deliveries"][0].event_id != first["deliveries"][0].event_id
+
+
+def test_anomalies_name_every_failed_check():
+    clean = {"fulfillment": {"missing": 0, "duplicate_enrollments": 0, "enrollments_for_abandoned": 0,
+                             "not_marked_paid": 0},
+             "storm": {"forged_accepted": 0, "gave_up": 0}, "config": {"max_attempts": 5}}
+    assert anomalies(clean) == []
+    broken = {**clean, "fulfillment": {**clean["fulfillment"], "duplicate_enrollments": 2},
+              "storm": {"forged_accepted": 1, "gave_up": 3}}
+    assert anomalies(broken) == ["2 duplicate enrollments", "1 forged deliveries answered with 2xx",
+                                 "3 deliveries still failing after 5 attempts"]
+
+
+async def test_a_small_storm_fulfils_every_paid_session_once(client, register, course_ids):
+    import server
+
+    tokens, owners = {}, {}
+    for index in range(12):
+        user, headers = await register()
+        tokens[user["id"]] = headers["Authorization"].split()[1]
+        response = await client.post("/api/payments/checkout", headers=headers,
+                                     json={"course_id": course_ids[index % 3], "origin_url": "https://app.example.com"})
+        owners[response.json()["session_id"]] = user["id"]
+
+    plan = plan_storm(sorted(owners), storm_args(abandon=0.25, async_fraction=0.5, reorder=0.5, duplicates=2.0,
+                                                 poll=0.5), random.Random(11))
+    storm = Storm(fake_integrations, BenchmarkClient(client, RouteStats()), tokens, owners,
+                  concurrency=20, max_attempts=3)
+    await storm.run(plan["deliveries"], rate=0)
+    outcome = await webhook_replay.inspect_outcome(server, fake_integrations, plan, owners)
+    result = {"fulfillment": outcome, "storm": {"forged_accepted": storm.forged_accepted, "gave_up": storm.gave_up},
+              "config": {"max_attempts": 3}}
+    assert anomalies(result) == []
+    assert outcome["fulfilled"] == len(plan["paid"]) > 0
@@ -0,0 +1,133 @@
+import asyncio
+
+import pytest
+from pymongo.errors import AutoReconnect, BulkWriteError
+
+import storage
+import write_behind
+from write_behind import WriteBehindBuffer
+
+pytestmark = pytest.mark.anyio
+
+
+def buffer(**options):
+    buffer = WriteBehindBuffer("ai_chats", **options)
+    buffer.bind(storage.MemoryClient().rtcapp_test)
+    return buffer
+
+
+async def settle(condition, attempts=50):
+    for _ in range(attempts):
+        if await condition():
+            return True
+        await asyncio.sleep(0.01)
+    return False
+
+
+async def count(chats, expected):
+    return await chats.collection.count_documents({}) == expected
+
+
+async def stop(task):
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+
+
+async def test_append_returns_before_the_write_and_a_full_batch_flushes():
+    chats = buffer(batch_size=3, flush_interval=3600)
+    task = asyncio.create_task(chats.run())
+    await asyncio.sleep(0)
+    for index in range(2):
+        await chats.append({"id": index})
+    await asyncio.sleep(0.02)
+    assert chats.pending() == 2
+    assert await chats.collection.count_documents({}) == 0
+
+    await chats.append({"id": 2})
+    assert await settle(lambda: count(chats, 3))
+    assert chats.pending() == 0
+    await stop(task)
+
+
+async def test_partial_batches_flush_on_the_interval():
+    chats = buffer(batch_size=100, flush_interval=0.02)
+    task = asyncio.create_task(chats.run())
+    await chats.append({"id": 1})
+    assert await settle(lambda: count(chats, 1))
+    await stop(task)
+
+
+async def test_cancelling_the_task_drains_pending_documents():
+    chats = buffer(batch_size=2, flush_interval=3600)
+    task = asyncio.create_task(chats.run())
+    await asyncio.sleep(0)
+    for index in range(5):
+        chats._queue.append({"id": index})
+    await stop(task)
+    assert await chats.collection.count_documents({}) == 5
+
+
+async def test_zero_interval_writes_through():
+    chats = buffer(flush_interval=0)
+    await chats.append({"id": 1})
+    assert chats.pending() == 0
+    assert await chats.collection.count_documents({}) == 1
+
+
+async def test_full_queue_applies_backpressure_until_a_flush():
+    chats = buffer(batch_size=2, flush_interval=3600, max_pending=2)
+    for index in range(2):
+        await chats.append({"id": index})
+    blocked = asyncio.create_task(chats.append({"id": 2}))
+    await asyncio.sleep(0.01)
+    assert not blocked.done()
+
+    await chats.flush()
+    await asyncio.wait_for(blocked, 1)
+    assert chats.pending() == 1
+    assert await chats.collection.count_documents({}) == 2
+
+
+async def test_failed_flushes_are_requeued_in_order(monkeypatch):
+    chats = buffer(batch_size=10, flush_interval=3600)
+    for index in range(3):
+        await chats.append({"id": index})
+
+    async def unavailable(self, documents, ordered=True):
+        raise AutoReconnect("primary stepped down")
+
+    monkeypatch.setattr(type(chats.db.ai_chats), "insert_many", unavailable)
+    assert await chats.flush() is False
+    assert [document["id"] for document in chats._queue] == [0, 1, 2]
+
+    monkeypatch.undo()
+    assert await chats.flush() is True
+    assert await chats.collection.count_documents({}) == 3
+
+
+async def test_duplicate_keys_from_an_earlier_attempt_are_not_retried(monkeypatch):
+    chats = buffer(batch_size=10, flush_interval=3600)
+    for index in range(3):
+        await chats.append({"id": index})
+
+    async def partial(self, documents, ordered=True):
+        raise BulkWriteError({"writeErrors": [{"index": 0, "code": 11000}, {"index": 2, "code": 121}]})
+
+    monkeypatch.setattr(type(chats.db.ai_chats), "insert_many", partial)
+    assert await chats.flush() is False
+    assert [document["id"] for document in chats._queue] == [2]
+
+
+async def test_checkout_audit_records_are_written_behind(client, register, course_ids):
+    import server
+
+    user, headers = await register()
+    response = await client.post("/api/payments/checkout",
+                                 json={"course_id": course_ids[0], "origin_url": "https://app.example.com"},
+                                 headers=headers)
+    assert response.status_code == 200, response.text
+    await write_behind.payment_audit.drain()
+    audit = await server.db.payment_audit.find_one({"user_id": user["id"]}, {"_id": 0})
+    assert audit["event"] == "checkout.created"
+    assert audit["session_id"] == response.json()["session_id"]